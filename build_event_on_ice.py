@@ -0,0 +1,256 @@
+"""
+Build derived.event_on_ice_{season}: who was on ice for every PBP event.
+
+One vectorized shift/event join per season (on_ice_utils.events_on_ice), stored
+as long rows for ad hoc on-ice queries (who was on ice for event X, a player's
+on-ice events) and read back with load_event_on_ice.
+
+Built on demand, not by run_modern_pipeline: the season builders attribute their
+on-ice counters in memory (on_ice_utils.attribute_on_ice) from their own shift
+inputs and on-ice rules, which is cheaper than reading this table back.
+
+On-ice rule: shift_start <= game_seconds < shift_end (same half-open rule as
+mart.player_game_es_{season}); goalies are kept and flagged by position.
+
+Inputs:
+- derived.game_plays_{season}_from_raw_pbp
+- raw.raw_shifts_resolved
+- dim.dim_team_code
+
+Output:
+- derived.event_on_ice_{season} with:
+  (season, game_id, event_index, game_seconds, event_type, team_id, player_id,
+   position, is_home, is_event_team)
+  indexed on (game_id, event_index) and (player_id)
+
+Usage:
+  python build_event_on_ice.py --season 20242025
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData, Table, text
+
+from constants import SCHEMA, SEASONS_MODERN
+from db_utils import copy_dataframe, dispose_engines, get_db_engine, read_frame
+from log_utils import setup_logger
+from on_ice_utils import events_on_ice
+from schema_utils import fq
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+EVENT_ON_ICE_COLUMNS = [
+    "season",
+    "game_id",
+    "event_index",
+    "game_seconds",
+    "event_type",
+    "team_id",
+    "player_id",
+    "position",
+    "is_home",
+    "is_event_team",
+]
+
+
+def build_event_on_ice_for_season(season: int, engine=None) -> pd.DataFrame:
+    """Return the long event_on_ice rows for a season."""
+    plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
+    shifts_resolved = fq("raw", "raw_shifts_resolved")
+    dim_team_code = fq("dim", "dim_team_code")
+
+    engine = engine or get_db_engine()
+    with engine.connect() as conn:
+        ev = read_frame(
+            conn,
+            text(
+                f"""
+                SELECT
+                  p.game_id::bigint AS game_id,
+                  p.event_index,
+                  p.game_seconds,
+                  p.event_type,
+                  te.team_id AS event_team_id,
+                  th.team_id AS home_team_id
+                FROM {plays_view} p
+                LEFT JOIN {dim_team_code} te ON te.team_code = p.event_team
+                LEFT JOIN {dim_team_code} th ON th.team_code = p.home_team
+                WHERE p.event_index IS NOT NULL
+                  AND p.game_seconds IS NOT NULL
+                """
+            ),
+        )
+        gs = read_frame(
+            conn,
+            text(
+                f"""
+                SELECT
+                  rs.game_id::bigint AS game_id,
+                  rs.player_id_resolved::bigint AS player_id,
+                  dt.team_id::bigint AS team_id,
+                  rs.position,
+                  rs.seconds_start AS shift_start,
+                  rs.seconds_end AS shift_end
+                FROM {shifts_resolved} rs
+                JOIN {dim_team_code} dt
+                  ON dt.team_code = rs.team
+                WHERE rs.season = :season
+                  AND rs.session = 'R'
+                  AND rs.player_id_resolved IS NOT NULL
+                  AND rs.seconds_end > rs.seconds_start
+                """
+            ),
+            {"season": int(season)},
+        )
+
+    if ev.empty or gs.empty:
+        return pd.DataFrame(columns=EVENT_ON_ICE_COLUMNS)
+
+    ev = ev.sort_values(["game_id", "event_index"], ignore_index=True)
+    rows = events_on_ice(gs, ev.rename(columns={"game_seconds": "time"}))
+
+    e = ev.iloc[rows["event_row"].to_numpy()].reset_index(drop=True)
+    out = pd.DataFrame(
+        {
+            "season": int(season),
+            "game_id": rows["game_id"].to_numpy(np.int64),
+            "event_index": e["event_index"].to_numpy(),
+            "game_seconds": e["game_seconds"].to_numpy(),
+            "event_type": e["event_type"].to_numpy(),
+            "team_id": rows["team_id"].to_numpy(np.int64),
+            "player_id": rows["player_id"].to_numpy(np.int64),
+        }
+    )
+    out["is_home"] = out["team_id"].to_numpy() == e["home_team_id"].to_numpy()
+    out["is_event_team"] = out["team_id"].to_numpy() == e["event_team_id"].to_numpy()
+
+    # one position per player-game (most frequent across their shift rows)
+    pos = (
+        gs.dropna(subset=["position"])
+        .groupby(["game_id", "player_id"])["position"]
+        .agg(lambda x: x.value_counts().index[0])
+        .reset_index()
+    )
+    out = out.merge(pos, on=["game_id", "player_id"], how="left")
+    return out[EVENT_ON_ICE_COLUMNS]
+
+
+def write_event_on_ice(engine, season: int, df: pd.DataFrame) -> str:
+    """Replace derived.event_on_ice_{season} and index it; return its name."""
+    schema = SCHEMA["derived"]
+    table = f"event_on_ice_{season}"
+
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "{schema}"."{table}" CASCADE;'))
+        df.head(0).to_sql(table, conn, schema=schema, index=False)
+
+    # rows go in with COPY (db_utils.copy_dataframe)
+    with engine.begin() as conn:
+        target = Table(table, MetaData(), schema=schema, autoload_with=conn)
+        try:
+            copy_dataframe(df, target, conn)
+        except NotImplementedError as e:
+            logger.warning("%s; falling back to multi-row inserts.", e)
+            df.to_sql(
+                table,
+                conn,
+                schema=schema,
+                if_exists="append",
+                index=False,
+                method="multi",
+                chunksize=50_000,
+            )
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{table}_game_event
+                ON "{schema}"."{table}" (game_id, event_index);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{table}_player
+                ON "{schema}"."{table}" (player_id);
+                """
+            )
+        )
+    return f"{schema}.{table}"
+
+
+def load_event_on_ice(
+    engine,
+    season: int,
+    *,
+    game_ids: list[int] | None = None,
+    event_types: list[str] | None = None,
+    skaters_only: bool = True,
+) -> pd.DataFrame:
+    """
+    Read derived.event_on_ice_{season} (written by write_event_on_ice).
+
+    :param game_ids: only these games
+    :param event_types: only these raw event types (e.g. SHOT, GOAL, MISS, BLOCK)
+    :param skaters_only: drop goalie rows (position 'G')
+    """
+    where = []
+    params = {}
+    if game_ids is not None:
+        where.append("game_id = ANY(:game_ids)")
+        params["game_ids"] = [int(g) for g in game_ids]
+    if event_types is not None:
+        where.append("event_type = ANY(:event_types)")
+        params["event_types"] = list(event_types)
+    if skaters_only:
+        where.append("position IS DISTINCT FROM 'G'")
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+    return read_frame(
+        engine,
+        text(
+            f"SELECT {', '.join(EVENT_ON_ICE_COLUMNS)}"
+            f" FROM {fq('derived', f'event_on_ice_{season}')} {clause}"
+        ),
+        params,
+    )
+
+
+def main() -> None:
+    """Build derived.event_on_ice_{season} for one or all modern seasons."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    args = ap.parse_args()
+
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in SEASONS_MODERN]
+    )
+
+    engine = get_db_engine()
+    try:
+        for season in seasons:
+            df = build_event_on_ice_for_season(int(season), engine)
+            if df.empty:
+                logger.warning("⚠️ %s: no event_on_ice rows produced", season)
+                continue
+            name = write_event_on_ice(engine, int(season), df)
+            logger.info("✅ %s: wrote %s rows -> %s", season, len(df), name)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
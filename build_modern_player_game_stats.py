@@ -17,21 +17,27 @@ Output:
 
 from __future__ import annotations
 
+import argparse
 import os
 import pathlib
-from typing import List
 
 import numpy as np
 import pandas as pd
 from sqlalchemy import text
 
+from cache_utils import GameResultCache, cached_run_sharded
 from constants import SEASONS_MODERN
 from db_utils import get_db_engine
+from extract_cache_utils import ExtractCache
+from game_store_utils import SeasonStore
 from log_utils import setup_logger
+from on_ice_utils import ALL_METRICS, attribute_on_ice, metric_columns
 from schema_utils import fq
+from season_data_utils import load_season_plays, load_season_shifts
 from strength_utils import (
-    apply_exclude_to_plays,
-    build_exclude_timeline_equal_strength,
+    apply_segments_to_plays,
+    build_es_toi,
+    build_strength_segments,
     filter_goalies_modern,
 )
 
@@ -42,108 +48,113 @@ logger = setup_logger()
 OUT_DIR = "player_game_stats"
 
 
+STORE_VARIANT = "player_game_stats"
+
+
+def load_season_inputs(
+    conn, season: int, game_ids=None, *, cache: ExtractCache | None = None
+) -> dict[str, pd.DataFrame]:
+    """Plays (gp) and resolved shifts in game seconds (gs) for one season."""
+    # compact dtypes, team ids + Corsi event labels resolved in SQL
+    return {
+        "gp": load_season_plays(conn, season, game_ids=game_ids, cache=cache),
+        "gs": load_season_shifts(
+            conn, season, game_ids=game_ids, period_offset=True, cache=cache
+        ),
+    }
+
+
 # -------------------------
 # TOI helpers
 # -------------------------
 def build_total_toi_for_game(gs_game: pd.DataFrame) -> pd.DataFrame:
     """Total TOI (seconds) per (game_id, player_id, team_id) from shifts."""
-    gs = gs_game.copy()
-    gs["shift_start"] = gs["shift_start"].astype(int)
-    gs["shift_end"] = gs["shift_end"].astype(int)
-    dur = (gs["shift_end"] - gs["shift_start"]).clip(lower=0)
-
-    out = gs[["game_id", "player_id", "team_id"]].copy()
-    out["toi_total_sec"] = dur.to_numpy(np.int64)
+    dur = gs_game["shift_end"].to_numpy(np.int64) - gs_game["shift_start"].to_numpy(
+        np.int64
+    )
+    out = gs_game[["game_id", "player_id", "team_id"]].assign(
+        toi_total_sec=np.maximum(dur, 0)
+    )
     return out.groupby(["game_id", "player_id", "team_id"], as_index=False)[
         "toi_total_sec"
     ].sum()
 
 
-def exclude_intervals(df_exclude: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
-    """Convert df_exclude rows into [start,end) intervals where exclude=True."""
-    if df_exclude.empty:
-        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
-
-    t = df_exclude["time"].to_numpy(dtype=np.int64)
-    # end boundary is next time; last row end doesn't matter much
-    t_next = np.r_[t[1:], t[-1]]
-    mask = df_exclude["exclude"].to_numpy(bool)
-
-    starts = t[mask]
-    ends = t_next[mask]
-    good = ends > starts
-    return starts[good], ends[good]
-
-
-def overlap_seconds(
-    interval_start: np.ndarray,
-    interval_end: np.ndarray,
-    ex_start: np.ndarray,
-    ex_end: np.ndarray,
-) -> np.ndarray:
-    """Overlap between many [interval_start, interval_end) and exclude intervals."""
-    out = np.zeros(len(interval_start), dtype=np.int64)
-    if len(ex_start) == 0:
-        return out
-
-    # simple loop over exclude intervals (usually not huge)
-    for i in range(len(ex_start)):
-        a = np.maximum(interval_start, ex_start[i])
-        b = np.minimum(interval_end, ex_end[i])
-        out += np.maximum(0, b - a)
-    return out
-
+def build_es_toi_for_game(
+    gs_game: pd.DataFrame, segments: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """
+    Return toi_es_sec per (game_id, player_id, team_id) for one game.
 
-def build_es_toi_for_game(gs_game: pd.DataFrame) -> pd.DataFrame:
-    """Return toi_es_sec per (game_id, player_id, team_id) for one game."""
+    segments: this game's rows of the season strength-segment table
+    (built from gs_game when not given).
+    """
     gs_game = filter_goalies_modern(gs_game)
 
-    df_ex = build_exclude_timeline_equal_strength(gs_game)
-    ex_s, ex_e = exclude_intervals(df_ex)
+    if segments is None:
+        segments = build_strength_segments(gs_game)
 
-    gs = gs_game.copy()
-    gs["shift_start"] = gs["shift_start"].astype(int)
-    gs["shift_end"] = gs["shift_end"].astype(int)
+    # overlapping shift rows are summed as-is (no per-player merge)
+    return build_es_toi(gs_game, segments, merge_shifts=False)
 
-    s = gs["shift_start"].to_numpy(np.int64)
-    e = gs["shift_end"].to_numpy(np.int64)
-    dur = np.maximum(0, e - s)
 
-    ov = overlap_seconds(s, e, ex_s, ex_e)
-    es = dur - ov
-    es[es < 0] = 0
+def compute_player_game_stats(gs: pd.DataFrame, gp: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute player-game stats from cleaned shifts/plays (any subset of games).
 
-    out = gs[["game_id", "player_id", "team_id"]].copy()
-    out["toi_es_sec"] = es
-    return out.groupby(["game_id", "player_id", "team_id"], as_index=False)[
-        "toi_es_sec"
-    ].sum()
+    Games are independent, so this also runs per shard under --workers.
+    Returns: game_id, player_id, team_id, cf, ca, ff, fa, sf, sa, gf, ga, xgf, xga,
+    toi_total_sec, toi_es_sec, cf60, ca60, cf_percent
+    """
+    # skaters only
+    gs = filter_goalies_modern(gs)
 
+    if gs.empty:
+        return pd.DataFrame()
 
-# -------------------------
-# ES CF/CA counting (same idea as build_player_game_es)
-# -------------------------
-def update_corsi_counts(
-    df_corsi: pd.DataFrame, event: pd.Series, gs_game: pd.DataFrame
-) -> None:
-    """Mutates df_corsi cf/ca in-place for one event."""
-    t = int(event["time"])
-    team_for = int(event["team_id_for"])
-    team_against = int(event["team_id_against"])
-
-    on_ice = gs_game[(gs_game["shift_start"] <= t) & (gs_game["shift_end"] >= t)]
-    players_for = on_ice.loc[on_ice["team_id"] == team_for, "player_id"].to_numpy()
-    players_against = on_ice.loc[
-        on_ice["team_id"] == team_against, "player_id"
-    ].to_numpy()
-
-    ev = event["event"]
-    if ev in ("Shot", "Goal", "Missed Shot"):
-        df_corsi.loc[df_corsi["player_id"].isin(players_for), "cf"] += 1
-        df_corsi.loc[df_corsi["player_id"].isin(players_against), "ca"] += 1
-    elif ev == "Blocked Shot":
-        df_corsi.loc[df_corsi["player_id"].isin(players_for), "ca"] += 1
-        df_corsi.loc[df_corsi["player_id"].isin(players_against), "cf"] += 1
+    # strength segments once (shared by ES TOI + ES plays)
+    segments = build_strength_segments(gs)
+
+    # TOI (all games at once)
+    toi_total = build_total_toi_for_game(gs)
+    toi_es = build_es_toi(gs, segments, merge_shifts=False)
+
+    out = toi_es[["game_id", "player_id", "team_id"]].drop_duplicates()
+    out = out.merge(
+        toi_total, on=["game_id", "player_id", "team_id"], how="left"
+    ).merge(toi_es, on=["game_id", "player_id", "team_id"], how="left")
+
+    # ES plays (exclude imbalanced segments)
+    gp_es = apply_segments_to_plays(gp, segments)
+
+    # CF/CA (+ FF/SF/GF/xGF) in one pass (on ice: shift_start <= t <= shift_end)
+    corsi = attribute_on_ice(
+        gs,
+        gp_es,
+        metrics=ALL_METRICS,
+        end_inclusive=True,
+        match_team=False,
+    )
+
+    out = corsi.merge(out, on=["game_id", "player_id", "team_id"], how="right")
+
+    out["cf60"] = np.where(
+        out["toi_es_sec"] > 0,
+        out["cf"] * 3600.0 / out["toi_es_sec"],
+        np.nan,
+    )
+    out["ca60"] = np.where(
+        out["toi_es_sec"] > 0,
+        out["ca"] * 3600.0 / out["toi_es_sec"],
+        np.nan,
+    )
+    out["cf_percent"] = np.where(
+        (out["cf"] + out["ca"]) > 0,
+        100.0 * out["cf"] / (out["cf"] + out["ca"]),
+        np.nan,
+    )
+
+    return out
 
 
 def build_player_game_stats_for_season(
@@ -151,147 +162,47 @@ def build_player_game_stats_for_season(
     *,
     limit_games: int | None = None,
     game_ids_override: list[int] | None = None,
+    workers: int = 1,
+    cache: GameResultCache | None = None,
+    store: SeasonStore | None = None,
+    extract_cache: ExtractCache | None = None,
 ) -> pd.DataFrame:
     """
     Build player-game stats for one season.
 
-    Plays source (derived.game_plays_{season}_from_raw_pbp) columns used:
-      - game_id, game_seconds, event_type, event_team, home_team, away_team
-
-    Shifts source:
-      - raw.raw_shifts_resolved (player_id_resolved)
+    workers > 1 shards games across a process pool (see parallel_utils).
+    cache serves unchanged games from the per-game result cache (see cache_utils).
+    store reads the season from its memory-mapped bundle (see game_store_utils)
+    instead of Postgres; game_ids_override then slices the stored season.
+    extract_cache serves the plays / shifts extracts from local Parquet while
+    their source tables are unchanged (see extract_cache_utils).
 
-    Team mapping:
-      - dim.dim_team_code (team_code -> team_id)
+    Inputs come from season_data_utils (compact int32/int16/categorical dtypes):
+      - plays: derived.game_plays_{season}_from_raw_pbp (Corsi events only)
+      - shifts: raw.raw_shifts_resolved (player_id_resolved, game seconds)
+      - team mapping: dim.dim_team_code (team_code -> team_id)
 
     Output columns in result:
-      season, game_id, player_id, team_id, cf, ca, toi_total_sec, toi_es_sec, cf60, ca60, cf_percent
+      season, game_id, player_id, team_id, cf, ca, ff, fa, sf, sa, gf, ga, xgf, xga,
+      toi_total_sec, toi_es_sec, cf60, ca60, cf_percent
     """
     engine = get_db_engine()
 
-    plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
-    shifts_view = fq("raw", "raw_shifts_resolved")
-    dim_team_code = fq("dim", "dim_team_code")
+    logger.info("plays_view=%s", fq("derived", f"game_plays_{season}_from_raw_pbp"))
+    logger.info("shifts_view=%s", fq("raw", "raw_shifts_resolved"))
 
-    logger.info("plays_view=%s", plays_view)
-    logger.info("shifts_view=%s", shifts_view)
-    logger.info("dim_team_code=%s", dim_team_code)
-
-    try:
+    if store is not None:
+        bundle = store.load(engine, season, STORE_VARIANT, load_season_inputs)
+        gp, gs = bundle.frame("gp"), bundle.frame("gs")
+    elif extract_cache is not None:
+        frames = load_season_inputs(
+            engine, season, game_ids_override, cache=extract_cache
+        )
+        gp, gs = frames["gp"], frames["gs"]
+    else:
         with engine.connect() as conn:
-            # -------------------------
-            # LOAD plays (gp) with only needed columns
-            # -------------------------
-            gp = pd.read_sql_query(
-                text(
-                    f"""
-                    SELECT
-                        game_id,
-                        game_seconds,
-                        event_type,
-                        event_team,
-                        home_team,
-                        away_team
-                    FROM {plays_view}
-                    """
-                ),
-                conn,
-            )
-
-            # team_code -> team_id mapping
-            dt = pd.read_sql_query(
-                text(f"SELECT team_code, team_id FROM {dim_team_code}"),
-                conn,
-            )
-            team_code_to_id = dict(zip(dt["team_code"], dt["team_id"]))
-
-            # -------------------------
-            # NORMALIZE plays (gp) to expected schema
-            # -------------------------
-            gp = gp.copy()
-
-            # time
-            gp["time"] = pd.to_numeric(gp["game_seconds"], errors="coerce")
-
-            # event mapping: your view uses codes like SHOT/GOAL/MISS/BLOCK
-            event_map = {
-                "SHOT": "Shot",
-                "GOAL": "Goal",
-                "MISS": "Missed Shot",
-                "BLOCK": "Blocked Shot",
-            }
-            gp["event"] = gp["event_type"].map(event_map)
-
-            unknown = gp.loc[gp["event"].isna(), "event_type"].value_counts().head(10)
-            if not unknown.empty:
-                logger.info(
-                    "%s: unmapped event_type sample: %s", season, unknown.to_dict()
-                )
-
-            # team_id_for
-            gp["team_id_for"] = gp["event_team"].map(team_code_to_id)
-
-            # team_id_against depends on whether event_team is home or away
-            is_home_for = gp["event_team"] == gp["home_team"]
-            gp["team_id_against"] = np.where(
-                is_home_for,
-                gp["away_team"].map(team_code_to_id),
-                gp["home_team"].map(team_code_to_id),
-            )
-
-            # drop unusable rows
-            gp = gp.dropna(
-                subset=["game_id", "time", "event", "team_id_for", "team_id_against"]
-            ).copy()
-
-            # dtypes
-            gp["game_id"] = pd.to_numeric(gp["game_id"], errors="coerce").astype(
-                "int64"
-            )
-            gp["time"] = gp["time"].astype("int64")
-            gp["team_id_for"] = gp["team_id_for"].astype("int64")
-            gp["team_id_against"] = gp["team_id_against"].astype("int64")
-
-            # keep only corsi-relevant events
-            gp = gp[
-                gp["event"].isin(["Shot", "Goal", "Missed Shot", "Blocked Shot"])
-            ].copy()
-
-            gp = gp.sort_values(["game_id", "time"], ignore_index=True)
-
-            # -------------------------
-            # LOAD shifts (gs)
-            # -------------------------
-            gs = pd.read_sql_query(
-                text(
-                    f"""
-                    SELECT
-                        rs.game_id,
-                        rs.player_id_resolved AS player_id,
-                        dt.team_id,
-                        rs."position" AS position,
-                        rs.game_period AS period,
-                        CASE WHEN rs.game_period IN (1,2,3)
-                            THEN (rs.game_period - 1) * 1200 + rs.seconds_start
-                            ELSE 3600 + rs.seconds_start END AS shift_start,
-                        CASE WHEN rs.game_period IN (1,2,3)
-                            THEN (rs.game_period - 1) * 1200 + rs.seconds_end
-                            ELSE 3600 + rs.seconds_end END AS shift_end
-                    FROM {shifts_view} rs
-                    JOIN {dim_team_code} dt
-                      ON dt.team_code = rs.team
-                    WHERE rs.season = :season
-                      AND rs.session = 'R'
-                      AND rs.player_id_resolved IS NOT NULL
-                      AND rs.seconds_end > rs.seconds_start
-                    """
-                ),
-                conn,
-                params={"season": int(season)},
-            )
-
-    finally:
-        engine.dispose()
+            frames = load_season_inputs(conn, season, game_ids_override)
+        gp, gs = frames["gp"], frames["gs"]
 
     if gp.empty or gs.empty:
         logger.warning(
@@ -299,23 +210,6 @@ def build_player_game_stats_for_season(
         )
         return pd.DataFrame()
 
-    # -------------------------
-    # CLEAN SHIFTS DATA
-    # -------------------------
-    gs = gs.copy()
-    for col in ["game_id", "player_id", "team_id", "shift_start", "shift_end"]:
-        gs[col] = pd.to_numeric(gs[col], errors="coerce")
-    gs = gs.dropna(
-        subset=["game_id", "player_id", "team_id", "shift_start", "shift_end"]
-    ).copy()
-
-    gs["game_id"] = gs["game_id"].astype("int64")
-    gs["player_id"] = gs["player_id"].astype("int64")
-    gs["team_id"] = gs["team_id"].astype("int64")
-    gs["shift_start"] = gs["shift_start"].astype("int64")
-    gs["shift_end"] = gs["shift_end"].astype("int64")
-    gs = gs[gs["shift_end"] > gs["shift_start"]].copy()
-
     # -------------------------
     # GAME LOOP
     # -------------------------
@@ -332,8 +226,9 @@ def build_player_game_stats_for_season(
         game_ids = game_ids[:limit_games]
 
     # now filter gp/gs to exactly what we will process
-    gp = gp[gp["game_id"].isin(game_ids)].copy()
-    gs = gs[gs["game_id"].isin(game_ids)].copy()
+    if len(game_ids) < len(gp_ids | gs_ids):
+        gp = gp[gp["game_id"].isin(game_ids).to_numpy()]
+        gs = gs[gs["game_id"].isin(game_ids).to_numpy()]
 
     logger.info(
         "%s: gp games=%s gs games=%s processing_games=%s first_games=%s",
@@ -344,70 +239,26 @@ def build_player_game_stats_for_season(
         game_ids[:10],
     )
 
-    plays_by_game = dict(tuple(gp.groupby("game_id", sort=False)))
-    shifts_by_game = dict(tuple(gs.groupby("game_id", sort=False)))
-
-    out_rows: List[pd.DataFrame] = []
-
-    for game_id in game_ids:
-        gp_game = plays_by_game.get(game_id)
-        gs_game = shifts_by_game.get(game_id)
-        if gp_game is None or gs_game is None or gp_game.empty or gs_game.empty:
-            continue
-
-        # skaters only
-        gs_skaters = filter_goalies_modern(gs_game)
-
-        # TOI
-        toi_total = build_total_toi_for_game(gs_skaters)
-        toi_es = build_es_toi_for_game(gs_skaters)
-
-        # ES plays (exclude imbalanced segments)
-        df_ex = build_exclude_timeline_equal_strength(gs_skaters)
-        gp_es = apply_exclude_to_plays(gp_game, df_ex)
-
-        # CF/CA
-        df_corsi = toi_es[["game_id", "player_id", "team_id"]].drop_duplicates().copy()
-        df_corsi["cf"] = 0
-        df_corsi["ca"] = 0
-
-        for _, ev in gp_es.iterrows():
-            update_corsi_counts(df_corsi, ev, gs_skaters)
-
-        merged = df_corsi.merge(
-            toi_total, on=["game_id", "player_id", "team_id"], how="left"
-        ).merge(toi_es, on=["game_id", "player_id", "team_id"], how="left")
-
-        merged["cf60"] = np.where(
-            merged["toi_es_sec"] > 0,
-            merged["cf"] * 3600.0 / merged["toi_es_sec"],
-            np.nan,
-        )
-        merged["ca60"] = np.where(
-            merged["toi_es_sec"] > 0,
-            merged["ca"] * 3600.0 / merged["toi_es_sec"],
-            np.nan,
-        )
-        merged["cf_percent"] = np.where(
-            (merged["cf"] + merged["ca"]) > 0,
-            100.0 * merged["cf"] / (merged["cf"] + merged["ca"]),
-            np.nan,
-        )
-
-        merged["season"] = int(season)
-        out_rows.append(merged)
-
-    if not out_rows:
+    out = cached_run_sharded(
+        compute_player_game_stats,
+        {"gs": gs, "gp": gp},
+        cache=cache,
+        namespace="player_game_stats",
+        workers=workers,
+        game_ids=game_ids,
+    )
+    if out.empty:
         return pd.DataFrame()
 
-    out = pd.concat(out_rows, ignore_index=True)
+    out["season"] = int(season)
 
     # final dtypes
     out["game_id"] = out["game_id"].astype("int64")
     out["player_id"] = out["player_id"].astype("int64")
     out["team_id"] = out["team_id"].astype("int64")
-    out["cf"] = out["cf"].astype("int64")
-    out["ca"] = out["ca"].astype("int64")
+    for col in metric_columns(ALL_METRICS):
+        dtype = "float64" if col.startswith("xg") else "int64"
+        out[col] = out[col].fillna(0).astype(dtype)
     out["toi_total_sec"] = out["toi_total_sec"].fillna(0).astype("int64")
     out["toi_es_sec"] = out["toi_es_sec"].fillna(0).astype("int64")
 
@@ -416,6 +267,47 @@ def build_player_game_stats_for_season(
 
 def main() -> None:
     """Docstring for main."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Process-pool workers (games are sharded per worker); 1 = serial",
+    )
+    ap.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute every game (skip the per-game result cache)",
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="Read seasons from the local memory-mapped season store",
+    )
+    ap.add_argument(
+        "--store-no-verify",
+        action="store_true",
+        help="With --store, skip the source-hash check (no database round trip)",
+    )
+    ap.add_argument(
+        "--extract-cache",
+        action="store_true",
+        help="Serve season extracts from the local Parquet cache (extract_cache_utils)",
+    )
+    ap.add_argument(
+        "--extract-cache-no-verify",
+        action="store_true",
+        help="With --extract-cache, serve cached extracts without the fingerprint check",
+    )
+    args = ap.parse_args()
+    cache = None if args.no_cache else GameResultCache()
+    store = SeasonStore(verify=not args.store_no_verify) if args.store else None
+    extract_cache = (
+        ExtractCache(verify=not args.extract_cache_no_verify)
+        if args.extract_cache
+        else None
+    )
+
     os.makedirs(OUT_DIR, exist_ok=True)
 
     TEST_MODE = True
@@ -430,26 +322,22 @@ def main() -> None:
         if season_i == 20182019 and TEST_MODE:
             wanted = [8475640, 8478427, 8483678]
 
-            engine = get_db_engine()
-            try:
-                with engine.connect() as conn:
-                    games_df = pd.read_sql_query(
-                        text(
-                            """
-                            SELECT DISTINCT game_id
-                            FROM raw.raw_shifts_resolved
-                            WHERE season = :season
-                              AND session = 'R'
-                              AND player_id_resolved = ANY(:wanted)
-                            ORDER BY game_id
-                            LIMIT 25
-                            """
-                        ),
-                        conn,
-                        params={"season": season_i, "wanted": wanted},
-                    )
-            finally:
-                engine.dispose()
+            with get_db_engine().connect() as conn:
+                games_df = pd.read_sql_query(
+                    text(
+                        """
+                        SELECT DISTINCT game_id
+                        FROM raw.raw_shifts_resolved
+                        WHERE season = :season
+                          AND session = 'R'
+                          AND player_id_resolved = ANY(:wanted)
+                        ORDER BY game_id
+                        LIMIT 25
+                        """
+                    ),
+                    conn,
+                    params={"season": season_i, "wanted": wanted},
+                )
 
             game_ids_override = games_df["game_id"].astype(int).tolist()
             logger.info(
@@ -461,10 +349,19 @@ def main() -> None:
             df = build_player_game_stats_for_season(
                 season_i,
                 game_ids_override=game_ids_override,
+                workers=args.workers,
+                cache=cache,
+                store=store,
+                extract_cache=extract_cache,
             )
         else:
             df = build_player_game_stats_for_season(
-                season_i, limit_games=TEST_LIMIT_GAMES
+                season_i,
+                limit_games=TEST_LIMIT_GAMES,
+                workers=args.workers,
+                cache=cache,
+                store=store,
+                extract_cache=extract_cache,
             )
 
         # ---- Season-specific sanity check (only for 20182019) ----
@@ -12,17 +12,36 @@ Definition (skater-strength based):
 Metrics:
 - CF/CA: counted from play-by-play shot attempts (Shot, Missed Shot, Blocked Shot, Goal)
   that occur during included (non-excluded) time.
+- FF/FA, SF/SA, GF/GA, xGF/xGA (pred_goal): accumulated in the same on-ice pass.
+- adj_cf/adj_ca: CF/CA with every attempt weighted for the shooting team's score
+  state and venue (score_adjust_utils; shares estimated from the whole season as
+  of its last full build), summed in the same pass.
 - TOI (toi_sec): computed from player shifts with excluded-interval overlap removed.
-- Rates: cf60, ca60, and cf_percent derived from CF/CA and toi_sec.
+- Rates: cf60, ca60, and cf_percent derived from CF/CA and toi_sec; adj_cf60,
+  adj_ca60 and adj_cf_percent from the adjusted counts.
 
 Inputs:
 - derived.game_plays_{season}_from_raw_pbp
 - raw.raw_shifts_resolved
 - dim.dim_team_code
+- legacy seasons (20152016-20172018, --season or --include-legacy):
+  raw.game_plays, raw.game_shifts, raw.game_skater_stats, raw.game,
+  raw.player_info, adapted to the same arrays by season_data_utils
+  (no pred_goal, so xGF/xGA are 0)
 
 Output:
 - mart.player_game_es_{season} with:
-  (game_id, player_id, team_id, cf, ca, toi_sec, cf60, ca60, cf_percent)
+  (game_id, player_id, team_id, cf, ca, ff, fa, sf, sa, gf, ga, xgf, xga,
+   adj_cf, adj_ca, toi_sec, cf60, ca60, cf_percent, adj_cf60, adj_ca60,
+   adj_cf_percent)
+
+Incremental (nightly):
+- --incremental rebuilds only games that are new or whose source rows changed
+  and upserts them (per-game watermarks in mart.build_watermark; see
+  incremental_utils.py). Full builds reset the watermarks.
+- adj_* weights are frozen per season: full builds refresh the score/venue
+  counts (mart.score_venue_counts), incremental runs weight new games with the
+  stored counts. Run a full build to refresh the weights in-season.
 
 Author: Eric Winiecke (standardized build script)
 
@@ -37,353 +56,264 @@ import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.exc import ProgrammingError
 
-from constants import SCHEMA, SEASONS_MODERN
-from db_utils import get_db_engine
+from cache_utils import GameResultCache, cached_run_sharded
+from constants import SCHEMA, SEASONS_ALL, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine
+from extract_cache_utils import ExtractCache
+from game_store_utils import SeasonStore
+from incremental_utils import (
+    add_missing_columns,
+    plan_incremental,
+    record_full_build,
+    source_fingerprints,
+    upsert_games,
+)
 from log_utils import setup_logger
-from schema_utils import fq
+from on_ice_utils import ADJUSTED_METRICS, ALL_METRICS, attribute_on_ice, metric_columns
+from score_adjust_utils import (
+    WEIGHT_COLUMN,
+    add_score_venue_weight,
+    store_score_venue_counts,
+    stored_score_venue_counts,
+)
+from season_data_utils import (
+    load_score_venue_counts,
+    load_season_plays,
+    load_season_shifts,
+)
 from strength_utils import (
-    apply_exclude_to_plays,
-    build_exclude_timeline_equal_strength,
+    apply_segments_to_plays,
+    build_es_toi,
+    build_strength_segments,
     filter_goalies_modern,
 )
 
 logger = setup_logger()
 
+# on-ice counters written next to cf/ca (cf, ca, ff, fa, sf, sa, gf, ga, xgf, xga,
+# adj_cf, adj_ca)
+METRIC_COLUMNS = metric_columns(ALL_METRICS + ADJUSTED_METRICS)
+METRIC_DTYPES = {
+    c: "float64" if c.startswith(("xg", "adj_")) else "int64" for c in METRIC_COLUMNS
+}
+METRIC_SQL_TYPES = {
+    c: "double precision" if METRIC_DTYPES[c] == "float64" else "bigint"
+    for c in METRIC_COLUMNS
+}
+RATE_SQL_TYPES = {
+    c: "double precision" for c in ("adj_cf60", "adj_ca60", "adj_cf_percent")
+}
+STORE_VARIANT = "player_game_es"
+
+
+def load_season_inputs(
+    conn, season: int, game_ids=None, *, cache: ExtractCache | None = None
+) -> dict[str, pd.DataFrame]:
+    """Plays (gp) and skater shifts as stored (gs)."""
+    # compact dtypes, team ids + Corsi event labels resolved in SQL
+    return {
+        "gp": load_season_plays(conn, season, game_ids=game_ids, cache=cache),
+        "gs": load_season_shifts(
+            conn,
+            season,
+            game_ids=game_ids,
+            period_offset=False,
+            skaters_only=True,
+            resolved_only=False,
+            cache=cache,
+        ),
+    }
 
-def exclude_intervals(df_exclude: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
-    """Convert df_exclude rows into [start,end) intervals where exclude=True."""
-    if df_exclude.empty:
-        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
-
-    t = df_exclude["time"].to_numpy(dtype=np.int64)
-    # end boundary is next time; last row end doesn't matter much
-    t_next = np.r_[t[1:], t[-1]]
-    mask = df_exclude["exclude"].to_numpy(bool)
-
-    starts = t[mask]
-    ends = t_next[mask]
-    good = ends > starts
-    return starts[good], ends[good]
-
-
-def overlap_seconds(
-    interval_start: np.ndarray,
-    interval_end: np.ndarray,
-    ex_start: np.ndarray,
-    ex_end: np.ndarray,
-) -> np.ndarray:
-    """Overlap between many [interval_start, interval_end) and exclude intervals."""
-    out = np.zeros(len(interval_start), dtype=np.int64)
-    if len(ex_start) == 0:
-        return out
-
-    for i in range(len(ex_start)):
-        a = np.maximum(interval_start, ex_start[i])
-        b = np.minimum(interval_end, ex_end[i])
-        out += np.maximum(0, b - a)
-    return out
-
-
-def merge_intervals(
-    starts: np.ndarray, ends: np.ndarray
-) -> tuple[np.ndarray, np.ndarray]:
-    """Merge overlapping [start,end) intervals."""
-    if len(starts) == 0:
-        return starts, ends
-    order = np.argsort(starts)
-    s = starts[order]
-    e = ends[order]
-
-    out_s = [int(s[0])]
-    out_e = [int(e[0])]
-
-    for i in range(1, len(s)):
-        if s[i] <= out_e[-1]:  # overlap/touch
-            out_e[-1] = max(out_e[-1], int(e[i]))
-        else:
-            out_s.append(int(s[i]))
-            out_e.append(int(e[i]))
 
-    return np.array(out_s, dtype=np.int64), np.array(out_e, dtype=np.int64)
+def add_adjusted_rates(df: pd.DataFrame) -> pd.DataFrame:
+    """Set adj_cf60, adj_ca60 and adj_cf_percent from adj_cf / adj_ca and toi_sec."""
+    toi = df["toi_sec"]
+    df["adj_cf60"] = np.where(toi > 0, df["adj_cf"] * 3600.0 / toi, np.nan)
+    df["adj_ca60"] = np.where(toi > 0, df["adj_ca"] * 3600.0 / toi, np.nan)
+    total = df["adj_cf"] + df["adj_ca"]
+    df["adj_cf_percent"] = np.where(total > 0, 100.0 * df["adj_cf"] / total, 0.0)
+    return df
 
 
-def build_es_toi_for_game(gs_game: pd.DataFrame) -> pd.DataFrame:
+def build_es_toi_for_game(
+    gs_game: pd.DataFrame, segments: pd.DataFrame | None = None
+) -> pd.DataFrame:
     """
     Docstring for build_es_toi_for_game.
 
     :param gs_game: Description
     :type gs_game: pd.DataFrame
+    :param segments: this game's rows of the season strength-segment table
+        (built from gs_game when not given)
+    :type segments: pd.DataFrame | None
     :return: Description
     :rtype: DataFrame
     """
     gs_game = filter_goalies_modern(gs_game)
 
-    df_ex = build_exclude_timeline_equal_strength(gs_game)
-    ex_s, ex_e = exclude_intervals(df_ex)
-
-    gs_game = gs_game.copy()
-    gs_game["shift_start"] = gs_game["shift_start"].astype(np.int64)
-    gs_game["shift_end"] = gs_game["shift_end"].astype(np.int64)
-
-    rows = []
-    for (gid, pid, tid), grp in gs_game.groupby(
-        ["game_id", "player_id", "team_id"], sort=False
-    ):
-        s = grp["shift_start"].to_numpy(np.int64)
-        e = grp["shift_end"].to_numpy(np.int64)
-
-        # merge overlaps first
-        ms, me = merge_intervals(s, e)
-
-        dur = np.maximum(0, me - ms)
-        ov = overlap_seconds(ms, me, ex_s, ex_e)
-        es = dur - ov
-        es[es < 0] = 0
-
-        rows.append((gid, pid, tid, int(es.sum())))
-
-    return pd.DataFrame(rows, columns=["game_id", "player_id", "team_id", "toi_sec"])
-
-
-def update_corsi_counts(
-    df_corsi: pd.DataFrame, event: pd.Series, game_shifts: pd.DataFrame
-) -> None:
-    """Mutates df_corsi cf/ca in-place for one event."""
-    time = int(event["time"])
-    team_for = int(event["team_id_for"])
-    team_against = int(event["team_id_against"])
-
-    on_ice = game_shifts[
-        (game_shifts["shift_start"] <= time) & (game_shifts["shift_end"] > time)
-    ]
-    players_for = on_ice.loc[on_ice["team_id"] == team_for, "player_id"].to_numpy()
-    players_against = on_ice.loc[
-        on_ice["team_id"] == team_against, "player_id"
-    ].to_numpy()
-
-    ev = event["event"]
-    if ev in ("Shot", "Goal", "Missed Shot"):
-        # CF for the "for" team skaters on ice
-        df_corsi.loc[
-            (df_corsi["team_id"] == team_for)
-            & (df_corsi["player_id"].isin(players_for)),
-            "cf",
-        ] += 1
-        # CA for the "against" team skaters on ice
-        df_corsi.loc[
-            (df_corsi["team_id"] == team_against)
-            & (df_corsi["player_id"].isin(players_against)),
-            "ca",
-        ] += 1
-
-    elif ev == "Blocked Shot":
-        # blocked shot: attribution is reversed vs shot
-        df_corsi.loc[
-            (df_corsi["team_id"] == team_for)
-            & (df_corsi["player_id"].isin(players_for)),
-            "ca",
-        ] += 1
-        df_corsi.loc[
-            (df_corsi["team_id"] == team_against)
-            & (df_corsi["player_id"].isin(players_against)),
-            "cf",
-        ] += 1
-
-
-def build_player_game_es_for_season(season: int) -> pd.DataFrame:
-    """Compute ES player-game stats for a season and return a dataframe."""
-    engine = get_db_engine()
-
-    plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
-    shifts_resolved = fq("raw", "raw_shifts_resolved")
-    dim_team_code = fq("dim", "dim_team_code")
+    if segments is None:
+        segments = build_strength_segments(gs_game)
 
-    gp = pd.read_sql(f"SELECT * FROM {plays_view}", engine)
+    # a player's overlapping/touching shifts are merged before removing excluded time
+    toi = build_es_toi(gs_game, segments, merge_shifts=True)
+    return toi.rename(columns={"toi_es_sec": "toi_sec"})
 
-    # ---- PATCH: normalize play time + event columns + team ids ----
 
-    # time column
-    if "time" not in gp.columns:
-        if "game_seconds" in gp.columns:
-            gp = gp.rename(columns={"game_seconds": "time"})
-        else:
-            raise KeyError(f"{plays_view} missing time/game_seconds")
-
-    # event column
-    if "event" not in gp.columns and "event_type" in gp.columns:
-        gp = gp.rename(columns={"event_type": "event"})
-
-    # normalize event labels to match your later logic
-    event_map = {
-        "SHOT": "Shot",
-        "GOAL": "Goal",
-        "MISS": "Missed Shot",
-        "BLOCK": "Blocked Shot",
-    }
-    gp["event"] = gp["event"].map(event_map)
-
-    # keep only corsi events early (prevents weird rows later)
-    gp = gp.dropna(subset=["time", "event"]).copy()
-    print("Corsi events present:", sorted(gp["event"].unique()))
-
-    # map team codes -> team_id using dim_team_code
-    team_map = pd.read_sql("SELECT team_code, team_id FROM dim.dim_team_code", engine)
-
-    gp = gp.merge(
-        team_map.rename(columns={"team_code": "home_team", "team_id": "home_team_id"}),
-        on="home_team",
-        how="left",
-    )
-    gp = gp.merge(
-        team_map.rename(columns={"team_code": "away_team", "team_id": "away_team_id"}),
-        on="away_team",
-        how="left",
-    )
-    gp = gp.merge(
-        team_map.rename(
-            columns={"team_code": "event_team", "team_id": "event_team_id"}
-        ),
-        on="event_team",
-        how="left",
+def build_player_game_es_for_season(
+    season: int,
+    *,
+    workers: int = 1,
+    game_ids: list[int] | None = None,
+    cache: GameResultCache | None = None,
+    store: SeasonStore | None = None,
+    extract_cache: ExtractCache | None = None,
+    score_counts: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """
+    Compute ES player-game stats for a season and return a dataframe.
+
+    workers > 1 shards the season by game_id across a process pool.
+    game_ids limits the plays/shifts loads to those games (incremental runs).
+    cache serves unchanged games from the per-game result cache (see cache_utils).
+    store reads the season from its memory-mapped bundle (see game_store_utils);
+    game_ids then slices the stored season.
+    extract_cache serves the plays / shifts extracts from local Parquet while
+    their source tables are unchanged (see extract_cache_utils).
+    score_counts are the season's score/venue counts for adj_cf / adj_ca
+    (score_adjust_utils); without them the adjusted columns are not produced.
+    """
+    engine = get_db_engine()
+    if store is not None:
+        bundle = store.load(engine, season, STORE_VARIANT, load_season_inputs)
+        gp, gs = bundle.frame("gp"), bundle.frame("gs")
+        if game_ids is not None:
+            gp = gp[gp["game_id"].isin(game_ids).to_numpy()]
+            gs = gs[gs["game_id"].isin(game_ids).to_numpy()]
+    elif extract_cache is not None:
+        frames = load_season_inputs(engine, season, game_ids, cache=extract_cache)
+        gp, gs = frames["gp"], frames["gs"]
+    else:
+        with engine.connect() as conn:
+            frames = load_season_inputs(conn, season, game_ids)
+        gp, gs = frames["gp"], frames["gs"]
+
+    if score_counts is not None:
+        gp = add_score_venue_weight(gp, score_counts)
+
+    logger.info(
+        "%s: loaded %s Corsi plays (%s), %s skater shift rows",
+        season,
+        len(gp),
+        ", ".join(sorted(gp["event"].dropna().unique())),
+        len(gs),
     )
 
-    # derive for/against ids
-    gp["team_id_for"] = gp["event_team_id"]
-    gp["team_id_against"] = np.where(
-        gp["event_team_id"] == gp["home_team_id"],
-        gp["away_team_id"],
-        gp["home_team_id"],
-    )
+    n_goalie = (gs["position"] == "G").sum()
+    if n_goalie:
+        logger.warning("Found %s goalie shift rows in gs (should be 0).", int(n_goalie))
 
-    print(
-        f"[{season}] missing team ids:",
-        gp["team_id_for"].isna().sum(),
-        gp["team_id_against"].isna().sum(),
-    )
-    # final cleanup: require both team ids
-    gp = gp.dropna(subset=["team_id_for", "team_id_against"]).copy()
-    gp["team_id_for"] = gp["team_id_for"].astype("int64")
-    gp["team_id_against"] = gp["team_id_against"].astype("int64")
-    gp["time"] = pd.to_numeric(gp["time"], errors="coerce").astype("int64")
-
-    # --------------------------------------------------------------
-
-    gs = pd.read_sql(
-        f"""
-        SELECT
-        rs.game_id,
-        rs.player_id_resolved AS player_id,
-        dt.team_id,
-        rs.position,
-        rs.game_period AS period,
-        rs.seconds_start AS shift_start,
-        rs.seconds_end   AS shift_end
-        FROM {shifts_resolved} rs
-        JOIN {dim_team_code} dt
-        ON dt.team_code = rs.team
-        WHERE rs.season = {int(season)}
-        AND rs.session = 'R'
-        AND rs.position <> 'G'
-        AND rs.seconds_end > rs.seconds_start
-        """,
-        engine,
+    gs = gs.drop(columns="period")
+    out = cached_run_sharded(
+        compute_player_game_es,
+        {"gs": gs, "gp": gp},
+        cache=cache,
+        namespace="player_game_es",
+        workers=workers,
+        season=season,
     )
+    if out.empty:
+        return out
 
-    engine.dispose()
-
-    out_rows: list[pd.DataFrame] = []
+    # compact input dtypes -> bigint keys in the mart table
+    for col in ("game_id", "player_id", "team_id"):
+        out[col] = out[col].astype("int64")
+    return out
 
-    print(sorted(gp["event"].dropna().unique())[:50])
 
-    n_goalie = (gs["position"] == "G").sum()
-    if n_goalie:
-        logger.warning("Found %s goalie shift rows in gs (should be 0).", int(n_goalie))
+def compute_player_game_es(
+    gs: pd.DataFrame, gp: pd.DataFrame, *, season: int
+) -> pd.DataFrame:
+    """
+    ES player-game stats for any set of games (a season or one worker shard).
 
-    for game_id, gp_game in gp.groupby("game_id", sort=False):
-        gs_game = gs[gs["game_id"] == game_id]
-        if gp_game.empty or gs_game.empty:
-            continue
+    :param gs: skater shifts (game_id, player_id, team_id, position, shift_start, shift_end)
+    :param gp: plays with team_id_for / team_id_against already resolved; adj_cf /
+        adj_ca are only produced when it carries score_venue_weight
+    :param season: only used in log / error messages
+    """
+    metrics = ALL_METRICS + (ADJUSTED_METRICS if WEIGHT_COLUMN in gp else ())
 
-        # Ensure plays have numeric time and are corsi-relevant
-        gp_game = gp_game.copy()
-        gp_game["time"] = pd.to_numeric(gp_game["time"], errors="coerce").astype(
-            "Int64"
-        )
-        gp_game = gp_game.dropna(subset=["time"])
-        gp_game["time"] = gp_game["time"].astype("int64")
-        gp_game = gp_game[
-            gp_game["event"].isin(["Shot", "Goal", "Missed Shot", "Blocked Shot"])
-        ].dropna(subset=["team_id_for", "team_id_against"])
+    # ✅ filter goalies once; use same skater shifts for TOI + CF/CA
+    gs = filter_goalies_modern(gs)
+    gs["shift_start"] = gs["shift_start"].astype(int)
+    gs["shift_end"] = gs["shift_end"].astype(int)
 
-        if gp_game.empty:
-            continue
+    # only games that have both corsi plays and skater shifts
+    gp = gp[gp["event"].isin(["Shot", "Goal", "Missed Shot", "Blocked Shot"])]
+    game_ids = set(gp["game_id"].unique()) & set(gs["game_id"].unique())
+    if not game_ids:
+        return pd.DataFrame()
+    gp = gp[gp["game_id"].isin(game_ids)]
+    gs = gs[gs["game_id"].isin(game_ids)]
 
-        # ✅ filter goalies once; use same gs_game for TOI + CF/CA
-        gs_game = filter_goalies_modern(gs_game)
-        gs_game["shift_start"] = gs_game["shift_start"].astype(int)
-        gs_game["shift_end"] = gs_game["shift_end"].astype(int)
-
-        # sanity: shifts should be within a single game's clock
-        if gs_game["shift_end"].max() > 3900:
-            logger.warning(
-                "game_id=%s shift_end max looks high: %s",
-                game_id,
-                int(gs_game["shift_end"].max()),
-            )
-        # TOI ES
-        toi_game = build_es_toi_for_game(gs_game)
+    # sanity: shifts should be within a single game's clock
+    max_end = gs.groupby("game_id")["shift_end"].max()
+    for game_id, v in max_end[max_end > 3900].items():
+        logger.warning("game_id=%s shift_end max looks high: %s", game_id, int(v))
 
-        keys = ["game_id", "player_id", "team_id"]
-        if toi_game.duplicated(keys).any():
-            bad = toi_game[toi_game.duplicated(keys, keep=False)].sort_values(keys)
-            logger.error("DUPES in toi_game for game_id=%s:\n%s", game_id, bad.head(50))
-            raise RuntimeError(f"TOI dupes in game_id={game_id}")
-
-        max_toi = int(toi_game["toi_sec"].max()) if not toi_game.empty else 0
-        if max_toi > 3900:
-            logger.warning(
-                "game_id=%s max player toi_sec=%s (>3900) after merge", game_id, max_toi
-            )
+    # strength segments once per season (shared by ES TOI + ES plays)
+    segments = build_strength_segments(gs)
 
-        df_corsi = (
-            toi_game[["game_id", "player_id", "team_id"]].drop_duplicates().copy()
-        )
-        df_corsi["cf"] = 0
-        df_corsi["ca"] = 0
-
-        df_ex = build_exclude_timeline_equal_strength(gs_game)
-        gp_game_es = apply_exclude_to_plays(gp_game, df_ex)
+    # TOI ES (whole season at once)
+    toi = build_es_toi(gs, segments, merge_shifts=True).rename(
+        columns={"toi_es_sec": "toi_sec"}
+    )
 
-        for _, ev in gp_game_es.iterrows():
-            update_corsi_counts(df_corsi, ev, gs_game)
+    keys = ["game_id", "player_id", "team_id"]
+    if toi.duplicated(keys).any():
+        bad = toi[toi.duplicated(keys, keep=False)].sort_values(keys)
+        logger.error("DUPES in toi for season=%s:\n%s", season, bad.head(50))
+        raise RuntimeError(f"TOI dupes in season={season}")
 
-        merged = df_corsi.merge(
-            toi_game, on=["game_id", "player_id", "team_id"], how="left"
+    max_toi = toi.groupby("game_id")["toi_sec"].max()
+    for game_id, v in max_toi[max_toi > 3900].items():
+        logger.warning(
+            "game_id=%s max player toi_sec=%s (>3900) after merge", game_id, int(v)
         )
 
-        merged["cf60"] = np.where(
-            merged["toi_sec"] > 0, merged["cf"] * 3600.0 / merged["toi_sec"], np.nan
-        )
-        merged["ca60"] = np.where(
-            merged["toi_sec"] > 0, merged["ca"] * 3600.0 / merged["toi_sec"], np.nan
-        )
-        merged["cf_percent"] = np.where(
-            (merged["cf"] + merged["ca"]) > 0,
-            100.0 * merged["cf"] / (merged["cf"] + merged["ca"]),
-            0.0,
-        )
-        keys = ["game_id", "player_id", "team_id"]
-        if merged.duplicated(keys).any():
-            bad = merged[merged.duplicated(keys, keep=False)].sort_values(keys)
-            logger.error("DUPES in merged for game_id=%s:\n%s", game_id, bad.head(50))
-            raise RuntimeError(f"ES merged dupes in game_id={game_id}")
+    # ES plays (exclude imbalanced segments)
+    gp_es = apply_segments_to_plays(gp, segments)
 
-        out_rows.append(merged)
+    # CF/CA (+ FF/SF/GF/xGF) in one pass (on ice: shift_start <= t < shift_end)
+    df_corsi = attribute_on_ice(
+        gs,
+        gp_es,
+        metrics=metrics,
+        end_inclusive=False,
+        match_team=True,
+    )
 
-    if not out_rows:
-        return pd.DataFrame()
+    merged = df_corsi.merge(toi, on=["game_id", "player_id", "team_id"], how="right")
 
-    return pd.concat(out_rows, ignore_index=True)
+    merged["cf60"] = np.where(
+        merged["toi_sec"] > 0, merged["cf"] * 3600.0 / merged["toi_sec"], np.nan
+    )
+    merged["ca60"] = np.where(
+        merged["toi_sec"] > 0, merged["ca"] * 3600.0 / merged["toi_sec"], np.nan
+    )
+    merged["cf_percent"] = np.where(
+        (merged["cf"] + merged["ca"]) > 0,
+        100.0 * merged["cf"] / (merged["cf"] + merged["ca"]),
+        0.0,
+    )
+    if "adj_cf" in merged:
+        add_adjusted_rates(merged)
+    if merged.duplicated(keys).any():
+        bad = merged[merged.duplicated(keys, keep=False)].sort_values(keys)
+        logger.error("DUPES in merged for season=%s:\n%s", season, bad.head(50))
+        raise RuntimeError(f"ES merged dupes in season={season}")
+
+    return merged
 
 
 def main() -> None:
@@ -393,36 +323,127 @@ def main() -> None:
     ap.add_argument(
         "--season", type=int, default=None, help="Run one season, e.g. 20182019"
     )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Process-pool workers (games are sharded per worker); 1 = serial",
+    )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rebuild games that are new or whose source rows changed (upsert)",
+    )
+    ap.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute every game (skip the per-game result cache)",
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="Read seasons from the local memory-mapped season store",
+    )
+    ap.add_argument(
+        "--store-no-verify",
+        action="store_true",
+        help="With --store, skip the source-hash check (no database round trip)",
+    )
+    ap.add_argument(
+        "--extract-cache",
+        action="store_true",
+        help="Serve season extracts from the local Parquet cache (extract_cache_utils)",
+    )
+    ap.add_argument(
+        "--extract-cache-no-verify",
+        action="store_true",
+        help="With --extract-cache, serve cached extracts without the fingerprint check",
+    )
+    ap.add_argument(
+        "--include-legacy",
+        action="store_true",
+        help="Without --season, also run the legacy seasons (SEASONS_ALL)",
+    )
     args = ap.parse_args()
+    cache = None if args.no_cache else GameResultCache()
+    store = SeasonStore(verify=not args.store_no_verify) if args.store else None
+    extract_cache = (
+        ExtractCache(verify=not args.extract_cache_no_verify)
+        if args.extract_cache
+        else None
+    )
 
     # choose seasons to run
+    all_seasons = SEASONS_ALL if args.include_legacy else SEASONS_MODERN
     seasons = (
-        [args.season] if args.season is not None else [int(s) for s in SEASONS_MODERN]
+        [args.season] if args.season is not None else [int(s) for s in all_seasons]
     )
 
     engine = get_db_engine()
 
     # for season in SEASONS_MODERN:
     for season in seasons:
-        df = build_player_game_es_for_season(int(season))
+        out_table = f"player_game_es_{season}"
+        schema = SCHEMA["mart"]
+
+        # older tables predate the ff/sf/gf/xg columns; those need a full rebuild
+        added = add_missing_columns(
+            engine, schema, out_table, {**METRIC_SQL_TYPES, **RATE_SQL_TYPES}
+        )
+
+        plan = None
+        if args.incremental and not added:
+            plan = plan_incremental(engine, int(season), schema, out_table)
+            if plan.empty:
+                print(f"✅ {season}: {schema}.{out_table} is up to date")
+                continue
+
+        # full builds fingerprint their sources before loading them
+        fingerprints = (
+            source_fingerprints(engine, int(season)) if plan is None else None
+        )
+
+        # adj_* weights: full builds refresh the season's score/venue counts,
+        # incremental runs reuse the counts frozen by the last full build, so new
+        # games never reweight (and force rebuilding) earlier ones
+        score_counts = (
+            None if plan is None else stored_score_venue_counts(engine, int(season))
+        )
+        refresh_counts = score_counts is None
+        if refresh_counts:
+            score_counts = load_score_venue_counts(
+                engine, int(season), cache=extract_cache
+            )
+
+        if plan is not None and not plan.rebuild:
+            df = pd.DataFrame()
+        else:
+            df = build_player_game_es_for_season(
+                int(season),
+                workers=args.workers,
+                game_ids=None if plan is None else plan.rebuild,
+                cache=cache,
+                store=store,
+                extract_cache=extract_cache,
+                score_counts=score_counts,
+            )
         if df.empty:
             print(f"⚠️ {season}: no rows produced")
+            if plan is not None:
+                upsert_games(engine, schema, out_table, df, plan)
             continue
 
-        out_table = f"player_game_es_{season}"
-        schema = SCHEMA["mart"]
-
         df = df[
             [
                 "game_id",
                 "player_id",
                 "team_id",
-                "cf",
-                "ca",
+                *METRIC_COLUMNS,
                 "toi_sec",
                 "cf60",
                 "ca60",
                 "cf_percent",
+                *RATE_SQL_TYPES,
             ]
         ].copy()
 
@@ -430,8 +451,8 @@ def main() -> None:
         df["game_id"] = df["game_id"].astype("int64")
         df["player_id"] = df["player_id"].astype("int64")
         df["team_id"] = df["team_id"].astype("int64")
-        df["cf"] = df["cf"].astype("int64")
-        df["ca"] = df["ca"].astype("int64")
+        for col in METRIC_COLUMNS:
+            df[col] = df[col].astype(METRIC_DTYPES[col])
         df["toi_sec"] = df["toi_sec"].astype("int64")
 
         # --- HARD GUARDRail: enforce unique key ---
@@ -442,7 +463,7 @@ def main() -> None:
             raise RuntimeError(f"ES df has dupes for season={season}")
 
         df = df.groupby(keys, as_index=False).agg(
-            {"cf": "sum", "ca": "sum", "toi_sec": "sum"}
+            {**{col: "sum" for col in METRIC_COLUMNS}, "toi_sec": "sum"}
         )
 
         # recompute rate columns after aggregation
@@ -470,7 +491,14 @@ def main() -> None:
             0.0,
         )
 
-        df[["cf", "ca", "toi_sec"]] = df[["cf", "ca", "toi_sec"]].fillna(0)
+        df[[*METRIC_COLUMNS, "toi_sec"]] = df[[*METRIC_COLUMNS, "toi_sec"]].fillna(0)
+        add_adjusted_rates(df)
+
+        if plan is not None:
+            upsert_games(engine, schema, out_table, df, plan)
+            if refresh_counts:
+                store_score_venue_counts(engine, int(season), score_counts)
+            continue
 
         with engine.begin() as conn:
             mode = "replace"
@@ -490,8 +518,10 @@ def main() -> None:
         )
 
         print(f"✅ wrote {len(df)} rows -> {schema}.{out_table}")
+        record_full_build(engine, schema, out_table, fingerprints)
+        store_score_venue_counts(engine, int(season), score_counts)
 
-    engine.dispose()
+    dispose_engines()
 
 
 if __name__ == "__main__":
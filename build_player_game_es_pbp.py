@@ -0,0 +1,206 @@
+"""
+Build mart.player_game_es_pbp_{season} from PBP on-ice columns (no shift join).
+
+Alternate, cheaper ES CF/CA engine (see pbp_on_ice_utils.py):
+- on-ice skaters come from raw.raw_pbp_{season} home_on_1..7 / away_on_1..7
+- ES rule matches build_player_game_es.py (exclude imbalanced skater counts)
+- on-ice names are mapped to player_id through the game's resolved shifts
+
+With --reconcile the result is compared with the shift-based
+mart.player_game_es_{season}; mismatched rows and a per-game summary are written
+to reconciliation/ and a season summary is logged.
+
+Usage:
+  python build_player_game_es_pbp.py --season 20242025
+  python build_player_game_es_pbp.py --season 20242025 --reconcile --no-write
+
+Output:
+- mart.player_game_es_pbp_{season} with (game_id, player_id, team_id, cf, ca)
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from constants import SCHEMA, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine, read_frame
+from log_utils import setup_logger
+from pbp_on_ice_utils import (
+    PBP_COLUMNS,
+    PBP_CORSI_EVENTS,
+    attribute_corsi_from_pbp,
+    reconcile_on_ice,
+)
+from schema_utils import fq
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+RECON_DIR = "reconciliation"
+
+
+def load_pbp_inputs(engine, season: int) -> dict[str, pd.DataFrame]:
+    """Load PBP Corsi events, the name -> player_id map and team codes for a season."""
+    raw_pbp = fq("raw", f"raw_pbp_{season}")
+    shifts_resolved = fq("raw", "raw_shifts_resolved")
+    dim_team_code = fq("dim", "dim_team_code")
+
+    with engine.connect() as conn:
+        pbp = read_frame(
+            conn,
+            text(
+                f"""
+                SELECT {", ".join(PBP_COLUMNS)}
+                FROM {raw_pbp}
+                WHERE season = :season
+                  AND session = 'R'
+                  AND event_type = ANY(:events)
+                """
+            ),
+            {"season": int(season), "events": list(PBP_CORSI_EVENTS)},
+        )
+        name_map = read_frame(
+            conn,
+            text(
+                f"""
+                SELECT DISTINCT
+                  rs.game_id::bigint AS game_id,
+                  rs.team AS team_code,
+                  rs.player AS player_name,
+                  rs.player_id_resolved::bigint AS player_id
+                FROM {shifts_resolved} rs
+                WHERE rs.season = :season
+                  AND rs.session = 'R'
+                  AND rs.player_id_resolved IS NOT NULL
+                """
+            ),
+            {"season": int(season)},
+        )
+        team_map = read_frame(conn, f"SELECT team_code, team_id FROM {dim_team_code}")
+
+    return {"pbp": pbp, "name_map": name_map, "team_map": team_map}
+
+
+def build_player_game_es_pbp_for_season(
+    season: int, engine=None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return (ES CF/CA per player-game, unmapped on-ice names) for a season."""
+    engine = engine or get_db_engine()
+    inputs = load_pbp_inputs(engine, season)
+
+    df, unmapped = attribute_corsi_from_pbp(
+        inputs["pbp"], inputs["name_map"], inputs["team_map"]
+    )
+    if not unmapped.empty:
+        logger.warning(
+            "%s: %s on-ice names without a resolved player_id (cf=%s ca=%s)",
+            season,
+            len(unmapped),
+            int(unmapped["cf"].sum()),
+            int(unmapped["ca"].sum()),
+        )
+    return df, unmapped
+
+
+def reconcile_season(engine, season: int, pbp_df: pd.DataFrame) -> pd.DataFrame:
+    """Compare pbp_df with mart.player_game_es_{season}; write CSVs; return summary."""
+    es_table = fq("mart", f"player_game_es_{season}")
+    shift_df = read_frame(
+        engine, f"SELECT game_id, player_id, team_id, cf, ca FROM {es_table}"
+    )
+    detail, summary = reconcile_on_ice(shift_df, pbp_df)
+
+    os.makedirs(RECON_DIR, exist_ok=True)
+    detail.to_csv(os.path.join(RECON_DIR, f"es_pbp_vs_shifts_{season}.csv"), index=False)
+    summary.to_csv(
+        os.path.join(RECON_DIR, f"es_pbp_vs_shifts_{season}_games.csv"), index=False
+    )
+
+    rows = int(summary["rows"].sum())
+    bad = int(summary["rows_mismatched"].sum())
+    logger.info(
+        "%s: reconcile rows=%s mismatched=%s (%.2f%%) games_with_diffs=%s/%s "
+        "cf shift=%s pbp=%s | ca shift=%s pbp=%s",
+        season,
+        rows,
+        bad,
+        100.0 * bad / rows if rows else 0.0,
+        int((summary["rows_mismatched"] > 0).sum()),
+        len(summary),
+        int(summary["cf_shift"].sum()),
+        int(summary["cf_pbp"].sum()),
+        int(summary["ca_shift"].sum()),
+        int(summary["ca_pbp"].sum()),
+    )
+    return summary
+
+
+def write_table(engine, season: int, df: pd.DataFrame) -> None:
+    """TRUNCATE + append into mart.player_game_es_pbp_{season} (create if missing)."""
+    schema = SCHEMA["mart"]
+    out_table = f"player_game_es_pbp_{season}"
+
+    with engine.begin() as conn:
+        mode = "replace"
+        try:
+            conn.execute(text(f'TRUNCATE TABLE "{schema}"."{out_table}"'))
+            mode = "append"
+        except ProgrammingError:
+            pass
+
+    df.to_sql(
+        out_table,
+        engine,
+        schema=schema,
+        if_exists=mode,
+        index=False,
+        method="multi",
+    )
+    logger.info("✅ wrote %s rows -> %s.%s", len(df), schema, out_table)
+
+
+def main() -> None:
+    """Build mart.player_game_es_pbp_{season} for one or all modern seasons."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    ap.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="Compare with mart.player_game_es_{season} and write reconciliation/",
+    )
+    ap.add_argument(
+        "--no-write", action="store_true", help="Skip writing the mart table"
+    )
+    args = ap.parse_args()
+
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in SEASONS_MODERN]
+    )
+
+    engine = get_db_engine()
+    try:
+        for season in seasons:
+            df, _ = build_player_game_es_pbp_for_season(int(season), engine)
+            if df.empty:
+                logger.warning("⚠️ %s: no rows produced", season)
+                continue
+            if not args.no_write:
+                write_table(engine, int(season), df)
+            if args.reconcile:
+                reconcile_season(engine, int(season), df)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
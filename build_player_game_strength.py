@@ -0,0 +1,273 @@
+"""
+Build mart.player_game_strength_{season}: TOI and on-ice counts per strength state.
+
+build_player_game_es keeps only even-strength time (the segments that
+build_strength_segments does not exclude). This builder labels every strength
+segment from each team's view and splits TOI and CF/CA (+ FF/SF/GF/xG) per state
+in the same passes, producing a long table:
+
+  strength_state   5v5, 4v4, 3v3   equal skater counts
+                   PP / PK         more / fewer skaters (up to 6)
+                   EN              unequal counts with 6 skaters on either side
+                                   (goalie pulled)
+                   other           anything else (6v6, 2v2, odd data)
+
+The ES states (5v5 + 4v4 + 3v3 + other) add up to mart.player_game_es_{season}.
+
+Same inputs and on-ice rules as build_player_game_es: skater shifts (merged per
+player), shift_start <= t < shift_end, counts on the (player_id, team_id) on ice.
+
+Output:
+- mart.player_game_strength_{season} with:
+  (game_id, player_id, team_id, strength_state, toi_sec, cf, ca, ff, fa, sf, sa,
+   gf, ga, xgf, xga, cf60, ca60, cf_percent)
+
+Usage:
+  python build_player_game_strength.py --season 20242025 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from build_player_game_es import STORE_VARIANT, load_season_inputs
+from cache_utils import GameResultCache, cached_run_sharded
+from constants import SCHEMA, SEASONS_ALL, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine
+from game_store_utils import SeasonStore
+from log_utils import setup_logger
+from on_ice_utils import (
+    ALL_METRICS,
+    KEYS,
+    ON_ICE_METRICS,
+    attribute_on_ice_by_group,
+    metric_columns,
+)
+from strength_utils import (
+    STRENGTH_STATES,
+    build_strength_segments,
+    build_strength_toi,
+    filter_goalies_modern,
+    play_strength_states,
+)
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+METRIC_COLUMNS = metric_columns(ALL_METRICS)
+STRENGTH_COLUMNS = [
+    *KEYS,
+    "strength_state",
+    "toi_sec",
+    *METRIC_COLUMNS,
+    "cf60",
+    "ca60",
+    "cf_percent",
+]
+
+
+def compute_player_game_strength(
+    gs: pd.DataFrame, gp: pd.DataFrame, *, season: int
+) -> pd.DataFrame:
+    """
+    Strength-split player-game TOI and on-ice counts for any set of games.
+
+    :param gs: skater shifts (game_id, player_id, team_id, position, shift_start,
+        shift_end)
+    :param gp: plays with team_id_for / team_id_against already resolved
+    :param season: only used in log messages
+    """
+    gs = filter_goalies_modern(gs)
+    gp = gp[gp["event"].isin(ON_ICE_METRICS["c"][0])]
+    game_ids = set(gp["game_id"].unique()) & set(gs["game_id"].unique())
+    if not game_ids:
+        return pd.DataFrame(columns=STRENGTH_COLUMNS)
+    gp = gp[gp["game_id"].isin(game_ids)]
+    gs = gs[gs["game_id"].isin(game_ids)]
+
+    # one segment table: state TOI + per-play states
+    segments = build_strength_segments(gs)
+    toi = build_strength_toi(gs, segments, merge_shifts=True)
+
+    counts = attribute_on_ice_by_group(
+        gs,
+        gp,
+        play_strength_states(gp, segments),
+        len(STRENGTH_STATES),
+        metrics=ALL_METRICS,
+        end_inclusive=False,
+        match_team=True,
+    )
+    counts = counts[(counts[METRIC_COLUMNS] != 0).any(axis=1)]
+    counts = counts.assign(
+        strength_state=pd.Categorical.from_codes(
+            counts["group"].to_numpy(np.int8), categories=STRENGTH_STATES
+        )
+    ).drop(columns="group")
+
+    keys = KEYS + ["strength_state"]
+    out = toi.merge(counts, on=keys, how="outer")
+    for col in ["toi_sec", *METRIC_COLUMNS]:
+        dtype = "float64" if col.startswith("xg") else "int64"
+        out[col] = out[col].fillna(0).astype(dtype)
+
+    out["cf60"] = np.where(
+        out["toi_sec"] > 0, out["cf"] * 3600.0 / out["toi_sec"], np.nan
+    )
+    out["ca60"] = np.where(
+        out["toi_sec"] > 0, out["ca"] * 3600.0 / out["toi_sec"], np.nan
+    )
+    out["cf_percent"] = np.where(
+        (out["cf"] + out["ca"]) > 0,
+        100.0 * out["cf"] / (out["cf"] + out["ca"]),
+        0.0,
+    )
+    logger.info("%s: %s strength rows for %s games", season, len(out), len(game_ids))
+    return out[STRENGTH_COLUMNS]
+
+
+def build_player_game_strength_for_season(
+    season: int,
+    *,
+    workers: int = 1,
+    cache: GameResultCache | None = None,
+    store: SeasonStore | None = None,
+) -> pd.DataFrame:
+    """
+    Compute the strength-split player-game table for one season.
+
+    Inputs are build_player_game_es's (load_season_inputs; store shares its
+    season bundle). workers / cache as in build_player_game_es.
+    """
+    engine = get_db_engine()
+    if store is not None:
+        bundle = store.load(engine, season, STORE_VARIANT, load_season_inputs)
+        gp, gs = bundle.frame("gp"), bundle.frame("gs")
+    else:
+        with engine.connect() as conn:
+            frames = load_season_inputs(conn, season)
+        gp, gs = frames["gp"], frames["gs"]
+
+    logger.info(
+        "%s: loaded %s Corsi plays, %s skater shift rows", season, len(gp), len(gs)
+    )
+
+    out = cached_run_sharded(
+        compute_player_game_strength,
+        {"gs": gs.drop(columns="period"), "gp": gp},
+        cache=cache,
+        namespace="player_game_strength",
+        workers=workers,
+        season=season,
+    )
+    if out.empty:
+        return out
+
+    for col in KEYS:
+        out[col] = out[col].astype("int64")
+    return out.sort_values(KEYS + ["strength_state"], ignore_index=True)
+
+
+def write_player_game_strength(engine, season: int, df: pd.DataFrame) -> str:
+    """Replace the rows of mart.player_game_strength_{season}; return its name."""
+    schema = SCHEMA["mart"]
+    table = f"player_game_strength_{season}"
+    df = df.assign(strength_state=df["strength_state"].astype(str))
+
+    with engine.begin() as conn:
+        mode = "replace"
+        try:
+            conn.execute(text(f'TRUNCATE TABLE "{schema}"."{table}"'))
+            mode = "append"
+        except ProgrammingError:
+            pass
+
+    df.to_sql(
+        table,
+        engine,
+        schema=schema,
+        if_exists=mode,
+        index=False,
+        method="multi",
+        chunksize=50_000,
+    )
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{table}_key
+                ON "{schema}"."{table}" (game_id, player_id, team_id, strength_state);
+                """
+            )
+        )
+    return f"{schema}.{table}"
+
+
+def main() -> None:
+    """Build mart.player_game_strength_{season} for one or all modern seasons."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Process-pool workers (games are sharded per worker); 1 = serial",
+    )
+    ap.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute every game (skip the per-game result cache)",
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="Read seasons from the local memory-mapped season store",
+    )
+    ap.add_argument(
+        "--store-no-verify",
+        action="store_true",
+        help="With --store, skip the source-hash check (no database round trip)",
+    )
+    ap.add_argument(
+        "--include-legacy",
+        action="store_true",
+        help="Without --season, also run the legacy seasons (SEASONS_ALL)",
+    )
+    args = ap.parse_args()
+    cache = None if args.no_cache else GameResultCache()
+    store = SeasonStore(verify=not args.store_no_verify) if args.store else None
+
+    all_seasons = SEASONS_ALL if args.include_legacy else SEASONS_MODERN
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in all_seasons]
+    )
+
+    engine = get_db_engine()
+    try:
+        for season in seasons:
+            df = build_player_game_strength_for_season(
+                int(season), workers=args.workers, cache=cache, store=store
+            )
+            if df.empty:
+                logger.warning("⚠️ %s: no strength rows produced", season)
+                continue
+            name = write_player_game_strength(engine, int(season), df)
+            logger.info("✅ %s: wrote %s rows -> %s", season, len(df), name)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Build the season WOWY pair matrices and mart.player_pair_es_{season}.
+
+For every pair of skaters in a season: shared ES seconds as teammates and as
+opponents, and the ES CF/CA of their team while both were on ice (see
+wowy_utils.py). Same inputs and on-ice rules as build_player_game_es, so each
+player's own row (the matrix diagonal) equals their season sums there.
+
+Outputs:
+- .cache/player_pairs/player_pairs_{season}.npz: the sparse matrices, for
+  millisecond with/without queries (wowy_utils.load_pair_matrices)
+- mart.player_pair_es_{season} with:
+  (player_id_1, player_id_2, toi_with_sec, cf_with, ca_with, toi_against_sec),
+  one row per pair with player_id_1 < player_id_2
+
+Usage:
+  python build_player_pairs.py --season 20242025
+  python build_player_pairs.py --store --store-no-verify
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import time
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+
+from build_player_game_es import STORE_VARIANT, load_season_inputs
+from constants import SCHEMA, SEASONS_ALL, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine
+from game_store_utils import SeasonStore, season_source_hash
+from log_utils import setup_logger
+from wowy_utils import (
+    PairMatrices,
+    build_pair_matrices,
+    pair_path,
+    save_pair_matrices,
+)
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+
+def build_player_pairs_for_season(
+    season: int, *, store: SeasonStore | None = None
+) -> PairMatrices:
+    """Compute one season's pair matrices (inputs as build_player_game_es)."""
+    engine = get_db_engine()
+    if store is not None:
+        bundle = store.load(engine, season, STORE_VARIANT, load_season_inputs)
+        gp, gs = bundle.frame("gp"), bundle.frame("gs")
+    else:
+        with engine.connect() as conn:
+            frames = load_season_inputs(conn, season)
+        gp, gs = frames["gp"], frames["gs"]
+
+    t0 = time.perf_counter()
+    pairs = build_pair_matrices(gs, gp)
+    logger.info(
+        "%s: %s players, %s teammate / %s opponent pairs in %.1fs",
+        season,
+        len(pairs.player_ids),
+        (pairs.toi_with.nnz - len(pairs.player_ids)) // 2,
+        pairs.toi_against.nnz // 2,
+        time.perf_counter() - t0,
+    )
+    return pairs
+
+
+def write_player_pairs(engine, season: int, df: pd.DataFrame) -> str:
+    """Replace the rows of mart.player_pair_es_{season}; return its name."""
+    schema = SCHEMA["mart"]
+    table = f"player_pair_es_{season}"
+
+    with engine.begin() as conn:
+        mode = "replace"
+        try:
+            conn.execute(text(f'TRUNCATE TABLE "{schema}"."{table}"'))
+            mode = "append"
+        except ProgrammingError:
+            pass
+
+    df.to_sql(
+        table,
+        engine,
+        schema=schema,
+        if_exists=mode,
+        index=False,
+        method="multi",
+        chunksize=50_000,
+    )
+
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{table}_p1
+                ON "{schema}"."{table}" (player_id_1);
+                CREATE INDEX IF NOT EXISTS ix_{table}_p2
+                ON "{schema}"."{table}" (player_id_2);
+                """
+            )
+        )
+    return f"{schema}.{table}"
+
+
+def main() -> None:
+    """Build the pair matrices + mart.player_pair_es_{season} for modern seasons."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="Read seasons from the local memory-mapped season store",
+    )
+    ap.add_argument(
+        "--store-no-verify",
+        action="store_true",
+        help="With --store, skip the source-hash check (no database round trip)",
+    )
+    ap.add_argument(
+        "--include-legacy",
+        action="store_true",
+        help="Without --season, also run the legacy seasons (SEASONS_ALL)",
+    )
+    args = ap.parse_args()
+    store = SeasonStore(verify=not args.store_no_verify) if args.store else None
+
+    all_seasons = SEASONS_ALL if args.include_legacy else SEASONS_MODERN
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in all_seasons]
+    )
+
+    engine = get_db_engine()
+    try:
+        for season in seasons:
+            # stamped with the sources as they were before reading
+            with engine.connect() as conn:
+                source_hash = season_source_hash(conn, int(season))
+            pairs = build_player_pairs_for_season(int(season), store=store)
+            if len(pairs.player_ids) == 0:
+                logger.warning("⚠️ %s: no skaters with ES time", season)
+                continue
+            path = save_pair_matrices(
+                pairs, pair_path(int(season)), source_hash=source_hash
+            )
+            name = write_player_pairs(engine, int(season), pairs.to_frame())
+            logger.info("✅ %s: matrices -> %s, pairs -> %s", season, path, name)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Build QoC / QoT features per player-season and attach them to the archetype table.
+
+Quality of competition / teammates = shared-ES-TOI weighted means of opponents' /
+teammates' season ES CF% and net60 (CF - CA per 60), computed with sparse
+matrix-vector products on the WOWY pair matrices (wowy_utils.competition_features).
+
+Inputs:
+- .cache/player_pairs/player_pairs_{season}.npz (build_player_pairs.py); rebuilt
+  from the database when missing, when its source hash no longer matches the
+  season's source rows (game_store_utils.season_source_hash), or with
+  --rebuild-pairs
+
+Outputs:
+- mart.player_season_competition_modern with:
+  (season, player_id, toi_es_sec, cf_percent, net60, qoc_cf_percent, qoc_net60,
+   qot_cf_percent, qot_net60)
+- the qoc_* / qot_* columns of mart.player_season_archetype_features_modern_truth_clean
+  (added if missing, filled by UPDATE) so the clustering / transition models can
+  select them
+
+Usage:
+  python build_player_season_competition.py --season 20242025
+  python build_player_season_competition.py --attach-only
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+
+import pandas as pd
+from sqlalchemy import text
+
+from build_player_pairs import build_player_pairs_for_season
+from constants import SCHEMA, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine
+from game_store_utils import SeasonStore, season_source_hash
+from incremental_utils import add_missing_columns, table_columns
+from log_utils import setup_logger
+from wowy_utils import (
+    COMPETITION_COLUMNS,
+    COMPETITION_FEATURES,
+    competition_features,
+    load_pair_matrices,
+    pair_path,
+    pair_source_hash,
+    save_pair_matrices,
+)
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+COMPETITION_TABLE = "player_season_competition_modern"
+ARCHETYPE_TABLE = "player_season_archetype_features_modern_truth_clean"
+
+
+def build_competition_for_season(
+    season: int, *, rebuild_pairs: bool = False, store: SeasonStore | None = None
+) -> pd.DataFrame:
+    """QoC / QoT rows for one season (pair matrices read from / saved to .npz)."""
+    path = pair_path(season)
+    with get_db_engine().connect() as conn:
+        source_hash = season_source_hash(conn, int(season))
+    if not rebuild_pairs and pair_source_hash(path) == source_hash:
+        pairs = load_pair_matrices(path)
+    else:
+        if path.exists() and not rebuild_pairs:
+            logger.info("%s: %s is stale; rebuilding pair matrices", season, path)
+        pairs = build_player_pairs_for_season(season, store=store)
+        save_pair_matrices(pairs, path, source_hash=source_hash)
+
+    out = competition_features(pairs)
+    out.insert(0, "season", int(season))
+    return out[["season", *COMPETITION_COLUMNS]]
+
+
+def write_competition(engine, season: int, df: pd.DataFrame) -> str:
+    """Replace one season's rows of mart.player_season_competition_modern."""
+    schema = SCHEMA["mart"]
+    with engine.begin() as conn:
+        if table_columns(conn, schema, COMPETITION_TABLE):
+            conn.execute(
+                text(f'DELETE FROM "{schema}"."{COMPETITION_TABLE}" WHERE season = :s'),
+                {"s": int(season)},
+            )
+        df.to_sql(
+            COMPETITION_TABLE,
+            conn,
+            schema=schema,
+            if_exists="append",
+            index=False,
+            method="multi",
+            chunksize=50_000,
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{COMPETITION_TABLE}_key
+                ON "{schema}"."{COMPETITION_TABLE}" (season, player_id);
+                """
+            )
+        )
+    return f"{schema}.{COMPETITION_TABLE}"
+
+
+def attach_to_archetype_features(engine) -> int:
+    """
+    Copy the QoC / QoT columns onto the archetype feature table; return rows set.
+
+    The table is rebuilt by SQL (run_archetypes_pipeline.py), so this runs after
+    each rebuild. Players without a competition row keep NULLs.
+    """
+    schema = SCHEMA["mart"]
+    types = dict.fromkeys(COMPETITION_FEATURES, "double precision")
+    with engine.connect() as conn:
+        if not table_columns(conn, schema, ARCHETYPE_TABLE):
+            logger.warning("⚠️ %s.%s does not exist yet", schema, ARCHETYPE_TABLE)
+            return 0
+    add_missing_columns(engine, schema, ARCHETYPE_TABLE, types)
+
+    assignments = ",\n".join(f"{c} = c.{c}" for c in COMPETITION_FEATURES)
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(
+                f"""
+                UPDATE "{schema}"."{ARCHETYPE_TABLE}" f
+                SET {assignments}
+                FROM "{schema}"."{COMPETITION_TABLE}" c
+                WHERE c.season = f.season
+                  AND c.player_id = f.player_id;
+                """
+            )
+        )
+    return int(result.rowcount or 0)
+
+
+def main() -> None:
+    """Build QoC / QoT for one or all modern seasons and attach them."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    ap.add_argument(
+        "--rebuild-pairs",
+        action="store_true",
+        help="Recompute the pair matrices instead of reading the saved .npz",
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="When pairs are rebuilt, read seasons from the local season store",
+    )
+    ap.add_argument(
+        "--attach-only",
+        action="store_true",
+        help="Only copy existing QoC / QoT rows onto the archetype feature table",
+    )
+    args = ap.parse_args()
+    store = SeasonStore() if args.store else None
+
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in SEASONS_MODERN]
+    )
+
+    engine = get_db_engine()
+    try:
+        if not args.attach_only:
+            for season in seasons:
+                df = build_competition_for_season(
+                    int(season), rebuild_pairs=args.rebuild_pairs, store=store
+                )
+                name = write_competition(engine, int(season), df)
+                logger.info("✅ %s: wrote %s rows -> %s", season, len(df), name)
+
+        n = attach_to_archetype_features(engine)
+        logger.info("✅ QoC / QoT set on %s rows of mart.%s", n, ARCHETYPE_TABLE)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
@@ -64,23 +64,19 @@ def rebuild_one_season(*, season: int, schema_out: str = "derived") -> None:
     ON {out_table} (player_id);
     """
 
-    try:
-        with engine.begin() as conn:
-            # ensure schema exists
-            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_out}";'))
+    with engine.begin() as conn:
+        # ensure schema exists
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_out}";'))
 
-            conn.execute(text(sql_drop))
-            conn.execute(text(sql_create))
-            conn.execute(text(sql_index))
+        conn.execute(text(sql_drop))
+        conn.execute(text(sql_create))
+        conn.execute(text(sql_index))
 
-            n = conn.execute(text(f"SELECT COUNT(*) FROM {out_table};")).scalar_one()
+        n = conn.execute(text(f"SELECT COUNT(*) FROM {out_table};")).scalar_one()
 
-        logger.info(
-            "✅ %s: rebuilt %s rows -> %s.raw_corsi_%s", season, n, schema_out, season
-        )
-
-    finally:
-        engine.dispose()
+    logger.info(
+        "✅ %s: rebuilt %s rows -> %s.raw_corsi_%s", season, n, schema_out, season
+    )
 
 
 def main() -> None:
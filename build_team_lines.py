@@ -0,0 +1,174 @@
+"""
+Build mart.team_lines_modern: detected forward lines / defense pairs per season.
+
+Lines come from the ES shift data (line_utils.py): in every stretch of ES time
+where nobody changes, a team with exactly three forwards / two defensemen on ice
+has a line out; stretches shorter than --tolerance seconds (line changes) are
+skipped. The same trio / pair recurring across the season's games is one line.
+
+Same inputs and on-ice rules as build_player_game_es (load_season_inputs).
+
+Output:
+- mart.team_lines_modern with:
+  (season, line_id, team_id, line_type, line_rank, player_id_1, player_id_2,
+   player_id_3, games, toi_sec, cf, ca, cf_percent, cf60, ca60)
+  line_type F = forward line, D = defense pair (player_id_3 NULL)
+
+Usage:
+  python build_team_lines.py --season 20242025
+  python build_team_lines.py --store --min-toi 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from build_player_game_es import STORE_VARIANT, load_season_inputs
+from constants import SCHEMA, SEASONS_ALL, SEASONS_MODERN
+from db_utils import dispose_engines, get_db_engine
+from game_store_utils import SeasonStore
+from incremental_utils import table_columns
+from line_utils import (
+    LINE_COLUMNS,
+    LINE_MIN_TOI_SEC,
+    LINE_TOLERANCE_SEC,
+    detect_game_lines,
+    season_lines,
+)
+from log_utils import setup_logger
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = setup_logger()
+
+LINES_TABLE = "team_lines_modern"
+
+
+def build_team_lines_for_season(
+    season: int,
+    *,
+    tolerance: int = LINE_TOLERANCE_SEC,
+    min_toi_sec: int = LINE_MIN_TOI_SEC,
+    store: SeasonStore | None = None,
+) -> pd.DataFrame:
+    """Detect one season's lines (inputs as build_player_game_es)."""
+    engine = get_db_engine()
+    if store is not None:
+        bundle = store.load(engine, season, STORE_VARIANT, load_season_inputs)
+        gp, gs = bundle.frame("gp"), bundle.frame("gs")
+    else:
+        with engine.connect() as conn:
+            frames = load_season_inputs(conn, season)
+        gp, gs = frames["gp"], frames["gs"]
+
+    t0 = time.perf_counter()
+    game_lines = detect_game_lines(gs, gp, tolerance=tolerance)
+    out = season_lines(game_lines, min_toi_sec=min_toi_sec)
+    logger.info(
+        "%s: %s game-line rows -> %s lines in %.1fs",
+        season,
+        len(game_lines),
+        len(out),
+        time.perf_counter() - t0,
+    )
+    out.insert(0, "season", int(season))
+    return out[["season", *LINE_COLUMNS]]
+
+
+def write_team_lines(engine, season: int, df: pd.DataFrame) -> str:
+    """Replace one season's rows of mart.team_lines_modern."""
+    schema = SCHEMA["mart"]
+    with engine.begin() as conn:
+        if table_columns(conn, schema, LINES_TABLE):
+            conn.execute(
+                text(f'DELETE FROM "{schema}"."{LINES_TABLE}" WHERE season = :s'),
+                {"s": int(season)},
+            )
+        df.to_sql(
+            LINES_TABLE,
+            conn,
+            schema=schema,
+            if_exists="append",
+            index=False,
+            method="multi",
+            chunksize=50_000,
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS ix_{LINES_TABLE}_key
+                ON "{schema}"."{LINES_TABLE}" (season, team_id, line_type);
+                """
+            )
+        )
+    return f"{schema}.{LINES_TABLE}"
+
+
+def main() -> None:
+    """Build mart.team_lines_modern for one or all modern seasons."""
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--season", type=int, default=None, help="Run one season, e.g. 20182019"
+    )
+    ap.add_argument(
+        "--tolerance",
+        type=int,
+        default=LINE_TOLERANCE_SEC,
+        help="Skip ES stretches shorter than this many seconds (line changes)",
+    )
+    ap.add_argument(
+        "--min-toi",
+        type=int,
+        default=LINE_MIN_TOI_SEC,
+        help="Drop lines with fewer ES seconds together over the season",
+    )
+    ap.add_argument(
+        "--store",
+        action="store_true",
+        help="Read seasons from the local memory-mapped season store",
+    )
+    ap.add_argument(
+        "--store-no-verify",
+        action="store_true",
+        help="With --store, skip the source-hash check (no database round trip)",
+    )
+    ap.add_argument(
+        "--include-legacy",
+        action="store_true",
+        help="Without --season, also run the legacy seasons (SEASONS_ALL)",
+    )
+    args = ap.parse_args()
+    store = SeasonStore(verify=not args.store_no_verify) if args.store else None
+
+    all_seasons = SEASONS_ALL if args.include_legacy else SEASONS_MODERN
+    seasons = (
+        [args.season] if args.season is not None else [int(s) for s in all_seasons]
+    )
+
+    engine = get_db_engine()
+    try:
+        for season in seasons:
+            df = build_team_lines_for_season(
+                int(season),
+                tolerance=args.tolerance,
+                min_toi_sec=args.min_toi,
+                store=store,
+            )
+            if df.empty:
+                logger.warning("⚠️ %s: no lines detected", season)
+                continue
+            name = write_team_lines(engine, int(season), df)
+            logger.info("✅ %s: wrote %s lines -> %s", season, len(df), name)
+    finally:
+        dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
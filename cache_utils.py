@@ -0,0 +1,212 @@
+"""
+cache_utils.py.
+
+On-disk, content-addressed cache of per-game computation results.
+
+Fixing a handful of shift rows (identity resolution in raw_shifts_resolved)
+should not recompute a whole season. Each game's inputs (its rows in every input
+frame) are hashed together with a namespace (which builder), the engine version
+and the compute kwargs; the game's output rows are stored under that hash.
+
+- A rerun recomputes only games whose inputs changed (cache misses), as one
+  batch (optionally sharded across workers), and reads the rest from disk.
+- Row order inside a game does not affect its hash (SQL loads are unordered).
+- Entries are pickled DataFrames in <cache_dir>/<namespace>/<hash[:2]>/<hash>.pkl.
+- Size-based eviction: when the cache grows past max_bytes, least recently used
+  entries (by mtime, refreshed on every hit) are deleted.
+
+Config (env):
+  GAME_CACHE_DIR      default: <repo>/.cache/game_results
+  GAME_CACHE_MAX_MB   default: 2048
+
+Usage:
+    cache = GameResultCache()
+    out = cached_run_sharded(fn, {"gs": gs, "gp": gp}, cache=cache, namespace="es")
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import pathlib
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from on_ice_utils import ENGINE_VERSION
+from parallel_utils import run_sharded
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = pathlib.Path(__file__).resolve().parent / ".cache" / "game_results"
+DEFAULT_MAX_MB = 2048
+
+
+def game_input_hashes(
+    frames: dict[str, pd.DataFrame], game_ids, *, salt: str = ""
+) -> dict[int, str]:
+    """
+    Hash each game's rows across all frames (order-insensitive within a game).
+
+    Row hashes come from pd.util.hash_pandas_object; per game they are sorted and
+    fed to blake2b together with each frame's name, columns and dtypes.
+    """
+    ids = np.unique(np.asarray(game_ids, dtype=np.int64))
+    digests = {int(g): hashlib.blake2b(salt.encode(), digest_size=16) for g in ids}
+
+    for name in sorted(frames):
+        df = frames[name]
+        header = f"{name}|" + "|".join(f"{c}:{df[c].dtype}" for c in df.columns)
+        gid = df["game_id"].to_numpy(np.int64)
+        keep = np.isin(gid, ids)
+        gid = gid[keep]
+        row_hash = pd.util.hash_pandas_object(df[keep], index=False).to_numpy(
+            np.uint64
+        )
+
+        order = np.lexsort((row_hash, gid))
+        gid, row_hash = gid[order], row_hash[order]
+        bounds = np.flatnonzero(np.diff(gid)) + 1
+        starts = np.concatenate([[0], bounds]) if len(gid) else np.array([], int)
+        ends = np.concatenate([bounds, [len(gid)]]) if len(gid) else np.array([], int)
+        rows_by_game = {
+            int(gid[a]): row_hash[a:b].tobytes() for a, b in zip(starts, ends)
+        }
+
+        for g, h in digests.items():
+            h.update(header.encode())
+            h.update(rows_by_game.get(g, b""))
+            h.update(b"\x00")
+
+    return {g: h.hexdigest() for g, h in digests.items()}
+
+
+class GameResultCache:
+    """Content-addressed per-game result store with LRU size eviction."""
+
+    def __init__(
+        self, cache_dir: str | os.PathLike | None = None, max_bytes: int | None = None
+    ) -> None:
+        """Resolve cache_dir / max_bytes from args, env, then defaults."""
+        self.cache_dir = pathlib.Path(
+            cache_dir or os.getenv("GAME_CACHE_DIR") or DEFAULT_CACHE_DIR
+        )
+        if max_bytes is None:
+            max_bytes = int(os.getenv("GAME_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024**2
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, namespace: str, key: str) -> pathlib.Path:
+        return self.cache_dir / namespace / key[:2] / f"{key}.pkl"
+
+    def get(self, namespace: str, key: str) -> pd.DataFrame | None:
+        """Return the cached frame for key, or None (a hit refreshes its mtime)."""
+        path = self._path(namespace, key)
+        try:
+            df = pd.read_pickle(path)
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return df
+
+    def put(self, namespace: str, key: str, df: pd.DataFrame) -> None:
+        """Store df under key (atomic rename so readers never see partial files)."""
+        path = self._path(namespace, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+    def size_bytes(self) -> int:
+        """Return the total size of all cache entries."""
+        return sum(p.stat().st_size for p in self.cache_dir.rglob("*.pkl"))
+
+    def evict(self) -> int:
+        """Delete least recently used entries until under max_bytes; return count."""
+        if not self.cache_dir.exists():
+            return 0
+        entries = [(p, p.stat()) for p in self.cache_dir.rglob("*.pkl")]
+        total = sum(st.st_size for _, st in entries)
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= st.st_size
+            removed += 1
+        logger.info(
+            "cache evicted %s entries (now %.1f MB)", removed, total / 1024**2
+        )
+        return removed
+
+
+def cached_run_sharded(
+    fn: Callable[..., pd.DataFrame],
+    frames: dict[str, pd.DataFrame],
+    *,
+    cache: GameResultCache | None,
+    namespace: str,
+    workers: int = 1,
+    game_ids=None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    run_sharded() with per-game results served from / written to `cache`.
+
+    fn's output must carry game_id; rows are returned grouped by game_id in
+    sorted order. cache=None bypasses the cache (--no-cache).
+    """
+    if cache is None:
+        return run_sharded(fn, frames, workers=workers, game_ids=game_ids, **kwargs)
+
+    if game_ids is None:
+        game_ids = np.unique(
+            np.concatenate(
+                [f["game_id"].dropna().to_numpy(np.int64) for f in frames.values()]
+            )
+        )
+    salt = f"{namespace}|{ENGINE_VERSION}|{sorted(kwargs.items())!r}"
+    keys = game_input_hashes(frames, game_ids, salt=salt)
+
+    parts = {}
+    for g, key in keys.items():
+        hit = cache.get(namespace, key)
+        if hit is not None:
+            parts[g] = hit
+    misses = [g for g in keys if g not in parts]
+    logger.info(
+        "cache[%s]: %s games cached, %s to compute", namespace, len(parts), len(misses)
+    )
+
+    if misses:
+        miss_frames = {
+            name: df[df["game_id"].isin(misses)] for name, df in frames.items()
+        }
+        out = run_sharded(fn, miss_frames, workers=workers, game_ids=misses, **kwargs)
+        by_game = (
+            dict(tuple(out.groupby("game_id", sort=False)))
+            if not out.empty and "game_id" in out.columns
+            else {}
+        )
+        empty = out.iloc[0:0]
+        for g in misses:
+            part = by_game.get(g, empty)
+            cache.put(namespace, keys[g], part)
+            parts[g] = part
+        cache.evict()
+
+    non_empty = [parts[g] for g in sorted(parts) if not parts[g].empty]
+    if not non_empty:
+        return pd.DataFrame()
+    return pd.concat(non_empty, ignore_index=True)
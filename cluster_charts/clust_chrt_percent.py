@@ -15,10 +15,7 @@ def fetch_counts(table: str) -> pd.DataFrame:
     order by 1,2;
     """
     engine = get_db_engine()
-    try:
-        return pd.read_sql_query(text(sql), engine)
-    finally:
-        engine.dispose()
+    return pd.read_sql_query(text(sql), engine)
 
 
 def plot_stacked(df: pd.DataFrame, title: str, as_pct: bool) -> None:
@@ -10,9 +10,16 @@ position-specific mart tables:
   - mart.player_season_clusters_modern_truth_f / _d
   - mart.player_cluster_centers_modern_truth_f / _d
 
+--with-competition adds the QoC / QoT columns (build_player_season_competition.py)
+to the model features and to the centers table. --with-score-adjusted adds the
+score/venue-adjusted adj_cf60 / adj_ca60 / adj_cf_percent, aggregated per season
+from mart.player_game_stats_{season} (rebuild_player_game_stats_all_modern.py).
+
 Usage:
   python cluster_player_archetypes_modern.py --position F
   python cluster_player_archetypes_modern.py --position D
+  python cluster_player_archetypes_modern.py --position F --with-competition
+  python cluster_player_archetypes_modern.py --position D --with-score-adjusted
 """
 
 from __future__ import annotations
@@ -26,7 +33,9 @@ from sklearn.preprocessing import StandardScaler
 from sqlalchemy import text
 
 from db_utils import get_db_engine
+from incremental_utils import add_missing_columns
 from log_utils import setup_logger
+from wowy_utils import COMPETITION_FEATURES
 
 logger = setup_logger()
 
@@ -76,6 +85,9 @@ PREDICT_SEASONS = {20232024, 20242025}
 
 K_FIXED = 3
 
+# season-level score/venue-adjusted possession rates (opt-in model features)
+ADJUSTED_FEATURES = ["adj_cf60", "adj_ca60", "adj_cf_percent"]
+
 
 SRC_SQL = """
 SELECT
@@ -88,9 +100,52 @@ JOIN mart.player_season_pos_modern p
 WHERE p.pos = :pos
 """
 
+ADJUSTED_SQL = """
+SELECT
+  s.*,
+  a.adj_cf60,
+  a.adj_ca60,
+  a.adj_cf_percent
+FROM ({src}) s
+LEFT JOIN (
+  SELECT
+    season,
+    player_id,
+    CASE WHEN SUM(toi_es_sec) > 0
+      THEN SUM(adj_cf) * 3600.0 / SUM(toi_es_sec) END AS adj_cf60,
+    CASE WHEN SUM(toi_es_sec) > 0
+      THEN SUM(adj_ca) * 3600.0 / SUM(toi_es_sec) END AS adj_ca60,
+    CASE WHEN SUM(adj_cf) + SUM(adj_ca) > 0
+      THEN 100.0 * SUM(adj_cf) / (SUM(adj_cf) + SUM(adj_ca)) END AS adj_cf_percent
+  FROM ({games}) g
+  GROUP BY season, player_id
+) a
+  ON a.season = s.season
+ AND a.player_id = s.player_id
+"""
+
+
+def src_sql(*, with_score_adjusted: bool = False) -> str:
+    """Feature query, optionally joined to the season-level adj_* rates."""
+    if not with_score_adjusted:
+        return SRC_SQL
+    games = "\n  UNION ALL\n  ".join(
+        f"SELECT season, player_id, adj_cf, adj_ca, toi_es_sec"
+        f' FROM mart."player_game_stats_{season}"'
+        for season in sorted(TRAIN_SEASONS | PREDICT_SEASONS)
+    )
+    return ADJUSTED_SQL.format(src=SRC_SQL, games=games)
 
-def run_for_position(pos: str) -> None:
+
+def run_for_position(
+    pos: str, *, with_competition: bool = False, with_score_adjusted: bool = False
+) -> None:
     """Run clustering for one position group ('F' or 'D') and write outputs."""
+    extra = (COMPETITION_FEATURES if with_competition else []) + (
+        ADJUSTED_FEATURES if with_score_adjusted else []
+    )
+    features = FEATURES + extra
+    centers_cols = CENTERS_COLS + extra
     pos = pos.upper()
     if pos not in {"F", "D"}:
         raise ValueError("pos must be 'F' or 'D'")
@@ -104,17 +159,18 @@ def run_for_position(pos: str) -> None:
 
     # ---- read ----
     engine = get_db_engine()
-    try:
-        df = pd.read_sql_query(text(SRC_SQL), engine, params={"pos": pos})
-        logger.info(
-            "loaded rows=%s players=%s seasons=[%s..%s]",
-            len(df),
-            df["player_id"].nunique() if not df.empty else 0,
-            df["season"].min() if not df.empty else None,
-            df["season"].max() if not df.empty else None,
-        )
-    finally:
-        engine.dispose()
+    df = pd.read_sql_query(
+        text(src_sql(with_score_adjusted=with_score_adjusted)),
+        engine,
+        params={"pos": pos},
+    )
+    logger.info(
+        "loaded rows=%s players=%s seasons=[%s..%s]",
+        len(df),
+        df["player_id"].nunique() if not df.empty else 0,
+        df["season"].min() if not df.empty else None,
+        df["season"].max() if not df.empty else None,
+    )
 
     if df.empty:
         raise RuntimeError(
@@ -126,7 +182,12 @@ def run_for_position(pos: str) -> None:
         df["fo_win_pct"] = df["fo_win_pct"].fillna(0.5)
 
     # Drop rows with missing model features
-    df_model = df.dropna(subset=FEATURES).copy()
+    missing = sorted(set(features) - set(df.columns))
+    if missing:
+        raise RuntimeError(
+            f"Feature table lacks {missing}; run build_player_season_competition.py"
+        )
+    df_model = df.dropna(subset=features).copy()
 
     # Split train/predict
     df_train = df_model[df_model["season"].isin(TRAIN_SEASONS)].copy()
@@ -139,7 +200,7 @@ def run_for_position(pos: str) -> None:
 
     # ---- fit on train only ----
     scaler = StandardScaler()
-    X_train = df_train[FEATURES].to_numpy(dtype=float)
+    X_train = df_train[features].to_numpy(dtype=float)
     Xs_train = scaler.fit_transform(X_train)
 
     k = K_FIXED
@@ -149,7 +210,7 @@ def run_for_position(pos: str) -> None:
 
     # ---- predict for later seasons ----
     if not df_pred.empty:
-        X_pred = df_pred[FEATURES].to_numpy(dtype=float)
+        X_pred = df_pred[features].to_numpy(dtype=float)
         Xs_pred = scaler.transform(X_pred)
         df_pred["cluster"] = km.predict(Xs_pred)
 
@@ -163,42 +224,46 @@ def run_for_position(pos: str) -> None:
 
     # centers output (inverse-transform centers back to original units)
     centers = scaler.inverse_transform(km.cluster_centers_)
-    centers_df = pd.DataFrame(centers, columns=FEATURES)
+    centers_df = pd.DataFrame(centers, columns=features)
 
     # reorder for DB schema
-    centers_df = centers_df[CENTERS_COLS].copy()
+    centers_df = centers_df[centers_cols].copy()
     centers_df["cluster"] = np.arange(k, dtype=np.int64)
 
-    expected = CENTERS_COLS + ["cluster"]
+    expected = centers_cols + ["cluster"]
     assert list(centers_df.columns) == expected, centers_df.columns
 
     # ---- write ----
     engine = get_db_engine()
-    try:
-        with engine.begin() as conn:
-            conn.execute(text(f"TRUNCATE TABLE mart.{clusters_tbl};"))
-        out_clusters.to_sql(
-            clusters_tbl,
+    if extra:
+        add_missing_columns(
             engine,
-            schema="mart",
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
-
-        with engine.begin() as conn:
-            conn.execute(text(f"TRUNCATE TABLE mart.{centers_tbl};"))
-        centers_df.to_sql(
+            "mart",
             centers_tbl,
-            engine,
-            schema="mart",
-            if_exists="append",
-            index=False,
-            method="multi",
+            dict.fromkeys(extra, "double precision"),
         )
-    finally:
-        engine.dispose()
-        logger.info("Wrote mart.%s and mart.%s", clusters_tbl, centers_tbl)
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE TABLE mart.{clusters_tbl};"))
+    out_clusters.to_sql(
+        clusters_tbl,
+        engine,
+        schema="mart",
+        if_exists="append",
+        index=False,
+        method="multi",
+    )
+
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE TABLE mart.{centers_tbl};"))
+    centers_df.to_sql(
+        centers_tbl,
+        engine,
+        schema="mart",
+        if_exists="append",
+        index=False,
+        method="multi",
+    )
+    logger.info("Wrote mart.%s and mart.%s", clusters_tbl, centers_tbl)
 
 
 def main() -> None:
@@ -213,8 +278,22 @@ def main() -> None:
         required=True,
         help="Specify the position group: 'F' for forwards, 'D' for defensemen.",
     )
+    parser.add_argument(
+        "--with-competition",
+        action="store_true",
+        help="Also cluster on QoC / QoT (qoc_/qot_ cf_percent and net60).",
+    )
+    parser.add_argument(
+        "--with-score-adjusted",
+        action="store_true",
+        help="Also cluster on score/venue-adjusted adj_cf60, adj_ca60, adj_cf_percent.",
+    )
     args = parser.parse_args()
-    run_for_position(args.pos)
+    run_for_position(
+        args.pos,
+        with_competition=args.with_competition,
+        with_score_adjusted=args.with_score_adjusted,
+    )
 
 
 if __name__ == "__main__":
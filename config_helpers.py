@@ -19,6 +19,7 @@ from constants import (
     local_extract_path_II,
     local_extract_path_III,
 )
+from data_processing_utils import STREAM_CHUNK_ROWS
 from db_utils import (
     define_game_plays_players,
     define_game_plays_processor,
@@ -272,6 +273,8 @@ def build_processing_config(
     column_mapping,
     engine,
     local_download_path,
+    stream: bool = True,
+    chunk_rows: int = STREAM_CHUNK_ROWS,
 ):
     """
     Build a standardized config dictionary for S3 extraction and data processing.
@@ -288,6 +291,9 @@ def build_processing_config(
         column_mapping (dict): Column names and types for cleaning.
         engine (sqlalchemy.Engine): SQLAlchemy engine instance for database connection.
         local_download_path (str): Directory for downloading the ZIP file.
+        stream (bool): Load the CSV in chunks of chunk_rows, read straight out of the
+            ZIP (bounded memory; see data_processing_utils.stream_and_insert).
+        chunk_rows (int): Rows per streamed chunk.
 
     Returns:
     -------
@@ -308,6 +314,8 @@ def build_processing_config(
         "engine": engine,
         "handle_zip": str(local_zip_path).lower().endswith(".zip"),
         "local_download_path": local_download_path,
+        "stream": stream,
+        "chunk_rows": chunk_rows,
     }
 
 
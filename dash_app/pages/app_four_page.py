@@ -0,0 +1,245 @@
+"""Tab 4: forward lines and defense pairs (mart.team_lines_modern) per team-season."""
+
+from __future__ import annotations
+
+from functools import lru_cache
+
+import dash
+import pandas as pd
+import plotly.express as px
+from dash import Input, Output, dash_table, dcc, html
+from dash.dash_table.Format import Format, Scheme
+from sqlalchemy import text
+
+from db_utils import get_db_engine
+
+dash.register_page(__name__, path="/tab-4", name="Tab 4 — Lines", order=4)
+
+
+# ---------- SQL ----------
+SQL_SEASONS = """
+SELECT DISTINCT season
+FROM mart.team_lines_modern
+ORDER BY season;
+"""
+
+SQL_TEAMS_BY_SEASON = """
+SELECT DISTINCT tc.team_code
+FROM mart.team_lines_modern l
+JOIN dim.dim_team_code tc
+  ON tc.team_id = l.team_id
+WHERE l.season = :season
+ORDER BY tc.team_code;
+"""
+
+SQL_TEAM_LINES = """
+SELECT
+  l.line_id,
+  l.line_type,
+  l.line_rank,
+  l.player_id_1,
+  l.player_id_2,
+  l.player_id_3,
+  l.games,
+  ROUND(l.toi_sec / 60.0, 1) AS toi_es_min,
+  l.cf,
+  l.ca,
+  l.cf_percent,
+  l.cf60,
+  l.ca60,
+  (l.cf60 - l.ca60) AS es_net60
+FROM mart.team_lines_modern l
+JOIN dim.dim_team_code tc
+  ON tc.team_id = l.team_id
+WHERE l.season = :season
+  AND tc.team_code = :team_code
+  AND l.line_type = :line_type
+ORDER BY l.line_rank;
+"""
+
+
+# ---------- helpers ----------
+@lru_cache(maxsize=1)
+def _engine():
+    return get_db_engine("dash")
+
+
+def read_df(sql: str, params: dict | None = None) -> pd.DataFrame:
+    """Run sql on the dash engine and return a DataFrame."""
+    return pd.read_sql_query(text(sql), _engine(), params=params or {})
+
+
+def season_label(season: int) -> str:
+    """20242025 -> '2024-25'."""
+    s = int(season)
+    return f"{s // 10000}-{str(s % 10000)[-2:]}"
+
+
+def line_label(row) -> str:
+    """Player ids of a line row joined with ' / '."""
+    pids = [row["player_id_1"], row["player_id_2"], row["player_id_3"]]
+    return " / ".join(str(int(p)) for p in pids if pd.notna(p))
+
+
+def _num(name: str, precision: int = 1) -> dict:
+    return {
+        "name": name,
+        "id": name,
+        "type": "numeric",
+        "format": Format(precision=precision, scheme=Scheme.fixed),
+    }
+
+
+# ---------- app ----------
+def layout():
+    """Season / team / unit controls, ES minutes chart and lines table."""
+    try:
+        df_seasons = read_df(SQL_SEASONS)
+        season_vals = [int(s) for s in df_seasons["season"].tolist()]
+        season_options = [{"label": season_label(s), "value": s} for s in season_vals]
+        default_season = season_vals[-1] if season_vals else None
+
+        controls_row = html.Div(
+            style={
+                "display": "flex",
+                "gap": "12px",
+                "alignItems": "center",
+                "flexWrap": "wrap",
+                "marginTop": "10px",
+            },
+            children=[
+                html.Div(
+                    style={"minWidth": "180px"},
+                    children=[
+                        html.Label("Season"),
+                        dcc.Dropdown(
+                            id="tab4-season",
+                            options=season_options,
+                            value=default_season,
+                            clearable=False,
+                        ),
+                    ],
+                ),
+                html.Div(
+                    style={"minWidth": "180px"},
+                    children=[
+                        html.Label("Team"),
+                        dcc.Dropdown(
+                            id="tab4-team_code",
+                            options=[],
+                            value=None,
+                            clearable=True,
+                            placeholder="Select a team...",
+                        ),
+                    ],
+                ),
+                html.Div(
+                    style={"minWidth": "220px"},
+                    children=[
+                        html.Label("Unit"),
+                        dcc.RadioItems(
+                            id="tab4-line_type",
+                            options=[
+                                {"label": "Forward lines", "value": "F"},
+                                {"label": "Defense pairs", "value": "D"},
+                            ],
+                            value="F",
+                            inline=True,
+                        ),
+                    ],
+                ),
+            ],
+        )
+
+        return html.Div(
+            style={"maxWidth": "1200px", "margin": "0 auto", "padding": "18px"},
+            children=[
+                html.H2("Tab 4 — Lines"),
+                html.P(
+                    "Forward lines and defense pairs detected from even-strength "
+                    "shifts (same trio / pair on ice together), with their ES TOI "
+                    "and shot attempts for / against."
+                ),
+                controls_row,
+                html.Hr(),
+                dcc.Graph(id="tab4-lines_graph"),
+                html.H3("Lines"),
+                dash_table.DataTable(
+                    id="tab4-lines_table",
+                    columns=[
+                        {"name": "rank", "id": "line_rank"},
+                        {"name": "line", "id": "line"},
+                        {"name": "games", "id": "games"},
+                        _num("toi_es_min"),
+                        {"name": "cf", "id": "cf"},
+                        {"name": "ca", "id": "ca"},
+                        _num("cf_percent"),
+                        _num("cf60"),
+                        _num("ca60"),
+                        _num("es_net60"),
+                    ],
+                    page_size=20,
+                    sort_action="native",
+                    style_table={"overflowX": "auto"},
+                    style_cell={"fontFamily": "Arial", "fontSize": 12, "padding": "6px"},
+                ),
+            ],
+        )
+
+    except Exception as e:
+        return html.Div(
+            style={"padding": "18px"},
+            children=[
+                html.H3("Tab 4 failed to load"),
+                html.Pre(str(e)),
+            ],
+        )
+
+
+@dash.callback(
+    Output("tab4-team_code", "options"),
+    Output("tab4-team_code", "value"),
+    Input("tab4-season", "value"),
+)
+def refresh_teams(season: int | None):
+    """Team dropdown options for the selected season."""
+    if season is None:
+        return [], None
+    df = read_df(SQL_TEAMS_BY_SEASON, {"season": int(season)})
+    opts = [{"label": t, "value": t} for t in df["team_code"].tolist()]
+    return opts, None
+
+
+@dash.callback(
+    Output("tab4-lines_graph", "figure"),
+    Output("tab4-lines_table", "data"),
+    Input("tab4-season", "value"),
+    Input("tab4-team_code", "value"),
+    Input("tab4-line_type", "value"),
+)
+def refresh_lines(season: int | None, team_code: str | None, line_type: str):
+    """Chart + table rows of the selected team's lines or pairs."""
+    if season is None or not team_code:
+        return px.bar(title="Select a team"), []
+
+    df = read_df(
+        SQL_TEAM_LINES,
+        {"season": int(season), "team_code": str(team_code), "line_type": line_type},
+    )
+    if df.empty:
+        return px.bar(title=f"No lines for {team_code} {season_label(season)}"), []
+
+    df["line"] = df.apply(line_label, axis=1)
+    top = df.head(12)
+    fig = px.bar(
+        top,
+        x="line",
+        y="toi_es_min",
+        color="cf_percent",
+        color_continuous_scale="RdBu",
+        range_color=(35, 65),
+        hover_data=["games", "cf", "ca", "cf60", "ca60"],
+        title=f"{team_code} {season_label(season)} — ES minutes by unit (color = CF%)",
+    )
+    fig.update_layout(xaxis_title=None, yaxis_title="ES minutes together")
+    return fig, df.to_dict("records")
@@ -114,7 +114,7 @@ def add_cluster_label(df: pd.DataFrame) -> pd.DataFrame:
 
 @lru_cache(maxsize=1)
 def _engine():
-    return get_db_engine()
+    return get_db_engine("dash")
 
 
 def read_df(sql: str, params: dict | None = None) -> pd.DataFrame:
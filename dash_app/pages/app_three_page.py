@@ -207,7 +207,7 @@ TAB3_GLOSSARY = [
 # ---------------- helpers ----------------
 @lru_cache(maxsize=1)
 def get_engine():
-    return get_db_engine()
+    return get_db_engine("dash")
 
 
 def read_df(sql: str, params: dict | None = None) -> pd.DataFrame:
@@ -152,7 +152,7 @@ ORDER BY gc.game_date NULLS LAST, f.game_id;
 # ---------- helpers ----------
 @lru_cache(maxsize=1)
 def _engine():
-    return get_db_engine()
+    return get_db_engine("dash")
 
 
 def read_df(sql: str, params: dict | None = None) -> pd.DataFrame:
@@ -51,6 +51,13 @@ def layout():
                                             ": Team composition breakdown + projected next-season mix + roster what-if.",
                                         ]
                                     ),
+                                    html.Li(
+                                        [
+                                            dcc.Link("Tab 4 — Lines", href="/tab-4"),
+                                            ": Detected forward lines / defense pairs "
+                                            "with ES TOI and CF / CA.",
+                                        ]
+                                    ),
                                 ]
                             ),
                         ],
@@ -16,16 +16,20 @@ import os
 import re
 import shutil
 import string
+import time
+import zipfile
+from dataclasses import dataclass, field
 from pathlib import Path
 
 import boto3
 import botocore
+import numpy as np
 import pandas as pd
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker
 from tqdm import tqdm
 
-from db_utils import get_metadata
+from db_utils import COPY_BATCH_ROWS, copy_dataframe, get_metadata
 from log_utils import setup_logger
 
 setup_logger()
@@ -139,14 +143,54 @@ def convert_height(height_str):
         return None
 
 
-def add_suffix_to_duplicate_play_ids(df):
-    """Add alphabetical suffixes to duplicate 'play_id' values to ensure uniqueness."""
-    # Debugging output for column names
-    print(
-        "Columns in DataFrame when entering add_suffix_to_duplicate_play_ids:",
-        list(df.columns),
-    )
+class _HashSet:
+    """Sorted uint64 hashes (8 bytes per member) for membership across chunks."""
+
+    def __init__(self):
+        self.values = np.empty(0, dtype=np.uint64)
+
+    def contains(self, h: np.ndarray) -> np.ndarray:
+        """Boolean mask: which of h are members."""
+        if len(self.values) == 0:
+            return np.zeros(len(h), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.values, h), len(self.values) - 1)
+        return self.values[pos] == h
+
+    def add(self, h: np.ndarray) -> None:
+        """Add h (duplicates collapse)."""
+        self.values = np.union1d(self.values, h)
+
+
+@dataclass
+class StreamState:
+    """
+    What a chunked load of one file must remember between chunks.
+
+    play_ids / rows hold 64-bit hashes of the play_ids and cleaned rows already
+    loaded; repeated_play_ids only the play_ids seen more than once (with their
+    count), so the state stays a few bytes per row.
+    """
+
+    play_ids: _HashSet = field(default_factory=_HashSet)
+    repeated_play_ids: dict[str, int] = field(default_factory=dict)
+    rows: _HashSet = field(default_factory=_HashSet)
+
+    def drop_seen_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Drop rows duplicated within df or already loaded from earlier chunks."""
+        h = pd.util.hash_pandas_object(df, index=False).to_numpy(np.uint64)
+        keep = ~pd.Series(h).duplicated().to_numpy() & ~self.rows.contains(h)
+        self.rows.add(h[keep])
+        return df[keep].reset_index(drop=True)
+
 
+def add_suffix_to_duplicate_play_ids(df, state: StreamState | None = None):
+    """
+    Add alphabetical suffixes to duplicate 'play_id' values to ensure uniqueness.
+
+    The n-th occurrence of a play_id (n >= 2) gets string.ascii_lowercase[n - 1]
+    ("b", "c", ...). With state, occurrences are counted across the chunks of a
+    streamed file, so the suffixes match a load of the whole file at once.
+    """
     # Verify the existence of 'play_id' column before proceeding
     if "play_id" not in df.columns:
         raise KeyError("The 'play_id' column is missing in the DataFrame!")
@@ -154,29 +198,28 @@ def add_suffix_to_duplicate_play_ids(df):
     # ✅ Log unique play_ids before processing
     logger.info(f"Before Suffix Addition - Unique play_ids: {df['play_id'].nunique()}")
 
-    play_id_counts = {}  # Dictionary to track occurrences of each play_id
-
-    # Iterate over the DataFrame index to avoid issues with Series indexing
-    for idx in df.index:
-        play_id = df.at[idx, "play_id"]  # Access play_id directly by index
-        logger.debug(f"Processing play_id: {play_id}")  # Debug log for each play_id
-
-        # Check if play_id has already been seen
-        if play_id in play_id_counts:
-            # Increment count and add the appropriate suffix
-            play_id_counts[play_id] += 1
-            suffix = string.ascii_lowercase[play_id_counts[play_id] - 1]
-            df.at[idx, "play_id"] = f"{play_id}{suffix}"
-            logger.debug(
-                f"Updated play_id: {df.at[idx, 'play_id']}"
-            )  # Log updated play_id
-        else:
-            # Initialize the count for this play_id
-            play_id_counts[play_id] = 1
+    ids = df["play_id"].astype(str)
+    occurrence = ids.groupby(ids, sort=False).cumcount().to_numpy()
+    if state is not None:
+        h = pd.util.hash_array(ids.to_numpy(dtype=object))
+        seen = state.play_ids.contains(h)
+        prior = np.zeros(len(ids), dtype=np.int64)
+        if seen.any():
+            prior[seen] = (
+                ids[seen].map(state.repeated_play_ids).fillna(1).astype(np.int64)
+            )
+        occurrence = occurrence + prior
+
+        # remember the new totals of every play_id that now occurs twice or more
+        total = pd.Series(occurrence + 1, index=ids.to_numpy()).groupby(level=0).max()
+        state.repeated_play_ids.update(total[total > 1].to_dict())
+        state.play_ids.add(h)
+
+    suffix = [string.ascii_lowercase[k] if k else "" for k in occurrence]
+    df["play_id"] = ids + pd.Series(suffix, index=ids.index)
 
     #     # ✅ Log unique play_ids after processing
     logger.info(f"After Suffix Addition - Unique play_ids: {df['play_id'].nunique()}")
-    print(df.tail(100))
     return df
 
 
@@ -213,8 +256,18 @@ def normalize_columns(df):
 
 
 #     return df
-def clean_and_transform_data(df, column_mapping, table_name: str | None = None):
-    """Apply transformations and clean data using dtype mapping (col -> dtype)."""
+def clean_and_transform_data(
+    df,
+    column_mapping,
+    table_name: str | None = None,
+    state: StreamState | None = None,
+):
+    """
+    Apply transformations and clean data using dtype mapping (col -> dtype).
+
+    For chunked loads pass the file's StreamState: play_id suffixes and the final
+    de-duplication then span all chunks.
+    """
     # Normalize headers
     df.columns = [c.strip() for c in df.columns]
 
@@ -227,24 +280,22 @@ def clean_and_transform_data(df, column_mapping, table_name: str | None = None):
 
     # If play_id exists, enforce uniqueness
     if "play_id" in df.columns:
-        df = add_suffix_to_duplicate_play_ids(df)
+        df = add_suffix_to_duplicate_play_ids(df, state)
 
     # Height conversion (if present)
     if "height" in df.columns:
         df["height"] = df["height"].apply(convert_height)
 
     # Drop duplicates at the end (optional)
+    if state is not None:
+        return state.drop_seen_rows(df)
     df = df.drop_duplicates(ignore_index=True)
 
     return df
 
 
-def insert_data(df, table, session):
-    """Insert DataFrame into a database table. Assumes df is already cleaned/coerced."""
-    if df.empty:
-        logger.error(f"DataFrame is empty! No data inserted into {table.name}.")
-        return
-
+def _frame_for_table(df, table):
+    """Filter df to table's columns; None if a required NOT NULL column is missing."""
     # ✅ Filter df to table schema
     valid_cols = set(table.columns.keys())
     extra_cols = [c for c in df.columns if c not in valid_cols]
@@ -265,21 +316,64 @@ def insert_data(df, table, session):
         logger.error(
             f"Missing required NOT NULL columns for {table.name}: {missing_required}"
         )
-        return
+        return None
 
     # Keep only schema columns, in any order
-    df = df[[c for c in df.columns if c in valid_cols]]
+    return df[[c for c in df.columns if c in valid_cols]]
 
-    logger.info(f"Inserting {len(df)} rows into {table.name}.")
+
+def _insert_rows(df, table, session):
+    """Insert df one row per statement (fallback path); return the row count."""
     data = df.to_dict(orient="records")
+    with tqdm(total=len(data), desc=f"Inserting data into {table.name}") as pbar:
+        for record in data:
+            session.execute(table.insert().values(**record))
+            pbar.update(1)
+    return len(data)
+
 
+def insert_data(
+    df, table, session, *, method="copy", batch_rows=COPY_BATCH_ROWS, commit=True
+):
+    """
+    Insert DataFrame into a database table. Assumes df is already cleaned/coerced.
+
+    method="copy" streams the rows with COPY in batches of batch_rows and falls
+    back to per-row INSERTs when the driver cannot COPY; method="rows" always
+    uses per-row INSERTs. Logs rows/sec; errors are logged and rolled back.
+    With commit=False the rows stay in the session's open transaction for the
+    caller to commit (an error still rolls back the whole transaction).
+    Returns the number of rows inserted (0 when nothing was written).
+    """
+    if df.empty:
+        logger.error(f"DataFrame is empty! No data inserted into {table.name}.")
+        return 0
+
+    df = _frame_for_table(df, table)
+    if df is None:
+        return 0
+
+    logger.info(f"Inserting {len(df)} rows into {table.name} ({method}).")
+    t0 = time.perf_counter()
     try:
-        with tqdm(total=len(data), desc=f"Inserting data into {table.name}") as pbar:
-            for record in data:
-                session.execute(table.insert().values(**record))
-                pbar.update(1)
-        session.commit()
-        logger.info(f"Data successfully inserted into {table.name}.")
+        if method == "copy":
+            try:
+                n = copy_dataframe(
+                    df, table, session.connection(), batch_rows=batch_rows
+                )
+            except NotImplementedError as e:
+                logger.warning(f"{e}; falling back to per-row inserts.")
+                n = _insert_rows(df, table, session)
+        else:
+            n = _insert_rows(df, table, session)
+        if commit:
+            session.commit()
+        elapsed = time.perf_counter() - t0
+        logger.info(
+            f"Data successfully inserted into {table.name}: {n} rows in "
+            f"{elapsed:.1f}s ({n / max(elapsed, 1e-9):,.0f} rows/sec)."
+        )
+        return n
     except SQLAlchemyError as e:
         session.rollback()
         logger.error(f"Error inserting data into {table.name}: {e}", exc_info=True)
@@ -288,6 +382,7 @@ def insert_data(df, table, session):
         logger.error(
             f"Unexpected error inserting into {table.name}: {e}", exc_info=True
         )
+    return 0
 
 
 def clear_directory(directory):
@@ -380,6 +475,100 @@ def normalize_player_info_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+STREAM_CHUNK_ROWS = 200_000
+
+
+def _fix_raw_frame(df, table_name):
+    """Table-specific fixes applied before cleaning."""
+    if table_name.startswith("raw_shifts") and "shift_num" in df.columns:
+        df["shift_num"] = (
+            pd.to_numeric(df["shift_num"], errors="coerce").fillna(0).astype(int)
+        )
+    return df
+
+
+def find_zip_member(zip_path, filename):
+    """Name of the member called filename inside zip_path (macOS metadata skipped)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        for name in zf.namelist():
+            parts = Path(name).parts
+            if (
+                parts
+                and parts[-1] == filename
+                and "__MACOSX" not in parts
+                and not parts[-1].startswith("._")
+            ):
+                return name
+        logger.error(
+            f"{filename} not found in {zip_path}. Members: {zf.namelist()[:50]}"
+        )
+    return None
+
+
+def iter_csv_chunks(path, *, member=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Yield DataFrames of at most chunk_rows rows from a CSV file.
+
+    With member, path is a ZIP archive and the member is read straight out of it
+    (decompressed as it is read, never extracted to disk).
+    """
+    if member is None:
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+        return
+    with zipfile.ZipFile(path) as zf, zf.open(member) as fh:
+        yield from pd.read_csv(fh, chunksize=chunk_rows)
+
+
+def stream_and_insert(chunks, config, table, session):
+    """
+    Clean and load CSV chunks one at a time; return the rows inserted.
+
+    Memory stays at about one chunk plus StreamState (a few bytes per row).
+    All chunks load in one transaction, committed after the last chunk: the
+    first chunk that fails to load (logged by insert_data) rolls the whole load
+    back, so a failed run never leaves a partially loaded table. Returns 0 then.
+    """
+    state = StreamState()
+    total = 0
+    t0 = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        chunk = _fix_raw_frame(chunk, config["table_name"])
+        chunk = clean_and_transform_data(
+            chunk, config["column_mapping"], table_name=config["table_name"], state=state
+        )
+        if chunk.empty:
+            continue
+        n = insert_data(
+            chunk,
+            table,
+            session,
+            method=config.get("insert_method", "copy"),
+            commit=False,
+        )
+        if not n:
+            session.rollback()
+            logger.error(
+                f"Stopping {table.name} load at chunk {i}: insert failed; "
+                f"rolled back {total} rows from earlier chunks."
+            )
+            return 0
+        total += n
+
+    try:
+        session.commit()
+    except SQLAlchemyError as e:
+        session.rollback()
+        logger.error(f"Error committing {table.name} load: {e}", exc_info=True)
+        return 0
+
+    elapsed = time.perf_counter() - t0
+    logger.info(
+        f"Streamed {total} rows into {table.name} in {elapsed:.1f}s "
+        f"({total / max(elapsed, 1e-9):,.0f} rows/sec)."
+    )
+    return total
+
+
 def process_and_insert_data(config):
     """
     Download, extract, clean, and insert data into a database table.
@@ -398,6 +587,11 @@ def process_and_insert_data(config):
             - column_mapping (dict): Column mapping for data cleaning.
             - engine (sqlalchemy.engine.Engine): The database engine instance.
             - handle_zip (bool): Flag indicating whether the file is a zip archive.
+            - insert_method (str, optional): "copy" (default, bulk COPY) or "rows"
+              (per-row INSERTs, see insert_data).
+            - stream (bool, optional): read and load CSVs in chunks of chunk_rows
+              (default STREAM_CHUNK_ROWS), straight out of the ZIP without
+              extracting it; Excel files are always read whole.
 
     """
     session_factory = sessionmaker(bind=config["engine"])
@@ -415,7 +609,15 @@ def process_and_insert_data(config):
 
     download_zip_from_s3(config["bucket_name"], config["s3_file_key"], download_path)
 
-    if config["handle_zip"]:
+    stream = config.get("stream", False)
+    member = None
+    if config["handle_zip"] and stream:
+        member = find_zip_member(download_path, config["expected_csv_filename"])
+        if member is None:
+            return
+        csv_file_path = download_path
+
+    elif config["handle_zip"]:
         extract_zip(download_path, config["local_extract_path"])
 
         extract_dir = Path(config["local_extract_path"])
@@ -450,6 +652,33 @@ def process_and_insert_data(config):
             logger.error(f"Downloaded file not found at path: {csv_file_path}")
             return
 
+    if member is not None or (stream and csv_file_path.endswith(".csv")):
+        ensure_table_exists(
+            config["engine"],
+            get_metadata(),
+            config["table_name"],
+            config["table_definition_function"],
+        )
+        chunks = iter_csv_chunks(
+            csv_file_path,
+            member=member,
+            chunk_rows=config.get("chunk_rows", STREAM_CHUNK_ROWS),
+        )
+        try:
+            stream_and_insert(
+                chunks, config, get_metadata().tables[config["table_name"]], session
+            )
+        except Exception as e:
+            session.rollback()
+            logger.error(
+                f"Error streaming data into {config['table_name']}: {e}", exc_info=True
+            )
+        finally:
+            session.close()
+            if member is not None:
+                clear_directory(config["local_download_path"])
+        return
+
     try:
         if csv_file_path.endswith(".csv") or csv_file_path.endswith(".csv.xls"):
             df = pd.read_csv(csv_file_path)
@@ -460,10 +689,7 @@ def process_and_insert_data(config):
         return
 
     # ✅ table-specific fixes BEFORE cleaning
-    if config["table_name"].startswith("raw_shifts") and "shift_num" in df.columns:
-        df["shift_num"] = (
-            pd.to_numeric(df["shift_num"], errors="coerce").fillna(0).astype(int)
-        )
+    df = _fix_raw_frame(df, config["table_name"])
 
     # ✅ Ensure the table exists BEFORE referencing metadata.tables[...]
     ensure_table_exists(
@@ -480,7 +706,12 @@ def process_and_insert_data(config):
 
     try:
         logger.info(f"Inserting data into table: {config['table_name']}")
-        insert_data(df, get_metadata().tables[config["table_name"]], session)
+        insert_data(
+            df,
+            get_metadata().tables[config["table_name"]],
+            session,
+            method=config.get("insert_method", "copy"),
+        )
         logger.info(f"Data successfully inserted into {config['table_name']}.")
     except Exception as e:
         session.rollback()
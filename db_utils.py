@@ -9,13 +9,24 @@ Date: February 2025
 
 from __future__ import annotations
 
+import atexit
+import io
 import logging
 import os
 import pathlib
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
 from urllib.parse import quote_plus
 
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 from dotenv import load_dotenv
+from pyarrow import csv as pa_csv
 from sqlalchemy import (
     BigInteger,
     Boolean,
@@ -34,6 +45,8 @@ from sqlalchemy import (
     create_engine,
     text,
 )
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.schema import Identity
 
 from log_utils import setup_logger
@@ -45,6 +58,10 @@ logger = logging.getLogger(__name__)
 # ---- globals ----
 _ENV_LOADED = False
 _LOGGED_DB_CONFIG = False
+# pooled engines per (APP_ENV, connection URL, role) -- see get_db_engine
+_ENGINES: dict[tuple, Engine] = {}
+_POOL_STATS: dict[tuple, PoolStats] = {}
+_ENGINES_LOCK = threading.Lock()
 
 if os.getenv("DEBUG_IMPORTS") == "1":
     print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
@@ -65,9 +82,9 @@ def load_environment_variables():
 
 
 #     return create_engine(connection_string)
-def get_db_engine():
+def _connection_config() -> tuple[str, str, dict]:
     """
-    Create and return a SQLAlchemy database engine.
+    Return (APP_ENV, connection URL, connect_args) for the configured database.
 
     Priority:
       1) DATABASE_URL (if set)
@@ -83,16 +100,16 @@ def get_db_engine():
     global _LOGGED_DB_CONFIG
     load_environment_variables()
 
+    app_env = (os.getenv("APP_ENV") or "local").strip().lower()
     database_url = os.getenv("DATABASE_URL")
     if database_url:
         if not _LOGGED_DB_CONFIG:
             logger.info("Using DATABASE_URL from environment.")
             _LOGGED_DB_CONFIG = True
-        return create_engine(database_url, pool_pre_ping=True)
+        return app_env, database_url, {}
 
     database_type = os.getenv("DATABASE_TYPE")
     dbapi = os.getenv("DBAPI")
-    app_env = (os.getenv("APP_ENV") or "local").strip().lower()
 
     if not database_type or not dbapi:
         raise ValueError("Missing DATABASE_TYPE or DBAPI in environment.")
@@ -171,11 +188,376 @@ def get_db_engine():
     if ssl_mode:
         connect_args["sslmode"] = ssl_mode
 
-    return create_engine(
-        connection_string,
-        connect_args=connect_args,
-        pool_pre_ping=True,
+    return app_env, connection_string, connect_args
+
+
+def database_identity() -> str:
+    """Return "APP_ENV/host:port/database" of the configured database (no credentials)."""
+    app_env, url, _ = _connection_config()
+    u = make_url(url)
+    return f"{app_env}/{u.host or ''}:{u.port or ''}/{u.database or ''}"
+
+
+@dataclass
+class PoolStats:
+    """Checkout wait times of one registry engine's pool (seconds)."""
+
+    checkouts: int = 0
+    wait_sec_total: float = 0.0
+    wait_sec_max: float = 0.0
+
+    def record(self, wait_sec: float) -> None:
+        """Add one checkout that waited wait_sec."""
+        self.checkouts += 1
+        self.wait_sec_total += wait_sec
+        self.wait_sec_max = max(self.wait_sec_max, wait_sec)
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records how long every checkout waited for a connection."""
+
+    stats = PoolStats()
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.stats.record(time.perf_counter() - t0)
+
+
+def _env_int(name: str, default: int) -> int:
+    """Integer env var, default when unset or empty."""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def get_db_engine(
+    role: str = "default",
+    *,
+    pool_size: int | None = None,
+    max_overflow: int | None = None,
+    statement_timeout_ms: int | None = None,
+):
+    """
+    Return the process-wide pooled SQLAlchemy engine for role.
+
+    Engines are cached per (APP_ENV, connection URL, role): every call in a
+    process (builders, scripts, Dash callbacks) shares one warm pool, so callers
+    should not dispose() it. A role ("dash", "builder", ...) gets its own pool.
+
+    Pool settings come from the arguments or the environment:
+      DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30 s),
+      DB_STATEMENT_TIMEOUT_MS (0 = no limit; PostgreSQL only)
+    They apply when the role's engine is first created. Checkout wait times are
+    in pool_metrics(). See _connection_config for the connection variables.
+    """
+    app_env, url, connect_args = _connection_config()
+    key = (app_env, url, role)
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is not None:
+            return engine
+
+        timeout_ms = (
+            _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+            if statement_timeout_ms is None
+            else statement_timeout_ms
+        )
+        connect_args = dict(connect_args)
+        if timeout_ms > 0 and url.startswith("postgresql"):
+            connect_args["options"] = f"-c statement_timeout={int(timeout_ms)}"
+
+        stats = PoolStats()
+        engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_pre_ping=True,
+            poolclass=type("TimedQueuePool", (_TimedQueuePool,), {"stats": stats}),
+            pool_size=_env_int("DB_POOL_SIZE", 5) if pool_size is None else pool_size,
+            max_overflow=(
+                _env_int("DB_MAX_OVERFLOW", 10) if max_overflow is None else max_overflow
+            ),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", 30),
+        )
+        _ENGINES[key] = engine
+        _POOL_STATS[key] = stats
+        return engine
+
+
+def pool_metrics() -> dict[str, dict]:
+    """Checkout counts / wait times and pool occupancy per "APP_ENV/role" engine."""
+    out = {}
+    for (app_env, _url, role), engine in list(_ENGINES.items()):
+        stats = _POOL_STATS[(app_env, _url, role)]
+        pool = engine.pool
+        out[f"{app_env}/{role}"] = {
+            "checkouts": stats.checkouts,
+            "wait_ms_total": round(stats.wait_sec_total * 1000, 3),
+            "wait_ms_mean": round(
+                stats.wait_sec_total * 1000 / max(stats.checkouts, 1), 3
+            ),
+            "wait_ms_max": round(stats.wait_sec_max * 1000, 3),
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+    return out
+
+
+def log_pool_metrics() -> None:
+    """Log pool_metrics() (one line per engine that was used)."""
+    for name, m in pool_metrics().items():
+        if m["checkouts"]:
+            logger.info(
+                "DB pool %s: %s checkouts, wait mean %.1f ms / max %.1f ms",
+                name,
+                m["checkouts"],
+                m["wait_ms_mean"],
+                m["wait_ms_max"],
+            )
+
+
+def dispose_engines() -> None:
+    """Close every registry engine's pooled connections (engines stay usable)."""
+    for engine in list(_ENGINES.values()):
+        engine.dispose()
+
+
+def _reset_engines_after_fork() -> None:
+    """In a forked worker, drop inherited pool connections without closing them."""
+    global _ENGINES_LOCK
+    _ENGINES_LOCK = threading.Lock()
+    for engine in _ENGINES.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engines_after_fork)
+atexit.register(log_pool_metrics)
+
+
+# ---- bulk reads ----
+READ_BATCH_ROWS = 100_000
+COPY_DRIVERS = ("psycopg2", "psycopg")
+
+# Postgres type OID -> Arrow type for COPY ... TO STDOUT (unknown OIDs -> string)
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    26: pa.int64(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+}
+
+
+@contextmanager
+def _connected(conn):
+    """Yield a Connection for conn (an Engine is connected for the block)."""
+    if isinstance(conn, Engine):
+        with conn.connect() as c:
+            yield c
+    else:
+        yield conn
+
+
+def _compiled(conn, sql, params: dict | None) -> tuple[str, dict]:
+    """Driver-level SQL string + bind params for a text query."""
+    stmt = text(sql) if isinstance(sql, str) else sql
+    compiled = stmt.compile(dialect=conn.dialect)
+    return compiled.string, compiled.construct_params(params or {})
+
+
+def _copy_out(conn, sql, params: dict | None) -> pd.DataFrame:
+    """
+    Run sql as COPY (...) TO STDOUT (CSV) and parse it with Arrow.
+
+    Column types come from the query's result description (LIMIT 0), so ids stay
+    integers and text that looks numeric stays text. Rows never exist as Python
+    objects: the CSV bytes are parsed straight into Arrow columns.
+    """
+    query, bind = _compiled(conn, sql, params)
+    cursor = conn.connection.cursor()
+    buf = io.BytesIO()
+    try:
+        cursor.execute(f"SELECT * FROM ({query}) AS q LIMIT 0", bind)
+        names = [d[0] for d in cursor.description]
+        types = {d[0]: PG_ARROW_TYPES.get(d[1], pa.string()) for d in cursor.description}
+
+        if hasattr(cursor, "copy_expert"):
+            inner = cursor.mogrify(query, bind).decode()
+            cursor.copy_expert(
+                f"COPY ({inner}) TO STDOUT WITH (FORMAT csv, HEADER true)", buf
+            )
+        else:
+            copy_sql = f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+            with cursor.copy(copy_sql, bind) as copy:
+                for block in copy:
+                    buf.write(block)
+    finally:
+        cursor.close()
+
+    buf.seek(0)
+    table = pa_csv.read_csv(
+        buf,
+        read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types,
+            true_values=["t"],
+            false_values=["f"],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    buf.close()
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def iter_frames(
+    conn, sql, params: dict | None = None, *, batch_rows: int = READ_BATCH_ROWS
+) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of sql as DataFrames of up to batch_rows rows.
+
+    Uses a server-side cursor (stream_results), so only one batch is held in
+    memory at a time; an empty result yields one empty frame with the columns.
+    conn is an Engine or Connection.
+    """
+    with _connected(conn) as c:
+        result = c.execution_options(stream_results=True).execute(
+            text(sql) if isinstance(sql, str) else sql, params or {}
+        )
+        keys = list(result.keys())
+        empty = True
+        for rows in result.partitions(batch_rows):
+            empty = False
+            yield pd.DataFrame.from_records(rows, columns=keys, coerce_float=True)
+        if empty:
+            yield pd.DataFrame(columns=keys)
+
+
+def read_frame(
+    conn,
+    sql,
+    params: dict | None = None,
+    *,
+    method: str = "auto",
+    batch_rows: int = READ_BATCH_ROWS,
+) -> pd.DataFrame:
+    """
+    Read a whole query result into a DataFrame (pd.read_sql_query replacement).
+
+    method="copy" streams the result with COPY ... TO STDOUT into Arrow columns
+    (psycopg2 / psycopg 3 only); method="cursor" concatenates iter_frames
+    batches; "auto" uses COPY where the driver supports it. conn is an Engine or
+    Connection, sql a string or text() with :named params.
+    """
+    t0 = time.perf_counter()
+    with _connected(conn) as c:
+        if method == "auto":
+            method = "copy" if c.dialect.driver in COPY_DRIVERS else "cursor"
+        if method == "copy":
+            df = _copy_out(c, sql, params)
+        elif method == "cursor":
+            frames = list(iter_frames(c, sql, params, batch_rows=batch_rows))
+            df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        else:
+            raise ValueError(f"Unknown read method: {method!r}")
+    logger.debug(
+        "read_frame: %s rows (%s) in %.2fs", len(df), method, time.perf_counter() - t0
     )
+    return df
+
+
+# ---- bulk writes ----
+COPY_BATCH_ROWS = 100_000
+
+
+def _copy_csv(df, table):
+    """
+    Render df as COPY CSV text.
+
+    Float columns bound for integer columns (NaN-widened ints) are written as
+    integers, since COPY rejects "3.0" where a parameterized INSERT casts it.
+    Missing values become empty fields (NULL in CSV format).
+    """
+    fixes = {
+        c: df[c].round().astype("Int64")
+        for c in df.columns
+        if isinstance(table.c[c].type, Integer)
+        and pd.api.types.is_float_dtype(df[c].dtype)
+    }
+    if fixes:
+        df = df.assign(**fixes)
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False)
+    return buf.getvalue()
+
+
+def copy_dataframe(df, table, connection, *, batch_rows=COPY_BATCH_ROWS):
+    """
+    Stream df into table with COPY ... FROM STDIN (CSV), batch_rows at a time.
+
+    connection is a SQLAlchemy Connection (e.g. session.connection()); the
+    batches run in its transaction, so the caller commits or rolls back. Works
+    with psycopg2 (copy_expert) and psycopg 3 (cursor.copy); other drivers
+    raise NotImplementedError. Returns the number of rows sent.
+    """
+    prep = connection.dialect.identifier_preparer
+    cols = ", ".join(prep.quote(c) for c in df.columns)
+    sql = f"COPY {prep.format_table(table)} ({cols}) FROM STDIN WITH (FORMAT csv)"
+
+    cursor = connection.connection.cursor()
+    try:
+        if not hasattr(cursor, "copy_expert") and not hasattr(cursor, "copy"):
+            raise NotImplementedError(
+                f"COPY is not supported by the {connection.dialect.driver} driver"
+            )
+        n_batches = -(-len(df) // batch_rows)
+        for i in range(n_batches):
+            data = _copy_csv(df.iloc[i * batch_rows : (i + 1) * batch_rows], table)
+            if hasattr(cursor, "copy_expert"):
+                cursor.copy_expert(sql, io.StringIO(data))
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(data)
+            logger.debug("COPY into %s: batch %s/%s", table.name, i + 1, n_batches)
+    finally:
+        cursor.close()
+    return len(df)
+
+
+def iter_game_frames(
+    conn,
+    sql,
+    params: dict | None = None,
+    *,
+    key: str = "game_id",
+    batch_rows: int = READ_BATCH_ROWS,
+) -> Iterator[tuple[int, pd.DataFrame]]:
+    """
+    Yield (game_id, rows of that game) while the query is still streaming.
+
+    sql must be ORDER BY key. Batches come from iter_frames; a game cut by a
+    batch boundary is held back and completed with the next batch, so the first
+    game is available after one batch rather than after the whole season.
+    """
+    carry = None
+    for batch in iter_frames(conn, sql, params, batch_rows=batch_rows):
+        if carry is not None:
+            batch = pd.concat([carry, batch], ignore_index=True)
+        keys = batch[key].to_numpy()
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        for s, e in zip(starts[:-1], starts[1:]):
+            yield keys[s], batch.iloc[s:e].reset_index(drop=True)
+        carry = batch.iloc[starts[-1] :] if len(keys) else None
+    if carry is not None and len(carry):
+        yield carry[key].iloc[0], carry.reset_index(drop=True)
 
 
 # 🔹 **Step 3: Global MetaData Object (Prevents Duplication Issues)**
@@ -505,6 +887,14 @@ def create_player_game_es_table(table_name: str, metadata: MetaData) -> Table:
         # raw totals for that game at even strength
         Column("cf", Integer, nullable=False),
         Column("ca", Integer, nullable=False),
+        Column("ff", Integer),
+        Column("fa", Integer),
+        Column("sf", Integer),
+        Column("sa", Integer),
+        Column("gf", Integer),
+        Column("ga", Integer),
+        Column("xgf", Float),
+        Column("xga", Float),
         Column("toi_sec", Integer, nullable=False),
         # derived rates (optional but handy)
         Column("cf60", Float),
@@ -30,53 +30,49 @@ def season_from_table(table_name: str) -> str | None:
 
 def export_player_season_corsi_all() -> None:
     engine = get_db_engine()
-    try:
-        tables = list_raw_corsi_tables(engine)
-        season_tables = [(season_from_table(t), t) for t in tables]
-        season_tables = [(s, t) for s, t in season_tables if s is not None]
-
-        if not season_tables:
-            raise RuntimeError(
-                f"No tables matched raw_corsi_######## in schema '{RAW_SCHEMA}'."
-            )
-
-        out_rows: list[pd.DataFrame] = []
-
-        with engine.connect() as conn:
-            for season, table in season_tables:
-                print(f"Aggregating {RAW_SCHEMA}.{table} -> season {season}")
+    tables = list_raw_corsi_tables(engine)
+    season_tables = [(season_from_table(t), t) for t in tables]
+    season_tables = [(s, t) for s, t in season_tables if s is not None]
 
-                q = text(
-                    f"""
-                    SELECT
-                        :season AS season,
-                        player_id::bigint AS player_id,
-                        SUM(corsi_for)::double precision AS corsi_for,
-                        SUM(corsi_against)::double precision AS corsi_against
-                    FROM {RAW_SCHEMA}.{table}
-                    GROUP BY player_id
-                    ORDER BY player_id
-                """
-                )
+    if not season_tables:
+        raise RuntimeError(
+            f"No tables matched raw_corsi_######## in schema '{RAW_SCHEMA}'."
+        )
 
-                df = pd.read_sql_query(q, conn, params={"season": season})
+    out_rows: list[pd.DataFrame] = []
+
+    with engine.connect() as conn:
+        for season, table in season_tables:
+            print(f"Aggregating {RAW_SCHEMA}.{table} -> season {season}")
+
+            q = text(
+                f"""
+                SELECT
+                    :season AS season,
+                    player_id::bigint AS player_id,
+                    SUM(corsi_for)::double precision AS corsi_for,
+                    SUM(corsi_against)::double precision AS corsi_against
+                FROM {RAW_SCHEMA}.{table}
+                GROUP BY player_id
+                ORDER BY player_id
+            """
+            )
 
-                # Recompute cf_percent robustly
-                denom = df["corsi_for"] + df["corsi_against"]
-                df["cf_percent"] = (df["corsi_for"] / denom).fillna(0.0)
+            df = pd.read_sql_query(q, conn, params={"season": season})
 
-                out_rows.append(df)
+            # Recompute cf_percent robustly
+            denom = df["corsi_for"] + df["corsi_against"]
+            df["cf_percent"] = (df["corsi_for"] / denom).fillna(0.0)
 
-        all_df = pd.concat(out_rows, ignore_index=True)
-        all_df = all_df.sort_values(["season", "player_id"], ignore_index=True)
+            out_rows.append(df)
 
-        all_df.to_csv(OUT_CSV, index=False)
-        print(
-            f"Wrote {OUT_CSV} rows={len(all_df)} seasons={all_df['season'].nunique()}"
-        )
+    all_df = pd.concat(out_rows, ignore_index=True)
+    all_df = all_df.sort_values(["season", "player_id"], ignore_index=True)
 
-    finally:
-        engine.dispose()
+    all_df.to_csv(OUT_CSV, index=False)
+    print(
+        f"Wrote {OUT_CSV} rows={len(all_df)} seasons={all_df['season'].nunique()}"
+    )
 
 
 if __name__ == "__main__":
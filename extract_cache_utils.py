@@ -0,0 +1,258 @@
+"""
+extract_cache_utils.py.
+
+Local read-through cache of season extracts (query results) as zstd Parquet.
+
+The season builders pull the same raw.raw_shifts_resolved and
+derived.game_plays_{season}_from_raw_pbp extracts run after run. Each
+(query, params) result is stored once under the cache dir and served from disk
+while its source tables are unchanged:
+
+- Freshness is a cheap fingerprint of the query's source tables taken from the
+  catalog (no scan): relfilenode (changes on TRUNCATE / CTAS / rewrite) and the
+  pg_stat_user_tables insert / update / delete counters. Views have no stats row
+  and fall back to count(*). Postgres publishes table stats with a short delay
+  (about a second), so a rebuild started right after a write can still see the
+  old fingerprint; pass refresh=True when that matters.
+- verify=False skips the fingerprint: cached extracts are served with no
+  database round trip (repeat builds offline), misses still query the database.
+- Size-based eviction: when the cache grows past max_bytes, least recently used
+  extracts (by mtime, refreshed on every hit) are deleted.
+- Keys cover the database (db_utils.database_identity: APP_ENV, host, port,
+  database name) as well as the query and params, so switching APP_ENV or
+  DATABASE_URL never serves another database's extract, even with verify=False.
+- Entries are <cache_dir>/<key[:2]>/<key>.parquet + <key>.json (database, query,
+  params, source tables, fingerprint, rows).
+
+Config (env):
+  EXTRACT_CACHE_DIR      default: <repo>/.cache/extracts
+  EXTRACT_CACHE_MAX_MB   default: 4096
+
+Usage:
+    cache = ExtractCache()
+    gs = cached_read_frame(engine, sql, params, tables=[shifts], cache=cache)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+
+import pandas as pd
+
+from db_utils import database_identity, read_frame
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = pathlib.Path(__file__).resolve().parent / ".cache" / "extracts"
+DEFAULT_MAX_MB = 4096
+EXTRACT_CACHE_VERSION = 2
+
+SQL_TABLE_STATS = """
+SELECT
+  t.name,
+  c.relkind::text AS relkind,
+  pg_relation_filenode(c.oid)::bigint AS filenode,
+  s.n_tup_ins,
+  s.n_tup_upd,
+  s.n_tup_del
+FROM unnest(CAST(:tables AS text[])) AS t(name)
+LEFT JOIN pg_class c
+  ON c.oid = to_regclass(t.name)
+LEFT JOIN pg_stat_user_tables s
+  ON s.relid = c.oid
+ORDER BY t.name
+"""
+
+
+def table_fingerprint(conn, tables) -> str:
+    """
+    md5 over the catalog state of tables (fq names, see schema_utils.fq).
+
+    Tables: relfilenode + pg_stat insert / update / delete counters. Views and
+    other relations without a stats row: count(*). Missing relations hash as
+    missing, so creating one later changes the fingerprint.
+    """
+    stats = read_frame(conn, SQL_TABLE_STATS, {"tables": sorted(set(tables))})
+    parts = []
+    for row in stats.itertuples(index=False):
+        if pd.isna(row.relkind):
+            parts.append(f"{row.name}:missing")
+        elif pd.isna(row.n_tup_ins):
+            n = read_frame(conn, f"SELECT count(*) AS n FROM {row.name}")["n"].iloc[0]
+            parts.append(f"{row.name}:{row.relkind}:{int(n)}")
+        else:
+            parts.append(
+                f"{row.name}:{row.relkind}:{int(row.filenode)}:"
+                f"{int(row.n_tup_ins)}:{int(row.n_tup_upd)}:{int(row.n_tup_del)}"
+            )
+    return hashlib.md5("|".join(parts).encode()).hexdigest()
+
+
+class ExtractCache:
+    """(database, query, params) -> Parquet extract store with fingerprint checks and LRU."""
+
+    def __init__(
+        self,
+        cache_dir: str | os.PathLike | None = None,
+        max_bytes: int | None = None,
+        *,
+        verify: bool = True,
+        database: str | None = None,
+    ) -> None:
+        """
+        Resolve cache_dir / max_bytes from args, env, then defaults.
+
+        database defaults to db_utils.database_identity() of the configured
+        connection.
+        """
+        self.cache_dir = pathlib.Path(
+            cache_dir or os.getenv("EXTRACT_CACHE_DIR") or DEFAULT_CACHE_DIR
+        )
+        if max_bytes is None:
+            max_bytes = int(os.getenv("EXTRACT_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024**2
+        self.max_bytes = int(max_bytes)
+        self.verify = verify
+        self.database = database or database_identity()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sql, params: dict | None = None) -> str:
+        """Hash of the database, the query text and its params (order-insensitive)."""
+        payload = json.dumps(
+            [EXTRACT_CACHE_VERSION, self.database, str(sql), params or {}],
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def _path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / key[:2] / f"{key}.parquet"
+
+    def _meta(self, key: str) -> dict | None:
+        try:
+            return json.loads(self._path(key).with_suffix(".json").read_text())
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    def get(self, key: str) -> pd.DataFrame | None:
+        """Return the stored extract, or None (a hit refreshes its mtime)."""
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        os.utime(path)
+        return df
+
+    def put(self, key: str, df: pd.DataFrame, meta: dict) -> None:
+        """Store df + meta under key (atomic renames, data before meta)."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp, compression="zstd", index=False)
+        os.replace(tmp, path)
+        tmp.write_text(json.dumps({**meta, "rows": len(df)}, default=str))
+        os.replace(tmp, path.with_suffix(".json"))
+
+    def read(
+        self,
+        conn,
+        sql,
+        params: dict | None = None,
+        *,
+        tables,
+        refresh: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Return the extract of sql from the cache, querying conn when stale.
+
+        conn is an Engine or Connection (an Engine is only connected when the
+        database is needed); tables are the fq source relations of sql.
+        """
+        key = self.key(sql, params)
+        meta = None if refresh else self._meta(key)
+
+        fingerprint = None
+        if meta is not None and not self.verify:
+            df = self.get(key)
+            if df is not None:
+                self.hits += 1
+                return df
+        if self.verify:
+            fingerprint = table_fingerprint(conn, tables)
+            if meta is not None and meta.get("fingerprint") == fingerprint:
+                df = self.get(key)
+                if df is not None:
+                    self.hits += 1
+                    return df
+
+        self.misses += 1
+        t0 = time.perf_counter()
+        df = read_frame(conn, sql, params)
+        self.put(
+            key,
+            df,
+            {
+                "database": self.database,
+                "sql": str(sql),
+                "params": params or {},
+                "tables": sorted(set(tables)),
+                "fingerprint": fingerprint,
+            },
+        )
+        logger.info(
+            "extract cache miss: %s rows in %.1fs -> %s",
+            len(df),
+            time.perf_counter() - t0,
+            self._path(key).name,
+        )
+        self.evict()
+        return df
+
+    def size_bytes(self) -> int:
+        """Return the total size of all cache entries."""
+        return sum(p.stat().st_size for p in self.cache_dir.rglob("*.parquet"))
+
+    def evict(self) -> int:
+        """Delete least recently used extracts until under max_bytes; return count."""
+        if not self.cache_dir.exists():
+            return 0
+        entries = [(p, p.stat()) for p in self.cache_dir.rglob("*.parquet")]
+        total = sum(st.st_size for _, st in entries)
+        if total <= self.max_bytes:
+            return 0
+
+        removed = 0
+        for path, st in sorted(entries, key=lambda e: e[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+            total -= st.st_size
+            removed += 1
+        logger.info(
+            "extract cache evicted %s entries (now %.1f MB)", removed, total / 1024**2
+        )
+        return removed
+
+
+def cached_read_frame(
+    conn,
+    sql,
+    params: dict | None = None,
+    *,
+    tables,
+    cache: ExtractCache | None = None,
+) -> pd.DataFrame:
+    """read_frame(conn, sql, params), through cache when one is given."""
+    if cache is None:
+        return read_frame(conn, sql, params)
+    return cache.read(conn, sql, params, tables=tables)
@@ -0,0 +1,373 @@
+"""
+game_store_utils.py.
+
+Memory-mapped per-season game bundles on local disk.
+
+Every builder run used to re-query Postgres for a full season of shifts and
+plays, then split the frames with dict(tuple(df.groupby("game_id"))). A bundle
+keeps the builder-ready frames of one season on disk instead:
+
+  <root>/<season>/<variant>/
+      meta.json                 columns, dtypes, categories, source hash
+      <frame>/_index.npy        int64 rows of (game_id, offset, length)
+      <frame>/000.npy, 001.npy  one array per column (categoricals as codes)
+
+Rows are stored sorted by game_id, so a game is one contiguous (offset, length)
+range of every column. Columns are opened with np.load(mmap_mode="r"): opening
+a bundle reads only meta.json, and a game's arrays are zero-copy slices of the
+mapped files (pages are read on first touch).
+
+A variant names one loader (e.g. "player_game_stats"), since builders load
+shifts with different offsets / filters. SeasonStore.load() serves the bundle
+when its source hash (incremental_utils.source_fingerprints) still matches the
+database and rebuilds it from the loader otherwise; verify=False skips that
+check and opens the bundle without touching the database at all.
+
+Usage:
+    store = SeasonStore()
+    bundle = store.load(engine, season, "player_game_stats", load_season_inputs)
+    gs = bundle.frame("gs")                      # whole season, mmap-backed
+    gs_game = bundle.game("gs", 2018020001)      # one game, zero-copy
+    for game_id, gp in bundle.by_game("gp").items(): ...
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import time
+from collections.abc import Callable, Mapping
+
+import numpy as np
+import pandas as pd
+
+from incremental_utils import source_fingerprints
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = pathlib.Path(__file__).resolve().parent / ".cache" / "season_store"
+# bump when a stored loader layout changes (older bundles are rebuilt)
+STORE_VERSION = 2
+INDEX_FILE = "_index.npy"
+META_FILE = "meta.json"
+
+
+# -------------------------
+# Per-game slicing
+# -------------------------
+def game_index(game_id: np.ndarray) -> np.ndarray:
+    """
+    (game_id, offset, length) rows for an array already sorted by game_id.
+
+    Returns an int64 array of shape (n_games, 3).
+    """
+    gid = np.asarray(game_id)
+    if gid.size == 0:
+        return np.empty((0, 3), dtype=np.int64)
+    starts = np.r_[0, np.flatnonzero(gid[1:] != gid[:-1]) + 1]
+    lengths = np.diff(np.r_[starts, gid.size])
+    return np.column_stack([gid[starts], starts, lengths]).astype(np.int64)
+
+
+class GameSlices(Mapping):
+    """Read-only game_id -> frame mapping over a frame sorted by game_id."""
+
+    def __init__(self, df: pd.DataFrame, index: np.ndarray) -> None:
+        """Wrap df (sorted by game_id) and its game_index() rows."""
+        self._df = df
+        self._ids = index[:, 0]
+        self._offsets = index[:, 1]
+        self._lengths = index[:, 2]
+
+    def _pos(self, game_id) -> int:
+        pos = int(np.searchsorted(self._ids, game_id))
+        if pos >= len(self._ids) or self._ids[pos] != game_id:
+            raise KeyError(game_id)
+        return pos
+
+    def __getitem__(self, game_id) -> pd.DataFrame:
+        """Return game_id's rows as an iloc slice (no per-game copy)."""
+        pos = self._pos(game_id)
+        start = int(self._offsets[pos])
+        return self._df.iloc[start : start + int(self._lengths[pos])]
+
+    def __contains__(self, game_id) -> bool:
+        """Return True when game_id has rows."""
+        try:
+            self._pos(game_id)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        """Iterate game_ids in ascending order."""
+        return (int(g) for g in self._ids)
+
+    def __len__(self) -> int:
+        """Return the number of games."""
+        return len(self._ids)
+
+
+def game_slices(df: pd.DataFrame) -> GameSlices:
+    """
+    Lazy replacement for dict(tuple(df.groupby("game_id"))).
+
+    Rows with a missing game_id are dropped (as groupby does); df is stable-sorted
+    by game_id first unless it already is, so row order within a game is kept.
+    """
+    gid = df["game_id"]
+    if gid.hasnans:
+        df = df[gid.notna().to_numpy()]
+        gid = df["game_id"]
+    if not gid.is_monotonic_increasing:
+        df = df.iloc[np.argsort(gid.to_numpy(), kind="stable")]
+    return GameSlices(df, game_index(df["game_id"].to_numpy()))
+
+
+# -------------------------
+# Bundle files
+# -------------------------
+def _column_arrays(s: pd.Series) -> tuple[np.ndarray, dict]:
+    """Storable array + meta entry for one column (strings become categoricals)."""
+    if s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+        s = s.astype("category")
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        cats = s.cat.categories
+        return s.cat.codes.to_numpy(), {
+            "dtype": "category",
+            "categories": cats.tolist(),
+            "categories_dtype": str(cats.dtype),
+        }
+    arr = s.to_numpy()
+    if arr.dtype == object:
+        raise TypeError(f"column {s.name!r} has unsupported dtype {s.dtype}")
+    return arr, {"dtype": str(arr.dtype)}
+
+
+def write_bundle(
+    path: str | os.PathLike,
+    frames: dict[str, pd.DataFrame],
+    *,
+    meta: dict | None = None,
+) -> pathlib.Path:
+    """
+    Write frames (each with a game_id column) as a bundle directory at path.
+
+    The bundle is written next to path and renamed into place, so readers never
+    see a partial bundle. Returns the bundle path.
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    info = {"version": STORE_VERSION, "created_at": time.time(), **(meta or {})}
+    info["frames"] = {}
+    for name, df in frames.items():
+        frame_dir = tmp / name
+        frame_dir.mkdir(parents=True)
+
+        gid = df["game_id"].to_numpy()
+        order = np.argsort(gid, kind="stable")
+        df = df.iloc[order]
+        np.save(frame_dir / INDEX_FILE, game_index(gid[order]))
+
+        columns = []
+        for i, col in enumerate(df.columns):
+            arr, col_meta = _column_arrays(df[col])
+            np.save(frame_dir / f"{i:03d}.npy", np.ascontiguousarray(arr))
+            columns.append({"name": str(col), **col_meta})
+        info["frames"][name] = {"rows": len(df), "columns": columns}
+
+    (tmp / META_FILE).write_text(json.dumps(info, indent=2))
+
+    old = path.with_name(f"{path.name}.{os.getpid()}.old")
+    if path.exists():
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    return path
+
+
+class GameBundle:
+    """One season bundle opened read-only with memory-mapped columns."""
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        """Read meta.json; column files are mapped on first use."""
+        self.path = pathlib.Path(path)
+        self.meta = json.loads((self.path / META_FILE).read_text())
+        if self.meta.get("version") != STORE_VERSION:
+            raise ValueError(
+                f"{self.path}: bundle version {self.meta.get('version')} "
+                f"!= {STORE_VERSION}"
+            )
+        self._arrays: dict[str, dict[str, np.ndarray]] = {}
+        self._index: dict[str, np.ndarray] = {}
+
+    @property
+    def names(self) -> list[str]:
+        """Return the frame names in the bundle."""
+        return list(self.meta["frames"])
+
+    def index(self, name: str) -> np.ndarray:
+        """Return (game_id, offset, length) rows for frame `name`."""
+        if name not in self._index:
+            self._index[name] = np.load(self.path / name / INDEX_FILE)
+        return self._index[name]
+
+    def game_ids(self, name: str) -> np.ndarray:
+        """Return the sorted game_ids present in frame `name`."""
+        return self.index(name)[:, 0]
+
+    def columns(self, name: str) -> dict[str, np.ndarray]:
+        """Return frame `name` as {column: memory-mapped array}."""
+        if name not in self._arrays:
+            cols = self.meta["frames"][name]["columns"]
+            # plain ndarray views of the maps (np.memmap would leak into pandas)
+            self._arrays[name] = {
+                c["name"]: np.asarray(
+                    np.load(self.path / name / f"{i:03d}.npy", mmap_mode="r")
+                )
+                for i, c in enumerate(cols)
+            }
+        return self._arrays[name]
+
+    def _to_frame(self, name: str, arrays: dict[str, np.ndarray]) -> pd.DataFrame:
+        data = {}
+        for c in self.meta["frames"][name]["columns"]:
+            arr = arrays[c["name"]]
+            if c["dtype"] == "category":
+                cats = pd.Index(c["categories"], dtype=c["categories_dtype"])
+                data[c["name"]] = pd.Categorical.from_codes(arr, categories=cats)
+            else:
+                data[c["name"]] = arr
+        return pd.DataFrame(data, copy=False)
+
+    def frame(self, name: str) -> pd.DataFrame:
+        """Return the whole frame `name`, sorted by game_id and backed by the maps."""
+        return self._to_frame(name, self.columns(name))
+
+    def arrays(self, name: str, game_id: int) -> dict[str, np.ndarray]:
+        """Return one game's columns as zero-copy slices (categoricals as codes)."""
+        index = self.index(name)
+        pos = int(np.searchsorted(index[:, 0], game_id))
+        if pos >= len(index) or index[pos, 0] != game_id:
+            raise KeyError(game_id)
+        start, length = int(index[pos, 1]), int(index[pos, 2])
+        return {
+            col: arr[start : start + length] for col, arr in self.columns(name).items()
+        }
+
+    def game(self, name: str, game_id: int) -> pd.DataFrame:
+        """Return one game's rows of frame `name`."""
+        return self._to_frame(name, self.arrays(name, game_id))
+
+    def by_game(self, name: str) -> GameSlices:
+        """Return a lazy game_id -> frame mapping over frame `name`."""
+        return GameSlices(self.frame(name), self.index(name))
+
+
+# -------------------------
+# Season store
+# -------------------------
+def season_source_hash(conn, season: int) -> str:
+    """One md5 over every game fingerprint of the season's source rows."""
+    fp = source_fingerprints(conn, season)
+    h = hashlib.md5()
+    for game_id, source_hash in zip(fp["game_id"], fp["source_hash"]):
+        h.update(f"{int(game_id)}:{source_hash}|".encode())
+    return h.hexdigest()
+
+
+class SeasonStore:
+    """Season bundles under root, one directory per (season, variant)."""
+
+    def __init__(
+        self, root: str | os.PathLike | None = None, *, verify: bool = True
+    ) -> None:
+        """Resolve root from the arg, SEASON_STORE_DIR, then DEFAULT_STORE_DIR."""
+        self.root = pathlib.Path(
+            root or os.getenv("SEASON_STORE_DIR") or DEFAULT_STORE_DIR
+        )
+        self.verify = verify
+
+    def path(self, season: int, variant: str) -> pathlib.Path:
+        """Return the bundle directory of (season, variant)."""
+        return self.root / str(int(season)) / variant
+
+    def open(self, season: int, variant: str) -> GameBundle | None:
+        """Open the stored bundle, or None if it is missing or unreadable."""
+        path = self.path(season, variant)
+        try:
+            return GameBundle(path)
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            return None
+
+    def write(
+        self,
+        season: int,
+        variant: str,
+        frames: dict[str, pd.DataFrame],
+        *,
+        source_hash: str | None = None,
+    ) -> GameBundle:
+        """Store frames as the (season, variant) bundle and open it."""
+        path = write_bundle(
+            self.path(season, variant),
+            frames,
+            meta={
+                "season": int(season),
+                "variant": variant,
+                "source_hash": source_hash,
+            },
+        )
+        return GameBundle(path)
+
+    def load(
+        self,
+        engine,
+        season: int,
+        variant: str,
+        loader: Callable[..., dict[str, pd.DataFrame]],
+        *,
+        refresh: bool = False,
+    ) -> GameBundle:
+        """
+        Return the (season, variant) bundle, rebuilding it from loader when stale.
+
+        loader(conn, season) returns the frames to store. With verify=True the
+        bundle is rebuilt when the season's source hash changed; with
+        verify=False an existing bundle is opened without a database round trip.
+        """
+        bundle = None if refresh else self.open(season, variant)
+        if bundle is not None and not self.verify:
+            logger.info("%s/%s: opened bundle %s", season, variant, bundle.path)
+            return bundle
+
+        with engine.connect() as conn:
+            source_hash = season_source_hash(conn, season) if self.verify else None
+            if bundle is not None and bundle.meta.get("source_hash") == source_hash:
+                logger.info(
+                    "%s/%s: bundle is current (%s)", season, variant, bundle.path
+                )
+                return bundle
+
+            logger.info("%s/%s: loading season from the database", season, variant)
+            frames = loader(conn, season)
+
+        bundle = self.write(season, variant, frames, source_hash=source_hash)
+        logger.info(
+            "%s/%s: wrote bundle %s (%s)",
+            season,
+            variant,
+            bundle.path,
+            ", ".join(f"{n}={bundle.meta['frames'][n]['rows']}" for n in bundle.names),
+        )
+        return bundle
@@ -0,0 +1,371 @@
+"""
+incremental_utils.py.
+
+Watermark-based incremental rebuilds for per-season mart tables.
+
+Nightly in-season runs only need the handful of games that were added (or whose
+source rows changed) since the last build. For every game we fingerprint its
+source rows in SQL:
+
+  - raw.raw_shifts_resolved rows for the season (regular season)
+  - derived.game_plays_{season}_from_raw_pbp rows
+  (legacy seasons: raw.game_shifts / raw.game_plays rows of the season's
+  regular-season games in raw.game)
+
+and remember the fingerprint per (target_table, game_id) in mart.build_watermark.
+A game is rebuilt when it has no watermark yet or its fingerprint changed; games
+that disappeared from the sources are deleted from the target.
+
+Writes are game-level upserts: DELETE the target rows for the rebuilt game_ids,
+INSERT the new rows, and upsert the watermarks, all in one transaction.
+
+Usage:
+    plan = plan_incremental(engine, season, "mart", f"player_game_es_{season}")
+    df = build(..., game_ids=plan.rebuild)
+    upsert_games(engine, "mart", table, df, plan)
+
+    # full builds: fingerprint before loading, record after writing
+    fp = source_fingerprints(engine, season)
+    df = build(...)
+    record_full_build(engine, "mart", table, fp)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+from dataclasses import dataclass, field
+
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils import read_frame
+from schema_utils import fq, qident
+from season_data_utils import is_legacy_season
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_TABLE = "build_watermark"
+
+
+@dataclass
+class IncrementalPlan:
+    """Games to (re)build and delete for one target table."""
+
+    target: str
+    rebuild: list[int] = field(default_factory=list)
+    stale: list[int] = field(default_factory=list)
+    fingerprints: pd.DataFrame = field(
+        default_factory=lambda: pd.DataFrame(columns=["game_id", "source_hash"])
+    )
+
+    @property
+    def empty(self) -> bool:
+        """True when nothing needs to change."""
+        return not self.rebuild and not self.stale
+
+
+def ensure_watermark_table(conn) -> None:
+    """Create mart.build_watermark if missing."""
+    conn.execute(
+        text(
+            f"""
+            CREATE TABLE IF NOT EXISTS {fq("mart", WATERMARK_TABLE, quote=True)} (
+              target_table text NOT NULL,
+              game_id bigint NOT NULL,
+              source_hash text NOT NULL,
+              built_at timestamptz NOT NULL DEFAULT now(),
+              PRIMARY KEY (target_table, game_id)
+            );
+            """
+        )
+    )
+
+
+def target_exists(conn, schema: str, table: str) -> bool:
+    """Check for a table in information_schema."""
+    q = text(
+        """
+        SELECT EXISTS (
+          SELECT 1
+          FROM information_schema.tables
+          WHERE table_schema = :schema
+            AND table_name = :table
+        );
+        """
+    )
+    return bool(conn.execute(q, {"schema": schema, "table": table}).scalar())
+
+
+def table_columns(conn, schema: str, table: str) -> set[str]:
+    """Column names of schema.table (empty if it does not exist)."""
+    q = text(
+        """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = :schema
+          AND table_name = :table
+        """
+    )
+    return {r[0] for r in conn.execute(q, {"schema": schema, "table": table})}
+
+
+def add_missing_columns(
+    engine, schema: str, table: str, columns: dict[str, str]
+) -> list[str]:
+    """
+    ALTER TABLE ... ADD COLUMN for columns (name -> SQL type) the table lacks.
+
+    Returns the added column names (none if the table does not exist yet).
+    Existing rows get NULLs, so callers should rebuild every game after adding.
+    """
+    with engine.begin() as conn:
+        existing = table_columns(conn, schema, table)
+        if not existing:
+            return []
+        added = [c for c in columns if c not in existing]
+        for col in added:
+            conn.execute(
+                text(
+                    f"ALTER TABLE {qident(schema)}.{qident(table)}"
+                    f" ADD COLUMN IF NOT EXISTS {qident(col)} {columns[col]}"
+                )
+            )
+    if added:
+        logger.info("%s.%s: added columns %s", schema, table, added)
+    return added
+
+
+def source_fingerprints(conn, season: int) -> pd.DataFrame:
+    """
+    One md5 per game_id over its shift rows and play rows.
+
+    Any inserted, deleted or edited source row changes the game's hash.
+    """
+    if is_legacy_season(season):
+        games = f"""
+          SELECT game_id FROM {fq("raw", "game")}
+          WHERE season = :season AND type = 'R'
+        """
+        s_cte = f"""
+          SELECT
+            x.game_id,
+            md5(string_agg(
+              concat_ws(',', x.player_id, x.period, x.shift_start, x.shift_end),
+              '|' ORDER BY x.player_id, x.period, x.shift_start, x.shift_end
+            )) AS h
+          FROM {fq("raw", "game_shifts")} x
+          JOIN ({games}) g ON g.game_id = x.game_id
+          GROUP BY x.game_id
+        """
+        p_cte = f"""
+          SELECT
+            x.game_id,
+            md5(string_agg(
+              concat_ws(',', x.play_id, x.period, x."periodTime", x.event,
+                        x.team_id_for, x.team_id_against),
+              '|' ORDER BY x.play_id
+            )) AS h
+          FROM {fq("raw", "game_plays")} x
+          JOIN ({games}) g ON g.game_id = x.game_id
+          GROUP BY x.game_id
+        """
+    else:
+        s_cte = f"""
+          SELECT
+            game_id,
+            md5(string_agg(
+              concat_ws(',', player_id_resolved, team, position, game_period,
+                        seconds_start, seconds_end),
+              '|' ORDER BY player_id_resolved, team, game_period,
+                           seconds_start, seconds_end, position
+            )) AS h
+          FROM {fq("raw", "raw_shifts_resolved")}
+          WHERE season = :season
+            AND session = 'R'
+          GROUP BY game_id
+        """
+        p_cte = f"""
+          SELECT
+            game_id,
+            md5(string_agg(
+              concat_ws(',', event_index, game_period, game_seconds, event_type,
+                        event_team, home_team, away_team),
+              '|' ORDER BY event_index, game_seconds, event_type, event_team
+            )) AS h
+          FROM {fq("derived", f"game_plays_{season}_from_raw_pbp")}
+          GROUP BY game_id
+        """
+    q = text(
+        f"""
+        WITH s AS ({s_cte}),
+        p AS ({p_cte})
+        SELECT
+          COALESCE(s.game_id, p.game_id)::bigint AS game_id,
+          md5(COALESCE(s.h, '') || ':' || COALESCE(p.h, '')) AS source_hash
+        FROM s
+        FULL OUTER JOIN p
+          ON p.game_id = s.game_id
+        ORDER BY 1
+        """
+    )
+    return read_frame(conn, q, {"season": int(season)})
+
+
+def plan_incremental(engine, season: int, schema: str, table: str) -> IncrementalPlan:
+    """
+    Compare source fingerprints with the stored watermarks for schema.table.
+
+    If the target table does not exist yet every source game is scheduled.
+    """
+    target = f"{schema}.{table}"
+    with engine.begin() as conn:
+        ensure_watermark_table(conn)
+        fp = source_fingerprints(conn, season)
+        if target_exists(conn, schema, table):
+            wm = read_frame(
+                conn,
+                text(
+                    f"""
+                    SELECT game_id::bigint AS game_id, source_hash
+                    FROM {fq("mart", WATERMARK_TABLE, quote=True)}
+                    WHERE target_table = :target
+                    """
+                ),
+                {"target": target},
+            )
+        else:
+            wm = pd.DataFrame(columns=["game_id", "source_hash"])
+
+    merged = fp.merge(
+        wm, on="game_id", how="outer", suffixes=("", "_built"), indicator=True
+    )
+    changed = merged["_merge"].eq("left_only") | (
+        merged["_merge"].eq("both")
+        & merged["source_hash"].ne(merged["source_hash_built"])
+    )
+    plan = IncrementalPlan(
+        target=target,
+        rebuild=sorted(merged.loc[changed, "game_id"].astype(int).tolist()),
+        stale=sorted(
+            merged.loc[merged["_merge"].eq("right_only"), "game_id"]
+            .astype(int)
+            .tolist()
+        ),
+        fingerprints=fp,
+    )
+    logger.info(
+        "%s: %s source games, %s to rebuild, %s stale",
+        target,
+        len(fp),
+        len(plan.rebuild),
+        len(plan.stale),
+    )
+    return plan
+
+
+def record_watermarks(conn, plan: IncrementalPlan) -> None:
+    """Upsert watermarks for plan.rebuild and drop them for plan.stale."""
+    wm = fq("mart", WATERMARK_TABLE, quote=True)
+    if plan.stale:
+        conn.execute(
+            text(
+                f"DELETE FROM {wm} WHERE target_table = :target"
+                " AND game_id = ANY(:game_ids)"
+            ),
+            {"target": plan.target, "game_ids": plan.stale},
+        )
+    rows = plan.fingerprints[plan.fingerprints["game_id"].isin(plan.rebuild)]
+    if rows.empty:
+        return
+    conn.execute(
+        text(
+            f"""
+            INSERT INTO {wm} (target_table, game_id, source_hash, built_at)
+            VALUES (:target, :game_id, :source_hash, now())
+            ON CONFLICT (target_table, game_id)
+            DO UPDATE SET source_hash = EXCLUDED.source_hash, built_at = now();
+            """
+        ),
+        [
+            {"target": plan.target, "game_id": int(g), "source_hash": h}
+            for g, h in zip(rows["game_id"], rows["source_hash"])
+        ],
+    )
+
+
+def record_full_build(
+    engine, schema: str, table: str, fingerprints: pd.DataFrame
+) -> None:
+    """
+    Reset the watermarks of schema.table after a full (non-incremental) build.
+
+    fingerprints must be taken (source_fingerprints) before the build loads its
+    sources, so a source edit that lands during the build is still seen as a
+    change by the next --incremental run.
+    """
+    target = f"{schema}.{table}"
+    with engine.begin() as conn:
+        ensure_watermark_table(conn)
+        conn.execute(
+            text(
+                f"DELETE FROM {fq('mart', WATERMARK_TABLE, quote=True)}"
+                " WHERE target_table = :target"
+            ),
+            {"target": target},
+        )
+        plan = IncrementalPlan(
+            target=target,
+            rebuild=fingerprints["game_id"].astype(int).tolist(),
+            fingerprints=fingerprints,
+        )
+        record_watermarks(conn, plan)
+    logger.info("%s: recorded %s game watermarks", target, len(fingerprints))
+
+
+def delete_games(conn, schema: str, table: str, game_ids: list[int]) -> None:
+    """DELETE target rows for game_ids."""
+    if not game_ids:
+        return
+    conn.execute(
+        text(
+            f"DELETE FROM {qident(schema)}.{qident(table)}"
+            " WHERE game_id = ANY(:game_ids)"
+        ),
+        {"game_ids": [int(g) for g in game_ids]},
+    )
+
+
+def upsert_games(
+    engine, schema: str, table: str, df: pd.DataFrame, plan: IncrementalPlan
+) -> None:
+    """
+    Replace the rows of plan.rebuild (and remove plan.stale) in schema.table.
+
+    df holds the freshly built rows for plan.rebuild; DELETE + INSERT + watermark
+    upsert run in one transaction so a failed night leaves the table untouched.
+    """
+    with engine.begin() as conn:
+        delete_games(conn, schema, table, plan.rebuild + plan.stale)
+        if not df.empty:
+            df.to_sql(
+                table,
+                conn,
+                schema=schema,
+                if_exists="append",
+                index=False,
+                method="multi",
+            )
+        record_watermarks(conn, plan)
+    logger.info(
+        "✅ upserted %s rows (%s games, %s stale) -> %s.%s",
+        len(df),
+        len(plan.rebuild),
+        len(plan.stale),
+        schema,
+        table,
+    )
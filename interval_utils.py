@@ -0,0 +1,224 @@
+"""
+interval_utils.py.
+
+Vectorized interval algebra for shift math (merge, intersect, subtract).
+
+All intervals are half-open [start, end) in integer seconds. Every function takes
+optional `keys` (e.g. game_id) so a whole season can be processed in one call:
+intervals only interact with exclude intervals that carry the same key.
+
+How it stays O((n + m) log m):
+- keys are mapped to dense codes and each key gets its own band on one number line
+  (code * span + time), so a single sort/searchsorted covers every game at once.
+- exclude intervals are merged into a disjoint union per key, then
+  overlap(a, b) = F(b) - F(a), where F(x) is the prefix sum of excluded seconds up
+  to x (one searchsorted per endpoint).
+
+Used by ES TOI (strength segments), and available for penalty windows and
+strength-state splits.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+
+def _as_keys(keys: np.ndarray | None, n: int) -> np.ndarray:
+    """Return int64 keys (all zeros when no keys are given)."""
+    if keys is None:
+        return np.zeros(n, dtype=np.int64)
+    return np.asarray(keys, dtype=np.int64)
+
+
+def _band_axis(
+    keys: np.ndarray,
+    times: list[np.ndarray],
+    ex_keys: np.ndarray,
+    ex_times: list[np.ndarray],
+) -> tuple[list[np.ndarray], list[np.ndarray]]:
+    """Map (key, time) pairs of both interval sets onto one shared banded axis."""
+    all_keys = np.concatenate([keys, ex_keys])
+    _, codes = np.unique(all_keys, return_inverse=True)
+    codes = codes.astype(np.int64)
+    code, ex_code = codes[: len(keys)], codes[len(keys) :]
+
+    t_all = np.concatenate(times + ex_times)
+    t_min = int(t_all.min())
+    span = int(t_all.max()) - t_min + 1
+
+    return (
+        [code * span + (t - t_min) for t in times],
+        [ex_code * span + (t - t_min) for t in ex_times],
+    )
+
+
+def merge_intervals(
+    starts: np.ndarray, ends: np.ndarray, keys: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge overlapping/touching [start,end) intervals within each key.
+
+    Returns (starts, ends, keys) of the merged intervals, sorted by (key, start).
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keys = _as_keys(keys, len(starts))
+    if len(starts) == 0:
+        return starts, ends, keys
+
+    order = np.lexsort((starts, keys))
+    k = keys[order]
+    s = starts[order]
+    e = ends[order]
+
+    (s_ax, e_ax), _ = _band_axis(k, [s, e], k[:0], [])
+    run_end = np.maximum.accumulate(e_ax)
+
+    is_new = np.ones(len(k), dtype=bool)
+    is_new[1:] = s_ax[1:] > run_end[:-1]
+    first = np.flatnonzero(is_new)
+
+    return s[first], np.maximum.reduceat(e, first), k[first]
+
+
+def _excluded_before(
+    x: np.ndarray, ex_starts: np.ndarray, length: np.ndarray, cum: np.ndarray
+) -> np.ndarray:
+    """F(x): excluded seconds strictly before x on the band axis."""
+    j = np.searchsorted(ex_starts, x, side="right") - 1
+    jj = np.maximum(j, 0)
+    partial = np.clip(x - ex_starts[jj], 0, length[jj])
+    return np.where(j >= 0, cum[jj] + partial, 0)
+
+
+def overlap_seconds(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    ex_starts: np.ndarray,
+    ex_ends: np.ndarray,
+    *,
+    keys: np.ndarray | None = None,
+    ex_keys: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Seconds of each [start,end) covered by the exclude intervals with the same key.
+
+    Exclude intervals may overlap each other; their union is used.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    out = np.zeros(len(starts), dtype=np.int64)
+    if len(starts) == 0 or len(ex_starts) == 0:
+        return out
+
+    keys = _as_keys(keys, len(starts))
+    ex_s, ex_e, ex_k = merge_intervals(
+        ex_starts, ex_ends, _as_keys(ex_keys, len(ex_starts))
+    )
+    (a, b), (ex_a, ex_b) = _band_axis(keys, [starts, ends], ex_k, [ex_s, ex_e])
+
+    length = ex_b - ex_a
+    cum = np.concatenate([[0], np.cumsum(length)])
+    out = _excluded_before(b, ex_a, length, cum) - _excluded_before(
+        a, ex_a, length, cum
+    )
+    return np.maximum(out, 0).astype(np.int64)
+
+
+def _covering_range(
+    a: np.ndarray, b: np.ndarray, ex_a: np.ndarray, ex_b: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Index range [lo, hi) of disjoint exclude intervals that overlap each [a, b)."""
+    lo = np.searchsorted(ex_b, a, side="right")
+    hi = np.searchsorted(ex_a, b, side="left")
+    return lo, np.maximum(hi, lo)
+
+
+def intersect_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    other_starts: np.ndarray,
+    other_ends: np.ndarray,
+    *,
+    keys: np.ndarray | None = None,
+    other_keys: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pieces of each [start,end) that lie inside the other intervals (same key).
+
+    Returns (index, starts, ends): index points back into the input intervals.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    empty = np.array([], dtype=np.int64)
+    if len(starts) == 0 or len(other_starts) == 0:
+        return empty, empty, empty
+
+    keys = _as_keys(keys, len(starts))
+    o_s, o_e, o_k = merge_intervals(
+        other_starts, other_ends, _as_keys(other_keys, len(other_starts))
+    )
+    (a, b), (o_a, o_b) = _band_axis(keys, [starts, ends], o_k, [o_s, o_e])
+
+    lo, hi = _covering_range(a, b, o_a, o_b)
+    n = hi - lo
+    idx = np.repeat(np.arange(len(starts)), n)
+    j = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n)
+
+    piece_s = np.maximum(starts[idx], o_s[j])
+    piece_e = np.minimum(ends[idx], o_e[j])
+    keep = piece_e > piece_s
+    return idx[keep], piece_s[keep], piece_e[keep]
+
+
+def subtract_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    ex_starts: np.ndarray,
+    ex_ends: np.ndarray,
+    *,
+    keys: np.ndarray | None = None,
+    ex_keys: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pieces of each [start,end) left after removing the exclude intervals (same key).
+
+    Returns (index, starts, ends): index points back into the input intervals.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if len(starts) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    if len(ex_starts) == 0:
+        keep = ends > starts
+        return np.flatnonzero(keep), starts[keep], ends[keep]
+
+    keys = _as_keys(keys, len(starts))
+    ex_s, ex_e, ex_k = merge_intervals(
+        ex_starts, ex_ends, _as_keys(ex_keys, len(ex_starts))
+    )
+    (a, b), (ex_a, ex_b) = _band_axis(keys, [starts, ends], ex_k, [ex_s, ex_e])
+
+    # k exclude intervals inside [a, b) leave at most k + 1 gaps
+    lo, hi = _covering_range(a, b, ex_a, ex_b)
+    n = hi - lo + 1
+    idx = np.repeat(np.arange(len(starts)), n)
+    pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    j = np.repeat(lo, n) + pos
+
+    is_first = pos == 0
+    is_last = pos == np.repeat(n - 1, n)
+    gap_s = np.where(is_first, starts[idx], ex_e[np.clip(j - 1, 0, len(ex_e) - 1)])
+    gap_e = np.where(is_last, ends[idx], ex_s[np.clip(j, 0, len(ex_s) - 1)])
+
+    piece_s = np.maximum(gap_s, starts[idx])
+    piece_e = np.minimum(gap_e, ends[idx])
+    keep = piece_e > piece_s
+    return idx[keep], piece_s[keep], piece_e[keep]
@@ -0,0 +1,325 @@
+"""
+legacy_engine_utils.py.
+
+Frozen per-event reference implementations of the Corsi/TOI builders, as they
+were before the vectorized engines (on_ice_utils, strength segments,
+interval_utils). Used only as an oracle by scripts/diff_engines.py; do not
+optimize these.
+
+Each function reproduces one builder's original semantics:
+
+  legacy_premier_corsi        premier_make_corsi_stats_modern (per game)
+    - goalies dropped with the 2200 s TOI heuristic
+    - play -> breakpoint with searchsorted(side="left")
+    - on ice: shift_start <= t <= shift_end, matched on player_id only
+  legacy_player_game_es       build_player_game_es
+    - ES TOI from merged shifts; play -> breakpoint with side="right"
+    - on ice: shift_start <= t < shift_end, matched on (player_id, team_id)
+  legacy_player_game_stats    build_modern_player_game_stats
+    - ES TOI summed per shift row; play -> breakpoint with side="right"
+    - on ice: shift_start <= t <= shift_end, matched on player_id only
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+CORSI_EVENTS = ["Shot", "Blocked Shot", "Missed Shot", "Goal"]
+SHOT_EVENTS = ("Shot", "Goal", "Missed Shot")
+KEYS = ["game_id", "player_id", "team_id"]
+
+
+# -------------------------
+# Strength timeline
+# -------------------------
+def legacy_num_players(shift_df: pd.DataFrame) -> pd.DataFrame:
+    """Skaters on ice at each breakpoint: columns value (time), num_players."""
+    if shift_df.empty:
+        return pd.DataFrame(columns=["value", "num_players"])
+
+    melted = pd.melt(
+        shift_df,
+        id_vars=["game_id", "player_id"],
+        value_vars=["shift_start", "shift_end"],
+    ).sort_values("value", ignore_index=True)
+    melted["change"] = 2 * (melted["variable"] == "shift_start").astype(int) - 1
+    melted["num_players"] = melted["change"].cumsum()
+
+    out = melted.groupby("value")["num_players"].last().reset_index()
+    return out[out["num_players"].shift() != out["num_players"]].reset_index(drop=True)
+
+
+def legacy_exclude_timeline(gs_skaters: pd.DataFrame) -> pd.DataFrame:
+    """Per-game exclude timeline: columns time, team_1, team_2, exclude."""
+    empty = pd.DataFrame(columns=["time", "team_1", "team_2", "exclude"])
+    if gs_skaters.empty:
+        return empty
+
+    gs = gs_skaters.copy()
+    gs["shift_start"] = gs["shift_start"].astype(int)
+    gs["shift_end"] = gs["shift_end"].astype(int)
+
+    team_ids = sorted(gs["team_id"].dropna().unique())
+    if len(team_ids) != 2:
+        return empty
+
+    t1, t2 = team_ids
+    df1 = legacy_num_players(gs[gs["team_id"] == t1]).rename(
+        columns={"value": "time", "num_players": "team_1"}
+    )
+    df2 = legacy_num_players(gs[gs["team_id"] == t2]).rename(
+        columns={"value": "time", "num_players": "team_2"}
+    )
+
+    df_ex = (
+        pd.concat([df1, df2], ignore_index=True)
+        .sort_values("time", ignore_index=True)
+        .ffill()
+        .bfill()
+    )
+    df_ex = df_ex[df_ex["time"].shift(-1) != df_ex["time"]].reset_index(drop=True)
+    df_ex["exclude"] = (
+        (df_ex["team_1"] != df_ex["team_2"])
+        & (df_ex["team_1"] <= 6)
+        & (df_ex["team_2"] <= 6)
+    )
+    return df_ex
+
+
+def legacy_exclude_mask(
+    plays: pd.DataFrame, df_ex: pd.DataFrame, *, side: str
+) -> np.ndarray:
+    """Return True for plays whose breakpoint (searchsorted `side`) is excluded."""
+    if plays.empty or df_ex.empty:
+        return np.zeros(len(plays), dtype=bool)
+    idx = df_ex["time"].to_numpy().searchsorted(plays["time"].to_numpy(), side=side) - 1
+    idx = idx.clip(0, len(df_ex) - 1)
+    return df_ex["exclude"].to_numpy(bool)[idx]
+
+
+def legacy_exclude_intervals(df_ex: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Excluded [start, end) intervals of an exclude timeline."""
+    if df_ex.empty:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    t = df_ex["time"].to_numpy(dtype=np.int64)
+    t_next = np.r_[t[1:], t[-1]]
+    mask = df_ex["exclude"].to_numpy(bool)
+    good = t_next[mask] > t[mask]
+    return t[mask][good], t_next[mask][good]
+
+
+def legacy_overlap_seconds(
+    start: np.ndarray, end: np.ndarray, ex_start: np.ndarray, ex_end: np.ndarray
+) -> np.ndarray:
+    """Overlap of each [start, end) with all exclude intervals (loop per interval)."""
+    out = np.zeros(len(start), dtype=np.int64)
+    for a0, b0 in zip(ex_start, ex_end):
+        out += np.maximum(0, np.minimum(end, b0) - np.maximum(start, a0))
+    return out
+
+
+def legacy_merge_intervals(
+    starts: np.ndarray, ends: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Merge overlapping/touching [start, end) intervals (python loop)."""
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts)
+    s, e = starts[order], ends[order]
+    out_s, out_e = [int(s[0])], [int(e[0])]
+    for i in range(1, len(s)):
+        if s[i] <= out_e[-1]:
+            out_e[-1] = max(out_e[-1], int(e[i]))
+        else:
+            out_s.append(int(s[i]))
+            out_e.append(int(e[i]))
+    return np.array(out_s, dtype=np.int64), np.array(out_e, dtype=np.int64)
+
+
+# -------------------------
+# Per-event attribution
+# -------------------------
+def _update_counts(
+    df: pd.DataFrame,
+    event: pd.Series,
+    gs: pd.DataFrame,
+    *,
+    cols: tuple[str, str],
+    end_inclusive: bool,
+    match_team: bool,
+) -> None:
+    """Add one event to df's for/against columns in place."""
+    t = int(event["time"])
+    team_for = int(event["team_id_for"])
+    team_against = int(event["team_id_against"])
+
+    if end_inclusive:
+        on_ice = gs[(gs["shift_start"] <= t) & (gs["shift_end"] >= t)]
+    else:
+        on_ice = gs[(gs["shift_start"] <= t) & (gs["shift_end"] > t)]
+    players_for = on_ice.loc[on_ice["team_id"] == team_for, "player_id"].to_numpy()
+    players_against = on_ice.loc[
+        on_ice["team_id"] == team_against, "player_id"
+    ].to_numpy()
+
+    sel_for = df["player_id"].isin(players_for)
+    sel_against = df["player_id"].isin(players_against)
+    if match_team:
+        sel_for &= df["team_id"] == team_for
+        sel_against &= df["team_id"] == team_against
+
+    col_f, col_a = cols
+    if event["event"] in SHOT_EVENTS:
+        df.loc[sel_for, col_f] += 1
+        df.loc[sel_against, col_a] += 1
+    elif event["event"] == "Blocked Shot":
+        df.loc[sel_for, col_a] += 1
+        df.loc[sel_against, col_f] += 1
+
+
+# -------------------------
+# Builders
+# -------------------------
+def legacy_drop_probable_goalies(
+    game_shifts: pd.DataFrame, *, toi_threshold: int = 2200
+) -> pd.DataFrame:
+    """Drop players whose total TOI in a game is >= toi_threshold seconds."""
+    if game_shifts.empty:
+        return game_shifts
+    gs = game_shifts.copy()
+    gs["shift_dur"] = (gs["shift_end"] - gs["shift_start"]).clip(lower=0)
+    toi = gs.groupby(["game_id", "team_id", "player_id"], as_index=False)[
+        "shift_dur"
+    ].sum()
+    goalies = toi.loc[toi["shift_dur"] >= toi_threshold, ["game_id", "player_id"]]
+    gs = gs.merge(goalies.assign(_goalie=1), on=["game_id", "player_id"], how="left")
+    return gs[gs["_goalie"].isna()].drop(columns=["_goalie", "shift_dur"])
+
+
+def legacy_premier_corsi(
+    game_plays: pd.DataFrame, game_shifts: pd.DataFrame
+) -> pd.DataFrame:
+    """
+    Per-game premier Corsi (create_corsi_stats output) for every game.
+
+    game_plays needs an integer `time` column (cumulative game seconds).
+    """
+    out = []
+    shifts_by_game = dict(tuple(game_shifts.groupby("game_id", sort=False)))
+    for game_id, gp in game_plays.groupby("game_id", sort=True):
+        gs = shifts_by_game.get(game_id)
+        if gs is None or gs.empty or gp.empty:
+            continue
+
+        df = gs[KEYS].drop_duplicates().copy()
+        df[["corsi_for", "corsi_against", "corsi"]] = 0
+
+        gs = gs.dropna(subset=["shift_start", "shift_end", "team_id", "player_id"])
+        gs = gs.astype(
+            {"shift_start": int, "shift_end": int, "team_id": int, "player_id": int}
+        )
+        plays = gp[gp["event"].isin(CORSI_EVENTS)].dropna(
+            subset=["team_id_for", "team_id_against", "time"]
+        )
+        if not plays.empty:
+            gs = legacy_drop_probable_goalies(gs)
+            df_ex = legacy_exclude_timeline(gs)
+            plays = plays.loc[~legacy_exclude_mask(plays, df_ex, side="left")]
+            for _, ev in plays.iterrows():
+                _update_counts(
+                    df,
+                    ev,
+                    gs,
+                    cols=("corsi_for", "corsi_against"),
+                    end_inclusive=True,
+                    match_team=False,
+                )
+
+        df["corsi"] = df["corsi_for"] - df["corsi_against"]
+        denom = df["corsi_for"] + df["corsi_against"]
+        df["CF_Percent"] = ((df["corsi_for"] / denom) * 100).fillna(0).round(4)
+        out.append(df)
+
+    return pd.concat(out, ignore_index=True) if out else pd.DataFrame()
+
+
+def legacy_player_game_es(gs: pd.DataFrame, gp: pd.DataFrame) -> pd.DataFrame:
+    """Per-game ES TOI + CF/CA (build_player_game_es) for every game."""
+    out = []
+    gs = gs[gs["position"] != "G"]
+    for game_id, gp_game in gp.groupby("game_id", sort=False):
+        gs_game = gs[gs["game_id"] == game_id].copy()
+        gp_game = gp_game[gp_game["event"].isin(CORSI_EVENTS)].dropna(
+            subset=["team_id_for", "team_id_against"]
+        )
+        if gp_game.empty or gs_game.empty:
+            continue
+        gs_game["shift_start"] = gs_game["shift_start"].astype(int)
+        gs_game["shift_end"] = gs_game["shift_end"].astype(int)
+
+        df_ex = legacy_exclude_timeline(gs_game)
+        ex_s, ex_e = legacy_exclude_intervals(df_ex)
+        rows = []
+        for (gid, pid, tid), grp in gs_game.groupby(KEYS, sort=False):
+            ms, me = legacy_merge_intervals(
+                grp["shift_start"].to_numpy(np.int64),
+                grp["shift_end"].to_numpy(np.int64),
+            )
+            es = np.maximum(0, (me - ms) - legacy_overlap_seconds(ms, me, ex_s, ex_e))
+            rows.append((gid, pid, tid, int(es.sum())))
+        toi = pd.DataFrame(rows, columns=KEYS + ["toi_sec"])
+
+        df = toi[KEYS].copy()
+        df["cf"] = 0
+        df["ca"] = 0
+        gp_es = gp_game.loc[~legacy_exclude_mask(gp_game, df_ex, side="right")]
+        for _, ev in gp_es.iterrows():
+            _update_counts(
+                df, ev, gs_game, cols=("cf", "ca"), end_inclusive=False, match_team=True
+            )
+        out.append(df.merge(toi, on=KEYS, how="left"))
+
+    return pd.concat(out, ignore_index=True) if out else pd.DataFrame()
+
+
+def legacy_player_game_stats(gs: pd.DataFrame, gp: pd.DataFrame) -> pd.DataFrame:
+    """Per-game TOI + ES CF/CA (build_modern_player_game_stats) for every game."""
+    out = []
+    plays_by_game = dict(tuple(gp.groupby("game_id", sort=False)))
+    for game_id, gs_game in gs.groupby("game_id", sort=True):
+        gp_game = plays_by_game.get(game_id)
+        if gp_game is None or gp_game.empty:
+            continue
+        sk = gs_game[gs_game["position"] != "G"].copy()
+        sk["shift_start"] = sk["shift_start"].astype(int)
+        sk["shift_end"] = sk["shift_end"].astype(int)
+
+        df_ex = legacy_exclude_timeline(sk)
+        ex_s, ex_e = legacy_exclude_intervals(df_ex)
+        s = sk["shift_start"].to_numpy(np.int64)
+        e = sk["shift_end"].to_numpy(np.int64)
+        dur = np.maximum(0, e - s)
+        toi = sk[KEYS].assign(
+            toi_total_sec=dur,
+            toi_es_sec=np.maximum(0, dur - legacy_overlap_seconds(s, e, ex_s, ex_e)),
+        )
+        toi = toi.groupby(KEYS, as_index=False)[["toi_total_sec", "toi_es_sec"]].sum()
+
+        df = toi[KEYS].copy()
+        df["cf"] = 0
+        df["ca"] = 0
+        gp_es = gp_game.loc[~legacy_exclude_mask(gp_game, df_ex, side="right")]
+        for _, ev in gp_es.iterrows():
+            _update_counts(
+                df, ev, sk, cols=("cf", "ca"), end_inclusive=True, match_team=False
+            )
+        out.append(df.merge(toi, on=KEYS, how="left"))
+
+    return pd.concat(out, ignore_index=True) if out else pd.DataFrame()
@@ -0,0 +1,202 @@
+"""
+line_utils.py.
+
+Forward lines and defense pairs detected from ES shift data (no line charts).
+
+Between two ES breakpoints of a game (wowy_utils.elementary_segments) the skaters
+on ice do not change. In every such segment each team's forwards and defensemen
+form a group; a team with exactly LINE_SIZES[line_type] of them has a line on ice:
+
+  F   three forwards (C / L / R / F)
+  D   two defensemen
+
+Segments shorter than the tolerance are the staggered overlaps of a line change
+(one trio half off, the next half on) and credit no line. A line is its sorted
+player ids, so the same trio or pair recurring across games and the season is
+one line; it gets the segment seconds (toi_sec) and the ES shot attempts for /
+against its team while it was on ice (cf / ca, build_player_game_es rules).
+
+Usage:
+    game_lines = detect_game_lines(gs, gp)
+    lines = season_lines(game_lines)
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from on_ice_utils import BLOCKED_EVENTS, KEYS, SHOT_EVENTS
+from strength_utils import (
+    apply_segments_to_plays,
+    build_strength_segments,
+    filter_goalies_modern,
+)
+from wowy_utils import elementary_segments, es_pieces
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+LINE_SIZES = {"F": 3, "D": 2}
+DEFENSE_POSITIONS = ("D",)
+LINE_TOLERANCE_SEC = 5
+LINE_MIN_TOI_SEC = 600
+LINE_PLAYERS = ["player_id_1", "player_id_2", "player_id_3"]
+GAME_LINE_COLUMNS = [
+    "game_id",
+    "team_id",
+    "line_type",
+    *LINE_PLAYERS,
+    "toi_sec",
+    "cf",
+    "ca",
+]
+LINE_COLUMNS = [
+    "line_id",
+    "team_id",
+    "line_type",
+    "line_rank",
+    *LINE_PLAYERS,
+    "games",
+    "toi_sec",
+    "cf",
+    "ca",
+    "cf_percent",
+    "cf60",
+    "ca60",
+]
+
+
+def detect_game_lines(
+    shifts: pd.DataFrame,
+    plays: pd.DataFrame,
+    *,
+    tolerance: int = LINE_TOLERANCE_SEC,
+) -> pd.DataFrame:
+    """
+    ES TOI and CF / CA of every line in every game (any number of games).
+
+    shifts columns required: game_id, player_id, team_id, position, shift_start,
+    shift_end; plays: game_id, time, event, team_id_for, team_id_against.
+
+    Returns GAME_LINE_COLUMNS; player_id_3 is <NA> for defense pairs.
+    """
+    gs = filter_goalies_modern(shifts)
+    segments = build_strength_segments(gs)
+    keys_df, key, start, end = es_pieces(gs, segments)
+    if len(key) == 0:
+        return pd.DataFrame(columns=GAME_LINE_COLUMNS)
+
+    position = keys_df.merge(
+        gs[KEYS + ["position"]].drop_duplicates(KEYS), on=KEYS, how="left"
+    )["position"]
+    is_d = position.isin(DEFENSE_POSITIONS).to_numpy()[key]
+    game = keys_df["game_id"].to_numpy(np.int64)[key]
+    team = keys_df["team_id"].to_numpy(np.int64)[key]
+    player = keys_df["player_id"].to_numpy(np.int64)[key]
+
+    plays = plays[plays["event"].isin(SHOT_EVENTS + BLOCKED_EVENTS).to_numpy()]
+    plays = plays[plays[["team_id_for", "team_id_against"]].notna().all(axis=1)]
+    ev = apply_segments_to_plays(plays, segments).reset_index(drop=True)
+
+    length, piece, seg, ev_seg = elementary_segments(
+        game, start, end, at=(ev["game_id"].to_numpy(), ev["time"].to_numpy())
+    )
+    keep = length[seg] >= tolerance
+    seg, piece = seg[keep], piece[keep]
+
+    # group = (segment, team, F/D); members sorted by player id within a group
+    t_uniques = pd.Index(np.unique(team))
+    n_t = len(t_uniques)
+    group = (seg * n_t + t_uniques.get_indexer(team[piece])) * 2 + is_d[piece]
+    order = np.lexsort((player[piece], group))
+    group, piece = group[order], piece[order]
+    codes, first, size = np.unique(group, return_index=True, return_counts=True)
+    d_group = codes % 2 == 1
+    ok = size == np.where(d_group, LINE_SIZES["D"], LINE_SIZES["F"])
+    codes, first, size, d_group = codes[ok], first[ok], size[ok], d_group[ok]
+
+    members = np.full((len(codes), 3), -1, dtype=np.int64)
+    for k in range(3):
+        has = k < size
+        members[has, k] = player[piece[first[has] + k]]
+
+    # ES attempts -> the shooting / defending team's line groups of their segment
+    is_block = ev["event"].isin(BLOCKED_EVENTS).to_numpy()
+    shooter = np.where(is_block, ev["team_id_against"], ev["team_id_for"])
+    defender = np.where(is_block, ev["team_id_for"], ev["team_id_against"])
+    counts = {}
+    for name, side in (("cf", shooter), ("ca", defender)):
+        t_code = t_uniques.get_indexer(side.astype(np.int64))
+        valid = (ev_seg >= 0) & (t_code >= 0)
+        hits = []
+        for d in (0, 1):
+            code = (ev_seg[valid] * n_t + t_code[valid]) * 2 + d
+            pos = np.minimum(np.searchsorted(codes, code), max(len(codes) - 1, 0))
+            hits.append(pos[codes[pos] == code] if len(codes) else pos[:0])
+        counts[name] = np.bincount(np.concatenate(hits), minlength=len(codes))
+
+    out = pd.DataFrame(
+        {
+            "game_id": game[piece[first]],
+            "team_id": team[piece[first]],
+            "line_type": np.where(d_group, "D", "F"),
+            "player_id_1": members[:, 0],
+            "player_id_2": members[:, 1],
+            "player_id_3": members[:, 2],
+            "toi_sec": length[codes // 2 // n_t],
+            "cf": counts["cf"],
+            "ca": counts["ca"],
+        }
+    )
+    out = out.groupby(GAME_LINE_COLUMNS[:6], as_index=False, sort=True)[
+        ["toi_sec", "cf", "ca"]
+    ].sum()
+    out["player_id_3"] = out["player_id_3"].astype("Int64").mask(out["player_id_3"] < 0)
+    return out[GAME_LINE_COLUMNS]
+
+
+def season_lines(
+    game_lines: pd.DataFrame, *, min_toi_sec: int = LINE_MIN_TOI_SEC
+) -> pd.DataFrame:
+    """
+    Sum detect_game_lines rows per line over the season.
+
+    Lines under min_toi_sec ES seconds are dropped; line_rank orders each team's
+    forward lines / defense pairs by TOI (1 = most used). line_id is
+    "{line_type}-{player ids}" (stable across seasons and teams).
+    """
+    keys = ["team_id", "line_type", *LINE_PLAYERS]
+    out = (
+        game_lines.groupby(keys, as_index=False, sort=True, dropna=False)
+        .agg(
+            games=("game_id", "nunique"),
+            toi_sec=("toi_sec", "sum"),
+            cf=("cf", "sum"),
+            ca=("ca", "sum"),
+        )
+        .query("toi_sec >= @min_toi_sec")
+        .reset_index(drop=True)
+    )
+    if out.empty:
+        return pd.DataFrame(columns=LINE_COLUMNS)
+
+    ids = out[LINE_PLAYERS].astype("string").fillna("")
+    out["line_id"] = (
+        out["line_type"] + "-" + ids.agg("-".join, axis=1).str.rstrip("-")
+    )
+    out["line_rank"] = (
+        out.groupby(["team_id", "line_type"])["toi_sec"]
+        .rank(method="first", ascending=False)
+        .astype("int64")
+    )
+    cf, ca, toi = (out[c].to_numpy(np.float64) for c in ("cf", "ca", "toi_sec"))
+    out["cf_percent"] = np.where(cf + ca > 0, 100.0 * cf / np.maximum(cf + ca, 1), np.nan)
+    out["cf60"] = cf * 3600.0 / toi
+    out["ca60"] = ca * 3600.0 / toi
+    return out.sort_values(
+        ["team_id", "line_type", "line_rank"], ignore_index=True
+    )[LINE_COLUMNS]
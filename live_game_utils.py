@@ -0,0 +1,362 @@
+"""
+live_game_utils.py.
+
+Streaming (live) even-strength on-ice counters for one game.
+
+The season engines (strength_utils + on_ice_utils) need a finished season's
+frames. GameState instead ingests shift changes and plays one at a time, in
+time order, and keeps:
+
+  - the current on-ice skaters per team (a multiset per (player_id, team_id),
+    so double-logged / touching shifts count once, like merge_intervals)
+  - the skater strength per team and the exclude flag of
+    build_strength_segments: (team_1 != team_2) & (team_1 <= 6) & (team_2 <= 6)
+  - per-player CF/CA, FF/FA, SF/SA, GF/GA, xGF/xGA (on_ice_utils.ON_ICE_METRICS)
+  - per-player ES TOI through one running even-strength clock: a player banks
+    clock(off) - clock(on), so no event has to touch every on-ice player
+
+A shift change is O(1). A play touches only the skaters on ice for its two
+teams. Semantics follow build_player_game_es (shift_start <= t < shift_end,
+counts land on the (player_id, team_id) that was on ice): at one timestamp,
+shift ends are applied first, then shift starts, then plays.
+
+Difference from the season engine: until a team has logged its first shift
+the game is never excluded (the season engine back-fills that team's first
+skater count, which a live feed cannot know yet).
+
+Usage:
+    state = GameState(game_id)
+    state.shift_on(0, 8478402, 22)
+    keys = state.play(31, "Shot", 22, 10, 0.04)   # (player_id, team_id) updated
+    df = state.to_frame()                         # build_player_game_es layout
+
+    state = replay_game(gs_game, gp_game)         # recorded game, time order
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import pathlib
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+from game_store_utils import game_slices
+from on_ice_utils import ALL_METRICS, BLOCKED_EVENTS, ON_ICE_METRICS, metric_columns
+from season_data_utils import load_season_plays, load_season_shifts
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+# event kinds of a replay stream, in their order at equal timestamps
+SHIFT_OFF, SHIFT_ON, PLAY = 0, 1, 2
+
+
+class GameState:
+    """Incremental on-ice / strength state and per-player counters of one game."""
+
+    def __init__(
+        self, game_id: int, *, metrics: tuple[str, ...] = ALL_METRICS
+    ) -> None:
+        """Start an empty game (no skaters on ice, clock not started)."""
+        self.game_id = game_id
+        self.metrics = tuple(metrics)
+        self.columns = metric_columns(self.metrics)
+        self.time: int | None = None
+        self.excluded = False
+
+        # event label -> [(metric index, uses pred_goal)]
+        self._slots: dict[str, list[tuple[int, bool]]] = {}
+        for j, m in enumerate(self.metrics):
+            events, weight = ON_ICE_METRICS[m]
+            for e in events:
+                self._slots.setdefault(e, []).append((j, weight is not None))
+        self._toi = 2 * len(self.metrics)
+
+        self._skaters: dict[int, int] = {}  # team_id -> shift rows on ice
+        self._on_ice: dict[int, dict[int, int]] = {}  # team_id -> {player_id: rows}
+        self._counters: dict[tuple[int, int], list[float]] = {}
+        self._es_clock = 0
+        self._toi_start: dict[tuple[int, int], int] = {}
+
+    # -------------------------
+    # Clock / strength
+    # -------------------------
+    def _advance(self, t: int) -> None:
+        if self.time is not None:
+            if t < self.time:
+                raise ValueError(
+                    f"game_id={self.game_id}: event at {t} after {self.time}"
+                )
+            if not self.excluded:
+                self._es_clock += t - self.time
+        self.time = t
+
+    def _update_strength(self) -> None:
+        if len(self._skaters) != 2:
+            # one team seen so far (or a bad game with 3+ teams): never excluded
+            self.excluded = False
+            return
+        a, b = self._skaters.values()
+        self.excluded = a != b and a <= 6 and b <= 6
+
+    def strength(self) -> dict[int, int]:
+        """Return the skaters on ice per team_id."""
+        return dict(self._skaters)
+
+    def on_ice(self, team_id: int) -> list[int]:
+        """Return the player_ids of team_id currently on ice."""
+        return list(self._on_ice.get(team_id, ()))
+
+    # -------------------------
+    # Events
+    # -------------------------
+    def shift_on(self, t: int, player_id: int | None, team_id: int) -> None:
+        """
+        Put a skater shift on ice at t.
+
+        player_id None (unresolved row) still counts toward the team's strength.
+        """
+        self._advance(t)
+        self._skaters[team_id] = self._skaters.get(team_id, 0) + 1
+        if player_id is not None:
+            on = self._on_ice.setdefault(team_id, {})
+            n = on.get(player_id, 0)
+            on[player_id] = n + 1
+            if n == 0:
+                key = (player_id, team_id)
+                self._toi_start[key] = self._es_clock
+                if key not in self._counters:
+                    self._counters[key] = [0.0] * (self._toi + 1)
+        self._update_strength()
+
+    def shift_off(self, t: int, player_id: int | None, team_id: int) -> None:
+        """End a skater shift started with shift_on()."""
+        self._advance(t)
+        n_team = self._skaters.get(team_id, 0)
+        if n_team <= 0:
+            raise ValueError(
+                f"game_id={self.game_id}: shift_off for team {team_id} with no "
+                "skaters on ice"
+            )
+        self._skaters[team_id] = n_team - 1
+        if player_id is not None:
+            on = self._on_ice.get(team_id, {})
+            n = on.get(player_id, 0)
+            if n == 0:
+                raise ValueError(
+                    f"game_id={self.game_id}: shift_off for player {player_id} "
+                    f"(team {team_id}) who is not on ice"
+                )
+            if n == 1:
+                del on[player_id]
+                key = (player_id, team_id)
+                start = self._toi_start.pop(key)
+                self._counters[key][self._toi] += self._es_clock - start
+            else:
+                on[player_id] = n - 1
+        self._update_strength()
+
+    def play(
+        self,
+        t: int,
+        event: str,
+        team_id_for: int,
+        team_id_against: int,
+        pred_goal: float = 0.0,
+    ) -> list[tuple[int, int]]:
+        """
+        Count a play at t for the skaters on ice; return the updated keys.
+
+        Non-Corsi events and plays in excluded strength states only move the
+        clock. Blocked shots belong to the shooter (team_id_against).
+        """
+        self._advance(t)
+        slots = self._slots.get(event)
+        if slots is None or self.excluded:
+            return []
+
+        if event in BLOCKED_EVENTS:
+            shooter, defender = team_id_against, team_id_for
+        else:
+            shooter, defender = team_id_for, team_id_against
+        if pred_goal is None or math.isnan(pred_goal):
+            pred_goal = 0.0
+
+        keys = []
+        for team, side in ((shooter, 0), (defender, 1)):
+            for pid in self._on_ice.get(team, ()):
+                key = (pid, team)
+                c = self._counters[key]
+                for j, xg in slots:
+                    c[2 * j + side] += pred_goal if xg else 1.0
+                keys.append(key)
+        return keys
+
+    # -------------------------
+    # Output
+    # -------------------------
+    def counters(self, player_id: int, team_id: int) -> dict[str, float]:
+        """Return one player's current counters (toi_sec includes the open shift)."""
+        key = (player_id, team_id)
+        c = self._counters[key]
+        toi = c[self._toi]
+        if key in self._toi_start:
+            toi += self._es_clock - self._toi_start[key]
+        return {**dict(zip(self.columns, c)), "toi_sec": toi}
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the current counters in the build_player_game_es layout."""
+        cols = ["game_id", "player_id", "team_id", *self.columns, "toi_sec"]
+        if not self._counters:
+            return pd.DataFrame(columns=[*cols, "cf60", "ca60", "cf_percent"])
+
+        keys = list(self._counters)
+        values = np.array([self._counters[k] for k in keys], dtype=np.float64)
+        for i, key in enumerate(keys):
+            if key in self._toi_start:
+                values[i, self._toi] += self._es_clock - self._toi_start[key]
+
+        out = pd.DataFrame(
+            {
+                "game_id": self.game_id,
+                "player_id": [k[0] for k in keys],
+                "team_id": [k[1] for k in keys],
+            }
+        )
+        for j, col in enumerate(self.columns):
+            x = values[:, j]
+            out[col] = x if col.startswith("xg") else np.rint(x).astype(np.int64)
+        out["toi_sec"] = values[:, self._toi].astype(np.int64)
+
+        toi = out["toi_sec"].to_numpy()
+        cf, ca = out["cf"].to_numpy(), out["ca"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out["cf60"] = np.where(toi > 0, cf * 3600.0 / toi, np.nan)
+            out["ca60"] = np.where(toi > 0, ca * 3600.0 / toi, np.nan)
+            out["cf_percent"] = np.where(cf + ca > 0, 100.0 * cf / (cf + ca), 0.0)
+        return out
+
+
+# -------------------------
+# Replay
+# -------------------------
+def _ids(s: pd.Series) -> list:
+    """Python ints with None for missing values (dict keys for GameState)."""
+    return [None if pd.isna(v) else int(v) for v in s.to_numpy(object)]
+
+
+def game_events(gs_game: pd.DataFrame, gp_game: pd.DataFrame) -> list[tuple]:
+    """
+    Time-ordered replay stream for one game's skater shifts and plays.
+
+    Items are (t, SHIFT_OFF | SHIFT_ON, player_id, team_id) and
+    (t, PLAY, event, team_id_for, team_id_against, pred_goal). Shifts with
+    end <= start or no team_id and plays without both team ids are dropped.
+    """
+    gs = gs_game[gs_game["position"] != "G"] if "position" in gs_game else gs_game
+    gs = gs.dropna(subset=["team_id", "shift_start", "shift_end"])
+    gs = gs[gs["shift_end"].to_numpy() > gs["shift_start"].to_numpy()]
+    gp = gp_game.dropna(subset=["time", "team_id_for", "team_id_against"])
+
+    pid, team = _ids(gs["player_id"]), _ids(gs["team_id"])
+    start = gs["shift_start"].to_numpy(np.int64).tolist()
+    end = gs["shift_end"].to_numpy(np.int64).tolist()
+    xg = (
+        pd.to_numeric(gp["pred_goal"], errors="coerce").fillna(0.0).tolist()
+        if "pred_goal" in gp
+        else [0.0] * len(gp)
+    )
+    items = [
+        *zip(end, [SHIFT_OFF] * len(end), pid, team),
+        *zip(start, [SHIFT_ON] * len(start), pid, team),
+        *zip(
+            gp["time"].to_numpy(np.int64).tolist(),
+            [PLAY] * len(gp),
+            gp["event"].astype(object).tolist(),
+            _ids(gp["team_id_for"]),
+            _ids(gp["team_id_against"]),
+            xg,
+        ),
+    ]
+    # stable: plays at one timestamp keep their feed order
+    items.sort(key=lambda e: (e[0], e[1]))
+    return items
+
+
+def replay_events(
+    state: GameState,
+    events: list[tuple],
+    *,
+    on_update: Callable[[GameState, list[tuple[int, int]]], None] | None = None,
+) -> GameState:
+    """Feed a game_events() stream into state; on_update sees each counted play."""
+    shift_on, shift_off, play = state.shift_on, state.shift_off, state.play
+    for e in events:
+        kind = e[1]
+        if kind == PLAY:
+            keys = play(e[0], e[2], e[3], e[4], e[5])
+            if keys and on_update is not None:
+                on_update(state, keys)
+        elif kind == SHIFT_ON:
+            shift_on(e[0], e[2], e[3])
+        else:
+            shift_off(e[0], e[2], e[3])
+    return state
+
+
+def replay_game(
+    gs_game: pd.DataFrame,
+    gp_game: pd.DataFrame,
+    *,
+    game_id: int | None = None,
+    on_update: Callable[[GameState, list[tuple[int, int]]], None] | None = None,
+) -> GameState:
+    """Replay a recorded game (shifts + plays frames) through a new GameState."""
+    if game_id is None:
+        game_id = int(gs_game["game_id"].iloc[0])
+    state = GameState(game_id)
+    return replay_events(state, game_events(gs_game, gp_game), on_update=on_update)
+
+
+def replay_games(gs: pd.DataFrame, gp: pd.DataFrame) -> pd.DataFrame:
+    """
+    Replay every game with skater shifts and Corsi plays; concat to_frame().
+
+    Same games and columns as build_player_game_es.compute_player_game_es.
+    """
+    gp = gp[gp["event"].isin(ON_ICE_METRICS["c"][0])]
+    shifts_by_game = game_slices(gs)
+    plays_by_game = game_slices(gp)
+
+    out = []
+    for game_id in sorted(set(shifts_by_game) & set(plays_by_game)):
+        state = replay_game(
+            shifts_by_game[game_id], plays_by_game[game_id], game_id=game_id
+        )
+        out.append(state.to_frame())
+    return pd.concat(out, ignore_index=True) if out else pd.DataFrame()
+
+
+def load_recorded_game(conn, season: int, game_id: int):
+    """
+    One recorded game's (skater shifts, Corsi plays) for replay_game().
+
+    Same sources / seconds as build_player_game_es (raw.raw_shifts_resolved game
+    seconds, derived.game_plays_{season}_from_raw_pbp).
+    """
+    gp = load_season_plays(conn, season, game_ids=[game_id])
+    gs = load_season_shifts(
+        conn,
+        season,
+        game_ids=[game_id],
+        period_offset=False,
+        skaters_only=True,
+        resolved_only=False,
+    )
+    return gs, gp
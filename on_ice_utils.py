@@ -0,0 +1,404 @@
+"""
+on_ice_utils.py.
+
+Season-wide, vectorized on-ice event attribution (CF/CA, FF/FA, SF/SA, GF/GA,
+xGF/xGA and score/venue-adjusted CF/CA per player-game).
+
+Replaces the per-event iterrows() loops that filtered the whole shift frame for
+every shot attempt. Works on any number of games at once:
+
+  1) Shifts are merged per (game_id, player_id, team_id) so a player is counted
+     at most once per event (same as the old `.isin(players_on_ice)` update).
+  2) Events are sorted once by (game, team, time) with prefix sums per metric.
+  3) Each merged shift interval reads its counts with two searchsorted lookups.
+  4) Interval counts are folded back to player-game keys with np.bincount.
+
+Attribution rule (unchanged from the builders):
+  - Shot / Goal / Missed Shot: CF for team_id_for skaters, CA for team_id_against skaters
+  - Blocked Shot: reversed (CA for team_id_for skaters, CF for team_id_against skaters)
+
+Options that reproduce each builder's existing behaviour exactly:
+  - end_inclusive=True  -> on ice when shift_start <= t <= shift_end
+    end_inclusive=False -> on ice when shift_start <= t <  shift_end
+  - match_team=False -> a player's counts are shared across all of their team_id rows
+    in a game (old player_id-only `.isin()` update)
+    match_team=True  -> counts only land on the (player_id, team_id) row that was on ice
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from interval_utils import merge_intervals
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+KEYS = ["game_id", "player_id", "team_id"]
+# bump when attribution / TOI semantics change (invalidates cached per-game results)
+ENGINE_VERSION = "2"
+SHOT_EVENTS = ("Shot", "Goal", "Missed Shot")
+BLOCKED_EVENTS = ("Blocked Shot",)
+
+# metric prefix -> (events counted, weight column or None for a count)
+# all from the shooting team's view (blocked shots belong to the shooter).
+ON_ICE_METRICS = {
+    "c": (SHOT_EVENTS + BLOCKED_EVENTS, None),  # Corsi: all shot attempts
+    "f": (SHOT_EVENTS, None),  # Fenwick: unblocked attempts
+    "s": (("Shot", "Goal"), None),  # shots on goal
+    "g": (("Goal",), None),  # goals
+    "xg": (SHOT_EVENTS, "pred_goal"),  # expected goals (pbp pred_goal)
+    # score- and venue-adjusted Corsi (weights from score_adjust_utils)
+    "adj_c": (SHOT_EVENTS + BLOCKED_EVENTS, "score_venue_weight"),
+}
+# raw counters every builder writes; the adjusted ones need the weight column
+ALL_METRICS = ("c", "f", "s", "g", "xg")
+ADJUSTED_METRICS = ("adj_c",)
+
+
+def metric_columns(metrics: tuple[str, ...] = ALL_METRICS) -> list[str]:
+    """Output columns for metrics, e.g. ("c", "f") -> [cf, ca, ff, fa]."""
+    return [f"{m}{side}" for m in metrics for side in ("f", "a")]
+
+
+def _range_counts(
+    ev_key: np.ndarray,
+    ev_cum: np.ndarray,
+    lo_key: np.ndarray,
+    hi_key: np.ndarray,
+    *,
+    hi_side: str,
+) -> np.ndarray:
+    """Sum event weights with lo_key <= ev_key <= / < hi_key using prefix sums."""
+    lo = np.searchsorted(ev_key, lo_key, side="left")
+    hi = np.searchsorted(ev_key, hi_key, side=hi_side)
+    return ev_cum[hi] - ev_cum[lo]
+
+
+def _event_weights(ev: pd.DataFrame, metrics: tuple[str, ...]) -> np.ndarray:
+    """Per-event weight matrix (n_events, n_metrics) from the shooting team's view."""
+    cols = []
+    for m in metrics:
+        events, weight = ON_ICE_METRICS[m]
+        hit = ev["event"].isin(events).to_numpy()
+        if weight is None:
+            cols.append(hit.astype(np.float64))
+        else:
+            w = pd.to_numeric(ev[weight], errors="coerce").fillna(0.0).to_numpy()
+            cols.append(np.where(hit, w, 0.0))
+    return np.column_stack(cols)
+
+
+def attribute_on_ice(
+    shifts: pd.DataFrame,
+    plays: pd.DataFrame,
+    *,
+    metrics: tuple[str, ...] = ("c",),
+    end_inclusive: bool = True,
+    match_team: bool = False,
+) -> pd.DataFrame:
+    """
+    Accumulate on-ice for/against counters for every skater (any number of games).
+
+    All requested metrics come out of the same shift/event pass: each metric is one
+    column of the event weight matrix, so adding metrics adds prefix-sum columns,
+    not joins.
+
+    shifts columns required: game_id, player_id, team_id, shift_start, shift_end
+    plays columns required:  game_id, time, event, team_id_for, team_id_against
+                             (+ pred_goal when "xg" is requested,
+                             score_venue_weight when "adj_c" is requested)
+
+    Returns one row per (game_id, player_id, team_id) present in shifts with
+    <metric>f / <metric>a columns (ints, xgf/xga floats), e.g. cf, ca, ff, fa.
+    """
+    metric_cols = metric_columns(metrics)
+    out_cols = KEYS + metric_cols
+    if shifts.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    out, f_sum, a_sum = _on_ice_sums(
+        shifts, plays, metrics, end_inclusive=end_inclusive
+    )
+    for j, m in enumerate(metrics):
+        for side, acc in (("f", f_sum), ("a", a_sum)):
+            col = acc[:, j]
+            out[f"{m}{side}"] = (
+                col if ON_ICE_METRICS[m][1] else np.rint(col).astype(np.int64)
+            )
+
+    if not match_team:
+        grp = out.groupby(["game_id", "player_id"], sort=False)
+        for col in metric_cols:
+            out[col] = grp[col].transform("sum").astype(out[col].dtype)
+
+    return out[out_cols]
+
+
+def attribute_on_ice_by_group(
+    shifts: pd.DataFrame,
+    plays: pd.DataFrame,
+    groups: tuple[np.ndarray, np.ndarray],
+    n_groups: int,
+    *,
+    metrics: tuple[str, ...] = ("c",),
+    end_inclusive: bool = True,
+    match_team: bool = False,
+) -> pd.DataFrame:
+    """
+    attribute_on_ice() split by a per-play group code, in the same single pass.
+
+    groups = (code from team_id_for's view, code from team_id_against's view), one
+    entry per plays row in [0, n_groups); e.g. strength states, where a 5v4 play is
+    PP for one team and PK for the other. Each (metric, group) pair is one column of
+    the event weight matrix.
+
+    Returns long rows (game_id, player_id, team_id, group, <metric>f / <metric>a),
+    one per key and group, zeros included.
+    """
+    metric_cols = metric_columns(metrics)
+    out_cols = KEYS + ["group"] + metric_cols
+    if shifts.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    keys_df, f_sum, a_sum = _on_ice_sums(
+        shifts,
+        plays,
+        metrics,
+        end_inclusive=end_inclusive,
+        groups=groups,
+        n_groups=n_groups,
+    )
+    n_keys, n_m = len(keys_df), len(metrics)
+
+    # (n_keys, n_groups * n_metrics) -> one row per (key, group)
+    out = keys_df.loc[np.repeat(np.arange(n_keys), n_groups)].reset_index(drop=True)
+    out["group"] = np.tile(np.arange(n_groups), n_keys)
+    for j, m in enumerate(metrics):
+        for side, acc in (("f", f_sum), ("a", a_sum)):
+            col = acc.reshape(n_keys, n_groups, n_m)[:, :, j].ravel()
+            out[f"{m}{side}"] = (
+                col if ON_ICE_METRICS[m][1] else np.rint(col).astype(np.int64)
+            )
+
+    if not match_team:
+        grp = out.groupby(["game_id", "player_id", "group"], sort=False)
+        for col in metric_cols:
+            out[col] = grp[col].transform("sum").astype(out[col].dtype)
+
+    return out[out_cols]
+
+
+def _on_ice_sums(
+    shifts: pd.DataFrame,
+    plays: pd.DataFrame,
+    metrics: tuple[str, ...],
+    *,
+    end_inclusive: bool,
+    groups: tuple[np.ndarray, np.ndarray] | None = None,
+    n_groups: int = 1,
+) -> tuple[pd.DataFrame, np.ndarray, np.ndarray]:
+    """
+    Shared pass of attribute_on_ice / attribute_on_ice_by_group.
+
+    Returns (keys_df, f_sum, a_sum); the sums have one row per key and
+    n_groups * len(metrics) columns (group-major).
+    """
+    gs = shifts[KEYS + ["shift_start", "shift_end"]].dropna()
+    keys_df = gs[KEYS].drop_duplicates().sort_values(KEYS, ignore_index=True)
+    key_code = gs.groupby(KEYS, sort=True).ngroup().to_numpy(np.int64)
+    n_keys = len(keys_df)
+
+    ev_cols = ["game_id", "time", "event", "team_id_for", "team_id_against"]
+    weight_cols = sorted({ON_ICE_METRICS[m][1] for m in metrics} - {None})
+    missing = set(weight_cols) - set(plays.columns)
+    if missing:
+        raise KeyError(f"attribute_on_ice: plays missing {sorted(missing)}")
+    keep = (
+        plays["event"].isin(SHOT_EVENTS + BLOCKED_EVENTS).to_numpy()
+        & plays[ev_cols].notna().all(axis=1).to_numpy()
+    )
+    ev = plays.loc[keep, ev_cols + weight_cols]
+
+    n_cols = n_groups * len(metrics)
+    f_sum = np.zeros((n_keys, n_cols), dtype=np.float64)
+    a_sum = np.zeros((n_keys, n_cols), dtype=np.float64)
+    if ev.empty or gs.empty:
+        return keys_df, f_sum, a_sum
+
+    # the shooting team: team_id_for, except blocked shots (event team = blocker)
+    is_block = ev["event"].isin(BLOCKED_EVENTS).to_numpy()
+    shooter = np.where(is_block, ev["team_id_against"], ev["team_id_for"])
+    defender = np.where(is_block, ev["team_id_for"], ev["team_id_against"])
+
+    # shared dense codes for game and team across shifts + events
+    g_codes, _ = pd.factorize(
+        np.concatenate(
+            [gs["game_id"].to_numpy(np.int64), ev["game_id"].to_numpy(np.int64)]
+        )
+    )
+    t_codes, t_uniques = pd.factorize(
+        np.concatenate(
+            [
+                gs["team_id"].to_numpy(np.int64),
+                shooter.astype(np.int64),
+                defender.astype(np.int64),
+            ]
+        )
+    )
+    n_team = len(t_uniques)
+    n_s, n_e = len(gs), len(ev)
+
+    side_shift = g_codes[:n_s] * n_team + t_codes[:n_s]
+    side_for = g_codes[n_s:] * n_team + t_codes[n_s : n_s + n_e]
+    side_against = g_codes[n_s:] * n_team + t_codes[n_s + n_e :]
+
+    s_start = gs["shift_start"].to_numpy(np.int64)
+    s_end = gs["shift_end"].to_numpy(np.int64)
+    ev_t = ev["time"].to_numpy(np.int64)
+
+    t_min = min(int(s_start.min()), int(s_end.min()), int(ev_t.min()))
+    span = max(int(s_end.max()), int(s_start.max()), int(ev_t.max())) - t_min + 1
+
+    m_start, m_end, m_key = merge_intervals(s_start - t_min, s_end - t_min, key_code)
+
+    # every row of a key shares the same (game, team) side
+    key_side = np.empty(n_keys, dtype=np.int64)
+    key_side[key_code] = side_shift
+    m_side = key_side[m_key]
+
+    lo_key = m_side * span + m_start
+    hi_key = m_side * span + m_end
+    hi_side = "right" if end_inclusive else "left"
+
+    weights = _event_weights(ev, metrics)
+    if groups is None:
+        w_for = w_against = weights
+    else:
+        g_for = np.asarray(groups[0])[keep]
+        g_against = np.asarray(groups[1])[keep]
+        # group from the shooting / defending team's view
+        g_shooter = np.where(is_block, g_against, g_for)
+        g_defender = np.where(is_block, g_for, g_against)
+        w_for, w_against = (
+            _group_weights(weights, g, n_groups) for g in (g_shooter, g_defender)
+        )
+
+    for acc, side, w in ((f_sum, side_for, w_for), (a_sum, side_against, w_against)):
+        ev_key = side * span + (ev_t - t_min)
+        order = np.argsort(ev_key, kind="stable")
+        ev_cum = np.vstack([np.zeros((1, n_cols)), np.cumsum(w[order], axis=0)])
+        counts = _range_counts(ev_key[order], ev_cum, lo_key, hi_key, hi_side=hi_side)
+        for j in range(n_cols):
+            acc[:, j] = np.bincount(m_key, weights=counts[:, j], minlength=n_keys)
+
+    return keys_df, f_sum, a_sum
+
+
+def _group_weights(
+    weights: np.ndarray, group: np.ndarray, n_groups: int
+) -> np.ndarray:
+    """Spread (n_events, n_metrics) weights into group-major (group, metric) columns."""
+    n_e, n_m = weights.shape
+    out = np.zeros((n_e, n_groups, n_m), dtype=np.float64)
+    out[np.arange(n_e), group.astype(np.int64)] = weights
+    return out.reshape(n_e, n_groups * n_m)
+
+
+def attribute_corsi_on_ice(
+    shifts: pd.DataFrame,
+    plays: pd.DataFrame,
+    *,
+    end_inclusive: bool = True,
+    match_team: bool = False,
+) -> pd.DataFrame:
+    """
+    Attribute CF/CA to every skater on ice for each shot attempt (any number of games).
+
+    shifts columns required: game_id, player_id, team_id, shift_start, shift_end
+    plays columns required:  game_id, time, event, team_id_for, team_id_against
+
+    Returns one row per (game_id, player_id, team_id) present in shifts:
+      game_id, player_id, team_id, cf, ca
+    """
+    return attribute_on_ice(
+        shifts,
+        plays,
+        metrics=("c",),
+        end_inclusive=end_inclusive,
+        match_team=match_team,
+    )
+
+
+def events_on_ice(
+    shifts: pd.DataFrame,
+    events: pd.DataFrame,
+    *,
+    end_inclusive: bool = False,
+) -> pd.DataFrame:
+    """
+    Long (event, player) rows: who was on ice for every event (any number of games).
+
+    shifts columns required: game_id, player_id, team_id, shift_start, shift_end
+    events columns required: game_id, time
+
+    Each merged shift interval selects a contiguous run of the time-sorted events
+    of its game (two searchsorted lookups), so the join is one vectorized pass.
+
+    Returns: event_row (position in `events`), game_id, player_id, team_id,
+    sorted by (event_row, team_id, player_id).
+    """
+    out_cols = ["event_row"] + KEYS
+    gs = shifts[KEYS + ["shift_start", "shift_end"]].dropna()
+    if gs.empty or events.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    keys_df = gs[KEYS].drop_duplicates().sort_values(KEYS, ignore_index=True)
+    key_code = gs.groupby(KEYS, sort=True).ngroup().to_numpy(np.int64)
+
+    g_codes, _ = pd.factorize(
+        np.concatenate(
+            [keys_df["game_id"].to_numpy(np.int64), events["game_id"].to_numpy(np.int64)]
+        )
+    )
+    key_game = g_codes[: len(keys_df)]
+    ev_game = g_codes[len(keys_df) :]
+
+    s_start = gs["shift_start"].to_numpy(np.int64)
+    s_end = gs["shift_end"].to_numpy(np.int64)
+    ev_t = events["time"].to_numpy(np.int64)
+    t_min = min(int(s_start.min()), int(ev_t.min()))
+    span = max(int(s_end.max()), int(ev_t.max())) - t_min + 1
+
+    m_start, m_end, m_key = merge_intervals(s_start - t_min, s_end - t_min, key_code)
+    m_band = key_game[m_key] * span
+
+    ev_key = ev_game * span + (ev_t - t_min)
+    order = np.argsort(ev_key, kind="stable")
+    ev_sorted = ev_key[order]
+
+    lo = np.searchsorted(ev_sorted, m_band + m_start, side="left")
+    hi = np.searchsorted(
+        ev_sorted, m_band + m_end, side="right" if end_inclusive else "left"
+    )
+    n = np.maximum(hi - lo, 0)
+
+    interval = np.repeat(np.arange(len(m_key)), n)
+    pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n)
+    key = m_key[interval]
+
+    out = pd.DataFrame(
+        {
+            "event_row": order[pos],
+            "game_id": keys_df["game_id"].to_numpy()[key],
+            "player_id": keys_df["player_id"].to_numpy()[key],
+            "team_id": keys_df["team_id"].to_numpy()[key],
+        }
+    )
+    return out.sort_values(
+        ["event_row", "team_id", "player_id"], ignore_index=True
+    )[out_cols]
@@ -0,0 +1,162 @@
+"""
+parallel_utils.py.
+
+Per-game sharding of season builds across a process pool.
+
+Games are independent once plays/shifts are grouped by game_id, so a season
+driver can split its game_ids into contiguous shards and run the same compute
+function on each shard in a ProcessPoolExecutor.
+
+- Workers receive compact NumPy column arrays (strings as int32 codes + uniques),
+  not pickled DataFrames.
+- Shards are contiguous runs of sorted game_ids and results are concatenated in
+  shard order, so the merged output is deterministic and matches a serial run.
+- workers <= 1 runs the compute function in-process (no pool).
+
+Usage:
+    out = run_sharded(compute_fn, {"gs": shifts, "gp": plays}, workers=8)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+SHARDS_PER_WORKER = 4
+
+
+def frame_to_arrays(df: pd.DataFrame) -> dict:
+    """
+    Convert a DataFrame into {column: array} for cheap transfer to a worker.
+
+    Numeric/bool columns become plain NumPy arrays (nullable ints with missing
+    values become float64 with NaN); categoricals become ("category", codes,
+    categories); anything else (strings, mixed) becomes ("codes", int32 codes,
+    uniques).
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, np.dtype) and s.dtype.kind in "biuf":
+            out[col] = s.to_numpy()
+        elif pd.api.types.is_numeric_dtype(s.dtype):
+            # pandas nullable Int64/Float64/boolean
+            if s.hasnans:
+                out[col] = s.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                out[col] = s.to_numpy(dtype=s.dtype.numpy_dtype)
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            # keep compact categoricals compact (codes + categories)
+            cats = s.cat.categories.to_numpy()
+            out[col] = ("category", s.cat.codes.to_numpy(), cats)
+        else:
+            codes, uniques = pd.factorize(s, use_na_sentinel=True)
+            out[col] = ("codes", codes.astype(np.int32), np.asarray(uniques, dtype=object))
+    return out
+
+
+def arrays_to_frame(arrays: dict) -> pd.DataFrame:
+    """Rebuild a DataFrame from frame_to_arrays() output (missing codes -> None)."""
+    cols = {}
+    for col, arr in arrays.items():
+        if isinstance(arr, tuple) and arr[0] == "codes":
+            _, codes, uniques = arr
+            values = np.empty(len(codes), dtype=object)
+            valid = codes >= 0
+            values[valid] = uniques[codes[valid]]
+            values[~valid] = None
+            cols[col] = pd.Series(values).infer_objects()
+        elif isinstance(arr, tuple) and arr[0] == "category":
+            _, codes, categories = arr
+            cols[col] = pd.Categorical.from_codes(codes, categories=categories)
+        else:
+            cols[col] = arr
+    return pd.DataFrame(cols)
+
+
+def shard_game_ids(game_ids, n_shards: int) -> list[np.ndarray]:
+    """Split sorted unique game_ids into contiguous, non-empty shards."""
+    ids = np.unique(np.asarray(game_ids, dtype=np.int64))
+    n_shards = max(1, min(int(n_shards), len(ids)))
+    return [s for s in np.array_split(ids, n_shards) if len(s)]
+
+
+def _slice_by_games(df: pd.DataFrame, ids: np.ndarray) -> pd.DataFrame:
+    """Rows of df whose game_id is in ids."""
+    return df[df["game_id"].isin(ids)]
+
+
+def _run_shard(fn: Callable, payload: dict, kwargs: dict) -> dict:
+    """Worker entry point: rebuild frames, run fn, return compact arrays."""
+    frames = {name: arrays_to_frame(arrs) for name, arrs in payload.items()}
+    out = fn(**frames, **kwargs)
+    if out is None or out.empty:
+        return {}
+    return frame_to_arrays(out)
+
+
+def run_sharded(
+    fn: Callable[..., pd.DataFrame],
+    frames: dict[str, pd.DataFrame],
+    *,
+    workers: int = 1,
+    game_ids=None,
+    **kwargs,
+) -> pd.DataFrame:
+    """
+    Run fn(**frames, **kwargs) per game shard and concatenate results in shard order.
+
+    fn must be a module-level function (picklable) that accepts the named frames
+    (each with a game_id column) and returns a DataFrame. game_ids defaults to
+    the union of game_ids across frames.
+    """
+    if workers is None or workers <= 1:
+        return fn(**frames, **kwargs)
+
+    if game_ids is None:
+        game_ids = np.unique(
+            np.concatenate(
+                [f["game_id"].dropna().to_numpy(np.int64) for f in frames.values()]
+            )
+        )
+
+    shards = shard_game_ids(game_ids, workers * SHARDS_PER_WORKER)
+    if not shards:
+        return fn(**frames, **kwargs)
+
+    payloads = [
+        {name: frame_to_arrays(_slice_by_games(df, ids)) for name, df in frames.items()}
+        for ids in shards
+    ]
+    logger.info(
+        "run_sharded: %s games in %s shards across %s workers",
+        sum(len(s) for s in shards),
+        len(shards),
+        workers,
+    )
+
+    with ProcessPoolExecutor(max_workers=int(workers)) as pool:
+        results = list(
+            pool.map(
+                _run_shard,
+                [fn] * len(payloads),
+                payloads,
+                [kwargs] * len(payloads),
+            )
+        )
+
+    parts = [arrays_to_frame(r) for r in results if r]
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
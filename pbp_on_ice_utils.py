@@ -0,0 +1,176 @@
+"""
+pbp_on_ice_utils.py.
+
+Alternate ES CF/CA engine that reads on-ice skaters straight from the PBP feed.
+
+raw.raw_pbp_{season} already carries home_on_1..7 / away_on_1..7 (player names),
+home_goalie / away_goalie and home_skaters / away_skaters for every event, so no
+shift join is needed:
+
+  1) keep Corsi events (SHOT, GOAL, MISS, BLOCK) at equal strength, using the same
+     rule as strength_utils: exclude = (home != away) AND both <= 6
+  2) unpivot the 14 on-ice columns into long (event, side, player_name) rows and
+     drop goalies
+  3) CF when the player's side is the shooting side (BLOCK: event_team is the
+     blocker, so the shooter is the other side), else CA
+  4) one groupby to (game_id, player_name, team_code), then names -> player_id via
+     the game's resolved shifts and team codes -> team_id
+
+reconcile_on_ice() compares the result with the shift-based numbers
+(mart.player_game_es_{season}) as a cross-check.
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from on_ice_utils import KEYS
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+ON_ICE_SLOTS = 7
+HOME_ON_COLS = [f"home_on_{i}" for i in range(1, ON_ICE_SLOTS + 1)]
+AWAY_ON_COLS = [f"away_on_{i}" for i in range(1, ON_ICE_SLOTS + 1)]
+PBP_CORSI_EVENTS = ("SHOT", "GOAL", "MISS", "BLOCK")
+
+PBP_COLUMNS = [
+    "game_id",
+    "event_index",
+    "event_type",
+    "event_team",
+    "home_team",
+    "away_team",
+    "home_skaters",
+    "away_skaters",
+    "home_goalie",
+    "away_goalie",
+    *HOME_ON_COLS,
+    *AWAY_ON_COLS,
+]
+
+
+def es_corsi_events(pbp: pd.DataFrame) -> pd.DataFrame:
+    """Corsi events at equal skater strength (same exclude rule as the shift engine)."""
+    ev = pbp[pbp["event_type"].isin(PBP_CORSI_EVENTS)]
+    ev = ev.dropna(subset=["event_team", "home_team", "away_team"])
+    home_n = pd.to_numeric(ev["home_skaters"], errors="coerce")
+    away_n = pd.to_numeric(ev["away_skaters"], errors="coerce")
+    exclude = (home_n != away_n) & (home_n <= 6) & (away_n <= 6)
+    return ev[~exclude & home_n.notna() & away_n.notna()]
+
+
+def unpivot_on_ice(ev: pd.DataFrame) -> pd.DataFrame:
+    """
+    Long on-ice rows, one per (event, skater).
+
+    Returns: game_id, event_index, team_code, player_name, is_for (bool, player's
+    side is the shooting side).
+    """
+    n = len(ev)
+    names = np.concatenate(
+        [ev[HOME_ON_COLS].to_numpy(object), ev[AWAY_ON_COLS].to_numpy(object)], axis=1
+    )
+    is_home = np.repeat(
+        np.array([True] * ON_ICE_SLOTS + [False] * ON_ICE_SLOTS)[None, :], n, axis=0
+    )
+
+    event_team = ev["event_team"].to_numpy(object)
+    home_team = ev["home_team"].to_numpy(object)
+    away_team = ev["away_team"].to_numpy(object)
+    is_block = ev["event_type"].eq("BLOCK").to_numpy()
+    shooter_is_home = (event_team == home_team) != is_block
+
+    goalie = np.where(
+        is_home,
+        ev["home_goalie"].to_numpy(object)[:, None],
+        ev["away_goalie"].to_numpy(object)[:, None],
+    )
+    keep = pd.notna(names) & (names != goalie) & (names != "")
+
+    row = np.repeat(np.arange(n)[:, None], 2 * ON_ICE_SLOTS, axis=1)[keep]
+    side_home = is_home[keep]
+    return pd.DataFrame(
+        {
+            "game_id": ev["game_id"].to_numpy(np.int64)[row],
+            "event_index": ev["event_index"].to_numpy()[row],
+            "team_code": np.where(side_home, home_team[row], away_team[row]),
+            "player_name": names[keep],
+            "is_for": side_home == shooter_is_home[row],
+        }
+    )
+
+
+def attribute_corsi_from_pbp(
+    pbp: pd.DataFrame, name_map: pd.DataFrame, team_map: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    ES CF/CA per (game_id, player_id, team_id) from PBP on-ice columns.
+
+    :param pbp: raw_pbp rows with PBP_COLUMNS
+    :param name_map: game_id, team_code, player_name, player_id (resolved shifts)
+    :param team_map: team_code, team_id
+    :return: (stats, unmapped) where unmapped lists on-ice names with no player_id
+    """
+    long = unpivot_on_ice(es_corsi_events(pbp))
+    if long.empty:
+        return pd.DataFrame(columns=KEYS + ["cf", "ca"]), pd.DataFrame()
+
+    long["cf"] = long["is_for"].astype(np.int64)
+    long["ca"] = 1 - long["cf"]
+    by_name = long.groupby(
+        ["game_id", "team_code", "player_name"], as_index=False, sort=True
+    )[["cf", "ca"]].sum()
+
+    names = name_map[["game_id", "team_code", "player_name", "player_id"]]
+    names = names.drop_duplicates(["game_id", "team_code", "player_name"])
+    out = by_name.merge(
+        names, on=["game_id", "team_code", "player_name"], how="left"
+    ).merge(team_map[["team_code", "team_id"]], on="team_code", how="left")
+
+    mapped = out["player_id"].notna() & out["team_id"].notna()
+    unmapped = out.loc[~mapped, ["game_id", "team_code", "player_name", "cf", "ca"]]
+
+    out = out[mapped].astype({"player_id": "int64", "team_id": "int64"})
+    out = out.groupby(KEYS, as_index=False, sort=True)[["cf", "ca"]].sum()
+    return out, unmapped.reset_index(drop=True)
+
+
+def reconcile_on_ice(
+    shift_based: pd.DataFrame, pbp_based: pd.DataFrame
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Compare shift-based and PBP-based CF/CA per player-game.
+
+    Rows missing on one side count as zeros (shift tables also list players who
+    were on ice for no attempts). Returns (detail of mismatched rows, per-game
+    summary).
+    """
+    a = shift_based[KEYS + ["cf", "ca"]]
+    b = pbp_based[KEYS + ["cf", "ca"]]
+    m = a.merge(b, on=KEYS, how="outer", suffixes=("_shift", "_pbp"), indicator=True)
+    for col in ("cf_shift", "ca_shift", "cf_pbp", "ca_pbp"):
+        m[col] = m[col].fillna(0).astype(np.int64)
+    m["cf_diff"] = m["cf_pbp"] - m["cf_shift"]
+    m["ca_diff"] = m["ca_pbp"] - m["ca_shift"]
+    m["source"] = m["_merge"].map(
+        {"both": "both", "left_only": "shift_only", "right_only": "pbp_only"}
+    )
+    m = m.drop(columns="_merge")
+    m["match"] = (m["cf_diff"] == 0) & (m["ca_diff"] == 0)
+    m["abs_diff"] = m["cf_diff"].abs() + m["ca_diff"].abs()
+
+    summary = m.assign(mismatch=~m["match"]).groupby("game_id", as_index=False).agg(
+        rows=("match", "size"),
+        rows_mismatched=("mismatch", "sum"),
+        cf_shift=("cf_shift", "sum"),
+        cf_pbp=("cf_pbp", "sum"),
+        ca_shift=("ca_shift", "sum"),
+        ca_pbp=("ca_pbp", "sum"),
+        abs_diff=("abs_diff", "sum"),
+    )
+    return m[~m["match"]].reset_index(drop=True), summary
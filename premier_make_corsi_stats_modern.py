@@ -16,16 +16,26 @@ Author: Eric Winiecke
 Date: Oct 30, 2024 (updated January 2026.)
 """
 
+import argparse
 import os
 import pathlib
 
+import numpy as np
 import pandas as pd
 
 from constants import SEASONS_MODERN
 from db_utils import get_db_engine
+from extract_cache_utils import ExtractCache, cached_read_frame
 from log_utils import setup_logger
+from on_ice_utils import KEYS, attribute_corsi_on_ice
+from parallel_utils import run_sharded
 from schema_utils import fq
-from strength_utils import build_exclude_timeline_equal_strength
+from season_data_utils import compact_frame, load_season_shifts
+from strength_utils import (
+    build_exclude_timeline_equal_strength,
+    build_strength_segments,
+    flag_excluded_plays,
+)
 
 if os.getenv("DEBUG_IMPORTS") == "1":
     print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
@@ -71,16 +81,17 @@ def add_cumulative_time_from_period(gp: pd.DataFrame) -> pd.DataFrame:
     Periods 1-3: (period-1)*1200 + periodTime
     OT (period >= 4): 3600 + periodTime.
     """
-    gp = gp.copy()
-
     if "time" in gp.columns:
         return gp
 
+    gp = gp.copy()
+
     if "period" not in gp.columns or "periodTime" not in gp.columns:
         raise KeyError("game_plays is missing required columns: period, periodTime")
 
     pt = _period_time_to_seconds(gp["periodTime"])
-    per = pd.to_numeric(gp["period"], errors="coerce")
+    # widen first: compact loads keep period as int8
+    per = pd.to_numeric(gp["period"], errors="coerce").astype("float64")
 
     # OT+ goes on top of 3600
     base = (per - 1) * 1200
@@ -161,6 +172,21 @@ def get_exclude_timeline(
 # -------------------------
 # Corsi calculation helpers
 # -------------------------
+def prepare_game_shifts(game_shifts: pd.DataFrame) -> pd.DataFrame:
+    """Coerce shift keys/times to int and drop rows missing any of them."""
+    gs = game_shifts.copy()
+    gs["shift_start"] = pd.to_numeric(gs["shift_start"], errors="coerce").astype(
+        "Int64"
+    )
+    gs["shift_end"] = pd.to_numeric(gs["shift_end"], errors="coerce").astype("Int64")
+    gs = gs.dropna(subset=["shift_start", "shift_end", "team_id", "player_id"]).copy()
+    gs["shift_start"] = gs["shift_start"].astype(int)
+    gs["shift_end"] = gs["shift_end"].astype(int)
+    gs["team_id"] = gs["team_id"].astype(int)
+    gs["player_id"] = gs["player_id"].astype(int)
+    return gs
+
+
 def prepare_game_plays(
     df_game: dict, relevant_events: list[str]
 ) -> pd.DataFrame | None:
@@ -178,8 +204,7 @@ def prepare_game_plays(
         logger.error("'game_plays' missing in df_game")
         return None
 
-    gp = df_game["game_plays"].copy()
-    gp = add_cumulative_time_from_period(gp)
+    gp = add_cumulative_time_from_period(df_game["game_plays"])
 
     if "event" not in gp.columns:
         logger.error("'event' column missing in game_plays")
@@ -191,124 +216,56 @@ def prepare_game_plays(
         logger.error(f"Missing required team columns in game_plays: {sorted(missing)}")
         return None
 
-    gp = (
-        gp[gp["event"].isin(relevant_events)]
-        .dropna(subset=["team_id_for", "team_id_against"])
-        .copy()
+    # filter first, then coerce time on the (much smaller) filtered frame
+    gp = gp[gp["event"].isin(relevant_events)].dropna(
+        subset=["team_id_for", "team_id_against"]
     )
-
-    # ensure int time
-    gp["time"] = pd.to_numeric(gp["time"], errors="coerce").astype("Int64")
-    gp = gp.dropna(subset=["time"]).copy()
+    gp = gp.assign(time=pd.to_numeric(gp["time"], errors="coerce").astype("Int64"))
+    gp = gp[gp["time"].notna().to_numpy()]
 
     return gp
 
 
-def update_corsi(
-    df_corsi: pd.DataFrame, event: pd.Series, game_shifts: pd.DataFrame
-) -> pd.DataFrame:
-    """
-    Update_corsi.
-
-    :param df_corsi: Description
-    :type df_corsi: pd.DataFrame
-    :param event: Description
-    :type event: pd.Series
-    :param game_shifts: Description
-    :type game_shifts: pd.DataFrame
-    :return: Description
-    :rtype: DataFrame
-    """
-    t = int(event["time"])
-    team_for = int(event["team_id_for"])
-    team_against = int(event["team_id_against"])
-
-    players_on_ice = game_shifts[
-        (game_shifts["shift_start"] <= t) & (game_shifts["shift_end"] >= t)
-    ]
-
-    players_for = players_on_ice[players_on_ice["team_id"] == team_for]
-    players_against = players_on_ice[players_on_ice["team_id"] == team_against]
-
-    if event["event"] in ["Shot", "Goal", "Missed Shot"]:
-        df_corsi.loc[
-            df_corsi["player_id"].isin(players_for["player_id"]), "corsi_for"
-        ] += 1
-        df_corsi.loc[
-            df_corsi["player_id"].isin(players_against["player_id"]), "corsi_against"
-        ] += 1
-    elif event["event"] == "Blocked Shot":
-        df_corsi.loc[
-            df_corsi["player_id"].isin(players_for["player_id"]), "corsi_against"
-        ] += 1
-        df_corsi.loc[
-            df_corsi["player_id"].isin(players_against["player_id"]), "corsi_for"
-        ] += 1
-
-    return df_corsi
-
-
 def calculate_corsi_for_game(df_corsi: pd.DataFrame, df_game: dict) -> pd.DataFrame:
     """
-    Calculate_corsi_for_game.
+    Calculate_corsi_for_game (any number of games in one pass).
 
-    :param df_corsi: Description
+    :param df_corsi: player-game keys to fill (game_id, player_id, team_id)
     :type df_corsi: pd.DataFrame
-    :param df_game: Description
+    :param df_game: game_shifts / game_plays of the same games (+ optional
+        strength_segments, built from the skater shifts when missing)
     :type df_game: dict
-    :return: Description
+    :return: df_corsi with corsi_for / corsi_against added
     :rtype: DataFrame
     """
-    gs = df_game["game_shifts"].copy()
-    gp = df_game["game_plays"].copy()
+    gs = df_game["game_shifts"]
+    gp = df_game["game_plays"]
 
     if gs.empty or gp.empty:
         return df_corsi
 
-    # Ensure ints
-    gs["shift_start"] = pd.to_numeric(gs["shift_start"], errors="coerce").astype(
-        "Int64"
-    )
-    gs["shift_end"] = pd.to_numeric(gs["shift_end"], errors="coerce").astype("Int64")
-    gs = gs.dropna(subset=["shift_start", "shift_end", "team_id", "player_id"]).copy()
-    gs["shift_start"] = gs["shift_start"].astype(int)
-    gs["shift_end"] = gs["shift_end"].astype(int)
-    gs["team_id"] = gs["team_id"].astype(int)
-    gs["player_id"] = gs["player_id"].astype(int)
+    gs = prepare_game_shifts(gs)
 
     relevant_events = ["Shot", "Blocked Shot", "Missed Shot", "Goal"]
     plays = prepare_game_plays({"game_plays": gp}, relevant_events)
     if plays is None or plays.empty:
         return df_corsi
 
-    # Build exclude timeline (skater imbalance)
+    # Strength segments (skater imbalance): shared table when provided
     gs = drop_probable_goalies(gs)
-    df_ex = get_exclude_timeline(gs)
-
-    if df_ex.empty:
-        # no exclude timeline; proceed without exclusions
-        for _, event in plays.iterrows():
-            df_corsi = update_corsi(df_corsi, event, gs)
-        return df_corsi
-
-    # df_ex is non-empty here
-    assert df_ex["time"].is_monotonic_increasing
-    assert {"time", "team_1", "team_2", "exclude"}.issubset(df_ex.columns)
+    segments = df_game.get("strength_segments")
+    if segments is None:
+        segments = build_strength_segments(gs)
 
-    df_ex["time"] = df_ex["time"].astype(int)
-    plays = plays.copy()
-    plays["time"] = plays["time"].astype(int)
+    # Map play times to the last breakpoint strictly before the play
+    plays = plays.loc[~flag_excluded_plays(plays, segments, side="left")]
 
-    # Map play times to breakpoint index
-    idx = df_ex["time"].searchsorted(plays["time"]) - 1
-    idx[idx < 0] = 0
-    idx = idx.clip(0, len(df_ex) - 1)
+    # on ice: shift_start <= t <= shift_end, matched on player_id only
+    counts = attribute_corsi_on_ice(gs, plays, end_inclusive=True, match_team=False)
+    counts = df_corsi[KEYS].merge(counts, on=KEYS, how="left")
 
-    mask = df_ex["exclude"].iloc[idx].to_numpy()
-    plays = plays.loc[~mask]
-
-    for _, event in plays.iterrows():
-        df_corsi = update_corsi(df_corsi, event, gs)
+    df_corsi["corsi_for"] += counts["cf"].fillna(0).astype(int).to_numpy()
+    df_corsi["corsi_against"] += counts["ca"].fillna(0).astype(int).to_numpy()
 
     return df_corsi
 
@@ -339,52 +296,38 @@ def create_corsi_stats(df_corsi: pd.DataFrame, df_game: dict) -> pd.DataFrame:
 # -------------------------
 # Season driver
 # -------------------------
-def calculate_and_save_corsi_stats(season: int) -> None:
+def calculate_and_save_corsi_stats(
+    season: int, *, workers: int = 1, extract_cache: ExtractCache | None = None
+) -> None:
     """
     Calculate_and_save_corsi_stats.
 
     :param season: Description
     :type season: int
+    :param workers: process-pool workers; games are sharded across them when > 1
+    :type workers: int
+    :param extract_cache: serve the plays / shifts extracts from local Parquet
+        while their source tables are unchanged (see extract_cache_utils)
+    :type extract_cache: ExtractCache | None
     """
     df_master = {}
     engine = get_db_engine()
 
-    try:
-        plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
-        df_master["game_plays"] = pd.read_sql(f"SELECT * FROM {plays_view}", engine)
-
-        raw_shifts_resolved = fq("raw", "raw_shifts_resolved")
-        dim_team_code = fq("dim", "dim_team_code")
-
-        # IMPORTANT: this query builds shift_start/shift_end in cumulative seconds,
-        # matching add_cumulative_time_from_period() for plays.
-        df_master["game_shifts"] = pd.read_sql(
-            f"""
-            SELECT
-                rs.game_id,
-                rs.player_id_resolved AS player_id,
-                dt.team_id,
-                rs.game_period AS period,
-                CASE
-                    WHEN rs.game_period IN (1,2,3) THEN (rs.game_period - 1) * 1200 + rs.seconds_start
-                    ELSE 3600 + rs.seconds_start
-                END AS shift_start,
-                CASE
-                    WHEN rs.game_period IN (1,2,3) THEN (rs.game_period - 1) * 1200 + rs.seconds_end
-                    ELSE 3600 + rs.seconds_end
-                END AS shift_end
-            FROM {raw_shifts_resolved} rs
-            JOIN {dim_team_code} dt
-                ON dt.team_code = rs.team
-            WHERE rs.season = {int(season)}
-              AND rs.session = 'R'
-              AND rs.seconds_end > rs.seconds_start
-            """,
+    plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
+    df_master["game_plays"] = compact_frame(
+        cached_read_frame(
             engine,
+            f"SELECT * FROM {plays_view}",
+            tables=[plays_view],
+            cache=extract_cache,
         )
+    )
 
-    finally:
-        engine.dispose()
+    # shift_start/shift_end in cumulative seconds, matching
+    # add_cumulative_time_from_period() for plays
+    df_master["game_shifts"] = load_season_shifts(
+        engine, season, period_offset=True, resolved_only=False, cache=extract_cache
+    )
 
     # basic validation
     if df_master["game_plays"].empty or df_master["game_shifts"].empty:
@@ -397,36 +340,20 @@ def calculate_and_save_corsi_stats(season: int) -> None:
     )
     logger.info(f"{season}: processing {len(season_game_ids)} games")
 
-    plays_by_game = dict(tuple(df_master["game_plays"].groupby("game_id", sort=False)))
-    shifts_by_game = dict(
-        tuple(df_master["game_shifts"].groupby("game_id", sort=False))
+    final_df = run_sharded(
+        compute_corsi_stats,
+        {
+            "game_plays": df_master["game_plays"],
+            "game_shifts": df_master["game_shifts"],
+        },
+        workers=workers,
+        game_ids=season_game_ids,
+        season=season,
     )
-
-    season_out = []
-
-    for game_id in season_game_ids:
-        gp = plays_by_game.get(game_id)
-        gs = shifts_by_game.get(game_id)
-
-        if gp is None or gs is None or gp.empty or gs.empty:
-            logger.warning(f"{season} game_id {game_id}: missing plays or shifts.")
-            continue
-
-        df_game = {"game_plays": gp, "game_shifts": gs}
-
-        # Seed players from shifts (has team_id)
-        df_corsi = gs[["game_id", "player_id", "team_id"]].drop_duplicates().copy()
-
-        corsi_stats = create_corsi_stats(df_corsi, df_game)
-        if not corsi_stats.empty:
-            season_out.append(corsi_stats)
-
-    if not season_out:
+    if final_df.empty:
         logger.warning(f"{season}: no corsi output generated.")
         return
 
-    final_df = pd.concat(season_out, ignore_index=True)
-
     out_dir = os.path.join(os.getcwd(), "corsi_stats")
     os.makedirs(out_dir, exist_ok=True)
     out_file = os.path.join(out_dir, f"corsi_stats_{season}.csv")
@@ -434,7 +361,74 @@ def calculate_and_save_corsi_stats(season: int) -> None:
     logger.info(f"{season}: saved to {out_file}")
 
 
+def compute_corsi_stats(
+    game_plays: pd.DataFrame, game_shifts: pd.DataFrame, *, season: int
+) -> pd.DataFrame:
+    """
+    Corsi stats for every game in game_plays (a season or one worker shard).
+
+    One season-wide create_corsi_stats() call: goalies are dropped, strength
+    segments built and shot attempts attributed once for all games, then the
+    counts land on the player-game keys seeded from shifts.
+
+    :param game_plays: plays view rows for the games to process
+    :param game_shifts: shift rows (cumulative seconds) for the same games
+    :param season: only used in log messages
+    :return: create_corsi_stats() output ordered by game_id (empty if none)
+    """
+    game_ids = game_plays["game_id"].dropna().astype(int).unique()
+    shift_games = game_shifts["game_id"].dropna().astype(int).unique()
+
+    missing = np.setdiff1d(game_ids, shift_games)
+    if len(missing):
+        logger.warning(
+            f"{season}: {len(missing)} games missing shifts "
+            f"(e.g. {missing[:5].tolist()})."
+        )
+    game_ids = np.intersect1d(game_ids, shift_games)
+    if not len(game_ids):
+        return pd.DataFrame()
+
+    gs = game_shifts[game_shifts["game_id"].isin(game_ids).to_numpy()]
+    gp = game_plays[game_plays["game_id"].isin(game_ids).to_numpy()]
+
+    # Seed players from shifts (has team_id), in game order
+    df_corsi = (
+        gs[["game_id", "player_id", "team_id"]]
+        .drop_duplicates()
+        .sort_values("game_id", kind="stable", ignore_index=True)
+    )
+
+    return create_corsi_stats(df_corsi, {"game_plays": gp, "game_shifts": gs})
+
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Process-pool workers (games are sharded per worker); 1 = serial",
+    )
+    ap.add_argument(
+        "--extract-cache",
+        action="store_true",
+        help="Serve season extracts from the local Parquet cache (extract_cache_utils)",
+    )
+    ap.add_argument(
+        "--extract-cache-no-verify",
+        action="store_true",
+        help="With --extract-cache, serve cached extracts without the fingerprint check",
+    )
+    args = ap.parse_args()
+    extract_cache = (
+        ExtractCache(verify=not args.extract_cache_no_verify)
+        if args.extract_cache
+        else None
+    )
+
     for season in SEASONS_MODERN:
         logger.info(f"Running season {season}")
-        calculate_and_save_corsi_stats(int(season))
+        calculate_and_save_corsi_stats(
+            int(season), workers=args.workers, extract_cache=extract_cache
+        )
@@ -5,6 +5,8 @@ Builds:
   1) mart.toi_total_{season} from raw.raw_shifts_resolved (skaters only, all strengths)
   2) mart.player_game_stats_{season} from mart.player_game_es_{season} (authoritative keyset)
      LEFT JOIN toi_total_{season} for toi_total_sec
+     (ES on-ice counters: cf/ca, ff/fa, sf/sa, gf/ga, xgf/xga, and the
+     score/venue-adjusted adj_cf/adj_ca with their rates)
 
 Guarantees:
   stats_rows == es_rows for every season (or raises an error)
@@ -13,6 +15,11 @@ Usage:
   python rebuild_player_game_stats_all_modern.py
   python rebuild_player_game_stats_all_modern.py --season 20192020
   python rebuild_player_game_stats_all_modern.py --drop-toi-total
+  python rebuild_player_game_stats_all_modern.py --season 20242025 --incremental
+
+Incremental mode only rebuilds games that are new or whose shift/play rows changed
+since the last build (mart.build_watermark) and upserts them into toi_total and
+player_game_stats. Run it after build_player_game_es.py --incremental.
 """
 
 from __future__ import annotations
@@ -25,6 +32,14 @@ from sqlalchemy import text
 
 from constants import SEASONS_MODERN
 from db_utils import get_db_engine
+from incremental_utils import (
+    delete_games,
+    plan_incremental,
+    record_full_build,
+    record_watermarks,
+    source_fingerprints,
+    table_columns,
+)
 from log_utils import setup_logger
 
 if os.getenv("DEBUG_IMPORTS") == "1":
@@ -32,6 +47,12 @@ if os.getenv("DEBUG_IMPORTS") == "1":
 
 logger = setup_logger()
 
+# on-ice counters carried over from mart.player_game_es_{season}
+STATS_METRIC_COLUMNS = {"cf", "ca", "ff", "fa", "sf", "sa", "gf", "ga", "xgf", "xga"}
+# score/venue-adjusted columns (build_player_game_es.py); NULL when the ES table
+# predates them
+ADJUSTED_COLUMNS = ("adj_cf", "adj_ca", "adj_cf60", "adj_ca60", "adj_cf_percent")
+
 
 def table_exists(conn, schema: str, table: str) -> bool:
     """Check for table."""
@@ -54,7 +75,9 @@ def table_exists(conn, schema: str, table: str) -> bool:
     return bool(conn.execute(q, {"schema": schema, "table": table}).scalar())
 
 
-def rebuild_for_season(*, season: int, drop_toi_total: bool) -> None:
+def rebuild_for_season(
+    *, season: int, drop_toi_total: bool, incremental: bool = False
+) -> None:
     """
     Docstring for rebuild_for_season.
 
@@ -62,6 +85,9 @@ def rebuild_for_season(*, season: int, drop_toi_total: bool) -> None:
     :type season: int
     :param drop_toi_total: Description
     :type drop_toi_total: bool
+    :param incremental: only rebuild games that are new or whose source rows
+        changed (falls back to a full rebuild when a target table is missing)
+    :type incremental: bool
     """
     engine = get_db_engine()
 
@@ -77,129 +103,192 @@ def rebuild_for_season(*, season: int, drop_toi_total: bool) -> None:
     shifts_view = '"raw"."raw_shifts_resolved"'
     dim_team = '"dim"."dim_team_code"'
 
-    try:
-        with engine.begin() as conn:
-            if not table_exists(conn, es_schema, es_table):
-                logger.warning(
-                    "⚠️ %s: missing %s.%s; skipping", season, es_schema, es_table
-                )
-                return
+    plan = None
+    if incremental:
+        plan = plan_incremental(engine, season, out_schema, out_table)
+        if plan.empty:
+            logger.info("✅ %s: %s.%s is up to date", season, out_schema, out_table)
+            return
+
+    # watermarks of a full build use the sources as they were before reading
+    fingerprints = (
+        source_fingerprints(engine, season) if plan is None else plan.fingerprints
+    )
 
-            # 1) Total TOI per (game_id, player_id, team_id) from shifts (skaters only)
-            logger.info("%s: building %s.%s", season, toi_schema, toi_table)
+    with engine.begin() as conn:
+        if not table_exists(conn, es_schema, es_table):
+            logger.warning(
+                "⚠️ %s: missing %s.%s; skipping", season, es_schema, es_table
+            )
+            return
 
-            conn.execute(text(f'DROP TABLE IF EXISTS "{toi_schema}"."{toi_table}";'))
+        full = (
+            plan is None
+            or not table_exists(conn, toi_schema, toi_table)
+            or not STATS_METRIC_COLUMNS | set(ADJUSTED_COLUMNS)
+            <= table_columns(conn, out_schema, out_table)
+        )
+        params = {} if full else {"game_ids": plan.rebuild}
+        rs_games = "" if full else "AND rs.game_id = ANY(:game_ids)"
+        es_games = "" if full else "WHERE es.game_id = ANY(:game_ids)"
+        if not full:
+            logger.info(
+                "%s: incremental rebuild of %s games (%s stale)",
+                season,
+                len(plan.rebuild),
+                len(plan.stale),
+            )
 
+        # 1) Total TOI per (game_id, player_id, team_id) from shifts (skaters only)
+        logger.info("%s: building %s.%s", season, toi_schema, toi_table)
+
+        toi_select = f"""
+                SELECT
+                  {season}::int AS season,
+                  rs.game_id::bigint AS game_id,
+                  rs.player_id_resolved::bigint AS player_id,
+                  dt.team_id::bigint AS team_id,
+                  SUM(GREATEST(0, rs.seconds_end - rs.seconds_start))::bigint AS toi_total_sec
+                FROM {shifts_view} rs
+                JOIN {dim_team} dt
+                  ON dt.team_code = rs.team
+                WHERE rs.season = {season}
+                  AND rs.session = 'R'
+                  AND rs.position <> 'G'
+                  AND rs.seconds_end > rs.seconds_start
+                  {rs_games}
+                GROUP BY 1,2,3,4
+                """
+
+        if full:
             conn.execute(
-                text(
-                    f"""
-                    CREATE TABLE "{toi_schema}"."{toi_table}" AS
-                    SELECT
-                      {season}::int AS season,
-                      rs.game_id::bigint AS game_id,
-                      rs.player_id_resolved::bigint AS player_id,
-                      dt.team_id::bigint AS team_id,
-                      SUM(GREATEST(0, rs.seconds_end - rs.seconds_start))::bigint AS toi_total_sec
-                    FROM {shifts_view} rs
-                    JOIN {dim_team} dt
-                      ON dt.team_code = rs.team
-                    WHERE rs.season = {season}
-                      AND rs.session = 'R'
-                      AND rs.position <> 'G'
-                      AND rs.seconds_end > rs.seconds_start
-                    GROUP BY 1,2,3,4;
-                    """
-                )
+                text(f'DROP TABLE IF EXISTS "{toi_schema}"."{toi_table}";')
             )
-
             conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS toi_total_{season}_key_idx
-                    ON "{toi_schema}"."{toi_table}" (game_id, player_id, team_id);
-                    """
-                )
+                text(f'CREATE TABLE "{toi_schema}"."{toi_table}" AS {toi_select};')
+            )
+        else:
+            delete_games(conn, toi_schema, toi_table, plan.rebuild + plan.stale)
+            conn.execute(
+                text(f'INSERT INTO "{toi_schema}"."{toi_table}" {toi_select};'),
+                params,
             )
 
-            # 2) Player-game stats from ES keyset + total TOI
-            logger.info("%s: building %s.%s", season, out_schema, out_table)
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS toi_total_{season}_key_idx
+                ON "{toi_schema}"."{toi_table}" (game_id, player_id, team_id);
+                """
+            )
+        )
 
-            conn.execute(text(f'DROP TABLE IF EXISTS "{out_schema}"."{out_table}";'))
+        # 2) Player-game stats from ES keyset + total TOI
+        logger.info("%s: building %s.%s", season, out_schema, out_table)
 
-            conn.execute(
-                text(
-                    f"""
-                    CREATE TABLE "{out_schema}"."{out_table}" AS
-                    SELECT
-                      {season}::int AS season,
-                      es.game_id::bigint AS game_id,
-                      es.player_id::bigint AS player_id,
-                      es.team_id::bigint AS team_id,
-                      es.cf::bigint AS cf,
-                      es.ca::bigint AS ca,
-                      COALESCE(tt.toi_total_sec, 0)::bigint AS toi_total_sec,
-                      es.toi_sec::bigint AS toi_es_sec,
-                      es.cf60::double precision AS cf60,
-                      es.ca60::double precision AS ca60,
-                      es.cf_percent::double precision AS cf_percent
-                    FROM "{es_schema}"."{es_table}" es
-                    LEFT JOIN "{toi_schema}"."{toi_table}" tt
-                      ON tt.game_id = es.game_id
-                     AND tt.player_id = es.player_id
-                     AND tt.team_id = es.team_id;
-                    """
-                )
-            )
+        es_columns = table_columns(conn, es_schema, es_table)
+        adjusted_select = ",\n".join(
+            f"                  {f'es.{c}' if c in es_columns else 'NULL'}"
+            f"::double precision AS {c}"
+            for c in ADJUSTED_COLUMNS
+        )
 
+        stats_select = f"""
+                SELECT
+                  {season}::int AS season,
+                  es.game_id::bigint AS game_id,
+                  es.player_id::bigint AS player_id,
+                  es.team_id::bigint AS team_id,
+                  es.cf::bigint AS cf,
+                  es.ca::bigint AS ca,
+                  es.ff::bigint AS ff,
+                  es.fa::bigint AS fa,
+                  es.sf::bigint AS sf,
+                  es.sa::bigint AS sa,
+                  es.gf::bigint AS gf,
+                  es.ga::bigint AS ga,
+                  es.xgf::double precision AS xgf,
+                  es.xga::double precision AS xga,
+                  COALESCE(tt.toi_total_sec, 0)::bigint AS toi_total_sec,
+                  es.toi_sec::bigint AS toi_es_sec,
+                  es.cf60::double precision AS cf60,
+                  es.ca60::double precision AS ca60,
+                  es.cf_percent::double precision AS cf_percent,
+{adjusted_select}
+                FROM "{es_schema}"."{es_table}" es
+                LEFT JOIN "{toi_schema}"."{toi_table}" tt
+                  ON tt.game_id = es.game_id
+                 AND tt.player_id = es.player_id
+                 AND tt.team_id = es.team_id
+                {es_games}
+                """
+
+        if full:
             conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS player_game_stats_{season}_game_idx
-                    ON "{out_schema}"."{out_table}" (game_id);
-                    """
-                )
+                text(f'DROP TABLE IF EXISTS "{out_schema}"."{out_table}";')
             )
             conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS player_game_stats_{season}_player_idx
-                    ON "{out_schema}"."{out_table}" (player_id);
-                    """
-                )
+                text(f'CREATE TABLE "{out_schema}"."{out_table}" AS {stats_select};')
             )
+        else:
+            delete_games(conn, out_schema, out_table, plan.rebuild + plan.stale)
             conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS player_game_stats_{season}_team_idx
-                    ON "{out_schema}"."{out_table}" (team_id);
-                    """
-                )
+                text(f'INSERT INTO "{out_schema}"."{out_table}" {stats_select};'),
+                params,
             )
 
-            # 3) Validate counts match ES exactly
-            es_rows = conn.execute(
-                text(f'SELECT COUNT(*) FROM "{es_schema}"."{es_table}";')
-            ).scalar_one()
-            stats_rows = conn.execute(
-                text(f'SELECT COUNT(*) FROM "{out_schema}"."{out_table}";')
-            ).scalar_one()
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS player_game_stats_{season}_game_idx
+                ON "{out_schema}"."{out_table}" (game_id);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS player_game_stats_{season}_player_idx
+                ON "{out_schema}"."{out_table}" (player_id);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS player_game_stats_{season}_team_idx
+                ON "{out_schema}"."{out_table}" (team_id);
+                """
+            )
+        )
+
+        # 3) Validate counts match ES exactly
+        es_rows = conn.execute(
+            text(f'SELECT COUNT(*) FROM "{es_schema}"."{es_table}";')
+        ).scalar_one()
+        stats_rows = conn.execute(
+            text(f'SELECT COUNT(*) FROM "{out_schema}"."{out_table}";')
+        ).scalar_one()
+
+        if es_rows != stats_rows:
+            raise RuntimeError(
+                f"{season}: row mismatch (es_rows={es_rows}, stats_rows={stats_rows})"
+            )
 
-            if es_rows != stats_rows:
-                raise RuntimeError(
-                    f"{season}: row mismatch (es_rows={es_rows}, stats_rows={stats_rows})"
-                )
+        logger.info("✅ %s: stats_rows=%s (matches ES)", season, stats_rows)
 
-            logger.info("✅ %s: stats_rows=%s (matches ES)", season, stats_rows)
+        if not full:
+            record_watermarks(conn, plan)
 
-            # 4) Optional cleanup
-            if drop_toi_total:
-                conn.execute(
-                    text(f'DROP TABLE IF EXISTS "{toi_schema}"."{toi_table}";')
-                )
-                logger.info("%s: dropped %s.%s", season, toi_schema, toi_table)
+        # 4) Optional cleanup
+        if drop_toi_total:
+            conn.execute(
+                text(f'DROP TABLE IF EXISTS "{toi_schema}"."{toi_table}";')
+            )
+            logger.info("%s: dropped %s.%s", season, toi_schema, toi_table)
 
-    finally:
-        engine.dispose()
+    if full:
+        record_full_build(engine, out_schema, out_table, fingerprints)
 
 
 def main() -> None:
@@ -213,12 +302,21 @@ def main() -> None:
         action="store_true",
         help="Drop mart.toi_total_{season} after building stats table",
     )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rebuild games that are new or whose source rows changed (upsert)",
+    )
     args = ap.parse_args()
 
     seasons = [args.season] if args.season else [int(s) for s in SEASONS_MODERN]
 
     for s in seasons:
-        rebuild_for_season(season=s, drop_toi_total=args.drop_toi_total)
+        rebuild_for_season(
+            season=s,
+            drop_toi_total=args.drop_toi_total,
+            incremental=args.incremental,
+        )
 
 
 if __name__ == "__main__":
@@ -55,128 +55,124 @@ def rebuild_for_season(*, season: int, out_schema: str = "derived") -> None:
     es_table = f"player_game_es_{season}"
     out_table = f"raw_corsi_{season}"
 
-    try:
-        with engine.begin() as conn:
-            if not table_exists(conn, es_schema, es_table):
-                logger.warning(
-                    "⚠️ %s: missing %s.%s; skipping", season, es_schema, es_table
-                )
-                return
-            # --- FAIL FAST: ES must be unique on (game_id, player_id, team_id) ---
-            dupe_keys = conn.execute(
-                text(
-                    f"""
-                    SELECT COUNT(*) FROM (
-                      SELECT game_id, player_id, team_id
-                      FROM "{es_schema}"."{es_table}"
-                      GROUP BY 1,2,3
-                      HAVING COUNT(*) > 1
-                    ) d;
-                    """
-                )
-            ).scalar_one()
-
-            if int(dupe_keys) > 0:
-                raise RuntimeError(
-                    f"{season}: ES has {dupe_keys} duplicate (game_id,player_id,team_id) keys in "
-                    f"{es_schema}.{es_table}. Rebuild ES / fix resolver before raw_corsi."
-                )
-
-            null_keys = conn.execute(
-                text(
-                    f"""
-                    SELECT COUNT(*)
-                    FROM "{es_schema}"."{es_table}"
-                    WHERE game_id IS NULL OR player_id IS NULL OR team_id IS NULL;
-                    """
-                )
-            ).scalar_one()
-
-            if int(null_keys) > 0:
-                raise RuntimeError(
-                    f"{season}: ES has {null_keys} rows with NULL game_id/player_id/team_id in "
-                    f"{es_schema}.{es_table}. Fix upstream before raw_corsi."
-                )
-
-            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{out_schema}";'))
-            conn.execute(
-                text(
-                    f'DROP TABLE IF EXISTS "{out_schema}"."raw_corsi_{season}" CASCADE;'
-                )
+    with engine.begin() as conn:
+        if not table_exists(conn, es_schema, es_table):
+            logger.warning(
+                "⚠️ %s: missing %s.%s; skipping", season, es_schema, es_table
             )
+            return
+        # --- FAIL FAST: ES must be unique on (game_id, player_id, team_id) ---
+        dupe_keys = conn.execute(
+            text(
+                f"""
+                SELECT COUNT(*) FROM (
+                  SELECT game_id, player_id, team_id
+                  FROM "{es_schema}"."{es_table}"
+                  GROUP BY 1,2,3
+                  HAVING COUNT(*) > 1
+                ) d;
+                """
+            )
+        ).scalar_one()
 
-            conn.execute(
-                text(
-                    f"""
-                    CREATE TABLE "{out_schema}"."{out_table}" AS
-                    SELECT
-                      es.game_id::bigint AS game_id,
-                      es.player_id::bigint AS player_id,
-                      es.team_id::bigint AS team_id,
-                      es.cf::bigint AS corsi_for,
-                      es.ca::bigint AS corsi_against,
-                      (es.cf - es.ca)::bigint AS corsi,
-                      es.cf_percent::double precision AS cf_percent
-                    FROM "{es_schema}"."{es_table}" es;
-                    """
-                )
+        if int(dupe_keys) > 0:
+            raise RuntimeError(
+                f"{season}: ES has {dupe_keys} duplicate (game_id,player_id,team_id) keys in "
+                f"{es_schema}.{es_table}. Rebuild ES / fix resolver before raw_corsi."
             )
 
-            conn.execute(
-                text(
-                    f"""
-                    CREATE UNIQUE INDEX IF NOT EXISTS raw_corsi_{season}_key_idx
-                    ON "{out_schema}"."{out_table}" (game_id, player_id, team_id);
-                    """
-                )
+        null_keys = conn.execute(
+            text(
+                f"""
+                SELECT COUNT(*)
+                FROM "{es_schema}"."{es_table}"
+                WHERE game_id IS NULL OR player_id IS NULL OR team_id IS NULL;
+                """
             )
-            conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS raw_corsi_{season}_game_idx
-                    ON "{out_schema}"."{out_table}" (game_id);
-                    """
-                )
+        ).scalar_one()
+
+        if int(null_keys) > 0:
+            raise RuntimeError(
+                f"{season}: ES has {null_keys} rows with NULL game_id/player_id/team_id in "
+                f"{es_schema}.{es_table}. Fix upstream before raw_corsi."
             )
-            conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS raw_corsi_{season}_player_idx
-                    ON "{out_schema}"."{out_table}" (player_id);
-                    """
-                )
+
+        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{out_schema}";'))
+        conn.execute(
+            text(
+                f'DROP TABLE IF EXISTS "{out_schema}"."raw_corsi_{season}" CASCADE;'
             )
-            conn.execute(
-                text(
-                    f"""
-                    CREATE INDEX IF NOT EXISTS raw_corsi_{season}_team_idx
-                    ON "{out_schema}"."{out_table}" (team_id);
-                    """
-                )
+        )
+
+        conn.execute(
+            text(
+                f"""
+                CREATE TABLE "{out_schema}"."{out_table}" AS
+                SELECT
+                  es.game_id::bigint AS game_id,
+                  es.player_id::bigint AS player_id,
+                  es.team_id::bigint AS team_id,
+                  es.cf::bigint AS corsi_for,
+                  es.ca::bigint AS corsi_against,
+                  (es.cf - es.ca)::bigint AS corsi,
+                  es.cf_percent::double precision AS cf_percent
+                FROM "{es_schema}"."{es_table}" es;
+                """
             )
-
-            es_rows = conn.execute(
-                text(f'SELECT COUNT(*) FROM "{es_schema}"."{es_table}";')
-            ).scalar_one()
-            out_rows = conn.execute(
-                text(f'SELECT COUNT(*) FROM "{out_schema}"."{out_table}";')
-            ).scalar_one()
-
-            if es_rows != out_rows:
-                raise RuntimeError(
-                    f"{season}: row mismatch (es_rows={es_rows}, raw_corsi_rows={out_rows})"
-                )
-
-            logger.info(
-                "✅ %s: rebuilt %s.%s rows=%s (matches ES)",
-                season,
-                out_schema,
-                out_table,
-                out_rows,
+        )
+
+        conn.execute(
+            text(
+                f"""
+                CREATE UNIQUE INDEX IF NOT EXISTS raw_corsi_{season}_key_idx
+                ON "{out_schema}"."{out_table}" (game_id, player_id, team_id);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS raw_corsi_{season}_game_idx
+                ON "{out_schema}"."{out_table}" (game_id);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS raw_corsi_{season}_player_idx
+                ON "{out_schema}"."{out_table}" (player_id);
+                """
+            )
+        )
+        conn.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS raw_corsi_{season}_team_idx
+                ON "{out_schema}"."{out_table}" (team_id);
+                """
+            )
+        )
+
+        es_rows = conn.execute(
+            text(f'SELECT COUNT(*) FROM "{es_schema}"."{es_table}";')
+        ).scalar_one()
+        out_rows = conn.execute(
+            text(f'SELECT COUNT(*) FROM "{out_schema}"."{out_table}";')
+        ).scalar_one()
+
+        if es_rows != out_rows:
+            raise RuntimeError(
+                f"{season}: row mismatch (es_rows={es_rows}, raw_corsi_rows={out_rows})"
             )
 
-    finally:
-        engine.dispose()
+        logger.info(
+            "✅ %s: rebuilt %s.%s rows=%s (matches ES)",
+            season,
+            out_schema,
+            out_table,
+            out_rows,
+        )
 
 
 def main() -> None:
@@ -9,6 +9,8 @@ Steps:
      - sql/mart/player_season_archetype_features_modern_truth.sql
   3) Build mart.player_season_archetype_features_modern_truth_clean (all seasons)
      - sql/mart/player_season_archetype_features_modern_truth_clean.sql
+     3b) QoC / QoT columns onto the clean table
+     - python build_player_season_competition.py
   4) Cluster
      - python cluster_player_archetypes_modern.py
 
@@ -113,6 +115,11 @@ def main() -> None:
     run_psql_file(args.dsn, None, CLEAN_SQL)
     fail_if_clean_missing(args.dsn)
 
+    # 3b) QoC / QoT features onto the clean table (WOWY pair matrices)
+    print("\n==================== QoC / QoT features ====================")
+    season_args = ["--season", str(args.season)] if args.season is not None else []
+    run([sys.executable, "-u", "build_player_season_competition.py", *season_args])
+
     # 4) cluster
     print("\n==================== clustering ====================")
     run(
@@ -3,6 +3,9 @@ Run the modern pipeline end-to-end (Python + psql), streaming output live.
 
 Per season:
   1) Build ES: mart.player_game_es_{season}
+     + strength splits: mart.player_game_strength_{season} (5v5/4v4/3v3/PP/PK/EN)
+     + WOWY pairs: mart.player_pair_es_{season} (+ sparse matrices in .cache)
+     + lines / D pairs: mart.team_lines_modern (season rows)
   2) Canonicalize IDs (psql): sql/mart/canonicalize_ids.sql
      - FAIL FAST if canonicalize creates duplicate (game_id,player_id,team_id) keys in ES
   3) Rebuild stats/toi_total: mart.player_game_stats_{season}, mart.toi_total_{season}
@@ -12,6 +15,7 @@ Per season:
 Notes:
 - Uses `-u` for Python scripts so prints/logs flush immediately.
 - Uses psql ON_ERROR_STOP so SQL failures stop the pipeline.
+- --incremental passes through to steps 1 and 3 (only new/changed games).
 
 """
 
@@ -90,17 +94,49 @@ def main() -> None:
     ap.add_argument(
         "--dsn", required=True, help="psql DSN string, e.g. postgresql://..."
     )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="ES + stats builders only rebuild new/changed games (nightly runs)",
+    )
     args = ap.parse_args()
 
     seasons = [args.season] if args.season is not None else SEASONS_MODERN
+    incremental = ["--incremental"] if args.incremental else []
 
     for s in seasons:
         print(f"\n==================== {s} ====================")
 
         # 1) Build ES
-        run([sys.executable, "-u", "build_player_game_es.py", "--season", str(s)])
+        run(
+            [
+                sys.executable,
+                "-u",
+                "build_player_game_es.py",
+                "--season",
+                str(s),
+                *incremental,
+            ]
+        )
         fail_if_es_dupes(args.dsn, s)  # safety check
 
+        # 1b) TOI + on-ice counts per strength state (same inputs as ES)
+        run(
+            [
+                sys.executable,
+                "-u",
+                "build_player_game_strength.py",
+                "--season",
+                str(s),
+            ]
+        )
+
+        # 1c) Shared ES TOI / CF / CA per player pair (same inputs as ES)
+        run([sys.executable, "-u", "build_player_pairs.py", "--season", str(s)])
+
+        # 1d) Detected forward lines / D pairs with ES TOI / CF / CA
+        run([sys.executable, "-u", "build_team_lines.py", "--season", str(s)])
+
         # 2) Canonicalize ES IDs
         run_psql_file(args.dsn, s, CANON_SQL)
         fail_if_es_dupes(args.dsn, s)  # FAIL FAST if canonicalize introduces dupes
@@ -113,6 +149,7 @@ def main() -> None:
                 "rebuild_player_game_stats_all_modern.py",
                 "--season",
                 str(s),
+                *incremental,
             ]
         )
 
@@ -0,0 +1,209 @@
+"""
+score_adjust_utils.py.
+
+Score- and venue-adjusted Corsi weights (per shot attempt).
+
+Raw CF% is biased by score effects: trailing teams out-attempt leading teams, and
+home teams out-attempt visitors. Each attempt gets a weight from the shooting
+team's state (venue, goal difference capped at +/-SCORE_DIFF_CAP):
+
+  share(state) = attempts by shooters in state
+                 / (that + attempts by their opponents in the mirrored state)
+  weight       = 0.5 / share(state)
+
+The mirrored state is the same moment seen from the other bench (home up 1 <->
+away down 1), so the two shares add up to 1 and an average team in any state
+comes out at an adjusted CF% of 50. Shares are estimated from one season's
+attempts (all strengths), which keeps the adjusted totals close to the raw ones.
+
+The weight is stored on the plays as WEIGHT_COLUMN, and on_ice_utils's "adj_c"
+metric sums it in the same prefix-sum / bincount pass as the raw counts, giving
+adj_cf / adj_ca.
+
+Frozen counts: a game's weights must not move when later games are added, or
+every nightly run would have to rebuild the whole season. Full builds refresh a
+season's counts and store them in mart.score_venue_counts
+(store_score_venue_counts); incremental runs weight new games with the stored
+counts (stored_score_venue_counts), so per-game rows only depend on their game.
+
+Usage:
+    with engine.connect() as conn:
+        gp = load_season_plays(conn, season)
+        counts = load_score_venue_counts(conn, season)
+    gp = add_score_venue_weight(gp, counts)
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_utils import read_frame
+from on_ice_utils import BLOCKED_EVENTS, SHOT_EVENTS
+from schema_utils import fq
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+SCORE_DIFF_CAP = 3
+WEIGHT_COLUMN = "score_venue_weight"
+STATE_COLUMNS = ["shooter_home", "score_diff"]
+COUNTS_TABLE = "score_venue_counts"
+
+
+def shooter_states(plays: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Shooting team's (home flag, capped goal difference) for every play.
+
+    plays columns required: event, home_for, score_diff_for (team_id_for's view,
+    see season_data_utils.load_season_plays). Blocked shots are flipped to the
+    shooter's view.
+    """
+    is_block = plays["event"].isin(BLOCKED_EVENTS).to_numpy()
+    home = plays["home_for"].to_numpy(np.int64) != 0
+    diff = plays["score_diff_for"].to_numpy(np.int64)
+    home = np.where(is_block, ~home, home)
+    diff = np.where(is_block, -diff, diff)
+    return home.astype(np.int8), np.clip(diff, -SCORE_DIFF_CAP, SCORE_DIFF_CAP)
+
+
+def score_venue_counts(plays: pd.DataFrame) -> pd.DataFrame:
+    """
+    Corsi attempts by shooter state from a plays frame.
+
+    In-memory counterpart of season_data_utils.load_score_venue_counts (same
+    columns: shooter_home, score_diff, n).
+    """
+    corsi = plays[plays["event"].isin(SHOT_EVENTS + BLOCKED_EVENTS).to_numpy()]
+    home, diff = shooter_states(corsi)
+    counts = (
+        pd.DataFrame({"shooter_home": home, "score_diff": diff})
+        .value_counts()
+        .rename("n")
+        .reset_index()
+    )
+    return counts.sort_values(STATE_COLUMNS, ignore_index=True)
+
+
+def score_venue_shares(counts: pd.DataFrame) -> np.ndarray:
+    """
+    Shooter share of attempts per state as a (2, 2 * SCORE_DIFF_CAP + 1) array.
+
+    Indexed [shooter_home, score_diff + SCORE_DIFF_CAP]; states without attempts
+    on either side get 0.5 (weight 1).
+    """
+    width = 2 * SCORE_DIFF_CAP + 1
+    n = np.zeros((2, width), dtype=np.float64)
+    home = counts["shooter_home"].to_numpy(np.int64)
+    diff = np.clip(
+        counts["score_diff"].to_numpy(np.int64), -SCORE_DIFF_CAP, SCORE_DIFF_CAP
+    )
+    np.add.at(n, (home, diff + SCORE_DIFF_CAP), counts["n"].to_numpy(np.float64))
+
+    # mirrored state: other venue, negated difference
+    total = n + n[::-1, ::-1]
+    return np.divide(n, total, out=np.full_like(n, 0.5), where=total > 0)
+
+
+def score_venue_weights(
+    plays: pd.DataFrame, counts: pd.DataFrame | None = None
+) -> np.ndarray:
+    """
+    Per-play adjustment weight (0.5 / shooter share); 1.0 for non-Corsi plays.
+
+    counts defaults to score_venue_counts(plays); pass the season's counts when
+    plays only hold some of its games.
+    """
+    if counts is None:
+        counts = score_venue_counts(plays)
+    shares = score_venue_shares(counts)
+    home, diff = shooter_states(plays)
+    share = shares[home, diff + SCORE_DIFF_CAP]
+    w = np.divide(0.5, share, out=np.ones_like(share), where=share > 0)
+    is_corsi = plays["event"].isin(SHOT_EVENTS + BLOCKED_EVENTS).to_numpy()
+    return np.where(is_corsi, w, 1.0)
+
+
+def add_score_venue_weight(
+    plays: pd.DataFrame, counts: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """Return plays with WEIGHT_COLUMN added (see score_venue_weights)."""
+    return plays.assign(**{WEIGHT_COLUMN: score_venue_weights(plays, counts)})
+
+
+# -------------------------
+# Frozen season counts
+# -------------------------
+def ensure_counts_table(conn) -> None:
+    """Create mart.score_venue_counts if missing."""
+    conn.execute(
+        text(
+            f"""
+            CREATE TABLE IF NOT EXISTS {fq("mart", COUNTS_TABLE, quote=True)} (
+              season integer NOT NULL,
+              shooter_home smallint NOT NULL,
+              score_diff smallint NOT NULL,
+              n bigint NOT NULL,
+              refreshed_at timestamptz NOT NULL DEFAULT now(),
+              PRIMARY KEY (season, shooter_home, score_diff)
+            );
+            """
+        )
+    )
+
+
+def store_score_venue_counts(engine, season: int, counts: pd.DataFrame) -> None:
+    """Replace the stored counts of season (one transaction)."""
+    table = fq("mart", COUNTS_TABLE, quote=True)
+    with engine.begin() as conn:
+        ensure_counts_table(conn)
+        conn.execute(
+            text(f"DELETE FROM {table} WHERE season = :season"),
+            {"season": int(season)},
+        )
+        if counts.empty:
+            return
+        conn.execute(
+            text(
+                f"""
+                INSERT INTO {table} (season, shooter_home, score_diff, n)
+                VALUES (:season, :shooter_home, :score_diff, :n)
+                """
+            ),
+            [
+                {
+                    "season": int(season),
+                    "shooter_home": int(h),
+                    "score_diff": int(d),
+                    "n": int(n),
+                }
+                for h, d, n in zip(
+                    counts["shooter_home"], counts["score_diff"], counts["n"]
+                )
+            ],
+        )
+
+
+def stored_score_venue_counts(engine, season: int) -> pd.DataFrame | None:
+    """Return the counts stored by the last full build of season, or None."""
+    with engine.begin() as conn:
+        ensure_counts_table(conn)
+        counts = read_frame(
+            conn,
+            text(
+                f"""
+                SELECT shooter_home, score_diff, n
+                FROM {fq("mart", COUNTS_TABLE, quote=True)}
+                WHERE season = :season
+                ORDER BY shooter_home, score_diff
+                """
+            ),
+            {"season": int(season)},
+        )
+    if counts.empty:
+        return None
+    return counts.astype(np.int64)
@@ -91,10 +91,7 @@ class RunSummary:
 
 def read_df(sql: str, params: dict | None = None) -> pd.DataFrame:
     engine = get_db_engine()
-    try:
-        return pd.read_sql_query(text(sql), engine, params=params or {})
-    finally:
-        engine.dispose()
+    return pd.read_sql_query(text(sql), engine, params=params or {})
 
 
 def season_next(season: int) -> int:
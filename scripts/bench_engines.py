@@ -0,0 +1,193 @@
+"""
+scripts.bench_engines.
+
+Offline benchmark for the Corsi/TOI engines on a synthetic season (no Postgres).
+
+Generates a season with synthetic_season.generate_season() and times each stage
+of the player-game stats build on it:
+
+  segments        build_strength_segments (season-wide strength timeline)
+  exclude_per_game build_exclude_timeline_equal_strength, one call per game
+  es_toi          build_es_toi
+  es_plays        apply_segments_to_plays
+  cfca            attribute_on_ice, Corsi only
+  all_metrics     attribute_on_ice, CF/FF/SF/GF/xG
+  full            compute_player_game_stats (serial, or run_sharded with --workers)
+
+For every stage: best wall time over --repeat runs, games/sec and peak traced
+memory (tracemalloc, which also sees numpy buffers).
+
+Usage:
+  python -m scripts.bench_engines
+  python -m scripts.bench_engines --games 200 --repeat 3 --stages segments,cfca
+  python -m scripts.bench_engines --workers 4 --json bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+# Ensure repo root is on sys.path so "import strength_utils" works when running:
+#   python -m scripts.bench_engines ...
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from build_modern_player_game_stats import compute_player_game_stats  # noqa: E402
+from on_ice_utils import ALL_METRICS, attribute_on_ice  # noqa: E402
+from parallel_utils import run_sharded  # noqa: E402
+from strength_utils import (  # noqa: E402
+    apply_segments_to_plays,
+    build_es_toi,
+    build_exclude_timeline_equal_strength,
+    build_strength_segments,
+    filter_goalies_modern,
+)
+from synthetic_season import generate_season  # noqa: E402
+
+STAGES = [
+    "segments",
+    "exclude_per_game",
+    "es_toi",
+    "es_plays",
+    "cfca",
+    "all_metrics",
+    "full",
+]
+
+
+def _measure(fn, repeat: int) -> dict:
+    """Run fn() `repeat` times; return best/mean seconds and peak traced MiB."""
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        "best_sec": min(times),
+        "mean_sec": sum(times) / len(times),
+        "peak_mib": peak / 2**20,
+    }
+
+
+def _stage_fns(gs, gp, *, workers: int) -> dict:
+    """Zero-arg callables per stage (inputs prepared once, outside the timings)."""
+    sk = filter_goalies_modern(gs)
+    segments = build_strength_segments(sk)
+    gp_es = apply_segments_to_plays(gp, segments)
+    per_game = [g for _, g in sk.groupby("game_id", sort=False)]
+
+    def full():
+        if workers > 1:
+            return run_sharded(
+                compute_player_game_stats, {"gs": gs, "gp": gp}, workers=workers
+            )
+        return compute_player_game_stats(gs, gp)
+
+    return {
+        "segments": lambda: build_strength_segments(sk),
+        "exclude_per_game": lambda: [
+            build_exclude_timeline_equal_strength(g) for g in per_game
+        ],
+        "es_toi": lambda: build_es_toi(sk, segments, merge_shifts=False),
+        "es_plays": lambda: apply_segments_to_plays(gp, segments),
+        "cfca": lambda: attribute_on_ice(sk, gp_es, metrics=("c",)),
+        "all_metrics": lambda: attribute_on_ice(sk, gp_es, metrics=ALL_METRICS),
+        "full": full,
+    }
+
+
+def run_benchmark(
+    *,
+    n_games: int,
+    seed: int = 0,
+    repeat: int = 3,
+    stages: list[str] | None = None,
+    workers: int = 1,
+) -> dict:
+    """Generate a synthetic season and time the requested stages."""
+    t0 = time.perf_counter()
+    season = generate_season(n_games=n_games, seed=seed)
+    gen_sec = time.perf_counter() - t0
+    gs, gp = season["gs"], season["gp"]
+
+    fns = _stage_fns(gs, gp, workers=workers)
+    results = {}
+    for name in stages or STAGES:
+        r = _measure(fns[name], repeat)
+        r["games_per_sec"] = n_games / r["best_sec"] if r["best_sec"] > 0 else None
+        results[name] = r
+
+    return {
+        "games": n_games,
+        "seed": seed,
+        "repeat": repeat,
+        "workers": workers,
+        "shift_rows": len(gs),
+        "play_rows": len(gp),
+        "generate_sec": gen_sec,
+        "stages": results,
+    }
+
+
+def _print_report(report: dict) -> None:
+    print(
+        f"synthetic season: {report['games']} games, {report['shift_rows']} shifts, "
+        f"{report['play_rows']} plays (generated in {report['generate_sec']:.1f}s, "
+        f"seed={report['seed']}, repeat={report['repeat']}, "
+        f"workers={report['workers']})"
+    )
+    print(f"{'stage':<18}{'best s':>10}{'mean s':>10}{'games/s':>12}{'peak MiB':>11}")
+    for name, r in report["stages"].items():
+        print(
+            f"{name:<18}{r['best_sec']:>10.3f}{r['mean_sec']:>10.3f}"
+            f"{r['games_per_sec'] or float('nan'):>12.0f}{r['peak_mib']:>11.1f}"
+        )
+
+
+def main() -> int:
+    """Benchmark the engines on a synthetic season; return the exit code."""
+    ap = argparse.ArgumentParser(description="Benchmark the Corsi/TOI engines.")
+    ap.add_argument("--games", type=int, default=1300, help="Synthetic games")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per stage (best kept)")
+    ap.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"Comma-separated subset of: {','.join(STAGES)}",
+    )
+    ap.add_argument(
+        "--workers", type=int, default=1, help="Worker processes for the full stage"
+    )
+    ap.add_argument("--json", default=None, help="Also write the report to this path")
+    args = ap.parse_args()
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = sorted(set(stages) - set(STAGES))
+    if unknown:
+        ap.error(f"unknown stages: {unknown}")
+
+    report = run_benchmark(
+        n_games=args.games,
+        seed=args.seed,
+        repeat=args.repeat,
+        stages=stages,
+        workers=args.workers,
+    )
+    _print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+"""
+scripts.bench_live_game.
+
+Replay recorded games through the streaming GameState (live_game_utils) and
+report events/sec.
+
+Every game is turned into its time-ordered event stream first (game_events);
+only feeding the stream is timed, so the numbers are the per-event cost of the
+live engine (shift on / shift off / play).
+
+Sources:
+  default        synthetic season (synthetic_season.generate_season), no database
+  --db           one recorded game from Postgres (--season, --game-id)
+
+--check compares the replayed counters with build_player_game_es's season
+engine on the same games (exit status 1 on any difference).
+
+Usage:
+  python -m scripts.bench_live_game
+  python -m scripts.bench_live_game --games 200 --repeat 3 --check
+  python -m scripts.bench_live_game --db --season 20232024 --game-id 2023020001
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+# Ensure repo root is on sys.path so "import live_game_utils" works when running:
+#   python -m scripts.bench_live_game ...
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from game_store_utils import game_slices  # noqa: E402
+from live_game_utils import (  # noqa: E402
+    PLAY,
+    GameState,
+    game_events,
+    load_recorded_game,
+    replay_events,
+)
+from on_ice_utils import metric_columns  # noqa: E402
+
+
+def _load(args) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(shifts, plays) for the requested source."""
+    if args.db:
+        from db_utils import get_db_engine
+
+        engine = get_db_engine()
+        with engine.connect() as conn:
+            return load_recorded_game(conn, args.season, args.game_id)
+
+    from season_data_utils import compact_frame
+    from synthetic_season import generate_season
+
+    season = generate_season(n_games=args.games, seed=args.seed)
+    return compact_frame(season["gs"]), compact_frame(season["gp"])
+
+
+def _check(gs: pd.DataFrame, gp: pd.DataFrame, live: pd.DataFrame) -> int:
+    """Diff replayed counters against compute_player_game_es; return diff count."""
+    from build_player_game_es import compute_player_game_es
+    from scripts.diff_engines import diff_frames
+
+    season = compute_player_game_es(gs, gp, season=0)
+    diff = diff_frames(season, live, [*metric_columns(), "toi_sec"])
+    print(f"check vs compute_player_game_es: {len(diff)} differing values")
+    if not diff.empty:
+        print(diff.head(20).to_string(index=False))
+    return len(diff)
+
+
+def main() -> int:
+    """Benchmark GameState replays; return the exit code."""
+    ap = argparse.ArgumentParser(description="Benchmark the streaming GameState.")
+    ap.add_argument("--games", type=int, default=200, help="Synthetic games")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="Replays (best kept)")
+    ap.add_argument("--db", action="store_true", help="Replay a recorded game")
+    ap.add_argument("--season", type=int, default=None)
+    ap.add_argument("--game-id", type=int, default=None)
+    ap.add_argument("--check", action="store_true", help="Diff vs the season engine")
+    args = ap.parse_args()
+    if args.db and (args.season is None or args.game_id is None):
+        ap.error("--db needs --season and --game-id")
+
+    gs, gp = _load(args)
+    shifts_by_game, plays_by_game = game_slices(gs), game_slices(gp)
+    game_ids = sorted(set(shifts_by_game) & set(plays_by_game))
+    streams = {g: game_events(shifts_by_game[g], plays_by_game[g]) for g in game_ids}
+    n_events = sum(len(s) for s in streams.values())
+    n_plays = sum(e[1] == PLAY for s in streams.values() for e in s)
+
+    best, states = float("inf"), {}
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        states = {g: replay_events(GameState(g), s) for g, s in streams.items()}
+        best = min(best, time.perf_counter() - t0)
+
+    print(
+        f"replayed {len(game_ids)} games: {n_events} events "
+        f"({n_plays} plays, {n_events - n_plays} shift changes)"
+    )
+    print(
+        f"best of {args.repeat}: {best:.3f}s -> {n_events / best:,.0f} events/s, "
+        f"{1e6 * best / n_events:.2f} us/event, {len(game_ids) / best:.1f} games/s"
+    )
+
+    if args.check:
+        live = pd.concat([s.to_frame() for s in states.values()], ignore_index=True)
+        return 1 if _check(gs, gp, live) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
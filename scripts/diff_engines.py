@@ -0,0 +1,312 @@
+"""
+scripts.diff_engines.
+
+Differential test: run the vectorized Corsi/TOI engines and the frozen per-event
+reference implementations (legacy_engine_utils) on the same games and diff the
+outputs per (game_id, player_id, team_id). No Postgres needed.
+
+Engines compared:
+  premier  premier_make_corsi_stats_modern.compute_corsi_stats
+           vs legacy_premier_corsi
+  es       build_player_game_es.compute_player_game_es
+           vs legacy_player_game_es
+  stats    build_modern_player_game_stats.compute_player_game_stats
+           vs legacy_player_game_stats
+  live     live_game_utils.replay_games (streaming GameState, event by event)
+           vs legacy_player_game_es
+
+Inputs:
+  - synthetic games (synthetic_season.generate_season)
+  - fixture games for the edge cases:
+      boundary     every Corsi event sits exactly on a shift_start or shift_end
+      overtime     3v3 OT with events at OT line changes
+      goalie_2200  goalies with 2199 s / 2200 s TOI (premier TOI heuristic) and
+                   a skater above the threshold
+      two_teams    one player logged under both team_ids in the same game
+
+Exit status is 1 when any engine differs. With --perf-gate it is 1 only when an
+engine is both slower than its reference and different.
+
+Usage:
+  python -m scripts.diff_engines
+  python -m scripts.diff_engines --games 40 --engines es,stats --out-dir reconciliation
+  python -m scripts.diff_engines --perf-gate
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Ensure repo root is on sys.path so "import on_ice_utils" works when running:
+#   python -m scripts.diff_engines ...
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from build_modern_player_game_stats import compute_player_game_stats  # noqa: E402
+from build_player_game_es import compute_player_game_es  # noqa: E402
+from legacy_engine_utils import (  # noqa: E402
+    CORSI_EVENTS,
+    KEYS,
+    legacy_player_game_es,
+    legacy_player_game_stats,
+    legacy_premier_corsi,
+)
+from live_game_utils import replay_games  # noqa: E402
+from premier_make_corsi_stats_modern import compute_corsi_stats  # noqa: E402
+from season_data_utils import compact_frame  # noqa: E402
+from synthetic_season import PERIOD_SEC, generate_game, generate_season  # noqa: E402
+
+ENGINES = {
+    # name -> (new fn, legacy fn, compared columns)
+    "premier": (
+        lambda gs, gp: compute_corsi_stats(gp, gs, season=0),
+        lambda gs, gp: legacy_premier_corsi(gp, gs),
+        ["corsi_for", "corsi_against", "corsi", "CF_Percent"],
+    ),
+    "es": (
+        lambda gs, gp: compute_player_game_es(gs, gp, season=0),
+        legacy_player_game_es,
+        ["cf", "ca", "toi_sec"],
+    ),
+    "stats": (
+        compute_player_game_stats,
+        legacy_player_game_stats,
+        ["cf", "ca", "toi_total_sec", "toi_es_sec"],
+    ),
+    "live": (
+        replay_games,
+        legacy_player_game_es,
+        ["cf", "ca", "toi_sec"],
+    ),
+}
+FIXTURES = ("boundary", "overtime", "goalie_2200", "two_teams")
+FIXTURE_GAME_ID = 2099020001
+
+
+# -------------------------
+# Fixture games
+# -------------------------
+def _snap_to_boundaries(
+    rng: np.random.Generator, gs: pd.DataFrame, gp: pd.DataFrame
+) -> pd.DataFrame:
+    """Move every Corsi event onto a skater shift_start or shift_end."""
+    sk = gs[gs["position"] != "G"]
+    edges = np.unique(np.r_[sk["shift_start"].to_numpy(), sk["shift_end"].to_numpy()])
+    gp = gp.copy()
+    att = gp["event"].isin(CORSI_EVENTS).to_numpy()
+    gp.loc[att, "time"] = rng.choice(edges, size=int(att.sum()))
+    return gp.sort_values("time", kind="stable", ignore_index=True)
+
+
+def _set_goalie_toi(gs: pd.DataFrame, team_id: int, toi: int) -> pd.DataFrame:
+    """Cut a team's goalie shifts so their total TOI is exactly `toi` seconds."""
+    is_g = (gs["team_id"] == team_id) & (gs["position"] == "G")
+    gs = gs[~is_g | (gs["shift_start"] < toi)].copy()
+    is_g = (gs["team_id"] == team_id) & (gs["position"] == "G")
+    gs.loc[is_g, "shift_end"] = gs.loc[is_g, "shift_end"].clip(upper=toi)
+    return gs
+
+
+def fixture_game(
+    name: str, game_id: int, seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """One edge-case game (shifts, plays) by fixture name."""
+    rng = np.random.default_rng(seed)
+    home, away = 1, 2
+
+    if name == "overtime":
+        # draw games until one goes to OT, then put events on OT line changes
+        while True:
+            gs, gp = generate_game(rng, game_id, home, away)
+            if gs["shift_end"].max() > 3 * PERIOD_SEC:
+                break
+        ot = gs["shift_start"] >= 3 * PERIOD_SEC
+        gp = _snap_to_boundaries(rng, gs[ot], gp)
+        return gs, gp
+
+    gs, gp = generate_game(rng, game_id, home, away)
+
+    if name == "boundary":
+        return gs, _snap_to_boundaries(rng, gs, gp)
+
+    if name == "goalie_2200":
+        # premier drops TOI >= 2200: home goalie stays (2199), away goalie goes (2200)
+        gs = _set_goalie_toi(gs, home, 2199)
+        gs = _set_goalie_toi(gs, away, 2200)
+        # a skater double-logged past the threshold is dropped as well
+        skater = gs.loc[(gs["team_id"] == home) & (gs["position"] == "D"), "player_id"]
+        skater = skater.iloc[0]
+        extra = gs[gs["player_id"] == skater].copy()
+        extra["shift_start"] += 1
+        gs = pd.concat([gs, extra], ignore_index=True)
+        return gs, _snap_to_boundaries(rng, gs, gp)
+
+    if name == "two_teams":
+        skater = gs.loc[(gs["team_id"] == home) & (gs["position"] == "F"), "player_id"]
+        skater = skater.iloc[0]
+        extra = gs[gs["player_id"] == skater].copy()
+        extra["team_id"] = away
+        extra["shift_start"] += 5
+        extra = extra[extra["shift_end"] > extra["shift_start"]]
+        gs = pd.concat([gs, extra], ignore_index=True)
+        return gs, _snap_to_boundaries(rng, gs, gp)
+
+    raise ValueError(f"unknown fixture: {name}")
+
+
+def build_inputs(
+    n_games: int, seed: int, fixtures: list[str]
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Synthetic season + fixture games as one (shifts, plays) pair."""
+    season = generate_season(n_games=n_games, seed=seed)
+    gss, gps = [season["gs"]], [season["gp"]]
+    for i, name in enumerate(fixtures):
+        gs, gp = fixture_game(name, FIXTURE_GAME_ID + i, seed=seed + i)
+        gss.append(gs)
+        gps.append(gp)
+    return pd.concat(gss, ignore_index=True), pd.concat(gps, ignore_index=True)
+
+
+# -------------------------
+# Diff
+# -------------------------
+def diff_frames(old: pd.DataFrame, new: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
+    """
+    Long diff of two per-player-game frames.
+
+    Returns one row per (game_id, player_id, team_id, column) that differs, with
+    old / new values and source (both / old_only / new_only). Floats compare with
+    np.isclose; NaN equals NaN.
+    """
+    m = old[KEYS + cols].merge(
+        new[KEYS + cols],
+        on=KEYS,
+        how="outer",
+        suffixes=("_old", "_new"),
+        indicator=True,
+    )
+    source = m["_merge"].map(
+        {"both": "both", "left_only": "old_only", "right_only": "new_only"}
+    )
+    parts = []
+    for col in cols:
+        a = pd.to_numeric(m[f"{col}_old"], errors="coerce").to_numpy(float)
+        b = pd.to_numeric(m[f"{col}_new"], errors="coerce").to_numpy(float)
+        same = np.isclose(a, b, equal_nan=True) & (source == "both").to_numpy()
+        if (~same).any():
+            parts.append(
+                pd.DataFrame(
+                    {
+                        **{k: m.loc[~same, k].to_numpy() for k in KEYS},
+                        "column": col,
+                        "old": a[~same],
+                        "new": b[~same],
+                        "source": source[~same].to_numpy(),
+                    }
+                )
+            )
+    if not parts:
+        return pd.DataFrame(columns=KEYS + ["column", "old", "new", "source"])
+    return pd.concat(parts, ignore_index=True).sort_values(KEYS + ["column"])
+
+
+def run_engine(name: str, gs: pd.DataFrame, gp: pd.DataFrame) -> dict:
+    """Run one engine and its reference; return timings and the diff."""
+    new_fn, old_fn, cols = ENGINES[name]
+
+    t0 = time.perf_counter()
+    old = old_fn(gs.copy(), gp.copy())
+    old_sec = time.perf_counter() - t0
+
+    # the new engines get compact dtypes, as loaded by season_data_utils
+    gs, gp = compact_frame(gs.copy()), compact_frame(gp.copy())
+    t0 = time.perf_counter()
+    new = new_fn(gs, gp)
+    new_sec = time.perf_counter() - t0
+
+    diff = diff_frames(old, new, cols)
+    return {
+        "engine": name,
+        "rows": len(old),
+        "old_sec": old_sec,
+        "new_sec": new_sec,
+        "diff": diff,
+    }
+
+
+def main() -> int:
+    """Diff the fast engines against the legacy ones; return 1 on any diff."""
+    ap = argparse.ArgumentParser(
+        description="Diff the fast engines against the legacy ones."
+    )
+    ap.add_argument("--games", type=int, default=20, help="Synthetic games")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument(
+        "--engines",
+        default=",".join(ENGINES),
+        help=f"Comma-separated subset of: {','.join(ENGINES)}",
+    )
+    ap.add_argument("--no-fixtures", action="store_true", help="Synthetic games only")
+    ap.add_argument(
+        "--out-dir", default=None, help="Write per-engine diff CSVs to this directory"
+    )
+    ap.add_argument(
+        "--perf-gate",
+        action="store_true",
+        help="Fail only when an engine is both slower than its reference and different",
+    )
+    args = ap.parse_args()
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = sorted(set(engines) - set(ENGINES))
+    if unknown:
+        ap.error(f"unknown engines: {unknown}")
+
+    fixtures = [] if args.no_fixtures else list(FIXTURES)
+    gs, gp = build_inputs(args.games, args.seed, fixtures)
+    print(
+        f"inputs: {gs['game_id'].nunique()} games ({args.games} synthetic, "
+        f"fixtures={fixtures or 'none'}), {len(gs)} shifts, {len(gp)} plays"
+    )
+
+    failed = []
+    print(
+        f"{'engine':<9}{'rows':>8}{'diffs':>8}{'games':>7}"
+        f"{'old s':>9}{'new s':>9}{'speedup':>9}"
+    )
+    for name in engines:
+        r = run_engine(name, gs, gp)
+        diff = r["diff"]
+        speedup = r["old_sec"] / r["new_sec"] if r["new_sec"] > 0 else float("inf")
+        print(
+            f"{name:<9}{r['rows']:>8}{len(diff):>8}{diff['game_id'].nunique():>7}"
+            f"{r['old_sec']:>9.2f}{r['new_sec']:>9.2f}{speedup:>8.1f}x"
+        )
+        if not diff.empty:
+            print(diff.head(20).to_string(index=False))
+            if args.out_dir:
+                os.makedirs(args.out_dir, exist_ok=True)
+                diff.to_csv(os.path.join(args.out_dir, f"diff_{name}.csv"), index=False)
+
+        different = not diff.empty
+        slower = r["new_sec"] > r["old_sec"]
+        if different and (slower or not args.perf_gate):
+            failed.append(name)
+
+    if failed:
+        print(f"FAIL: {', '.join(failed)}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,137 @@
+"""
+scripts.season_memory_report.
+
+Report season frame memory with default dtypes (int64 / object strings) versus
+the compact dtypes of season_data_utils (int32 / int16 / int8 / categorical).
+
+All seasons are held in one process at once, as a multi-season run would hold
+them. The report shows deep frame sizes and the tracemalloc peak of building
+each representation.
+
+Sources:
+  default   synthetic seasons (synthetic_season.generate_season), no database
+  --db      the modern seasons through load_season_plays / load_season_shifts
+
+Usage:
+  python -m scripts.season_memory_report
+  python -m scripts.season_memory_report --seasons 7 --games 1312
+  python -m scripts.season_memory_report --db
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+# Ensure repo root is on sys.path so "import season_data_utils" works when running:
+#   python -m scripts.season_memory_report ...
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from season_data_utils import compact_frame, frame_memory_mb  # noqa: E402
+
+
+def widen(df: pd.DataFrame) -> pd.DataFrame:
+    """Default-dtype copy of a frame: int64 integers, object strings."""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            out[col] = s.astype(object)
+        elif pd.api.types.is_integer_dtype(s.dtype):
+            out[col] = s.astype("int64")
+        else:
+            out[col] = s
+    return pd.DataFrame(out)
+
+
+def _synthetic_seasons(n_seasons: int, n_games: int):
+    """Yield (label, {name: default-dtype frame}) for synthetic seasons."""
+    from synthetic_season import generate_season, to_raw_plays
+
+    for i in range(n_seasons):
+        season = generate_season(n_games=n_games, seed=i)
+        yield f"synthetic-{i}", {
+            "gs": widen(season["gs"]),
+            "gp": widen(season["gp"]),
+            "plays_raw": widen(to_raw_plays(season["gp"], season["games"])),
+        }
+
+
+def _db_seasons():
+    """Yield (label, {name: compact frame}) for the modern seasons."""
+    from constants import SEASONS_MODERN
+    from db_utils import get_db_engine
+    from season_data_utils import load_season_plays, load_season_shifts
+
+    engine = get_db_engine()
+    for season in SEASONS_MODERN:
+        with engine.connect() as conn:
+            yield str(season), {
+                "gs": load_season_shifts(conn, int(season)),
+                "gp": load_season_plays(conn, int(season)),
+            }
+
+
+def _peak_mb(build) -> tuple[list, float]:
+    """Run build(); return (its result, tracemalloc peak in MiB)."""
+    tracemalloc.start()
+    try:
+        result = build()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak / 2**20
+
+
+def main() -> int:
+    """Print default vs compact season frame memory; return the exit code."""
+    ap = argparse.ArgumentParser(description="Default vs compact season memory.")
+    ap.add_argument("--seasons", type=int, default=7, help="Synthetic seasons")
+    ap.add_argument("--games", type=int, default=1312, help="Games per season")
+    ap.add_argument("--db", action="store_true", help="Load the modern seasons")
+    args = ap.parse_args()
+
+    source = _db_seasons() if args.db else _synthetic_seasons(args.seasons, args.games)
+    seasons = list(source)
+
+    # both representations are built from the same frames, one at a time
+    default, default_peak = _peak_mb(
+        lambda: [{k: widen(df) for k, df in f.items()} for _, f in seasons]
+    )
+    compact, compact_peak = _peak_mb(
+        lambda: [
+            {k: compact_frame(df.copy()) for k, df in f.items()} for _, f in seasons
+        ]
+    )
+
+    print(
+        f"{'season':<14}{'frame':<11}{'rows':>10}"
+        f"{'default MiB':>13}{'compact MiB':>13}"
+    )
+    tot_d = tot_c = 0.0
+    for (label, frames), d, c in zip(seasons, default, compact):
+        for name in frames:
+            md, mc = frame_memory_mb(d[name]), frame_memory_mb(c[name])
+            tot_d += md
+            tot_c += mc
+            print(f"{label:<14}{name:<11}{len(d[name]):>10}{md:>13.1f}{mc:>13.1f}")
+
+    print(
+        f"total: default {tot_d:.1f} MiB, compact {tot_c:.1f} MiB "
+        f"({100.0 * (1 - tot_c / tot_d) if tot_d else 0.0:.0f}% less)"
+    )
+    print(
+        f"peak while building all seasons: default {default_peak:.1f} MiB, "
+        f"compact {compact_peak:.1f} MiB"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""
+scripts.season_store.
+
+Build or benchmark the memory-mapped season bundles of game_store_utils.
+
+Modes:
+  default      write a synthetic season (synthetic_season.generate_season) to a
+               temporary store and time: write, open, whole-frame read, per-game
+               access through the bundle vs dict(tuple(df.groupby("game_id")))
+  --db         (re)build the bundles of the modern seasons from Postgres for the
+               builder variants (player_game_stats, player_game_es)
+
+Usage:
+  python -m scripts.season_store
+  python -m scripts.season_store --games 1312 --repeat 5
+  python -m scripts.season_store --db --seasons 20232024 --variants player_game_es
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path so "import game_store_utils" works when running:
+#   python -m scripts.season_store ...
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from game_store_utils import GameBundle, SeasonStore, write_bundle  # noqa: E402
+
+
+def _best(fn, repeat: int) -> float:
+    """Return the best wall time of fn() over `repeat` runs, in seconds."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def run_synthetic(n_games: int, seed: int, repeat: int) -> int:
+    """Time the store on a synthetic season."""
+    from season_data_utils import compact_frame
+    from synthetic_season import generate_season
+
+    season = generate_season(n_games=n_games, seed=seed)
+    frames = {"gs": compact_frame(season["gs"]), "gp": compact_frame(season["gp"])}
+    game_ids = frames["gs"]["game_id"].unique()
+    print(
+        f"synthetic season: {n_games} games, {len(frames['gs'])} shifts, "
+        f"{len(frames['gp'])} plays"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bundle"
+        t_write = _best(lambda: write_bundle(path, frames), 1)
+        size = sum(p.stat().st_size for p in path.rglob("*")) / 2**20
+
+        def every_game_bundle():
+            bundle = GameBundle(path)
+            for g in game_ids:
+                bundle.arrays("gs", g)
+                bundle.arrays("gp", g)
+
+        def every_game_slices():
+            bundle = GameBundle(path)
+            gs, gp = bundle.by_game("gs"), bundle.by_game("gp")
+            for g in game_ids:
+                gs.get(g)
+                gp.get(g)
+
+        def every_game_groupby():
+            gs = dict(tuple(frames["gs"].groupby("game_id", sort=False)))
+            gp = dict(tuple(frames["gp"].groupby("game_id", sort=False)))
+            for g in game_ids:
+                gs.get(g)
+                gp.get(g)
+
+        rows = [
+            ("write", t_write),
+            ("open", _best(lambda: GameBundle(path), repeat)),
+            (
+                "open + frames",
+                _best(lambda: [GameBundle(path).frame(n) for n in frames], repeat),
+            ),
+            ("per-game arrays", _best(every_game_bundle, repeat)),
+            ("per-game slices", _best(every_game_slices, repeat)),
+            ("groupby dict", _best(every_game_groupby, repeat)),
+        ]
+
+    print(f"bundle size: {size:.1f} MiB")
+    print(f"{'step':<18}{'best ms':>10}")
+    for name, sec in rows:
+        print(f"{name:<18}{sec * 1000:>10.1f}")
+    return 0
+
+
+def run_db(seasons: list[int], variants: list[str]) -> int:
+    """Rebuild the bundles of `seasons` for `variants` from Postgres."""
+    import build_modern_player_game_stats
+    import build_player_game_es
+    from db_utils import get_db_engine
+
+    loaders = {
+        m.STORE_VARIANT: m.load_season_inputs
+        for m in (build_modern_player_game_stats, build_player_game_es)
+    }
+    unknown = sorted(set(variants) - set(loaders))
+    if unknown:
+        print(f"unknown variants: {unknown}")
+        return 2
+
+    store = SeasonStore()
+    engine = get_db_engine()
+    for season in seasons:
+        for variant in variants:
+            t0 = time.perf_counter()
+            bundle = store.load(
+                engine, season, variant, loaders[variant], refresh=True
+            )
+            rows = {n: bundle.meta["frames"][n]["rows"] for n in bundle.names}
+            print(
+                f"{season} {variant}: {rows} -> {bundle.path} "
+                f"({time.perf_counter() - t0:.1f}s)"
+            )
+    return 0
+
+
+def main() -> int:
+    """Build or benchmark season bundles; return the exit code."""
+    ap = argparse.ArgumentParser(description="Build or benchmark season bundles.")
+    ap.add_argument("--games", type=int, default=1312, help="Synthetic games")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per step (best kept)")
+    ap.add_argument("--db", action="store_true", help="Build bundles from Postgres")
+    ap.add_argument(
+        "--seasons", default=None, help="Comma-separated seasons (default: modern)"
+    )
+    ap.add_argument(
+        "--variants",
+        default="player_game_stats,player_game_es",
+        help="Comma-separated bundle variants",
+    )
+    args = ap.parse_args()
+
+    if not args.db:
+        return run_synthetic(args.games, args.seed, args.repeat)
+
+    from constants import SEASONS_MODERN
+
+    seasons = (
+        [int(s) for s in args.seasons.split(",")]
+        if args.seasons
+        else [int(s) for s in SEASONS_MODERN]
+    )
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    return run_db(seasons, variants)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
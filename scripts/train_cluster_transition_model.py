@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 
@@ -15,6 +16,7 @@ from sklearn.preprocessing import StandardScaler
 from sqlalchemy import text
 
 from db_utils import get_db_engine
+from wowy_utils import COMPETITION_FEATURES
 
 SQL_SEASONS = """
 SELECT DISTINCT season
@@ -67,6 +69,12 @@ FROM pairs
 ORDER BY season_t, player_id;
 """
 
+# QoC / QoT of season_t (build_player_season_competition.py), with --with-competition
+SQL_COMPETITION = f"""
+SELECT season AS season_t, player_id, {", ".join(COMPETITION_FEATURES)}
+FROM mart.player_season_competition_modern;
+"""
+
 
 FEATURE_COLS = [
     # current cluster as numeric feature
@@ -106,18 +114,25 @@ def get_valid_test_seasons() -> list[int]:
 
 def read_df(sql: str, params: dict) -> pd.DataFrame:
     engine = get_db_engine()
-    try:
-        return pd.read_sql_query(text(sql), engine, params=params)
-    finally:
-        engine.dispose()
+    return pd.read_sql_query(text(sql), engine, params=params)
 
 
-def fit_one(pos_group: str, test_season: int = 20232024, out_dir: str = "model_out"):
+def fit_one(
+    pos_group: str,
+    test_season: int = 20232024,
+    out_dir: str = "model_out",
+    with_competition: bool = False,
+):
     os.makedirs(out_dir, exist_ok=True)
+    feature_cols = FEATURE_COLS + (COMPETITION_FEATURES if with_competition else [])
 
     df = read_df(SQL_TRAIN, {"pos_group": pos_group})
     if df.empty:
         raise RuntimeError(f"No training rows for pos_group={pos_group}")
+    if with_competition:
+        df = df.merge(
+            read_df(SQL_COMPETITION, {}), on=["season_t", "player_id"], how="left"
+        )
 
     # --- basic cleanup ---
     df = df.copy()
@@ -125,10 +140,10 @@ def fit_one(pos_group: str, test_season: int = 20232024, out_dir: str = "model_o
     df["cluster_t"] = df["cluster_t"].astype(int)
 
     # numeric conversions
-    for c in FEATURE_COLS:
+    for c in feature_cols:
         df[c] = pd.to_numeric(df[c], errors="coerce")
 
-    df = df.dropna(subset=FEATURE_COLS + ["cluster_next", "season_t"]).reset_index(
+    df = df.dropna(subset=feature_cols + ["cluster_next", "season_t"]).reset_index(
         drop=True
     )
     df["season_t"] = df["season_t"].astype(int)
@@ -157,10 +172,10 @@ def fit_one(pos_group: str, test_season: int = 20232024, out_dir: str = "model_o
         )
         return None, None
 
-    X_train = train_df[FEATURE_COLS].to_numpy()
+    X_train = train_df[feature_cols].to_numpy()
     y_train = train_df["cluster_next"].to_numpy()
 
-    X_test = test_df[FEATURE_COLS].to_numpy()
+    X_test = test_df[feature_cols].to_numpy()
     y_test = test_df["cluster_next"].to_numpy()
 
     # --- class balance ---
@@ -254,6 +269,13 @@ def fit_one(pos_group: str, test_season: int = 20232024, out_dir: str = "model_o
 
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument(
+        "--with-competition",
+        action="store_true",
+        help="Add season_t QoC / QoT (mart.player_season_competition_modern)",
+    )
+    args = ap.parse_args()
     out_dir = "model_out"
     test_seasons = sorted(set(get_valid_test_seasons()))
     # test_seasons = get_valid_test_seasons()
@@ -262,7 +284,12 @@ if __name__ == "__main__":
 
     for pos in ["F", "D"]:
         print(f"\n--- Running pos={pos} test_season={priority_ts} ---")
-        out_pred, summary = fit_one(pos, test_season=priority_ts, out_dir=out_dir)
+        out_pred, summary = fit_one(
+            pos,
+            test_season=priority_ts,
+            out_dir=out_dir,
+            with_competition=args.with_competition,
+        )
         if out_pred is None:
             print(f"{pos} model skipped for test_season={priority_ts}.")
 
@@ -271,6 +298,11 @@ if __name__ == "__main__":
             if ts == priority_ts:
                 continue
             print(f"\n--- Running pos={pos} test_season={ts} ---")
-            out_pred, summary = fit_one(pos, test_season=ts, out_dir=out_dir)
+            out_pred, summary = fit_one(
+                pos,
+                test_season=ts,
+                out_dir=out_dir,
+                with_competition=args.with_competition,
+            )
             if out_pred is None:
                 print(f"{pos} model skipped for test_season={ts}.")
@@ -0,0 +1,491 @@
+"""
+season_data_utils.py.
+
+Shared season loaders for shifts and plays with compact dtypes.
+
+The builders used to read plays with SELECT *, keep team codes and event labels
+as Python strings, resolve team ids with three pandas merges and then make
+defensive .copy() calls at every cleaning step. A season frame was mostly
+int64 / object columns. These loaders:
+
+  - resolve team ids, the Corsi event labels and the for/against side in SQL
+  - cast at read time to compact dtypes (COMPACT_DTYPES): int32 ids and seconds,
+    int16 team ids, int8 periods, categorical event / position / team codes
+  - filter in place (one boolean mask) instead of chained copies
+  - read through db_utils.read_frame (COPY ... TO STDOUT parsed into Arrow
+    columns, no per-row Python objects), or the local Parquet extract cache
+    when a loader gets cache= (extract_cache_utils)
+
+The on-ice engines widen to int64 only inside their NumPy passes, so results are
+unchanged. pred_goal stays float64 so xGF/xGA sums match exactly.
+
+Legacy seasons (SEASONS_LEGACY, 2015-2018) come from the older raw.game_plays /
+raw.game_shifts tables. The same loaders adapt them to the same layout in SQL
+(team ids from raw.game_skater_stats as in ensure_team_id_on_shifts_legacy,
+positions from raw.player_info, play time = (period - 1) * 1200 + periodTime), so
+every builder runs SEASONS_ALL through one engine.
+
+Usage:
+    with engine.connect() as conn:
+        gp = load_season_plays(conn, season)
+        gs = load_season_shifts(conn, season, period_offset=True)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from constants import SEASONS_LEGACY
+from extract_cache_utils import ExtractCache, cached_read_frame
+from schema_utils import fq
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+logger = logging.getLogger(__name__)
+
+# PBP event_type -> builder event label (Corsi events only)
+CORSI_EVENT_MAP = {
+    "SHOT": "Shot",
+    "GOAL": "Goal",
+    "MISS": "Missed Shot",
+    "BLOCK": "Blocked Shot",
+}
+
+# column name -> compact dtype (applied to whichever columns a frame has)
+COMPACT_DTYPES = {
+    "season": "int32",
+    "game_id": "int32",
+    "player_id": "int32",
+    "event_index": "int32",
+    "team_id": "int16",
+    "team_id_for": "int16",
+    "team_id_against": "int16",
+    "event_team_id": "int16",
+    "home_for": "int8",
+    "score_diff_for": "int8",
+    "shooter_home": "int8",
+    "score_diff": "int8",
+    "home_team_id": "int16",
+    "away_team_id": "int16",
+    "period": "int8",
+    "game_period": "int8",
+    "time": "int32",
+    "game_seconds": "int32",
+    "shift_start": "int32",
+    "shift_end": "int32",
+    "event": "category",
+    "event_type": "category",
+    "position": "category",
+    "event_team": "category",
+    "home_team": "category",
+    "away_team": "category",
+    "team": "category",
+    "session": "category",
+}
+
+PLAY_COLUMNS = [
+    "game_id",
+    "time",
+    "event",
+    "team_id_for",
+    "team_id_against",
+    "pred_goal",
+    "home_for",
+    "score_diff_for",
+]
+SHIFT_COLUMNS = [
+    "game_id",
+    "player_id",
+    "team_id",
+    "position",
+    "period",
+    "shift_start",
+    "shift_end",
+]
+
+
+def is_legacy_season(season: int) -> bool:
+    """Return True for seasons stored in the legacy raw.game_* tables."""
+    return int(season) in {int(s) for s in SEASONS_LEGACY}
+
+
+def compact_frame(df: pd.DataFrame, dtypes: dict | None = None) -> pd.DataFrame:
+    """
+    Cast df's columns to compact dtypes in place and return df.
+
+    Integer targets are skipped for columns that still hold missing values or
+    are not numeric (nothing is coerced or dropped here).
+    """
+    dtypes = COMPACT_DTYPES if dtypes is None else dtypes
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        s = df[col]
+        if dtype == "category":
+            df[col] = s.astype("category")
+        elif pd.api.types.is_numeric_dtype(s.dtype) and not s.hasnans:
+            df[col] = s.astype(dtype)
+    return df
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Deep memory of a frame in MiB (object strings included)."""
+    return float(df.memory_usage(deep=True, index=True).sum()) / 2**20
+
+
+def _games_clause(game_ids, column: str) -> tuple[str, dict]:
+    """AND clause + params restricting `column` to game_ids (no-op for None)."""
+    if game_ids is None:
+        return "", {}
+    return f"AND {column} = ANY(:game_ids)", {"game_ids": [int(g) for g in game_ids]}
+
+
+def load_season_plays(
+    conn, season: int, *, game_ids=None, cache: ExtractCache | None = None
+) -> pd.DataFrame:
+    """
+    Corsi plays for a season in the builder layout (compact dtypes).
+
+    Source: derived.game_plays_{season}_from_raw_pbp + dim.dim_team_code.
+    Rows without a time or either team id are dropped. Sorted by (game_id, time).
+
+    home_for / score_diff_for give team_id_for's venue (1 = home) and its goal
+    difference on the event row (home_score / away_score as stored; missing
+    scores count as 0), for score_adjust_utils.
+
+    Legacy seasons read raw.game_plays instead (_load_legacy_season_plays).
+    conn may be an Engine; with cache the extract is served from disk while its
+    source tables are unchanged (extract_cache_utils).
+
+    Returns: game_id, time, event, team_id_for, team_id_against, pred_goal,
+    home_for, score_diff_for
+    """
+    if is_legacy_season(season):
+        return _load_legacy_season_plays(conn, season, game_ids=game_ids, cache=cache)
+
+    plays_view = fq("derived", f"game_plays_{season}_from_raw_pbp")
+    dim_team_code = fq("dim", "dim_team_code")
+    games_and, params = _games_clause(game_ids, "p.game_id")
+    event_case = " ".join(f"WHEN '{k}' THEN '{v}'" for k, v in CORSI_EVENT_MAP.items())
+
+    gp = cached_read_frame(
+        conn,
+        text(
+            f"""
+            SELECT
+              p.game_id,
+              p.game_seconds AS time,
+              CASE p.event_type {event_case} END AS event,
+              te.team_id AS team_id_for,
+              CASE WHEN p.event_team = p.home_team
+                   THEN ta.team_id ELSE th.team_id END AS team_id_against,
+              p.pred_goal,
+              CASE WHEN p.event_team = p.home_team THEN 1 ELSE 0 END AS home_for,
+              CASE WHEN p.event_team = p.home_team THEN 1 ELSE -1 END
+                * (COALESCE(p.home_score, 0) - COALESCE(p.away_score, 0))
+                AS score_diff_for
+            FROM {plays_view} p
+            JOIN {dim_team_code} te ON te.team_code = p.event_team
+            LEFT JOIN {dim_team_code} th ON th.team_code = p.home_team
+            LEFT JOIN {dim_team_code} ta ON ta.team_code = p.away_team
+            WHERE p.event_type = ANY(:events)
+              AND p.game_id IS NOT NULL
+              AND p.game_seconds IS NOT NULL
+              {games_and}
+            ORDER BY p.game_id, p.game_seconds
+            """
+        ),
+        {"events": list(CORSI_EVENT_MAP), **params},
+        tables=[plays_view, dim_team_code],
+        cache=cache,
+    )
+
+    return _finish_plays(gp, season)
+
+
+def _finish_plays(gp: pd.DataFrame, season: int) -> pd.DataFrame:
+    """Drop plays without team ids, cast to the compact play layout."""
+    keep = gp["team_id_for"].notna() & gp["team_id_against"].notna()
+    if not keep.all():
+        logger.info("%s: dropped %s plays without team ids", season, int((~keep).sum()))
+        gp = gp[keep.to_numpy()].reset_index(drop=True)
+    gp["pred_goal"] = pd.to_numeric(gp["pred_goal"], errors="coerce").astype(
+        np.float64
+    )
+    return compact_frame(gp)[PLAY_COLUMNS]
+
+
+def _legacy_plays_sql(season_games: str) -> str:
+    """
+    Deduplicated legacy Corsi plays of the games in season_games.
+
+    Ingestion keeps duplicate PBP rows under suffixed play_ids (2016020045_12a,
+    data_processing_utils.add_suffix_to_duplicate_play_ids); one row per original
+    play_id is kept. Shootout attempts are not plays on ice and are dropped.
+    """
+    plays = fq("raw", "game_plays")
+    return f"""
+        SELECT DISTINCT ON (p.game_id, regexp_replace(p.play_id, '[a-z]+$', ''))
+          p.game_id,
+          (p.period - 1) * 1200 + p."periodTime" AS time,
+          p.event,
+          p.team_id_for,
+          p.team_id_against,
+          p.goals_home,
+          p.goals_away,
+          g.home_team_id
+        FROM {plays} p
+        JOIN ({season_games}) g ON g.game_id = p.game_id
+        WHERE p.event = ANY(:events)
+          AND p."periodTime" IS NOT NULL
+          AND COALESCE(p."periodType", '') <> 'SHOOTOUT'
+        ORDER BY p.game_id, regexp_replace(p.play_id, '[a-z]+$', ''), p.play_id
+    """
+
+
+def _legacy_games_sql(games_and: str = "") -> str:
+    """Regular-season game ids (+ home team) of :season from raw.game."""
+    game = fq("raw", "game")
+    return f"""
+        SELECT game_id, home_team_id
+        FROM {game}
+        WHERE season = :season
+          AND type = 'R'
+          {games_and}
+    """
+
+
+def _load_legacy_season_plays(
+    conn, season: int, *, game_ids=None, cache: ExtractCache | None = None
+) -> pd.DataFrame:
+    """load_season_plays for a legacy season (raw.game_plays + raw.game)."""
+    games_and, params = _games_clause(game_ids, "game_id")
+    gp = cached_read_frame(
+        conn,
+        text(
+            f"""
+            WITH p AS ({_legacy_plays_sql(_legacy_games_sql(games_and))})
+            SELECT
+              p.game_id,
+              p.time,
+              p.event,
+              p.team_id_for,
+              p.team_id_against,
+              NULL::double precision AS pred_goal,
+              CASE WHEN p.team_id_for = p.home_team_id THEN 1 ELSE 0 END
+                AS home_for,
+              CASE WHEN p.team_id_for = p.home_team_id THEN 1 ELSE -1 END
+                * (COALESCE(p.goals_home, 0) - COALESCE(p.goals_away, 0))
+                AS score_diff_for
+            FROM p
+            ORDER BY p.game_id, p.time
+            """
+        ),
+        {
+            "season": int(season),
+            "events": list(CORSI_EVENT_MAP.values()),
+            **params,
+        },
+        tables=[fq("raw", "game_plays"), fq("raw", "game")],
+        cache=cache,
+    )
+    return _finish_plays(gp, season)
+
+
+def load_score_venue_counts(
+    conn, season: int, *, cache: ExtractCache | None = None
+) -> pd.DataFrame:
+    """
+    Corsi attempts of a whole season by the shooting team's venue and score.
+
+    Same plays as load_season_plays; blocked shots count for the shooting team
+    (the PBP event team is the blocker). The counts always cover the full season;
+    full builds store them (score_adjust_utils.store_score_venue_counts) and
+    incremental runs reuse the stored counts.
+
+    Returns: shooter_home (1 = home), score_diff (shooter's goals minus the
+    opponent's, uncapped), n
+    """
+    if is_legacy_season(season):
+        source = f"""
+              SELECT
+                (p.team_id_for = p.home_team_id) <> (p.event = 'Blocked Shot')
+                  AS shooter_home,
+                COALESCE(p.goals_home, 0) - COALESCE(p.goals_away, 0) AS home_diff
+              FROM ({_legacy_plays_sql(_legacy_games_sql())}) p
+              WHERE p.team_id_for IS NOT NULL
+                AND p.team_id_against IS NOT NULL
+        """
+        params = {"season": int(season), "events": list(CORSI_EVENT_MAP.values())}
+        tables = [fq("raw", "game_plays"), fq("raw", "game")]
+    else:
+        source = f"""
+              SELECT
+                (p.event_team = p.home_team) <> (p.event_type = 'BLOCK')
+                  AS shooter_home,
+                COALESCE(p.home_score, 0) - COALESCE(p.away_score, 0) AS home_diff
+              FROM {fq("derived", f"game_plays_{season}_from_raw_pbp")} p
+              WHERE p.event_type = ANY(:events)
+                AND p.game_id IS NOT NULL
+                AND p.game_seconds IS NOT NULL
+                AND p.event_team IS NOT NULL
+                AND p.home_team IS NOT NULL
+        """
+        params = {"events": list(CORSI_EVENT_MAP)}
+        tables = [fq("derived", f"game_plays_{season}_from_raw_pbp")]
+
+    counts = cached_read_frame(
+        conn,
+        text(
+            f"""
+            WITH s AS ({source})
+            SELECT
+              CASE WHEN shooter_home THEN 1 ELSE 0 END AS shooter_home,
+              CASE WHEN shooter_home THEN home_diff ELSE -home_diff END
+                AS score_diff,
+              COUNT(*) AS n
+            FROM s
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+            """
+        ),
+        params,
+        tables=tables,
+        cache=cache,
+    )
+    counts["n"] = counts["n"].astype(np.int64)
+    return compact_frame(counts)
+
+
+def load_season_shifts(
+    conn,
+    season: int,
+    *,
+    game_ids=None,
+    period_offset: bool = True,
+    skaters_only: bool = False,
+    resolved_only: bool = True,
+    cache: ExtractCache | None = None,
+) -> pd.DataFrame:
+    """
+    Regular-season shifts for a season in the builder layout (compact dtypes).
+
+    Source: raw.raw_shifts_resolved + dim.dim_team_code.
+
+    :param period_offset: True turns period-relative seconds_start/end into game
+        seconds ((period-1)*1200, OT on top of 3600); False keeps them as stored
+    :param skaters_only: drop goalie rows (position 'G') in SQL
+    :param resolved_only: drop rows without player_id_resolved (False keeps them so
+        they still count toward skater strength)
+
+    Legacy seasons read raw.game_shifts instead (_load_legacy_season_shifts);
+    period_offset / resolved_only do not apply there. cache as in
+    load_season_plays.
+
+    Returns: game_id, player_id, team_id, position, period, shift_start, shift_end
+    """
+    if is_legacy_season(season):
+        return _load_legacy_season_shifts(conn, season, game_ids=game_ids, cache=cache)
+
+    shifts_resolved = fq("raw", "raw_shifts_resolved")
+    dim_team_code = fq("dim", "dim_team_code")
+    games_and, params = _games_clause(game_ids, "rs.game_id")
+    skaters_and = "AND rs.position <> 'G'" if skaters_only else ""
+    resolved_and = "AND rs.player_id_resolved IS NOT NULL" if resolved_only else ""
+
+    if period_offset:
+        start = """CASE WHEN rs.game_period IN (1,2,3)
+                   THEN (rs.game_period - 1) * 1200 + rs.seconds_start
+                   ELSE 3600 + rs.seconds_start END"""
+        end = """CASE WHEN rs.game_period IN (1,2,3)
+                 THEN (rs.game_period - 1) * 1200 + rs.seconds_end
+                 ELSE 3600 + rs.seconds_end END"""
+    else:
+        start, end = "rs.seconds_start", "rs.seconds_end"
+
+    gs = cached_read_frame(
+        conn,
+        text(
+            f"""
+            SELECT
+              rs.game_id,
+              rs.player_id_resolved AS player_id,
+              dt.team_id,
+              rs.position,
+              rs.game_period AS period,
+              {start} AS shift_start,
+              {end} AS shift_end
+            FROM {shifts_resolved} rs
+            JOIN {dim_team_code} dt
+              ON dt.team_code = rs.team
+            WHERE rs.season = :season
+              AND rs.session = 'R'
+              AND rs.seconds_start IS NOT NULL
+              {resolved_and}
+              AND rs.seconds_end > rs.seconds_start
+              {skaters_and}
+              {games_and}
+            """
+        ),
+        {"season": int(season), **params},
+        tables=[shifts_resolved, dim_team_code],
+        cache=cache,
+    )
+    return compact_frame(gs)[SHIFT_COLUMNS]
+
+
+def _load_legacy_season_shifts(
+    conn, season: int, *, game_ids=None, cache: ExtractCache | None = None
+) -> pd.DataFrame:
+    """
+    load_season_shifts for a legacy season (raw.game_shifts + raw.game).
+
+    raw.game_shifts has no team: it comes from raw.game_skater_stats, which has
+    no goalie rows, so goalies drop out here (ensure_team_id_on_shifts_legacy)
+    and legacy loads are always skaters only. shift_start / shift_end are
+    already game seconds. Duplicate ingested rows are collapsed.
+    """
+    shifts = fq("raw", "game_shifts")
+    skater_stats = fq("raw", "game_skater_stats")
+    player_info = fq("raw", "player_info")
+    games_and, params = _games_clause(game_ids, "game_id")
+
+    gs = cached_read_frame(
+        conn,
+        text(
+            f"""
+            SELECT DISTINCT
+              s.game_id,
+              s.player_id,
+              ss.team_id,
+              pi."primaryPosition" AS position,
+              s.period,
+              s.shift_start,
+              s.shift_end
+            FROM {shifts} s
+            JOIN ({_legacy_games_sql(games_and)}) g
+              ON g.game_id = s.game_id
+            JOIN (
+              SELECT DISTINCT game_id, player_id, team_id
+              FROM {skater_stats}
+            ) ss
+              ON ss.game_id = s.game_id
+             AND ss.player_id = s.player_id
+            LEFT JOIN {player_info} pi
+              ON pi.player_id = s.player_id
+            WHERE s.shift_start IS NOT NULL
+              AND s.shift_end > s.shift_start
+            """
+        ),
+        {"season": int(season), **params},
+        tables=[shifts, fq("raw", "game"), skater_stats, player_info],
+        cache=cache,
+    )
+    return compact_frame(gs)[SHIFT_COLUMNS]
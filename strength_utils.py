@@ -16,6 +16,19 @@ Notes:
   and drop null team_id (filters goalies/unmatched).
 - Modern shifts often already have team_id; goalie filtering depends on available columns.
 
+Season-wide strength segments:
+- build_strength_segments() computes every game's skater-count timeline in one
+  vectorized pass (one row per game segment). Builders compute it once per season
+  and share it between ES TOI and ES play filtering instead of rebuilding the
+  per-game exclude timeline for each consumer.
+
+Strength states:
+- strength_state_codes() labels a segment from each team's view (5v5, 4v4, 3v3,
+  PP, PK, EN, other); PP / PK / EN are exactly the excluded segments.
+- build_strength_toi() splits TOI per state with one prefix-sum pass, and
+  play_strength_states() gives the per-play codes for
+  on_ice_utils.attribute_on_ice_by_group().
+
 """
 
 from __future__ import annotations
@@ -23,12 +36,32 @@ from __future__ import annotations
 import os
 import pathlib
 
+import numpy as np
 import pandas as pd
 
+from interval_utils import merge_intervals, overlap_seconds
+
 if os.getenv("DEBUG_IMPORTS") == "1":
     print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
 
 
+SEGMENT_COLUMNS = [
+    "game_id",
+    "segment_start",
+    "segment_end",
+    "team_1",
+    "team_2",
+    "team_1_skaters",
+    "team_2_skaters",
+    "exclude",
+]
+
+# skater-count states from one team's view (see strength_state_codes)
+STRENGTH_STATES = ("5v5", "4v4", "3v3", "PP", "PK", "EN", "other")
+# states build_strength_segments does not exclude (the ES builders' time)
+ES_STATES = ("5v5", "4v4", "3v3", "other")
+
+
 def get_num_players(shift_df: pd.DataFrame) -> pd.DataFrame:
     """
     Compute number of players (skaters) on ice at each time breakpoint.
@@ -111,6 +144,185 @@ def filter_goalies_modern(game_shifts: pd.DataFrame) -> pd.DataFrame:
     return game_shifts
 
 
+def build_strength_segments(shifts_skaters: pd.DataFrame) -> pd.DataFrame:
+    """
+    Build skater-count segments for every game in SKATER shifts (one vectorized pass).
+
+    shifts_skaters columns required: ['game_id', 'team_id', 'shift_start', 'shift_end']
+    (goalies removed). Games that do not have exactly two team_ids are skipped.
+
+    team_1 / team_2 are the lower / higher team_id of the game (same convention as
+    build_exclude_timeline_equal_strength). Each segment covers
+    [segment_start, segment_end); the last segment of a game has zero length.
+
+    Returns columns:
+      game_id, segment_start, segment_end, team_1, team_2,
+      team_1_skaters, team_2_skaters, exclude
+    """
+    empty = pd.DataFrame(columns=SEGMENT_COLUMNS)
+    if shifts_skaters.empty:
+        return empty
+
+    gs = shifts_skaters[["game_id", "team_id", "shift_start", "shift_end"]].dropna()
+    teams = gs.groupby("game_id", sort=True)["team_id"].agg(["nunique", "min", "max"])
+    teams = teams[teams["nunique"] == 2]
+    gs = gs[gs["game_id"].isin(teams.index)]
+    if gs.empty:
+        return empty
+
+    game_ids = teams.index.to_numpy(np.int64)
+    g = np.searchsorted(game_ids, gs["game_id"].to_numpy(np.int64))
+    side = (gs["team_id"].to_numpy(np.int64) == teams["max"].to_numpy(np.int64)[g])
+    start = gs["shift_start"].to_numpy(np.int64)
+    end = gs["shift_end"].to_numpy(np.int64)
+
+    t_min = int(min(start.min(), end.min()))
+    span = int(max(start.max(), end.max())) - t_min + 1
+
+    # +1 at shift_start / -1 at shift_end, netted per (game, team side, time)
+    gside = np.concatenate([g * 2 + side, g * 2 + side])
+    times = np.concatenate([start, end]) - t_min
+    delta = np.concatenate([np.ones(len(start)), -np.ones(len(end))])
+
+    uniq, inv = np.unique(gside * span + times, return_inverse=True)
+    net = np.bincount(inv, weights=delta).astype(np.int64)
+    u_gside = uniq // span
+    u_time = uniq % span
+
+    # skaters on ice after each time = running sum, reset per (game, side)
+    csum = np.cumsum(net)
+    first = np.ones(len(uniq), dtype=bool)
+    first[1:] = u_gside[1:] != u_gside[:-1]
+    starts = np.flatnonzero(first)
+    lengths = np.diff(np.r_[starts, len(uniq)])
+    count = csum - np.repeat(csum[starts] - net[starts], lengths)
+
+    # keep only times where a side's count changes (get_num_players rule)
+    keep = first.copy()
+    keep[1:] |= count[1:] != count[:-1]
+    k_gside, k_time, k_count = u_gside[keep], u_time[keep], count[keep]
+
+    # breakpoints = union of both sides' change times per game
+    bp = np.unique((k_gside // 2) * span + k_time)
+    bp_game = bp // span
+    bp_time = bp % span
+
+    skaters = []
+    for sd in (0, 1):
+        sel = (k_gside % 2) == sd
+        side_key = k_gside[sel] * span + k_time[sel]
+        side_count = k_count[sel]
+        q_gside = bp_game * 2 + sd
+
+        # forward fill: last change at or before the breakpoint
+        idx = np.searchsorted(side_key, q_gside * span + bp_time, side="right") - 1
+        # back fill: before a side's first change, use its first value
+        first_idx = np.searchsorted(side_key, q_gside * span, side="left")
+        before_first = (idx < 0) | (k_gside[sel][np.maximum(idx, 0)] != q_gside)
+        idx = np.where(before_first, first_idx, idx)
+        skaters.append(side_count[idx])
+
+    last_in_game = np.ones(len(bp), dtype=bool)
+    last_in_game[:-1] = bp_game[1:] != bp_game[:-1]
+    seg_end = np.where(last_in_game, bp_time, np.r_[bp_time[1:], 0])
+
+    out = pd.DataFrame(
+        {
+            "game_id": game_ids[bp_game],
+            "segment_start": bp_time + t_min,
+            "segment_end": seg_end + t_min,
+            "team_1": teams["min"].to_numpy(np.int64)[bp_game],
+            "team_2": teams["max"].to_numpy(np.int64)[bp_game],
+            "team_1_skaters": skaters[0],
+            "team_2_skaters": skaters[1],
+        }
+    )
+    out["exclude"] = (
+        (out["team_1_skaters"] != out["team_2_skaters"])
+        & (out["team_1_skaters"] <= 6)
+        & (out["team_2_skaters"] <= 6)
+    )
+    return out
+
+
+def _excluded_segments(segments: pd.DataFrame) -> pd.DataFrame:
+    """Rows of a segment table that are excluded and non-empty."""
+    if segments.empty:
+        return segments
+    return segments[
+        segments["exclude"].to_numpy(bool)
+        & (segments["segment_end"] > segments["segment_start"])
+    ]
+
+
+def segment_exclude_intervals(segments: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Return [start,end) arrays for excluded (non-empty) segments."""
+    if segments.empty:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    ex = _excluded_segments(segments)
+    return (
+        ex["segment_start"].to_numpy(np.int64),
+        ex["segment_end"].to_numpy(np.int64),
+    )
+
+
+def build_es_toi(
+    shifts_skaters: pd.DataFrame,
+    segments: pd.DataFrame,
+    *,
+    merge_shifts: bool = True,
+) -> pd.DataFrame:
+    """
+    Even-strength TOI per (game_id, player_id, team_id) for any number of games.
+
+    ES seconds = shift seconds minus overlap with the game's excluded segments.
+    merge_shifts=True merges a player's overlapping/touching shifts first, so
+    double-logged shifts are not counted twice; False sums every shift row.
+
+    Returns columns: game_id, player_id, team_id, toi_es_sec
+    """
+    keys = ["game_id", "player_id", "team_id"]
+    if shifts_skaters.empty:
+        return pd.DataFrame(columns=keys + ["toi_es_sec"])
+
+    # rows without a player_id still count toward strength, but get no TOI row
+    gs = shifts_skaters[keys + ["shift_start", "shift_end"]].dropna(subset=keys)
+    key_df = gs[keys].drop_duplicates().sort_values(keys, ignore_index=True)
+    key_code = gs.groupby(keys, sort=True).ngroup().to_numpy(np.int64)
+
+    start = gs["shift_start"].to_numpy(np.int64)
+    end = gs["shift_end"].to_numpy(np.int64)
+    if merge_shifts:
+        start, end, key_code = merge_intervals(start, end, key_code)
+
+    game_of_key = key_df["game_id"].to_numpy(np.int64)
+    ex = _excluded_segments(segments)
+    ex_s, ex_e = segment_exclude_intervals(ex)
+
+    ov = overlap_seconds(
+        start,
+        end,
+        ex_s,
+        ex_e,
+        keys=game_of_key[key_code],
+        ex_keys=ex["game_id"].to_numpy(np.int64) if len(ex) else None,
+    )
+    es = np.maximum(0, np.maximum(0, end - start) - ov)
+
+    key_df["toi_es_sec"] = np.bincount(
+        key_code, weights=es, minlength=len(key_df)
+    ).astype(np.int64)
+    return key_df
+
+
+def segments_by_game(segments: pd.DataFrame) -> dict:
+    """Split a season segment table into {game_id: segments} (no copies per consumer)."""
+    if segments.empty:
+        return {}
+    return dict(tuple(segments.groupby("game_id", sort=False)))
+
+
 def build_exclude_timeline_equal_strength(
     game_shifts_skaters: pd.DataFrame,
 ) -> pd.DataFrame:
@@ -124,46 +336,272 @@ def build_exclude_timeline_equal_strength(
       - Imbalanced skater counts up to 6 (6v5, 5v4, 4v3, etc.)
         exclude = (team_1 != team_2) & (team_1 <= 6) & (team_2 <= 6)
 
+    Per-game view of build_strength_segments().
+
     Returns columns:
       time (breakpoints), team_1, team_2, exclude
     """
     if game_shifts_skaters.empty:
         return pd.DataFrame(columns=["time", "team_1", "team_2", "exclude"])
 
-    # Ensure numeric timepoints
-    if "shift_start" in game_shifts_skaters.columns:
-        game_shifts_skaters = game_shifts_skaters.copy()
-        game_shifts_skaters["shift_start"] = game_shifts_skaters["shift_start"].astype(
-            int
-        )
-        game_shifts_skaters["shift_end"] = game_shifts_skaters["shift_end"].astype(int)
-
-    team_ids = sorted(game_shifts_skaters["team_id"].dropna().unique())
+    team_ids = game_shifts_skaters["team_id"].dropna().unique()
     if len(team_ids) != 2:
         return pd.DataFrame(columns=["time", "team_1", "team_2", "exclude"])
 
-    t1, t2 = team_ids
-    s1 = game_shifts_skaters[game_shifts_skaters["team_id"] == t1]
-    s2 = game_shifts_skaters[game_shifts_skaters["team_id"] == t2]
+    segments = build_strength_segments(game_shifts_skaters.assign(game_id=0))
+    return pd.DataFrame(
+        {
+            "time": segments["segment_start"],
+            "team_1": segments["team_1_skaters"],
+            "team_2": segments["team_2_skaters"],
+            "exclude": segments["exclude"],
+        }
+    )
+
+
+def _play_segment_index(
+    plays: pd.DataFrame, segments: pd.DataFrame, side: str
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Row of `segments` each play maps to, and whether its game has segments.
+
+    side="right": last segment with segment_start <= time
+    side="left":  last segment with segment_start <  time
+    Times before a game's first breakpoint use the first segment.
+    """
+    seg_game = segments["game_id"].to_numpy(np.int64)
+    seg_start = segments["segment_start"].to_numpy(np.int64)
+
+    game_ids, first = np.unique(seg_game, return_index=True)
+    last = np.r_[first[1:], len(seg_game)] - 1
+
+    p_game = plays["game_id"].to_numpy(np.int64)
+    p_time = plays["time"].to_numpy(np.int64)
+    g = np.clip(np.searchsorted(game_ids, p_game), 0, len(game_ids) - 1)
+    known = game_ids[g] == p_game
+
+    t_min = int(min(seg_start.min(), p_time.min()))
+    span = int(max(seg_start.max(), p_time.max())) - t_min + 1
+    seg_key = np.searchsorted(game_ids, seg_game) * span + (seg_start - t_min)
+    play_key = g * span + (p_time - t_min)
+
+    idx = np.searchsorted(seg_key, play_key, side=side) - 1
+    return np.clip(idx, first[g], last[g]), known
+
+
+def flag_excluded_plays(
+    plays: pd.DataFrame, segments: pd.DataFrame, *, side: str = "right"
+) -> np.ndarray:
+    """
+    Return a boolean mask (True = excluded) for plays of any number of games.
+
+    Each play maps to the segment at its time within its game:
+      side="right": last segment with segment_start <= time
+      side="left":  last segment with segment_start <  time
+    Times before a game's first breakpoint use the first segment. Plays from games
+    without segments are never excluded.
+    """
+    mask = np.zeros(len(plays), dtype=bool)
+    if plays.empty or segments.empty:
+        return mask
+
+    idx, known = _play_segment_index(plays, segments, side)
+    mask[known] = segments["exclude"].to_numpy(bool)[idx[known]]
+    return mask
+
+
+def strength_state_codes(own, opp) -> np.ndarray:
+    """
+    Index into STRENGTH_STATES for (own, opp) skater counts (vectorized).
+
+    Equal 5/4/3 -> 5v5 / 4v4 / 3v3. Unequal counts up to 6 (the excluded
+    segments) -> EN when either side has 6 skaters (goalie pulled), else PP / PK.
+    Anything else (6v6, 2v2, counts above 6) -> other.
+    """
+    own = np.asarray(own, dtype=np.int64)
+    opp = np.asarray(opp, dtype=np.int64)
+    code = np.full(own.shape, STRENGTH_STATES.index("other"), dtype=np.int8)
+
+    equal = own == opp
+    for n in (5, 4, 3):
+        code[equal & (own == n)] = STRENGTH_STATES.index(f"{n}v{n}")
+
+    uneven = ~equal & (own <= 6) & (opp <= 6)
+    en = uneven & ((own == 6) | (opp == 6))
+    code[uneven & ~en & (own > opp)] = STRENGTH_STATES.index("PP")
+    code[uneven & ~en & (own < opp)] = STRENGTH_STATES.index("PK")
+    code[en] = STRENGTH_STATES.index("EN")
+    return code
+
+
+def label_strength_states(segments: pd.DataFrame) -> pd.DataFrame:
+    """Segments with team_1_state / team_2_state (categorical STRENGTH_STATES)."""
+    t1 = segments["team_1_skaters"].to_numpy(np.int64)
+    t2 = segments["team_2_skaters"].to_numpy(np.int64)
+    return segments.assign(
+        team_1_state=pd.Categorical.from_codes(
+            strength_state_codes(t1, t2), categories=STRENGTH_STATES
+        ),
+        team_2_state=pd.Categorical.from_codes(
+            strength_state_codes(t2, t1), categories=STRENGTH_STATES
+        ),
+    )
 
-    df1 = get_num_players(s1).rename(columns={"value": "time", "num_players": "team_1"})
-    df2 = get_num_players(s2).rename(columns={"value": "time", "num_players": "team_2"})
 
-    df_ex = (
-        pd.concat([df1, df2], ignore_index=True)
-        .sort_values("time", ignore_index=True)
-        .ffill()
-        .bfill()
+def _team_state_codes(
+    segments: pd.DataFrame, idx: np.ndarray, team_id: np.ndarray
+) -> np.ndarray:
+    """STRENGTH_STATES codes of segments[idx] from team_id's view."""
+    t1 = segments["team_1_skaters"].to_numpy(np.int64)[idx]
+    t2 = segments["team_2_skaters"].to_numpy(np.int64)[idx]
+    on_team_2 = team_id == segments["team_2"].to_numpy(np.int64)[idx]
+    return strength_state_codes(
+        np.where(on_team_2, t2, t1), np.where(on_team_2, t1, t2)
     )
-    df_ex = df_ex[df_ex["time"].shift(-1) != df_ex["time"]].reset_index(drop=True)
 
-    df_ex["exclude"] = (
-        (df_ex["team_1"] != df_ex["team_2"])
-        & (df_ex["team_1"] <= 6)
-        & (df_ex["team_2"] <= 6)
+
+def play_strength_states(
+    plays: pd.DataFrame, segments: pd.DataFrame, *, side: str = "right"
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    STRENGTH_STATES codes of each play from team_id_for's and team_id_against's view.
+
+    Plays map to segments as in flag_excluded_plays(); plays from games without
+    segments (or without both team ids) are "other".
+    """
+    other = STRENGTH_STATES.index("other")
+    code_for = np.full(len(plays), other, dtype=np.int8)
+    code_against = np.full(len(plays), other, dtype=np.int8)
+    if plays.empty or segments.empty:
+        return code_for, code_against
+
+    idx, known = _play_segment_index(plays, segments, side)
+    for code, col in ((code_for, "team_id_for"), (code_against, "team_id_against")):
+        team = plays[col].to_numpy(np.float64)
+        ok = known & ~np.isnan(team)
+        code[ok] = _team_state_codes(segments, idx[ok], team[ok].astype(np.int64))
+    return code_for, code_against
+
+
+def build_strength_toi(
+    shifts_skaters: pd.DataFrame,
+    segments: pd.DataFrame,
+    *,
+    merge_shifts: bool = True,
+) -> pd.DataFrame:
+    """
+    TOI per (game_id, player_id, team_id, strength_state) for any number of games.
+
+    Every (game, team side) gets prefix sums of seconds spent in each state at its
+    segment starts; a shift's seconds per state are two lookups into them, so all
+    states come out of one pass. States are from the player's team view; games
+    without segments count as "other". ES-state TOI sums to build_es_toi().
+
+    Returns long rows with toi_sec > 0:
+      game_id, player_id, team_id, strength_state (categorical), toi_sec
+    """
+    keys = ["game_id", "player_id", "team_id"]
+    out_cols = keys + ["strength_state", "toi_sec"]
+    if shifts_skaters.empty:
+        return pd.DataFrame(columns=out_cols)
+
+    gs = shifts_skaters[keys + ["shift_start", "shift_end"]].dropna(subset=keys)
+    key_df = gs[keys].drop_duplicates().sort_values(keys, ignore_index=True)
+    key_code = gs.groupby(keys, sort=True).ngroup().to_numpy(np.int64)
+
+    start = gs["shift_start"].to_numpy(np.int64)
+    end = gs["shift_end"].to_numpy(np.int64)
+    if merge_shifts:
+        start, end, key_code = merge_intervals(start, end, key_code)
+    dur = np.maximum(0, end - start)
+
+    n_keys, n_states = len(key_df), len(STRENGTH_STATES)
+    toi = np.zeros((n_keys, n_states), dtype=np.int64)
+    other = STRENGTH_STATES.index("other")
+
+    key_game = key_df["game_id"].to_numpy(np.int64)
+    key_team = key_df["team_id"].to_numpy(np.int64)
+    seg_game = segments["game_id"].to_numpy(np.int64) if len(segments) else key_game[:0]
+    seg_games = np.unique(seg_game)
+    shift_game = key_game[key_code]
+    g = np.searchsorted(seg_games, shift_game)
+    has_seg = g < len(seg_games)
+    has_seg[has_seg] = seg_games[g[has_seg]] == shift_game[has_seg]
+
+    # games without segments: every second is "other"
+    toi[:, other] = np.bincount(
+        key_code[~has_seg], weights=dur[~has_seg], minlength=n_keys
+    ).astype(np.int64)
+
+    if has_seg.any():
+        seg_start = segments["segment_start"].to_numpy(np.int64)
+        seg_len = segments["segment_end"].to_numpy(np.int64) - seg_start
+        team_2 = segments["team_2"].to_numpy(np.int64)
+        t1 = segments["team_1_skaters"].to_numpy(np.int64)
+        t2 = segments["team_2_skaters"].to_numpy(np.int64)
+        n_seg = len(segments)
+
+        # one band per (game, side): side 0 = team_1 view, side 1 = team_2 view
+        first = np.flatnonzero(np.r_[True, seg_game[1:] != seg_game[:-1]])
+        last = np.r_[first[1:], n_seg] - 1
+        state = np.concatenate(
+            [strength_state_codes(t1, t2), strength_state_codes(t2, t1)]
+        )
+        onehot = np.zeros((2 * n_seg, n_states), dtype=np.int64)
+        onehot[np.arange(2 * n_seg), state] = np.r_[seg_len, seg_len]
+        # seconds per state before each segment (one cumsum over all bands; only
+        # differences within a band are used)
+        cum = np.vstack(
+            [np.zeros((1, n_states), np.int64), np.cumsum(onehot, axis=0)[:-1]]
+        )
+
+        s_key = key_code[has_seg]
+        s_g = g[has_seg]
+        s_start, s_end = start[has_seg], end[has_seg]
+        side = (key_team[s_key] == team_2[first[s_g]]).astype(np.int64)
+
+        t_min = int(min(seg_start.min(), s_start.min()))
+        span = int(max(seg_start.max(), s_end.max())) - t_min + 1
+        seg_key = np.searchsorted(seg_games, seg_game) * span + (seg_start - t_min)
+
+        def seconds_before(t: np.ndarray) -> np.ndarray:
+            """Seconds per state from a fixed band origin to t, (n, n_states)."""
+            i = np.searchsorted(seg_key, s_g * span + (t - t_min), side="right") - 1
+            i = np.clip(i, first[s_g], last[s_g])
+            row = i + side * n_seg
+            out = cum[row]
+            out[np.arange(len(t)), state[row]] += np.clip(
+                t - seg_start[i], 0, seg_len[i]
+            )
+            return out
+
+        per_state = seconds_before(s_end) - seconds_before(s_start)
+        for j in range(n_states):
+            toi[:, j] += np.bincount(
+                s_key, weights=per_state[:, j], minlength=n_keys
+            ).astype(np.int64)
+
+    rows, cols = np.nonzero(toi > 0)
+    out = key_df.iloc[rows].reset_index(drop=True)
+    out["strength_state"] = pd.Categorical.from_codes(
+        cols.astype(np.int8), categories=STRENGTH_STATES
     )
+    out["toi_sec"] = toi[rows, cols]
+    return out[out_cols]
+
+
+def apply_segments_to_plays(
+    plays: pd.DataFrame, segments: pd.DataFrame, *, side: str = "right"
+) -> pd.DataFrame:
+    """
+    Season-wide apply_exclude_to_plays: keep plays in non-excluded segments.
+
+    Expects plays has 'game_id' and 'time' as int seconds.
+    """
+    if plays.empty or segments.empty:
+        return plays
 
-    return df_ex
+    return plays.loc[~flag_excluded_plays(plays, segments, side=side)].copy()
 
 
 def apply_exclude_to_plays(
@@ -0,0 +1,333 @@
+"""
+synthetic_season.py.
+
+Offline synthetic NHL seasons for profiling and differential testing (no Postgres).
+
+generate_season() returns the cleaned frames the season builders work on
+(compute_player_game_stats / compute_player_game_es):
+
+  gs: game_id, player_id, team_id, position, period, shift_start, shift_end
+  gp: game_id, event_index, period, time, event, team_id_for, team_id_against,
+      pred_goal, home_for, score_diff_for (team_id_for's venue and goal
+      difference before the event)
+
+Each game is built to look like a real one:
+- 2 teams x (12 F in 4 lines, 6 D in 3 pairs, 1 G) -> 36 skaters per game
+- line changes: lines/pairs rotate with 30-60 s (F) / 35-65 s (D) shifts
+- penalties: the penalized team plays one skater short for 120 s (5v4, 4v4 ...)
+- OT (about 1 game in 4): 300 s of 3v3 (2 F + 1 D per side)
+- pulled goalie: in close games the trailing team adds a sixth skater late
+- ~120 shot attempts per game (Shot / Missed Shot / Blocked Shot / Goal) plus
+  non-Corsi events (Faceoff, Hit); blocked shots carry the blocking team as
+  team_id_for, like the PBP feed
+
+to_raw_plays() / to_raw_shifts() render the same data in the column layout of
+derived.game_plays_{season}_from_raw_pbp and raw.raw_shifts_resolved so SQL
+readers can be faked.
+
+Usage:
+    season = generate_season(n_games=1300, seed=0)
+    gs, gp = season["gs"], season["gp"]
+    plays = to_raw_plays(gp, season["games"])
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+N_TEAMS = 32
+ROSTER_F, ROSTER_D, ROSTER_G = 14, 8, 2
+PERIOD_SEC = 1200
+OT_SEC = 300
+FIRST_GAME_ID = 2018020001
+
+# team_id -> 3-letter code for the raw PBP / shift layouts
+TEAM_CODES = {t: f"T{t:02d}" for t in range(1, N_TEAMS + 1)}
+
+RAW_EVENT_TYPES = {
+    "Shot": "SHOT",
+    "Goal": "GOAL",
+    "Missed Shot": "MISS",
+    "Blocked Shot": "BLOCK",
+    "Faceoff": "FAC",
+    "Hit": "HIT",
+}
+
+
+def _rotation(
+    rng: np.random.Generator, t0: int, t1: int, n_units: int, lo: int, hi: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Consecutive unit shifts covering [t0, t1): (unit, start, end) arrays."""
+    n = int((t1 - t0) / lo) + 2
+    lengths = rng.integers(lo, hi + 1, size=n)
+    starts = t0 + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    keep = starts < t1
+    starts = starts[keep]
+    ends = np.minimum(starts + lengths[keep], t1)
+    # top units play more: weights 0.35 / 0.3 / 0.2 / 0.15 (truncated to n_units)
+    w = np.array([0.35, 0.3, 0.2, 0.15][:n_units])
+    units = rng.choice(n_units, size=len(starts), p=w / w.sum())
+    return units, starts, ends
+
+
+def _clip_out(rows: list[tuple], window: tuple[int, int], victim: int) -> list[tuple]:
+    """Remove [a, b) from the shifts of player `victim` (splitting if needed)."""
+    a, b = window
+    out = []
+    for pid, pos, s, e in rows:
+        if pid != victim or e <= a or s >= b:
+            out.append((pid, pos, s, e))
+            continue
+        if s < a:
+            out.append((pid, pos, s, a))
+        if e > b:
+            out.append((pid, pos, b, e))
+    return out
+
+
+def _team_shifts(
+    rng: np.random.Generator,
+    team_id: int,
+    ot: bool,
+    penalties: list[tuple[int, int]],
+    pull: tuple[int, int] | None,
+) -> list[tuple]:
+    """Shift rows (player_id, position, start, end) for one team in one game."""
+    base = team_id * 100
+    fwd = base + rng.choice(ROSTER_F, size=12, replace=False)
+    dmen = base + 50 + rng.choice(ROSTER_D, size=6, replace=False)
+    goalie = base + 90 + int(rng.integers(ROSTER_G))
+    lines = fwd.reshape(4, 3)
+    pairs = dmen.reshape(3, 2)
+
+    rows: list[tuple] = []
+    for p in range(3):
+        t0, t1 = p * PERIOD_SEC, (p + 1) * PERIOD_SEC
+        for unit_players, pos, lo, hi in (
+            (lines, "F", 30, 60),
+            (pairs, "D", 35, 65),
+        ):
+            units, starts, ends = _rotation(rng, t0, t1, len(unit_players), lo, hi)
+            for u, s, e in zip(units, starts, ends):
+                for pid in unit_players[u]:
+                    rows.append((int(pid), pos, int(s), int(e)))
+
+    end_reg = 3 * PERIOD_SEC
+    g_end = end_reg if pull is None else pull[0]
+    for p in range(3):
+        g_stop = min((p + 1) * PERIOD_SEC, g_end)
+        rows.append((int(goalie), "G", p * PERIOD_SEC, g_stop))
+    rows = [r for r in rows if r[3] > r[2]]
+
+    if ot:
+        t0, t1 = end_reg, end_reg + OT_SEC
+        for unit_players, pos, lo, hi in (
+            (lines[:, :2], "F", 25, 50),
+            (dmen.reshape(6, 1), "D", 30, 55),
+        ):
+            units, starts, ends = _rotation(
+                rng, t0, t1, min(len(unit_players), 4), lo, hi
+            )
+            for u, s, e in zip(units, starts, ends):
+                for pid in unit_players[u]:
+                    rows.append((int(pid), pos, int(s), int(e)))
+        rows.append((int(goalie), "G", t0, t1))
+
+    # penalties: one forward per line sits out -> team is one skater short
+    for a, b in penalties:
+        for victim in lines[:, 0]:
+            rows = _clip_out(rows, (a, b), int(victim))
+
+    # pulled goalie: an extra skater (a 4th-line forward) covers the goalie's spot
+    if pull is not None:
+        a, b = pull
+        extra = int(lines[3, 1])
+        rows = _clip_out(rows, (a, b), extra)
+        rows.append((extra, "F", a, b))
+
+    return rows
+
+
+def _game_events(
+    rng: np.random.Generator,
+    game_id: int,
+    home: int,
+    away: int,
+    game_end: int,
+) -> pd.DataFrame:
+    """Shot attempts + non-Corsi events for one game."""
+    n_att = int(rng.integers(90, 150))
+    n_other = int(rng.integers(60, 100))
+    n = n_att + n_other
+
+    time = np.sort(rng.integers(0, game_end + 1, size=n))
+    shooter = np.where(rng.random(n) < 0.52, home, away)
+    other = np.where(shooter == home, away, home)
+
+    kinds = np.array(["Shot", "Missed Shot", "Blocked Shot", "Goal"])
+    att = rng.choice(kinds, size=n, p=[0.47, 0.24, 0.245, 0.045])
+    misc = rng.choice(np.array(["Faceoff", "Hit"]), size=n)
+    is_att = np.zeros(n, dtype=bool)
+    is_att[rng.choice(n, size=n_att, replace=False)] = True
+    event = np.where(is_att, att, misc)
+
+    # blocked shots: PBP event team is the blocking team
+    blocked = event == "Blocked Shot"
+    team_for = np.where(blocked, other, shooter)
+    team_against = np.where(blocked, shooter, other)
+
+    unblocked = np.isin(event, ["Shot", "Missed Shot", "Goal"])
+    xg = np.where(event == "Goal", rng.beta(2, 5, n), rng.beta(1, 12, n))
+
+    # score before each event (home minus away)
+    goal = event == "Goal"
+    home_goals = np.cumsum(goal & (shooter == home)) - (goal & (shooter == home))
+    away_goals = np.cumsum(goal & (shooter == away)) - (goal & (shooter == away))
+    home_for = team_for == home
+
+    return pd.DataFrame(
+        {
+            "game_id": game_id,
+            "event_index": np.arange(1, n + 1),
+            "period": np.minimum(time // PERIOD_SEC + 1, 4),
+            "time": time,
+            "event": event,
+            "team_id_for": team_for,
+            "team_id_against": team_against,
+            "pred_goal": np.where(unblocked, xg, np.nan),
+            "home_for": home_for.astype(np.int8),
+            "score_diff_for": np.where(
+                home_for, home_goals - away_goals, away_goals - home_goals
+            ),
+        }
+    )
+
+
+def generate_game(
+    rng: np.random.Generator, game_id: int, home: int, away: int
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """One synthetic game: (shifts, plays)."""
+    ot = rng.random() < 0.23
+    game_end = 3 * PERIOD_SEC + (OT_SEC if ot else 0)
+
+    pens = {home: [], away: []}
+    for _ in range(int(rng.integers(2, 8))):
+        team = home if rng.random() < 0.5 else away
+        a = int(rng.integers(30, 3 * PERIOD_SEC - 150))
+        pens[team].append((a, a + 120))
+
+    pull = {home: None, away: None}
+    if not ot and rng.random() < 0.4:
+        trailing = home if rng.random() < 0.5 else away
+        pulled_at = 3 * PERIOD_SEC - int(rng.integers(45, 150))
+        pull[trailing] = (pulled_at, 3 * PERIOD_SEC)
+
+    shift_rows = []
+    for team in (home, away):
+        for pid, pos, s, e in _team_shifts(rng, team, ot, pens[team], pull[team]):
+            shift_rows.append((game_id, pid, team, pos, s, e))
+
+    gs = pd.DataFrame(
+        shift_rows,
+        columns=[
+            "game_id",
+            "player_id",
+            "team_id",
+            "position",
+            "shift_start",
+            "shift_end",
+        ],
+    )
+    gs.insert(4, "period", np.minimum(gs["shift_start"] // PERIOD_SEC + 1, 4))
+    gp = _game_events(rng, game_id, home, away, game_end)
+    return gs, gp
+
+
+def generate_season(n_games: int = 1300, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """
+    Synthetic season in the cleaned builder layout.
+
+    Returns {"gs": shifts, "gp": plays, "games": game_id, home_team_id,
+    away_team_id}. The same (n_games, seed) always gives the same season.
+    """
+    rng = np.random.default_rng(seed)
+    gss, gps, games = [], [], []
+    for i in range(n_games):
+        home, away = rng.choice(np.arange(1, N_TEAMS + 1), size=2, replace=False)
+        gs, gp = generate_game(rng, FIRST_GAME_ID + i, int(home), int(away))
+        gss.append(gs)
+        gps.append(gp)
+        games.append((FIRST_GAME_ID + i, int(home), int(away)))
+    return {
+        "gs": pd.concat(gss, ignore_index=True),
+        "gp": pd.concat(gps, ignore_index=True),
+        "games": pd.DataFrame(
+            games, columns=["game_id", "home_team_id", "away_team_id"]
+        ),
+    }
+
+
+def to_raw_plays(
+    gp: pd.DataFrame, games: pd.DataFrame, season: int = 20182019
+) -> pd.DataFrame:
+    """Render plays like derived.game_plays_{season}_from_raw_pbp."""
+    g = gp[["game_id"]].merge(games, on="game_id", how="left")
+    home = g["home_team_id"]
+    away = g["away_team_id"]
+    # score before each event, per game
+    goal = gp["event"].eq("Goal").to_numpy()
+    goals = pd.DataFrame(
+        {
+            "home": goal & (gp["team_id_for"].to_numpy() == home.to_numpy()),
+            "away": goal & (gp["team_id_for"].to_numpy() == away.to_numpy()),
+        }
+    ).astype(np.int64)
+    score = goals.groupby(gp["game_id"].to_numpy()).cumsum() - goals
+    return pd.DataFrame(
+        {
+            "season": season,
+            "game_id": gp["game_id"],
+            "session": "R",
+            "event_index": gp["event_index"],
+            "game_period": gp["period"],
+            "game_seconds": gp["time"],
+            "event_type": gp["event"].map(RAW_EVENT_TYPES),
+            "event_team": gp["team_id_for"].map(TEAM_CODES),
+            "home_team": home.map(TEAM_CODES).to_numpy(),
+            "away_team": away.map(TEAM_CODES).to_numpy(),
+            "home_score": score["home"].to_numpy(),
+            "away_score": score["away"].to_numpy(),
+            "pred_goal": gp["pred_goal"],
+        }
+    )
+
+
+def to_raw_shifts(gs: pd.DataFrame, season: int = 20182019) -> pd.DataFrame:
+    """Render shifts like raw.raw_shifts_resolved (seconds are game-cumulative)."""
+    return pd.DataFrame(
+        {
+            "season": season,
+            "session": "R",
+            "game_id": gs["game_id"],
+            "player_id_resolved": gs["player_id"],
+            "team": gs["team_id"].map(TEAM_CODES),
+            "position": gs["position"],
+            "game_period": gs["period"],
+            "seconds_start": gs["shift_start"],
+            "seconds_end": gs["shift_end"],
+        }
+    )
+
+
+def team_code_frame() -> pd.DataFrame:
+    """dim.dim_team_code rows for the synthetic teams."""
+    return pd.DataFrame(
+        {"team_code": list(TEAM_CODES.values()), "team_id": list(TEAM_CODES.keys())}
+    )
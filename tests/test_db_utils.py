@@ -0,0 +1,49 @@
+"""Tests for db_utils.iter_game_frames (in-memory SQLite, no server needed)."""
+
+from __future__ import annotations
+
+import unittest
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from db_utils import iter_game_frames
+
+SQL = "SELECT game_id, n FROM plays ORDER BY game_id, n"
+
+
+class IterGameFramesTest(unittest.TestCase):
+    """Per-game frames must not depend on where the batches are cut."""
+
+    def setUp(self) -> None:
+        """Three games of 3, 1 and 4 rows."""
+        self.engine = create_engine("sqlite://")
+        self.plays = pd.DataFrame(
+            {"game_id": [1, 1, 1, 2, 3, 3, 3, 3], "n": [0, 1, 2, 0, 0, 1, 2, 3]}
+        )
+        self.plays.to_sql("plays", self.engine, index=False)
+
+    def tearDown(self) -> None:
+        """Close the in-memory database."""
+        self.engine.dispose()
+
+    def test_games_cut_by_batches_are_carried_over(self) -> None:
+        """Every batch size yields each game once, complete and in order."""
+        expected = {g: df.reset_index(drop=True) for g, df in self.plays.groupby("game_id")}
+        for batch_rows in (1, 2, 3, 5, 100):
+            with self.subTest(batch_rows=batch_rows):
+                games = list(iter_game_frames(self.engine, SQL, batch_rows=batch_rows))
+                self.assertEqual([int(g) for g, _ in games], [1, 2, 3])
+                for game_id, frame in games:
+                    pd.testing.assert_frame_equal(
+                        frame, expected[int(game_id)], check_dtype=False
+                    )
+
+    def test_empty_result_yields_nothing(self) -> None:
+        """A query without rows yields no games."""
+        sql = "SELECT game_id, n FROM plays WHERE game_id < 0 ORDER BY game_id"
+        self.assertEqual(list(iter_game_frames(self.engine, sql)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
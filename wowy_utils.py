@@ -0,0 +1,425 @@
+"""
+wowy_utils.py.
+
+Season player x player matrices for WOWY (with or without you) splits.
+
+For every pair of skaters in a season:
+  toi_with          shared ES seconds as teammates
+  toi_against       shared ES seconds as opponents
+  cf_with / ca_with ES shot attempts for / against their team with both on ice
+
+Built for a whole season in one pass (no per-pair or per-game loops):
+
+  1) ES ice time per player = merged shifts minus the excluded strength segments
+     (the same pieces build_es_toi sums).
+  2) Every piece endpoint in a game is a breakpoint; between two breakpoints the
+     skaters on ice do not change (an elementary segment of length L).
+  3) Incidence matrices B (segment-team rows x players) and A (segment rows x
+     players) give toi_with = B' diag(L) B and toi_against = A' diag(L) A - toi_with.
+  4) Events follow build_player_game_es (ES plays, shift_start <= t < shift_end,
+     counts on the team that was on ice): F / D (events x players) hold the
+     shooting / defending skaters, so cf_with = F'F and ca_with = D'D.
+
+Diagonals are each player's season totals (ES TOI, on-ice CF, CA), so "a without
+b" is M[a, a] - M[a, b]. Matrices are CSR, indexed like PairMatrices.player_ids,
+and one season is saved as one compressed .npz, stamped with the season's source
+hash (game_store_utils.season_source_hash) so readers can tell a stale file.
+
+QoC / QoT (competition_features) are shared-TOI weighted means of opponents' /
+teammates' season ES CF% and net60: one sparse matrix-vector product per metric,
+toi_against @ x / toi_against @ 1 (teammates: toi_with without the diagonal).
+
+Usage:
+    pairs = build_pair_matrices(gs, gp)
+    save_pair_matrices(pairs, pair_path(season))
+    load_pair_matrices(pair_path(season)).with_without(8478402, 8477934)
+"""
+
+from __future__ import annotations
+
+import os
+import pathlib
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from interval_utils import merge_intervals, subtract_intervals
+from on_ice_utils import BLOCKED_EVENTS, KEYS, SHOT_EVENTS, events_on_ice
+from strength_utils import (
+    apply_segments_to_plays,
+    build_strength_segments,
+    filter_goalies_modern,
+    segment_exclude_intervals,
+)
+
+if os.getenv("DEBUG_IMPORTS") == "1":
+    print(f"[IMPORT] {__name__} -> {pathlib.Path(__file__).resolve()}")
+
+DEFAULT_PAIR_DIR = pathlib.Path(__file__).resolve().parent / ".cache" / "player_pairs"
+PAIR_MATRICES = ("toi_with", "toi_against", "cf_with", "ca_with")
+PAIR_COLUMNS = [
+    "player_id_1",
+    "player_id_2",
+    "toi_with_sec",
+    "cf_with",
+    "ca_with",
+    "toi_against_sec",
+]
+COMPETITION_COLUMNS = [
+    "player_id",
+    "toi_es_sec",
+    "cf_percent",
+    "net60",
+    "qoc_cf_percent",
+    "qoc_net60",
+    "qot_cf_percent",
+    "qot_net60",
+]
+# QoC / QoT columns used as archetype model features
+COMPETITION_FEATURES = COMPETITION_COLUMNS[4:]
+
+
+@dataclass
+class PairMatrices:
+    """One season's WOWY matrices (CSR, rows/columns indexed like player_ids)."""
+
+    player_ids: np.ndarray
+    toi_with: sparse.csr_matrix
+    toi_against: sparse.csr_matrix
+    cf_with: sparse.csr_matrix
+    ca_with: sparse.csr_matrix
+
+    def index(self, player_id) -> int:
+        """Return the row of player_id (KeyError if they have no ES data)."""
+        pos = int(np.searchsorted(self.player_ids, player_id))
+        if pos >= len(self.player_ids) or self.player_ids[pos] != player_id:
+            raise KeyError(player_id)
+        return pos
+
+    def with_without(self, a, b) -> dict[str, float]:
+        """
+        ES TOI / CF / CA / CF% for a with b, a without b and b without a.
+
+        Keys: toi_sec_with, cf_with, ca_with, cf_percent_with, then the same with
+        _a_without_b and _b_without_a suffixes.
+        """
+        i, j = self.index(a), self.index(b)
+        out = {}
+        for name, m in (
+            ("toi_sec", self.toi_with),
+            ("cf", self.cf_with),
+            ("ca", self.ca_with),
+        ):
+            both = float(m[i, j])
+            out[f"{name}_with"] = both
+            out[f"{name}_a_without_b"] = float(m[i, i]) - both
+            out[f"{name}_b_without_a"] = float(m[j, j]) - both
+        for split in ("with", "a_without_b", "b_without_a"):
+            cf, ca = out[f"cf_{split}"], out[f"ca_{split}"]
+            out[f"cf_percent_{split}"] = 100.0 * cf / (cf + ca) if cf + ca else np.nan
+        return out
+
+    def teammates(self, player_id) -> pd.DataFrame:
+        """
+        With / without splits of player_id and every teammate they shared ice with.
+
+        Returns: player_id (the teammate), toi_with_sec, toi_without_sec, cf_with,
+        cf_without, ca_with, ca_without (without = player_id away from the
+        teammate), sorted by toi_with_sec descending.
+        """
+        i = self.index(player_id)
+        row = self.toi_with.getrow(i)
+        cols = row.indices[row.indices != i]
+        out = pd.DataFrame({"player_id": self.player_ids[cols]})
+        for name, m in (
+            ("toi", self.toi_with),
+            ("cf", self.cf_with),
+            ("ca", self.ca_with),
+        ):
+            with_ = m[i, cols].toarray().ravel() if len(cols) else np.array([])
+            suffix = "_sec" if name == "toi" else ""
+            out[f"{name}_with{suffix}"] = with_
+            out[f"{name}_without{suffix}"] = m[i, i] - with_
+        return out.sort_values("toi_with_sec", ascending=False, ignore_index=True)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Rows per pair (player_id_1 < player_id_2) with shared ES time or events."""
+        # PAIR_COLUMNS order: toi_with, cf_with, ca_with, toi_against
+        names = ("toi_with", "cf_with", "ca_with", "toi_against")
+        mats = [sparse.triu(getattr(self, m), k=1).tocoo() for m in names]
+        n = len(self.player_ids)
+        code = np.unique(np.concatenate([m.row * n + m.col for m in mats]))
+        out = pd.DataFrame(
+            {
+                "player_id_1": self.player_ids[code // n],
+                "player_id_2": self.player_ids[code % n],
+            }
+        )
+        for name, m in zip(PAIR_COLUMNS[2:], mats):
+            col = np.zeros(len(code), dtype=np.int64)
+            col[np.searchsorted(code, m.row * n + m.col)] = m.data
+            out[name] = col
+        return out[PAIR_COLUMNS]
+
+
+def competition_features(pairs: PairMatrices) -> pd.DataFrame:
+    """
+    Season ES ratings and TOI-weighted QoC / QoT for every player in pairs.
+
+    cf_percent = 100 * CF / (CF + CA); net60 = (CF - CA) per 60 ES minutes.
+    qoc_* / qot_* average the opponents' / teammates' ratings weighted by shared
+    ES seconds (players without a rating are left out of the weights); NaN when
+    a player shared no time with a rated opponent / teammate.
+    """
+    toi = pairs.toi_with.diagonal().astype(np.float64)
+    cf = pairs.cf_with.diagonal().astype(np.float64)
+    ca = pairs.ca_with.diagonal().astype(np.float64)
+    ratings = {
+        "cf_percent": np.divide(
+            100.0 * cf, cf + ca, out=np.full_like(cf, np.nan), where=cf + ca > 0
+        ),
+        "net60": np.divide(
+            (cf - ca) * 3600.0, toi, out=np.full_like(toi, np.nan), where=toi > 0
+        ),
+    }
+    out = pd.DataFrame(
+        {"player_id": pairs.player_ids, "toi_es_sec": toi.astype(np.int64), **ratings}
+    )
+
+    mates = pairs.toi_with.astype(np.float64)
+    weights = {
+        "qoc": pairs.toi_against.astype(np.float64),
+        "qot": (mates - sparse.diags(mates.diagonal())).tocsr(),
+    }
+    for prefix, w in weights.items():
+        for name, x in ratings.items():
+            rated = ~np.isnan(x)
+            num = w @ np.where(rated, x, 0.0)
+            den = w @ rated.astype(np.float64)
+            out[f"{prefix}_{name}"] = np.divide(
+                num, den, out=np.full_like(num, np.nan), where=den > 0
+            )
+    return out[COMPETITION_COLUMNS]
+
+
+def es_pieces(
+    shifts: pd.DataFrame, segments: pd.DataFrame
+) -> tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    ES ice-time pieces of every (game_id, player_id, team_id) (merged shifts).
+
+    Returns (keys_df, key, start, end): key indexes keys_df; the piece seconds
+    per key add up to build_es_toi's toi_es_sec.
+    """
+    gs = shifts[KEYS + ["shift_start", "shift_end"]].dropna()
+    keys_df = gs[KEYS].drop_duplicates().sort_values(KEYS, ignore_index=True)
+    key_code = gs.groupby(KEYS, sort=True).ngroup().to_numpy(np.int64)
+
+    start, end, key = merge_intervals(
+        gs["shift_start"].to_numpy(np.int64),
+        gs["shift_end"].to_numpy(np.int64),
+        key_code,
+    )
+    game_of_key = keys_df["game_id"].to_numpy(np.int64)
+    ex = segments
+    if not ex.empty:
+        ex = ex[
+            ex["exclude"].to_numpy(bool)
+            & (ex["segment_end"] > ex["segment_start"]).to_numpy()
+        ]
+    ex_s, ex_e = segment_exclude_intervals(ex)
+    idx, start, end = subtract_intervals(
+        start,
+        end,
+        ex_s,
+        ex_e,
+        keys=game_of_key[key],
+        ex_keys=ex["game_id"].to_numpy(np.int64) if len(ex) else None,
+    )
+    return keys_df, key[idx], start, end
+
+
+def _incidence(rows: np.ndarray, cols: np.ndarray, shape) -> sparse.csr_matrix:
+    """0/1 CSR matrix with a 1 at every (row, col) (duplicates collapse)."""
+    m = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=shape
+    )
+    m.data[:] = 1
+    return m
+
+
+def elementary_segments(
+    game: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    *,
+    at: tuple[np.ndarray, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None]:
+    """
+    Split pieces [start, end) at every piece endpoint of the same game.
+
+    Returns (length, piece, seg, at_seg): the seconds of every elementary
+    segment and one (piece, seg) pair per segment a piece covers. at = (game,
+    time) arrays of instants; at_seg is the segment holding each one (-1 before
+    the first / from the last breakpoint of the data), None without at.
+    """
+    at_game, at_time = (
+        (np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+        if at is None
+        else (np.asarray(at[0], np.int64), np.asarray(at[1], np.int64))
+    )
+    # every piece endpoint is a breakpoint on its game's band
+    g_code, _ = pd.factorize(np.concatenate([game, at_game]))
+    t_min = int(min(start.min(), at_time.min(initial=start.min())))
+    span = int(max(end.max(), at_time.max(initial=end.max()))) - t_min + 1
+    band_s = g_code[: len(game)] * span + (start - t_min)
+    band_e = g_code[: len(game)] * span + (end - t_min)
+    points = np.unique(np.concatenate([band_s, band_e]))
+    length = np.diff(points)
+
+    # piece -> the elementary segments it covers
+    lo = np.searchsorted(points, band_s)
+    n = np.searchsorted(points, band_e) - lo
+    piece = np.repeat(np.arange(len(game)), n)
+    seg = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n)
+
+    at_seg = None
+    if at is not None:
+        band_at = g_code[len(game) :] * span + (at_time - t_min)
+        at_seg = np.searchsorted(points, band_at, side="right") - 1
+        at_seg[at_seg >= len(length)] = -1
+    return length, piece, seg, at_seg
+
+
+def _shared_toi(
+    keys_df: pd.DataFrame,
+    key: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    player_ids: np.ndarray,
+) -> tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """(toi_with, toi_against) from ES pieces via elementary segments."""
+    n_p = len(player_ids)
+    if len(key) == 0:
+        empty = sparse.csr_matrix((n_p, n_p), dtype=np.int64)
+        return empty, empty.copy()
+
+    game = keys_df["game_id"].to_numpy(np.int64)[key]
+    team = keys_df["team_id"].to_numpy(np.int64)[key]
+    col = np.searchsorted(player_ids, keys_df["player_id"].to_numpy(np.int64)[key])
+    length, piece, seg, _ = elementary_segments(game, start, end)
+
+    n_seg = len(length)
+    a = _incidence(seg, col[piece], (n_seg, n_p))
+    t_code, t_uniques = pd.factorize(team[piece])
+    row, rows = pd.factorize(seg * len(t_uniques) + t_code)
+    b = _incidence(row, col[piece], (len(rows), n_p))
+
+    toi_all = a.T @ a.multiply(length[:, None]).tocsr()
+    toi_with = b.T @ b.multiply(length[rows // len(t_uniques)][:, None]).tocsr()
+    toi_against = toi_all - toi_with
+    toi_against.eliminate_zeros()
+    return toi_with.tocsr(), toi_against.tocsr()
+
+
+def _shared_corsi(
+    shifts: pd.DataFrame, plays: pd.DataFrame, player_ids: np.ndarray
+) -> tuple[sparse.csr_matrix, sparse.csr_matrix]:
+    """(cf_with, ca_with) from the skaters on ice for every ES shot attempt."""
+    n_p = len(player_ids)
+    ev = plays.reset_index(drop=True)
+    on_ice = events_on_ice(shifts, ev, end_inclusive=False)
+    if on_ice.empty:
+        empty = sparse.csr_matrix((n_p, n_p), dtype=np.int64)
+        return empty, empty.copy()
+
+    # shooting team: team_id_for, except blocked shots (event team = blocker)
+    is_block = ev["event"].isin(BLOCKED_EVENTS).to_numpy()
+    shooter = np.where(is_block, ev["team_id_against"], ev["team_id_for"])
+    defender = np.where(is_block, ev["team_id_for"], ev["team_id_against"])
+
+    row = on_ice["event_row"].to_numpy(np.int64)
+    team = on_ice["team_id"].to_numpy(np.int64)
+    col = np.searchsorted(player_ids, on_ice["player_id"].to_numpy(np.int64))
+    out = []
+    for side in (shooter, defender):
+        hit = team == side[row].astype(np.int64)
+        m = _incidence(row[hit], col[hit], (len(ev), n_p))
+        out.append((m.T @ m).tocsr())
+    return out[0], out[1]
+
+
+def build_pair_matrices(shifts: pd.DataFrame, plays: pd.DataFrame) -> PairMatrices:
+    """
+    WOWY matrices for any set of games (normally one season).
+
+    shifts columns required: game_id, player_id, team_id, shift_start, shift_end
+    (+ position to drop goalies); plays: game_id, time, event, team_id_for,
+    team_id_against. Same inputs and on-ice rules as build_player_game_es.
+    """
+    gs = filter_goalies_modern(shifts)
+    segments = build_strength_segments(gs)
+    keys_df, key, start, end = es_pieces(gs, segments)
+    player_ids = np.unique(keys_df["player_id"].to_numpy(np.int64))
+
+    plays = plays[plays["event"].isin(SHOT_EVENTS + BLOCKED_EVENTS).to_numpy()]
+    plays = plays[plays[["team_id_for", "team_id_against"]].notna().all(axis=1)]
+    plays_es = apply_segments_to_plays(plays, segments)
+
+    toi_with, toi_against = _shared_toi(keys_df, key, start, end, player_ids)
+    cf_with, ca_with = _shared_corsi(gs, plays_es, player_ids)
+    return PairMatrices(player_ids, toi_with, toi_against, cf_with, ca_with)
+
+
+def pair_path(season: int, root: str | os.PathLike | None = None) -> pathlib.Path:
+    """Return the .npz path of a season's matrices."""
+    root = DEFAULT_PAIR_DIR if root is None else pathlib.Path(root)
+    return root / f"player_pairs_{season}.npz"
+
+
+def save_pair_matrices(
+    pairs: PairMatrices, path: str | os.PathLike, *, source_hash: str | None = None
+) -> pathlib.Path:
+    """Write pairs as one compressed .npz (int32 CSR parts); return the path."""
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrays = {"player_ids": pairs.player_ids.astype(np.int64)}
+    if source_hash is not None:
+        arrays["source_hash"] = np.array(source_hash)
+    for name in PAIR_MATRICES:
+        m = getattr(pairs, name).tocsr()
+        arrays[f"{name}_data"] = m.data.astype(np.int32)
+        arrays[f"{name}_indices"] = m.indices.astype(np.int32)
+        arrays[f"{name}_indptr"] = m.indptr.astype(np.int64)
+
+    # written next to path and renamed into place (readers never see a partial file)
+    tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_pair_matrices(path: str | os.PathLike) -> PairMatrices:
+    """Read matrices written by save_pair_matrices."""
+    with np.load(path) as z:
+        player_ids = z["player_ids"]
+        n = len(player_ids)
+        mats = {
+            name: sparse.csr_matrix(
+                (z[f"{name}_data"], z[f"{name}_indices"], z[f"{name}_indptr"]),
+                shape=(n, n),
+            )
+            for name in PAIR_MATRICES
+        }
+    return PairMatrices(player_ids, **mats)
+
+
+def pair_source_hash(path: str | os.PathLike) -> str | None:
+    """Source hash saved with the matrices (None if missing or never stamped)."""
+    try:
+        with np.load(path) as z:
+            return str(z["source_hash"]) if "source_hash" in z.files else None
+    except (FileNotFoundError, ValueError, OSError):
+        return None